@@ -0,0 +1,45 @@
+import numpy as np
+from yt.utilities.cosmology import \
+    Cosmology, \
+    trapzint
+
+
+class CosmologySuite:
+    def setup(self):
+        self.co = Cosmology()
+        self.z = np.linspace(0, 10, 1000)
+        self.t = self.co.t_from_z(self.z)
+        # Build the tables of integrals before timing.
+        self.co.comoving_radial_distance(0, 1)
+
+    def time_comoving_radial_distance_scalar(self):
+        self.co.comoving_radial_distance(0, 1)
+
+    def time_comoving_radial_distance_array(self):
+        self.co.comoving_radial_distance(0, self.z)
+
+    def time_comoving_radial_distance_loop_trapzint(self):
+        # The integration done for each redshift before the tables
+        for z in self.z:
+            trapzint(self.co.inverse_expansion_factor, 0, z)
+
+    def time_lookback_time_array(self):
+        self.co.lookback_time(0, self.z)
+
+    def time_t_from_z_scalar(self):
+        self.co.t_from_z(1)
+
+    def time_t_from_z_array(self):
+        self.co.t_from_z(self.z)
+
+    def time_z_from_t_scalar(self):
+        self.co.z_from_t(self.t[100])
+
+    def time_z_from_t_array(self):
+        self.co.z_from_t(self.t)
+
+    def time_new_cosmology_tables(self):
+        # A new set of parameters builds its own tables.
+        co = Cosmology(omega_matter=np.random.random(),
+                       omega_lambda=0.7)
+        co.t_from_z(1)
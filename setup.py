@@ -53,6 +53,13 @@ else:
     std_libs = ["m"]
 
 cython_extensions = [
+    Extension("yt.analysis_modules.halo_finding.threaded_finders",
+              ["yt/analysis_modules/halo_finding/threaded_finders.pyx"],
+              include_dirs=["yt/analysis_modules/halo_finding/"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
+              depends=["yt/analysis_modules/halo_finding/atomic_ops.h"],
+              libraries=std_libs),
     Extension("yt.analysis_modules.photon_simulator.utils",
               ["yt/analysis_modules/photon_simulator/utils.pyx"],
               include_dirs=["yt/utilities/lib"]),
@@ -83,14 +90,20 @@ cython_extensions = [
     Extension("yt.geometry.selection_routines",
               ["yt/geometry/selection_routines.pyx"],
               include_dirs=["yt/utilities/lib/"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
               libraries=std_libs),
     Extension("yt.geometry.particle_deposit",
               ["yt/geometry/particle_deposit.pyx"],
               include_dirs=["yt/utilities/lib/"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
               libraries=std_libs),
     Extension("yt.geometry.particle_smooth",
               ["yt/geometry/particle_smooth.pyx"],
               include_dirs=["yt/utilities/lib/"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
               libraries=std_libs),
     Extension("yt.geometry.fake_octree",
               ["yt/geometry/fake_octree.pyx"],
@@ -113,6 +126,8 @@ cython_extensions = [
               ["yt/utilities/lib/contour_finding.pyx"],
               include_dirs=["yt/utilities/lib/",
                             "yt/geometry/"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
               libraries=std_libs),
     Extension("yt.utilities.lib.fnv_hash",
               ["yt/utilities/lib/fnv_hash.pyx"],
@@ -136,6 +151,8 @@ cython_extensions = [
               ["yt/utilities/lib/pixelization_routines.pyx",
                "yt/utilities/lib/pixelization_constants.c"],
               include_dirs=["yt/utilities/lib/"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
               libraries=std_libs,
               depends=["yt/utilities/lib/pixelization_constants.h"]),
     Extension("yt.utilities.lib.primitives",
@@ -170,6 +187,8 @@ cython_extensions = [
               depends=["yt/utilities/lib/fixed_interpolator.h"]),
     Extension("yt.utilities.lib.element_mappings",
               ["yt/utilities/lib/element_mappings.pyx"],
+              extra_compile_args=omp_args,
+              extra_link_args=omp_args,
               libraries=std_libs),
     Extension("yt.utilities.lib.alt_ray_tracers",
               ["yt/utilities/lib/alt_ray_tracers.pyx"],
@@ -20,14 +20,21 @@ from yt.analysis_modules.cosmological_observation.cosmology_splice import \
 from yt.convenience import \
     load
 from yt.frontends.ytdata.utilities import \
-    save_as_dataset
+    save_as_dataset, \
+    StreamingDatasetWriter
+from yt.funcs import \
+    is_root
 from yt.units.yt_array import \
     YTArray
 from yt.utilities.cosmology import \
     Cosmology
 from yt.utilities.logger import \
     ytLogger as mylog
+from yt.utilities.parallel_tools.local_parallelism import \
+    local_imap
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
+    communication_system, \
+    parallel_capable, \
     parallel_objects, \
     parallel_root_only
 from yt.utilities.physical_constants import speed_of_light_cgs
@@ -288,7 +295,8 @@ class LightRay(CosmologySplice):
                        fields=None, setup_function=None,
                        solution_filename=None, data_filename=None,
                        get_los_velocity=None, use_peculiar_velocity=True,
-                       redshift=None, field_parameters=None, njobs=-1):
+                       redshift=None, field_parameters=None, njobs=-1,
+                       stream=False):
         """
         make_light_ray(seed=None, periodic=True,
                        left_edge=None, right_edge=None, min_level=None,
@@ -296,7 +304,7 @@ class LightRay(CosmologySplice):
                        trajectory=None, fields=None, setup_function=None,
                        solution_filename=None, data_filename=None,
                        use_peculiar_velocity=True, redshift=None,
-                       njobs=-1)
+                       njobs=-1, stream=False)
 
         Create a light ray and get field values for each lixel.  A light
         ray consists of a list of field values for cells intersected by
@@ -376,6 +384,16 @@ class LightRay(CosmologySplice):
             The number of parallel jobs over which the segments will
             be split.  Choose -1 for one processor per segment.
             Default: -1.
+        stream : optional, bool
+            If True, the field values of each segment are appended to
+            data_filename, which must be given, as soon as the segment is
+            made, so that only the segments being made are held in memory
+            rather than the whole ray.  Without MPI, the segments are made
+            by a pool of local processes when the local_parallel_processes
+            configuration option is larger than one.  The fields are saved
+            as chunked and compressed hdf5 datasets, and are not kept by
+            the LightRay object; use the returned dataset to access them.
+            Default: False.
 
         Examples
         --------
@@ -477,156 +495,28 @@ class LightRay(CosmologySplice):
                                'redshift_dopp'])
             data_fields.extend(['velocity_x', 'velocity_y', 'velocity_z'])
 
+        segment_args = {"redshift": redshift,
+                        "setup_function": setup_function,
+                        "left_edge": left_edge, "right_edge": right_edge,
+                        "field_parameters": field_parameters,
+                        "all_fields": all_fields,
+                        "data_fields": data_fields,
+                        "use_peculiar_velocity": use_peculiar_velocity}
+
+        if stream:
+            if data_filename is None:
+                raise RuntimeError(
+                    "A data_filename must be given to stream a light ray.")
+            self._stream_light_ray(data_filename, segment_args, njobs=njobs)
+            ray_ds = load(data_filename)
+            return ray_ds
+
         all_ray_storage = {}
         for my_storage, my_segment in parallel_objects(self.light_ray_solution,
                                                        storage=all_ray_storage,
                                                        njobs=njobs):
-
-            # In case of simple rays, use the already loaded dataset: self.ds, 
-            # otherwise, load dataset for segment.
-            if self.ds is None:
-                ds = load(my_segment['filename'], **self.load_kwargs)
-            else:
-                ds = self.ds
-
-            my_segment['unique_identifier'] = ds.unique_identifier
-            if redshift is not None:
-                if ds.cosmological_simulation and redshift != ds.current_redshift:
-                    mylog.warn("Generating light ray with different redshift than " +
-                               "the dataset itself.")
-                my_segment["redshift"] = redshift
-
-            if setup_function is not None:
-                setup_function(ds)
-
-            if not ds.cosmological_simulation:
-                next_redshift = my_segment["redshift"]
-            elif self.near_redshift == self.far_redshift:
-                if isinstance(my_segment["traversal_box_fraction"], YTArray) and \
-                  not my_segment["traversal_box_fraction"].units.is_dimensionless:
-                    segment_length = \
-                      my_segment["traversal_box_fraction"].in_units("Mpccm / h")
-                else:
-                    segment_length = my_segment["traversal_box_fraction"] * \
-                      ds.domain_width[0].in_units("Mpccm / h")
-                next_redshift = my_segment["redshift"] - \
-                  self._deltaz_forward(my_segment["redshift"],
-                                       segment_length)
-            elif my_segment.get("next", None) is None:
-                next_redshift = self.near_redshift
-            else:
-                next_redshift = my_segment['next']['redshift']
-
-            # Make sure start, end, left, right
-            # are using the dataset's unit system.
-            my_start = ds.arr(my_segment['start'])
-            my_end   = ds.arr(my_segment['end'])
-            my_left  = ds.arr(left_edge)
-            my_right = ds.arr(right_edge)
-            mylog.info("Getting segment at z = %s: %s to %s." %
-                       (my_segment['redshift'], my_start, my_end))
-
-            # Break periodic ray into non-periodic segments.
-            sub_segments = periodic_ray(my_start, my_end,
-                                        left=my_left, right=my_right)
-
-            # Prepare data structure for subsegment.
-            sub_data = {}
-            sub_data['segment_redshift'] = my_segment['redshift']
-            for field in all_fields:
-                sub_data[field] = []
-
-            # Get data for all subsegments in segment.
-            for sub_segment in sub_segments:
-                mylog.info("Getting subsegment: %s to %s." %
-                           (list(sub_segment[0]), list(sub_segment[1])))
-                sub_ray = ds.ray(sub_segment[0], sub_segment[1])
-                for key, val in field_parameters.items():
-                    sub_ray.set_field_parameter(key, val)
-                asort = np.argsort(sub_ray["t"])
-                sub_data['dl'].extend(sub_ray['dts'][asort] *
-                                      vector_length(sub_ray.start_point,
-                                                    sub_ray.end_point))
-
-                for field in data_fields:
-                    sub_data[field].extend(sub_ray[field][asort])
-
-                if use_peculiar_velocity:
-                    line_of_sight = sub_segment[0] - sub_segment[1]
-                    line_of_sight /= ((line_of_sight**2).sum())**0.5
-                    sub_vel = ds.arr([sub_ray['velocity_x'],
-                                      sub_ray['velocity_y'],
-                                      sub_ray['velocity_z']])
-                    # Line of sight velocity = vel_los
-                    sub_vel_los = (np.rollaxis(sub_vel, 1) * \
-                                   line_of_sight).sum(axis=1)
-                    sub_data['velocity_los'].extend(sub_vel_los[asort])
-
-                    # doppler redshift:
-                    # See https://en.wikipedia.org/wiki/Redshift and 
-                    # Peebles eqns: 5.48, 5.49
-
-                    # 1 + redshift_dopp = (1 + v*cos(theta)/c) / 
-                    # sqrt(1 - v**2/c**2)
-
-                    # where v is the peculiar velocity (ie physical velocity
-                    # without the hubble flow, but no hubble flow in sim, so
-                    # just the physical velocity).
-
-                    # the bulk of the doppler redshift is from line of sight 
-                    # motion, but there is a small amount from time dilation 
-                    # of transverse motion, hence the inclusion of theta (the 
-                    # angle between line of sight and the velocity). 
-                    # theta is the angle between the ray vector (i.e. line of 
-                    # sight) and the velocity vectors: a dot b = ab cos(theta)
-
-                    sub_vel_mag = sub_ray['velocity_magnitude']
-                    cos_theta = line_of_sight.dot(sub_vel) / sub_vel_mag
-                    # Protect against situations where velocity mag is exactly
-                    # zero, in which case zero / zero = NaN.
-                    cos_theta = np.nan_to_num(cos_theta)
-                    redshift_dopp = \
-                        (1 + sub_vel_mag * cos_theta / speed_of_light_cgs) / \
-                         np.sqrt(1 - sub_vel_mag**2 / speed_of_light_cgs**2) - 1
-                    sub_data['redshift_dopp'].extend(redshift_dopp[asort])
-                    del sub_vel, sub_vel_los, sub_vel_mag, cos_theta, \
-                        redshift_dopp
-
-                sub_ray.clear_data()
-                del sub_ray, asort
-
-            for key in sub_data:
-                sub_data[key] = ds.arr(sub_data[key]).in_cgs()
-
-            # Get redshift for each lixel.  Assume linear relation between l 
-            # and z.
-            sub_data['dredshift'] = (my_segment['redshift'] - next_redshift) * \
-                (sub_data['dl'] / vector_length(my_start, my_end).in_cgs())
-            sub_data['redshift'] = my_segment['redshift'] - \
-              sub_data['dredshift'].cumsum() + sub_data['dredshift']
-
-            # When using the peculiar velocity, create effective redshift 
-            # (redshift_eff) field combining cosmological redshift and 
-            # doppler redshift.
-            
-            # then to add cosmological redshift and doppler redshifts, follow
-            # eqn 3.75 in Peacock's Cosmological Physics:
-            # 1 + z_eff = (1 + z_cosmo) * (1 + z_doppler)
-
-            if use_peculiar_velocity:
-               sub_data['redshift_eff'] = ((1 + sub_data['redshift_dopp']) * \
-                                            (1 + sub_data['redshift'])) - 1
-
-            # Remove empty lixels.
-            sub_dl_nonzero = sub_data['dl'].nonzero()
-            for field in all_fields:
-                sub_data[field] = sub_data[field][sub_dl_nonzero]
-            del sub_dl_nonzero
-
-            # Add to storage.
-            my_storage.result = sub_data
-
-            del ds
+            my_storage.result = self._get_segment_data(my_segment,
+                                                       **segment_args)
 
         # Reconstruct ray data from parallel_objects storage.
         all_data = [my_data for my_data in all_ray_storage.values()]
@@ -645,15 +535,236 @@ class LightRay(CosmologySplice):
         else:
             return None
 
+    def _get_segment_data(self, my_segment, redshift=None,
+                          setup_function=None, left_edge=None,
+                          right_edge=None, field_parameters=None,
+                          all_fields=None, data_fields=None,
+                          use_peculiar_velocity=True):
+        """
+        _get_segment_data(my_segment, **segment_args)
+
+        Get the field values along a segment of the light ray.
+        """
+
+        # In case of simple rays, use the already loaded dataset: self.ds, 
+        # otherwise, load dataset for segment.
+        if self.ds is None:
+            ds = load(my_segment['filename'], **self.load_kwargs)
+        else:
+            ds = self.ds
+
+        my_segment['unique_identifier'] = ds.unique_identifier
+        if redshift is not None:
+            if ds.cosmological_simulation and redshift != ds.current_redshift:
+                mylog.warn("Generating light ray with different redshift than " +
+                           "the dataset itself.")
+            my_segment["redshift"] = redshift
+
+        if setup_function is not None:
+            setup_function(ds)
+
+        if not ds.cosmological_simulation:
+            next_redshift = my_segment["redshift"]
+        elif self.near_redshift == self.far_redshift:
+            if isinstance(my_segment["traversal_box_fraction"], YTArray) and \
+              not my_segment["traversal_box_fraction"].units.is_dimensionless:
+                segment_length = \
+                  my_segment["traversal_box_fraction"].in_units("Mpccm / h")
+            else:
+                segment_length = my_segment["traversal_box_fraction"] * \
+                  ds.domain_width[0].in_units("Mpccm / h")
+            next_redshift = my_segment["redshift"] - \
+              self._deltaz_forward(my_segment["redshift"],
+                                   segment_length)
+        elif my_segment.get("next", None) is None:
+            next_redshift = self.near_redshift
+        else:
+            next_redshift = my_segment['next']['redshift']
+
+        # Make sure start, end, left, right
+        # are using the dataset's unit system.
+        my_start = ds.arr(my_segment['start'])
+        my_end   = ds.arr(my_segment['end'])
+        my_left  = ds.arr(left_edge)
+        my_right = ds.arr(right_edge)
+        mylog.info("Getting segment at z = %s: %s to %s." %
+                   (my_segment['redshift'], my_start, my_end))
+
+        # Break periodic ray into non-periodic segments.
+        sub_segments = periodic_ray(my_start, my_end,
+                                    left=my_left, right=my_right)
+
+        # Prepare data structure for subsegment.
+        sub_data = {}
+        sub_data['segment_redshift'] = my_segment['redshift']
+        for field in all_fields:
+            sub_data[field] = []
+
+        # Get data for all subsegments in segment.
+        for sub_segment in sub_segments:
+            mylog.info("Getting subsegment: %s to %s." %
+                       (list(sub_segment[0]), list(sub_segment[1])))
+            sub_ray = ds.ray(sub_segment[0], sub_segment[1])
+            for key, val in field_parameters.items():
+                sub_ray.set_field_parameter(key, val)
+            asort = np.argsort(sub_ray["t"])
+            sub_data['dl'].extend(sub_ray['dts'][asort] *
+                                  vector_length(sub_ray.start_point,
+                                                sub_ray.end_point))
+
+            for field in data_fields:
+                sub_data[field].extend(sub_ray[field][asort])
+
+            if use_peculiar_velocity:
+                line_of_sight = sub_segment[0] - sub_segment[1]
+                line_of_sight /= ((line_of_sight**2).sum())**0.5
+                sub_vel = ds.arr([sub_ray['velocity_x'],
+                                  sub_ray['velocity_y'],
+                                  sub_ray['velocity_z']])
+                # Line of sight velocity = vel_los
+                sub_vel_los = (np.rollaxis(sub_vel, 1) * \
+                               line_of_sight).sum(axis=1)
+                sub_data['velocity_los'].extend(sub_vel_los[asort])
+
+                # doppler redshift:
+                # See https://en.wikipedia.org/wiki/Redshift and 
+                # Peebles eqns: 5.48, 5.49
+
+                # 1 + redshift_dopp = (1 + v*cos(theta)/c) / 
+                # sqrt(1 - v**2/c**2)
+
+                # where v is the peculiar velocity (ie physical velocity
+                # without the hubble flow, but no hubble flow in sim, so
+                # just the physical velocity).
+
+                # the bulk of the doppler redshift is from line of sight 
+                # motion, but there is a small amount from time dilation 
+                # of transverse motion, hence the inclusion of theta (the 
+                # angle between line of sight and the velocity). 
+                # theta is the angle between the ray vector (i.e. line of 
+                # sight) and the velocity vectors: a dot b = ab cos(theta)
+
+                sub_vel_mag = sub_ray['velocity_magnitude']
+                cos_theta = line_of_sight.dot(sub_vel) / sub_vel_mag
+                # Protect against situations where velocity mag is exactly
+                # zero, in which case zero / zero = NaN.
+                cos_theta = np.nan_to_num(cos_theta)
+                redshift_dopp = \
+                    (1 + sub_vel_mag * cos_theta / speed_of_light_cgs) / \
+                     np.sqrt(1 - sub_vel_mag**2 / speed_of_light_cgs**2) - 1
+                sub_data['redshift_dopp'].extend(redshift_dopp[asort])
+                del sub_vel, sub_vel_los, sub_vel_mag, cos_theta, \
+                    redshift_dopp
+
+            sub_ray.clear_data()
+            del sub_ray, asort
+
+        for key in sub_data:
+            sub_data[key] = ds.arr(sub_data[key]).in_cgs()
+
+        # Get redshift for each lixel.  Assume linear relation between l 
+        # and z.
+        sub_data['dredshift'] = (my_segment['redshift'] - next_redshift) * \
+            (sub_data['dl'] / vector_length(my_start, my_end).in_cgs())
+        sub_data['redshift'] = my_segment['redshift'] - \
+          sub_data['dredshift'].cumsum() + sub_data['dredshift']
+
+        # When using the peculiar velocity, create effective redshift 
+        # (redshift_eff) field combining cosmological redshift and 
+        # doppler redshift.
+        
+        # then to add cosmological redshift and doppler redshifts, follow
+        # eqn 3.75 in Peacock's Cosmological Physics:
+        # 1 + z_eff = (1 + z_cosmo) * (1 + z_doppler)
+
+        if use_peculiar_velocity:
+           sub_data['redshift_eff'] = ((1 + sub_data['redshift_dopp']) * \
+                                        (1 + sub_data['redshift'])) - 1
+
+        # Remove empty lixels.
+        sub_dl_nonzero = sub_data['dl'].nonzero()
+        for field in all_fields:
+            sub_data[field] = sub_data[field][sub_dl_nonzero]
+        del sub_dl_nonzero
+
+        return sub_data
+
     def __getitem__(self, field):
         return self._data[field]
 
-    @parallel_root_only
-    def _write_light_ray(self, filename, data):
+    def _stream_light_ray(self, filename, segment_args, njobs=-1):
         """
-        _write_light_ray(filename, data)
+        _stream_light_ray(filename, segment_args, njobs=-1)
 
-        Write light ray data to hdf5 file.
+        Make the segments of the light ray and append each one to an hdf5
+        file as soon as it is made.
+        """
+
+        # Segments are written from high to low redshift.
+        order = sorted(range(len(self.light_ray_solution)),
+                       key=lambda i: self.light_ray_solution[i]['redshift'],
+                       reverse=True)
+
+        def get_segment(i):
+            my_segment = self.light_ray_solution[i]
+            sub_data = self._get_segment_data(my_segment, **segment_args)
+            sub_data.pop('segment_redshift')
+            # Forked processes send back what they learned of the segment.
+            info = dict((key, my_segment[key]) for key in
+                        ['unique_identifier', 'redshift'])
+            return i, _mask_light_ray(sub_data), info
+
+        if parallel_capable:
+            # Segments are shared out among the processors one round at a
+            # time, so only a round of segments is ever held in memory.
+            nprocs = communication_system.communicators[-1].size
+            def iterate():
+                for start in range(0, len(order), nprocs):
+                    storage = {}
+                    for my_storage, i in parallel_objects(
+                            order[start:start + nprocs], storage=storage,
+                            njobs=njobs):
+                        my_storage.result = get_segment(i)
+                    for key in sorted(storage):
+                        yield storage[key]
+        else:
+            def iterate():
+                for result in local_imap(get_segment, order, njobs=njobs):
+                    yield result
+
+        ds, extra_attrs = self._light_ray_attrs()
+        writer = None
+        if is_root():
+            writer = StreamingDatasetWriter(ds, filename,
+                                            field_types=_GridFieldTypes(),
+                                            extra_attrs=extra_attrs)
+        nlixels = 0
+        try:
+            for i, sub_data, info in iterate():
+                self.light_ray_solution[i].update(info)
+                nlixels += sub_data['dl'].size
+                if writer is not None:
+                    writer.append(sub_data)
+                del sub_data
+            if nlixels == 0:
+                raise RuntimeError(
+                    "No zones along light ray with nonzero temperature. "
+                    "Please modify your light ray trajectory.")
+            # The dataset identifiers are only known now.
+            if writer is not None:
+                ds, extra_attrs = self._light_ray_attrs()
+                writer.add_attrs(extra_attrs)
+        finally:
+            if writer is not None:
+                writer.close()
+        self._data = {}
+
+    def _light_ray_attrs(self):
+        """
+        _light_ray_attrs()
+
+        Return the dataset or dictionary of parameters and the extra
+        attributes with which the light ray data is saved.
         """
 
         extra_attrs = {"data_type": "yt_light_ray"}
@@ -696,19 +807,25 @@ class LightRay(CosmologySplice):
                     arr = arr.astype(str)
                 extra_attrs["light_ray_solution_%s" % key] = arr
 
+        return ds, extra_attrs
+
+    @parallel_root_only
+    def _write_light_ray(self, filename, data):
+        """
+        _write_light_ray(filename, data)
+
+        Write light ray data to hdf5 file.
+        """
+
+        ds, extra_attrs = self._light_ray_attrs()
         field_types = dict([(field, "grid") for field in data.keys()])
 
         # Only return LightRay elements with non-zero density
-        if 'temperature' in data: f = 'temperature'
-        if ('gas', 'temperature') in data: f = ('gas', 'temperature')
-        if 'temperature' in data or ('gas', 'temperature') in data:
-            mask = data[f] > 0
-            if not np.any(mask):
-                raise RuntimeError(
-                    "No zones along light ray with nonzero %s. "
-                    "Please modify your light ray trajectory." % (f,))
-            for key in data.keys():
-                data[key] = data[key][mask]
+        data = _mask_light_ray(data)
+        if 'dl' in data and data['dl'].size == 0:
+            raise RuntimeError(
+                "No zones along light ray with nonzero temperature. "
+                "Please modify your light ray trajectory.")
         save_as_dataset(ds, filename, data, field_types=field_types,
                         extra_attrs=extra_attrs)
 
@@ -735,6 +852,26 @@ class LightRay(CosmologySplice):
                      my_segment['filename']))
         f.close()
 
+class _GridFieldTypes(dict):
+    # Every light ray field is saved in the "grid" group.
+    def __missing__(self, key):
+        return "grid"
+
+def _mask_light_ray(data):
+    """
+    _mask_light_ray(data)
+
+    Keep only the lixels with non-zero temperature.
+    """
+
+    if 'temperature' in data: f = 'temperature'
+    if ('gas', 'temperature') in data: f = ('gas', 'temperature')
+    if 'temperature' in data or ('gas', 'temperature') in data:
+        mask = data[f] > 0
+        for key in data.keys():
+            data[key] = data[key][mask]
+    return data
+
 def _flatten_dict_list(data, exceptions=None):
     """
     _flatten_dict_list(data, exceptions=None)
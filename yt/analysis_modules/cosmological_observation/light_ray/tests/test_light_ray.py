@@ -16,7 +16,10 @@ from yt.convenience import \
     load
 from yt.testing import \
     assert_array_equal, \
-    requires_file
+    assert_equal, \
+    fake_random_ds, \
+    requires_file, \
+    requires_module
 from yt.analysis_modules.cosmological_observation.api import LightRay
 import os
 import shutil
@@ -165,3 +168,40 @@ def test_light_ray_non_cosmo_from_dataset():
     os.chdir(curdir)
     shutil.rmtree(tmpdir)
 
+
+@requires_module("h5py")
+def test_light_ray_stream():
+    """
+    This test streams a light ray to disk and compares it with one written
+    all at once
+    """
+
+    # Set up in a temp dir
+    tmpdir = tempfile.mkdtemp()
+    curdir = os.getcwd()
+    os.chdir(tmpdir)
+
+    ds = fake_random_ds(
+        16, nprocs=8,
+        fields=("density", "temperature",
+                "velocity_x", "velocity_y", "velocity_z"),
+        units=("g/cm**3", "K", "cm/s", "cm/s", "cm/s"))
+    lr = LightRay(ds)
+
+    ray_start = [0, 0, 0.1]
+    ray_end = [1, 0.9, 0.7]
+    ray_ds = lr.make_light_ray(start_position=ray_start, end_position=ray_end,
+                               fields=['density'], data_filename='lightray.h5')
+    stream_ds = lr.make_light_ray(start_position=ray_start,
+                                  end_position=ray_end, fields=['density'],
+                                  data_filename='stream.h5', stream=True)
+    compare_light_ray_solutions(ray_ds, stream_ds)
+    assert_equal(sorted(ray_ds.field_list), sorted(stream_ds.field_list))
+    ad1 = ray_ds.all_data()
+    ad2 = stream_ds.all_data()
+    for field in ray_ds.field_list:
+        assert_equal(ad1[field], ad2[field])
+
+    # clean up
+    os.chdir(curdir)
+    shutil.rmtree(tmpdir)
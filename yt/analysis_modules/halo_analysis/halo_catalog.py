@@ -22,6 +22,8 @@ from yt.funcs import \
     ensure_dir, \
     get_pbar, \
     mylog
+from yt.utilities.lib.geometry_utils import \
+    get_morton_indices
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
     ParallelAnalysisInterface, \
     parallel_blocking_call, \
@@ -301,7 +303,8 @@ class HaloCatalog(ParallelAnalysisInterface):
         halo_recipe = recipe_registry.find(recipe, *args, **kwargs)
         halo_recipe(self)
 
-    def create(self, save_halos=False, save_catalog=True, njobs=-1, dynamic=False):
+    def create(self, save_halos=False, save_catalog=True, njobs=-1, dynamic=False,
+               batch_size=None):
         r"""
         Create the halo catalog given the callbacks, quantities, and filters that
         have been provided.
@@ -328,15 +331,26 @@ class HaloCatalog(ParallelAnalysisInterface):
             If False, halo analysis is divided evenly between all available processors.
             If True, parallelism is performed via a task queue.
             Default: False
+        batch_size : int
+            If given, halos are sorted along a Morton curve through the
+            domain and analyzed in blocks of this many neighbors, and each
+            block is what is divided between processors.  While a block is
+            analyzed, the fluid fields read from the grids of the data
+            dataset are kept, so that the halos of the block overlapping the
+            same grids read them once.  The results are identical to those
+            of analyzing halos one at a time.
+            Default: None
 
         See Also
         --------
         load
 
         """
-        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic)
+        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic,
+                  batch_size=batch_size)
 
-    def load(self, save_halos=True, save_catalog=False, njobs=-1, dynamic=False):
+    def load(self, save_halos=True, save_catalog=False, njobs=-1, dynamic=False,
+             batch_size=None):
         r"""
         Load a previously created halo catalog.
 
@@ -363,16 +377,27 @@ class HaloCatalog(ParallelAnalysisInterface):
             If False, halo analysis is divided evenly between all available processors.
             If True, parallelism is performed via a task queue.
             Default: False
+        batch_size : int
+            If given, halos are sorted along a Morton curve through the
+            domain and analyzed in blocks of this many neighbors, and each
+            block is what is divided between processors.  While a block is
+            analyzed, the fluid fields read from the grids of the data
+            dataset are kept, so that the halos of the block overlapping the
+            same grids read them once.  The results are identical to those
+            of analyzing halos one at a time.
+            Default: None
 
         See Also
         --------
         create
 
         """
-        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic)
+        self._run(save_halos, save_catalog, njobs=njobs, dynamic=dynamic,
+                  batch_size=batch_size)
 
     @parallel_blocking_call
-    def _run(self, save_halos, save_catalog, njobs=-1, dynamic=False):
+    def _run(self, save_halos, save_catalog, njobs=-1, dynamic=False,
+             batch_size=None):
         r"""
         Run the requested halo analysis.
 
@@ -392,6 +417,15 @@ class HaloCatalog(ParallelAnalysisInterface):
             If False, halo analysis is divided evenly between all available processors.
             If True, parallelism is performed via a task queue.
             Default: False
+        batch_size : int
+            If given, halos are sorted along a Morton curve through the
+            domain and analyzed in blocks of this many neighbors, and each
+            block is what is divided between processors.  While a block is
+            analyzed, the fluid fields read from the grids of the data
+            dataset are kept, so that the halos of the block overlapping the
+            same grids read them once.  The results are identical to those
+            of analyzing halos one at a time.
+            Default: None
 
         See Also
         --------
@@ -421,13 +455,17 @@ class HaloCatalog(ParallelAnalysisInterface):
             self.add_default_quantities('all')
 
         halo_index = np.argsort(self.data_source["all", "particle_identifier"])
+        nhalos = halo_index.size
+        if batch_size is not None:
+            halo_index = self._spatial_blocks(halo_index, batch_size)
         # If we have just run hop or fof, halos are already divided amongst processors.
         if self.finder_method_name in ["hop", "fof"]:
             my_index = halo_index
-            nhalos = self.comm.mpi_allreduce(halo_index.size, op="sum")
+            nhalos = self.comm.mpi_allreduce(nhalos, op="sum")
         else:
             my_index = parallel_objects(halo_index, njobs=njobs, dynamic=dynamic)
-            nhalos = halo_index.size
+        if batch_size is not None:
+            my_index = self._iterate_blocks(my_index)
 
         my_i = 0
         my_n = self.comm.size
@@ -469,9 +507,41 @@ class HaloCatalog(ParallelAnalysisInterface):
             pbar.update(my_i)
 
         self.catalog.sort(key=lambda a:a['particle_identifier'].to_ndarray())
+        if save_halos and batch_size is not None:
+            self.halo_list.sort(
+                key=lambda h:h.quantities['particle_identifier'].to_ndarray())
         if save_catalog:
             self.save_catalog()
 
+    def _spatial_blocks(self, halo_index, batch_size):
+        # Split the halos into blocks of neighbors along a Morton curve.
+        ds = self.halos_ds
+        nbits = 20
+        ipos = np.empty((halo_index.size, 3), dtype="uint64")
+        for i, ax in enumerate("xyz"):
+            pos = self.data_source["all", "particle_position_%s" % ax]
+            pos = ((pos - ds.domain_left_edge[i]) /
+                   ds.domain_width[i]).to_ndarray()[halo_index]
+            ipos[:, i] = np.clip(pos * (1 << nbits), 0, (1 << nbits) - 1)
+        order = halo_index[np.argsort(get_morton_indices(ipos),
+                                      kind="mergesort")]
+        return [order[start:start + batch_size]
+                for start in range(0, order.size, batch_size)]
+
+    def _iterate_blocks(self, blocks):
+        # Keep the grid data each block reads until it is done.
+        cached = None
+        if self.data_ds is not None:
+            cached = getattr(self.data_ds.index, "cached_grid_data", None)
+        for block in blocks:
+            if cached is None:
+                for i in block:
+                    yield i
+                continue
+            with cached():
+                for i in block:
+                    yield i
+
     def save_catalog(self):
         "Write out hdf5 file with all halo quantities."
 
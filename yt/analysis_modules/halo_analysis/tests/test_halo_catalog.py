@@ -23,8 +23,12 @@ from yt.analysis_modules.halo_analysis.api import \
     add_quantity
 from yt.convenience import \
     load
+from yt.frontends.ytdata.utilities import \
+    save_as_dataset
 from yt.testing import \
-    assert_equal
+    assert_equal, \
+    fake_random_ds, \
+    requires_module
 from yt.utilities.answer_testing.framework import \
     AnswerTestingTest, \
     data_dir_load, \
@@ -35,6 +39,10 @@ def _nstars(halo):
     return (sp["all", "creation_time"] > 0).sum()
 add_quantity("nstars", _nstars)
 
+def _total_density(halo):
+    return halo.data_object["gas", "density"].sum()
+add_quantity("total_density", _total_density)
+
 class HaloQuantityTest(AnswerTestingTest):
     _type_name = "HaloQuantity"
     _attrs = ()
@@ -81,3 +89,39 @@ e64 = "Enzo_64/DD0043/data0043"
 @requires_ds(e64)
 def test_halo_quantity():
     yield HaloQuantityTest(e64, rh0)
+
+@requires_module("h5py")
+def test_batched_halo_catalog():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ds = fake_random_ds(32, nprocs=16)
+        n_halos = 20
+        rs = np.random.RandomState(0x4d3d3d3)
+        pos = rs.random_sample((n_halos, 3))
+        data = {"particle_identifier": ds.arr(np.arange(n_halos), ""),
+                "particle_mass": ds.arr(np.ones(n_halos), "g"),
+                "virial_radius": ds.arr(0.05 + 0.1 * rs.random_sample(n_halos),
+                                        "code_length")}
+        for i, ax in enumerate("xyz"):
+            data["particle_position_%s" % ax] = ds.arr(pos[:, i],
+                                                       "code_length")
+        fn = os.path.join(tmpdir, "halos.0.h5")
+        save_as_dataset(ds, fn, data,
+                        field_types=dict((field, ".") for field in data),
+                        extra_attrs={"data_type": "halo_catalog",
+                                     "num_halos": n_halos})
+        hds = load(fn)
+        results = []
+        for batch_size in (None, 4):
+            hc = HaloCatalog(data_ds=ds, halos_ds=hds,
+                             output_dir=os.path.join(tmpdir, "catalog"))
+            hc.add_callback("sphere")
+            hc.add_quantity("total_density")
+            hc.create(save_halos=True, save_catalog=False,
+                      batch_size=batch_size)
+            assert_equal([halo.quantities["particle_identifier"]
+                          for halo in hc.halo_list], np.arange(n_halos))
+            results.append([halo["total_density"] for halo in hc.catalog])
+        assert_equal(results[0], results[1])
+    finally:
+        shutil.rmtree(tmpdir)
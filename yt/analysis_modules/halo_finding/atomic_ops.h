@@ -0,0 +1,37 @@
+/*******************************************************************************
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+*******************************************************************************/
+//
+// atomic_ops
+//   Lock-free updates of shared arrays for the thread-parallel halo finders
+//
+
+#include "numpy/npy_common.h"
+
+#ifdef _MSC_VER
+#include <intrin.h>
+static __inline int atomic_cas_int64(npy_int64 *ptr, npy_int64 oldval,
+                                     npy_int64 newval)
+{
+    return _InterlockedCompareExchange64((volatile __int64 *) ptr,
+                                         newval, oldval) == oldval;
+}
+#else
+static __inline int atomic_cas_int64(npy_int64 *ptr, npy_int64 oldval,
+                                     npy_int64 newval)
+{
+    return __sync_bool_compare_and_swap(ptr, oldval, newval);
+}
+#endif
+
+static __inline void atomic_add_float64(npy_float64 *ptr, npy_float64 value)
+{
+#ifdef _OPENMP
+#pragma omp atomic
+#endif
+    *ptr += value;
+}
@@ -34,6 +34,9 @@ from yt.utilities.physical_ratios import \
 
 from .hop.EnzoHop import RunHOP
 from .fof.EnzoFOF import RunFOF
+from .threaded_finders import \
+    threaded_fof, \
+    threaded_hop
 
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
     ParallelAnalysisInterface, \
@@ -1005,7 +1008,9 @@ class HOPHaloList(HaloList):
     """
     Run hop on *data_source* with a given density *threshold*.  If
     *dm_only* is True (default), only run it on the dark matter particles, otherwise
-    on all particles.  Returns an iterable collection of *HopGroup* items.
+    on all particles.  If *num_threads* is not None, the thread-parallel
+    implementation is run with that many threads, where 0 uses every core.
+    Returns an iterable collection of *HopGroup* items.
     """
     _name = "HOP"
     _halo_class = HOPHalo
@@ -1013,18 +1018,23 @@ class HOPHaloList(HaloList):
               ["particle_mass"]
 
     def __init__(self, data_source, threshold=160.0, dm_only=True,
-                 ptype=None):
+                 ptype=None, num_threads=None):
         self.threshold = threshold
+        self.num_threads = num_threads
         mylog.info("Initializing HOP")
         HaloList.__init__(self, data_source, dm_only, ptype=ptype)
 
     def _run_finder(self):
-        self.densities, self.tags = \
-            RunHOP(self.particle_fields["particle_position_x"] / self.period[0],
+        args = (self.particle_fields["particle_position_x"] / self.period[0],
                 self.particle_fields["particle_position_y"] / self.period[1],
                 self.particle_fields["particle_position_z"] / self.period[2],
                 self.particle_fields["particle_mass"].in_units('Msun'),
                 self.threshold)
+        if self.num_threads is None:
+            self.densities, self.tags = RunHOP(*args)
+        else:
+            self.densities, self.tags = \
+                threaded_hop(*args, num_threads=self.num_threads)
         self.particle_fields["densities"] = self.densities
         self.particle_fields["tags"] = self.tags
 
@@ -1052,18 +1062,22 @@ class FOFHaloList(HaloList):
     _halo_class = FOFHalo
 
     def __init__(self, data_source, link=0.2, dm_only=True, redshift=-1,
-                 ptype=None):
+                 ptype=None, num_threads=None):
         self.link = link
+        self.num_threads = num_threads
         mylog.info("Initializing FOF")
         HaloList.__init__(self, data_source, dm_only, redshift=redshift,
                           ptype=ptype)
 
     def _run_finder(self):
-        self.tags = \
-        RunFOF(self.particle_fields["particle_position_x"] / self.period[0],
-               self.particle_fields["particle_position_y"] / self.period[1],
-               self.particle_fields["particle_position_z"] / self.period[2],
-               self.link)
+        args = (self.particle_fields["particle_position_x"] / self.period[0],
+                self.particle_fields["particle_position_y"] / self.period[1],
+                self.particle_fields["particle_position_z"] / self.period[2],
+                self.link)
+        if self.num_threads is None:
+            self.tags = RunFOF(*args)
+        else:
+            self.tags = threaded_fof(*args, num_threads=self.num_threads)
         self.densities = np.ones(self.tags.size, dtype='float64') * -1
         self.particle_fields["densities"] = self.densities
         self.particle_fields["tags"] = self.tags
@@ -1456,6 +1470,11 @@ class HOPHaloFinder(GenericHaloFinder, HOPHaloList):
         mass in the entire volume.
         Default = None, which means the total mass is automatically
         calculated.
+    num_threads : int
+        If not None, the halos of each subvolume are found with the
+        thread-parallel implementation of the finder, using this many
+        threads, or every core if 0.  This needs no MPI and can be combined
+        with it.  Default = None, which runs the serial implementation.
 
     Examples
     --------
@@ -1463,7 +1482,7 @@ class HOPHaloFinder(GenericHaloFinder, HOPHaloList):
     >>> halos = HaloFinder(ds)
     """
     def __init__(self, ds, subvolume=None, threshold=160, dm_only=True,
-                 ptype=None, padding=0.02, total_mass=None):
+                 ptype=None, padding=0.02, total_mass=None, num_threads=None):
         if subvolume is not None:
             ds_LE = np.array(subvolume.left_edge)
             ds_RE = np.array(subvolume.right_edge)
@@ -1529,7 +1548,8 @@ class HOPHaloFinder(GenericHaloFinder, HOPHaloList):
                 self._data_source.quantities.total_quantity(
                     (self.ptype, "particle_mass")).in_units('Msun')
         HOPHaloList.__init__(self, self._data_source,
-            threshold * total_mass / sub_mass, dm_only, ptype=self.ptype)
+            threshold * total_mass / sub_mass, dm_only, ptype=self.ptype,
+            num_threads=num_threads)
         self._parse_halolist(total_mass / sub_mass)
 
 
@@ -1573,6 +1593,11 @@ class FOFHaloFinder(GenericHaloFinder, FOFHaloList):
         with duplicated particles for halo finding to work. This number
         must be no smaller than the radius of the largest halo in the box
         in code units. Default = 0.02.
+    num_threads : int
+        If not None, the halos of each subvolume are found with the
+        thread-parallel implementation of the finder, using this many
+        threads, or every core if 0.  This needs no MPI and can be combined
+        with it.  Default = None, which runs the serial implementation.
 
     Examples
     --------
@@ -1580,7 +1605,7 @@ class FOFHaloFinder(GenericHaloFinder, FOFHaloList):
     >>> halos = FOFHaloFinder(ds)
     """
     def __init__(self, ds, subvolume=None, link=0.2, dm_only=True,
-                 ptype=None, padding=0.02):
+                 ptype=None, padding=0.02, num_threads=None):
         if subvolume is not None:
             ds_LE = np.array(subvolume.left_edge)
             ds_RE = np.array(subvolume.right_edge)
@@ -1637,7 +1662,8 @@ class FOFHaloFinder(GenericHaloFinder, FOFHaloList):
         # here is where the FOF halo finder is run
         mylog.info("Using a linking length of %0.3e", linking_length)
         FOFHaloList.__init__(self, self._data_source, linking_length, dm_only,
-                             redshift=self.redshift, ptype=self.ptype)
+                             redshift=self.redshift, ptype=self.ptype,
+                             num_threads=num_threads)
         self._parse_halolist(1.)
 
 HaloFinder = HOPHaloFinder
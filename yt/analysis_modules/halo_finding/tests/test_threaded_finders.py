@@ -0,0 +1,76 @@
+"""
+Tests for the thread-parallel HOP and FOF halo finders.
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+
+from yt.analysis_modules.halo_finding.fof.EnzoFOF import \
+    RunFOF
+from yt.analysis_modules.halo_finding.hop.EnzoHop import \
+    RunHOP
+from yt.analysis_modules.halo_finding.threaded_finders import \
+    threaded_fof, \
+    threaded_hop
+from yt.testing import \
+    assert_array_equal, \
+    assert_equal, \
+    assert_rel_equal
+
+def _clustered_particles(n, nclusters=8):
+    np.random.seed(0x4d3d3d3)
+    centers = np.random.random((nclusters, 3))
+    # the first cluster straddles the periodic boundary
+    centers[0] = 0.995
+    npc = n // (2 * nclusters)
+    pos = [np.random.normal(c, 0.02, size=(npc, 3)) for c in centers]
+    pos.append(np.random.random((n - nclusters * npc, 3)))
+    pos = np.mod(np.concatenate(pos), 1.0)
+    return [pos[:, i].copy() for i in range(3)]
+
+def _same_partition(tags1, tags2):
+    # the groups are the same, even if ties in size are numbered differently
+    assert_array_equal(tags1 < 0, tags2 < 0)
+    grouped = tags1 >= 0
+    pairs = np.unique(tags1[grouped] * (tags2.max() + 1) + tags2[grouped])
+    assert_equal(pairs.size, np.unique(tags1[grouped]).size)
+    assert_equal(pairs.size, np.unique(tags2[grouped]).size)
+
+def test_threaded_fof():
+    x, y, z = _clustered_particles(8000)
+    link = 0.2 * x.size ** (-1. / 3.)
+    expected = RunFOF(x.astype("float32"), y.astype("float32"),
+                      z.astype("float32"), link)
+    for num_threads in (1, 4):
+        tags = threaded_fof(x, y, z, link, num_threads=num_threads)
+        _same_partition(expected, tags)
+        sizes = np.bincount(tags[tags >= 0])
+        assert_array_equal(sizes, np.sort(sizes)[::-1])
+        assert sizes.min() >= 8
+
+def test_threaded_hop():
+    x, y, z = _clustered_particles(8000)
+    mass = np.random.random(x.size) + 0.5
+    expected_dens, expected_tags = RunHOP(x, y, z, mass, 160.0)
+    for num_threads in (1, 4):
+        dens, tags = threaded_hop(x, y, z, mass, 160.0,
+                                  num_threads=num_threads)
+        # RunHOP computes the densities in single precision
+        assert_rel_equal(dens, expected_dens, 4)
+        _same_partition(expected_tags, tags)
+
+def test_few_particles():
+    x, y, z = _clustered_particles(40, nclusters=1)
+    dens, tags = threaded_hop(x, y, z, np.ones(x.size))
+    assert_array_equal(tags, -1)
+    assert_equal(threaded_fof(x[:0], y[:0], z[:0], 0.1).size, 0)
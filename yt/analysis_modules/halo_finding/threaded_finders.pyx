@@ -0,0 +1,775 @@
+"""
+Thread-parallel friends-of-friends and HOP halo finders
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+cimport cython
+cimport numpy as np
+import numpy as np
+from libc.math cimport sqrt, M_PI
+from libc.stdlib cimport malloc, realloc, free
+from cython.parallel cimport prange, parallel
+
+cdef extern from "atomic_ops.h":
+    bint atomic_cas_int64(np.int64_t *ptr, np.int64_t oldval,
+                          np.int64_t newval) nogil
+    void atomic_add_float64(np.float64_t *ptr, np.float64_t value) nogil
+
+cdef np.int64_t LEAF_SIZE = 16
+# traversal stacks never hold more than two nodes per level of the tree
+cdef int STACK_SIZE = 128
+
+# The HOP parameters fixed by hop_main and regroup_main of the C
+# implementation: densities are smoothed over the 64 nearest particles,
+# which are also those a particle may hop to, and groups share a boundary
+# where a particle has one of the other group among its 5 nearest.
+cdef int HOP_NSMOOTH = 65
+cdef int HOP_NHOP = 64
+cdef int HOP_NMERGE = 5
+cdef np.float64_t HOP_PEAK = 3.0
+cdef np.float64_t HOP_SADDLE = 2.5
+cdef np.float64_t MINDENS = -1.e30/3.0
+
+@cython.cdivision(True)
+cdef inline np.float64_t periodic_dist2(np.float64_t *a,
+                                        np.float64_t *b) nogil:
+    cdef np.float64_t d, r2 = 0.0
+    cdef int i
+    for i in range(3):
+        d = a[i] - b[i]
+        if d > 0.5:
+            d -= 1.0
+        elif d < -0.5:
+            d += 1.0
+        r2 += d*d
+    return r2
+
+cdef inline np.float64_t box_dist2(np.float64_t *x,
+                                   np.float64_t *bbox) nogil:
+    # the squared distance from x to the nearest periodic image of a box,
+    # whose left and right edges are the first and last three values
+    cdef np.float64_t d, dw, r2 = 0.0
+    cdef int i
+    for i in range(3):
+        if x[i] < bbox[i]:
+            d = bbox[i] - x[i]
+            dw = x[i] + 1.0 - bbox[i + 3]
+        elif x[i] > bbox[i + 3]:
+            d = x[i] - bbox[i + 3]
+            dw = bbox[i] + 1.0 - x[i]
+        else:
+            continue
+        if dw < d:
+            d = dw
+        r2 += d*d
+    return r2
+
+cdef inline void heap_push(np.float64_t *hd, np.int64_t *hi, int n,
+                           np.float64_t d, np.int64_t j) nogil:
+    # add an item to a max-heap of n items
+    cdef int c = n, p
+    while c > 0:
+        p = (c - 1) >> 1
+        if hd[p] >= d:
+            break
+        hd[c] = hd[p]
+        hi[c] = hi[p]
+        c = p
+    hd[c] = d
+    hi[c] = j
+
+cdef inline void heap_replace(np.float64_t *hd, np.int64_t *hi, int n,
+                              np.float64_t d, np.int64_t j) nogil:
+    # replace the largest item of a max-heap of n items
+    cdef int p = 0, c
+    while True:
+        c = 2*p + 1
+        if c >= n:
+            break
+        if c + 1 < n and hd[c + 1] > hd[c]:
+            c += 1
+        if hd[c] <= d:
+            break
+        hd[p] = hd[c]
+        hi[p] = hi[c]
+        p = c
+    hd[p] = d
+    hi[p] = j
+
+cdef inline void sort_neighbors(np.float64_t *hd, np.int64_t *hi,
+                                int n) nogil:
+    # insertion sort by distance, which is quick for the short lists here
+    cdef int i, j
+    cdef np.float64_t d
+    cdef np.int64_t ind
+    for i in range(1, n):
+        d = hd[i]
+        ind = hi[i]
+        j = i - 1
+        while j >= 0 and hd[j] > d:
+            hd[j + 1] = hd[j]
+            hi[j + 1] = hi[j]
+            j -= 1
+        hd[j + 1] = d
+        hi[j + 1] = ind
+
+cdef inline np.int64_t uf_find(np.int64_t *parent, np.int64_t i) nogil:
+    # Find the root of i, halving the path on the way.  Only roots are ever
+    # relinked, so a pointer to a grandparent written by one thread is
+    # always still an ancestor for the others.
+    cdef np.int64_t p, gp
+    while True:
+        p = parent[i]
+        if p == i:
+            return i
+        gp = parent[p]
+        if gp != p:
+            parent[i] = gp
+        i = gp
+
+cdef inline void uf_union(np.int64_t *parent, np.int64_t a,
+                          np.int64_t b) nogil:
+    # Link the larger of two roots to the smaller, retrying whenever another
+    # thread relinked either of them first.  Every root is thus the lowest
+    # index of its set.
+    cdef np.int64_t t
+    while True:
+        a = uf_find(parent, a)
+        b = uf_find(parent, b)
+        if a == b:
+            return
+        if a < b:
+            t = a
+            a = b
+            b = t
+        if atomic_cas_int64(&parent[a], a, b):
+            return
+
+cdef void select_nth(np.int64_t *idx, np.float64_t *pos, int ax,
+                     np.int64_t lo, np.int64_t hi, np.int64_t k) nogil:
+    # Reorder idx[lo:hi] so that no particle before k has a larger
+    # coordinate ax than any particle from k on.
+    cdef np.int64_t i, j, t
+    cdef np.float64_t a, b, c, pivot
+    hi -= 1
+    while hi > lo:
+        # the pivot is the median of the first, middle and last values
+        a = pos[3*idx[lo] + ax]
+        b = pos[3*idx[lo + (hi - lo)//2] + ax]
+        c = pos[3*idx[hi] + ax]
+        if a > b:
+            a, b = b, a
+        pivot = b if b < c else (a if a > c else c)
+        i = lo
+        j = hi
+        while i <= j:
+            while pos[3*idx[i] + ax] < pivot:
+                i += 1
+            while pos[3*idx[j] + ax] > pivot:
+                j -= 1
+            if i <= j:
+                t = idx[i]
+                idx[i] = idx[j]
+                idx[j] = t
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            return
+
+cdef struct BoundaryBuffer:
+    np.int64_t n
+    np.int64_t size
+    np.int64_t *groups
+    np.float64_t *dens
+
+cdef inline int add_boundary(BoundaryBuffer *buf, np.int64_t g1,
+                             np.int64_t g2, np.float64_t dens) nogil:
+    # Returns -1, leaving the buffer as it was, if it could not be grown.
+    cdef np.int64_t *groups
+    cdef np.float64_t *bdens
+    if buf.n == buf.size:
+        groups = <np.int64_t *> realloc(
+            buf.groups, 4*buf.size*sizeof(np.int64_t))
+        if groups == NULL:
+            return -1
+        buf.groups = groups
+        bdens = <np.float64_t *> realloc(
+            buf.dens, 2*buf.size*sizeof(np.float64_t))
+        if bdens == NULL:
+            return -1
+        buf.dens = bdens
+        buf.size = 2*buf.size
+    buf.groups[2*buf.n] = g1
+    buf.groups[2*buf.n + 1] = g2
+    buf.dens[buf.n] = dens
+    buf.n += 1
+    return 0
+
+cdef class ParticleTree:
+    r"""A balanced kd-tree over particles in a periodic unit box.
+
+    Every node splits its particles in half at the median of their widest
+    dimension, down to leaves of at most 16 particles.  The nodes of each
+    level are split by all threads at once, and as the particles are sorted
+    into the order of the leaves, only the ranges of particles and the
+    bounding boxes of the nodes have to be stored.
+
+    Parameters
+    ----------
+    pos : array of floats, shape (N, 3)
+        The particle positions, all in [0, 1).
+    num_threads : int
+        The number of threads to use, where 0 uses every core.
+    """
+    cdef readonly np.int64_t num_particles
+    cdef readonly np.int64_t first_leaf
+    cdef np.float64_t[:, ::1] pos
+    cdef np.int64_t[:] start
+    cdef np.int64_t[:] end
+    cdef np.float64_t[:, ::1] bbox
+    cdef readonly object order
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    def __init__(self, pos, int num_threads = 0):
+        pos = np.ascontiguousarray(pos, dtype="float64")
+        cdef np.int64_t n = pos.shape[0]
+        cdef int depth = 0
+        while (n >> depth) > LEAF_SIZE:
+            depth += 1
+        cdef np.int64_t nleaves = 1 << depth
+        self.num_particles = n
+        self.first_leaf = nleaves - 1
+        leaves = np.arange(nleaves + 1, dtype="int64") * n // nleaves
+        start = np.empty(2*nleaves - 1, dtype="int64")
+        end = np.empty(2*nleaves - 1, dtype="int64")
+        start[nleaves - 1:] = leaves[:nleaves]
+        end[nleaves - 1:] = leaves[1:]
+        for level in range(depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (1 << (level + 1)) - 1)
+            start[nodes] = start[2*nodes + 1]
+            end[nodes] = end[2*nodes + 2]
+        self.start = start
+        self.end = end
+        self.bbox = np.empty((2*nleaves - 1, 6), dtype="float64")
+        order = np.arange(n, dtype="int64")
+        cdef np.int64_t[:] idx = order
+        cdef np.float64_t[:, ::1] ppos = pos
+        cdef np.int64_t k, first
+        cdef int lev
+        if n > 0:
+            for lev in range(depth):
+                first = (1 << lev) - 1
+                with nogil:
+                    for k in prange(first + 1, num_threads=num_threads,
+                                    schedule="dynamic"):
+                        self._split(first + k, &idx[0], &ppos[0, 0])
+        self.order = order
+        self.pos = pos[order]
+        with nogil:
+            for k in prange(nleaves, num_threads=num_threads):
+                self._node_bbox(nleaves - 1 + k, NULL, &self.pos[0, 0])
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _node_bbox(self, np.int64_t node, np.int64_t *idx,
+                         np.float64_t *pos) nogil:
+        # the bounding box of the particles of a node, which are those
+        # listed in idx or, without idx, those stored in its range
+        cdef np.int64_t i, p
+        cdef int j
+        for j in range(3):
+            self.bbox[node, j] = 1.0
+            self.bbox[node, j + 3] = 0.0
+        for i in range(self.start[node], self.end[node]):
+            p = i if idx == NULL else idx[i]
+            for j in range(3):
+                if pos[3*p + j] < self.bbox[node, j]:
+                    self.bbox[node, j] = pos[3*p + j]
+                if pos[3*p + j] > self.bbox[node, j + 3]:
+                    self.bbox[node, j + 3] = pos[3*p + j]
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _split(self, np.int64_t node, np.int64_t *idx,
+                     np.float64_t *pos) nogil:
+        cdef int j, ax = 0
+        self._node_bbox(node, idx, pos)
+        for j in range(1, 3):
+            if self.bbox[node, j + 3] - self.bbox[node, j] > \
+               self.bbox[node, ax + 3] - self.bbox[node, ax]:
+                ax = j
+        select_nth(idx, pos, ax, self.start[node], self.end[node],
+                   self.end[2*node + 1])
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int knn(self, np.int64_t pi, int k, np.float64_t *hd,
+                 np.int64_t *hi, np.int64_t *stack) nogil:
+        # Fill a max-heap with the k particles nearest to particle pi,
+        # including itself, and return how many were found.
+        cdef np.float64_t *x = &self.pos[pi, 0]
+        cdef np.float64_t d2, dl, dr
+        cdef np.int64_t node, j, c
+        cdef int n = 0, top = 1
+        stack[0] = 0
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            if n == k and box_dist2(x, &self.bbox[node, 0]) >= hd[0]:
+                continue
+            if node >= self.first_leaf:
+                for j in range(self.start[node], self.end[node]):
+                    d2 = periodic_dist2(x, &self.pos[j, 0])
+                    if n < k:
+                        heap_push(hd, hi, n, d2, j)
+                        n += 1
+                    elif d2 < hd[0]:
+                        heap_replace(hd, hi, k, d2, j)
+                continue
+            # the nearer child is searched first
+            c = 2*node + 1
+            dl = box_dist2(x, &self.bbox[c, 0])
+            dr = box_dist2(x, &self.bbox[c + 1, 0])
+            if dl <= dr:
+                stack[top] = c + 1
+                stack[top + 1] = c
+            else:
+                stack[top] = c
+                stack[top + 1] = c + 1
+            top += 2
+        return n
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void link_neighbors(self, np.int64_t pi, np.float64_t link2,
+                             np.int64_t *parent, np.int64_t *stack) nogil:
+        # Join particle pi with every particle after it closer than the
+        # linking length.
+        cdef np.float64_t *x = &self.pos[pi, 0]
+        cdef np.int64_t node, j
+        cdef int top = 1
+        stack[0] = 0
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            if self.end[node] <= pi + 1:
+                continue
+            if box_dist2(x, &self.bbox[node, 0]) >= link2:
+                continue
+            if node < self.first_leaf:
+                stack[top] = 2*node + 1
+                stack[top + 1] = 2*node + 2
+                top += 2
+                continue
+            for j in range(max(self.start[node], pi + 1), self.end[node]):
+                if periodic_dist2(x, &self.pos[j, 0]) < link2:
+                    uf_union(parent, pi, j)
+
+def _unit_positions(xpos, ypos, zpos):
+    pos = np.empty((np.asarray(xpos).size, 3), dtype="float64")
+    for i, ax in enumerate((xpos, ypos, zpos)):
+        pos[:, i] = np.mod(np.asarray(ax, dtype="float64"), 1.0)
+    # np.mod can round values just below zero up to 1.0
+    pos[pos >= 1.0] = 0.0
+    return pos
+
+def _number_groups(roots, np.int64_t min_members):
+    # Number the groups, given by the root of each particle, by decreasing
+    # size, with -1 for groups smaller than min_members.
+    counts = np.bincount(roots, minlength=roots.size)
+    groups = np.where(counts >= max(min_members, 1))[0]
+    groups = groups[np.argsort(-counts[groups], kind="mergesort")]
+    number = np.empty(roots.size, dtype="int64")
+    number.fill(-1)
+    number[groups] = np.arange(groups.size)
+    return number[roots]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def threaded_fof(xpos, ypos, zpos, np.float64_t link,
+                 int min_members = 8, int num_threads = 0):
+    r"""Find friends-of-friends groups of particles in a periodic unit box.
+
+    This is a thread-parallel counterpart of ``RunFOF``.  The particles are
+    put in a :class:`ParticleTree` and every thread links the particles it
+    is handed with their neighbors closer than *link*, joining their groups
+    in a union-find structure shared by all threads.  Groups are joined with
+    atomic compare-and-swap operations rather than locks.
+
+    Parameters
+    ----------
+    xpos, ypos, zpos : arrays of floats
+        The particle positions, in units of the box size.
+    link : float
+        The linking length, in units of the box size.
+    min_members : int
+        Groups with fewer particles than this are discarded.  Default: 8.
+    num_threads : int
+        The number of threads to use, where 0 uses every core.  Default: 0.
+
+    Returns
+    -------
+    tags : array of ints
+        The group of each particle, with groups numbered from 0 by
+        decreasing size, or -1 for particles not in a group.
+    """
+    pos = _unit_positions(xpos, ypos, zpos)
+    cdef np.int64_t n = pos.shape[0]
+    if n == 0:
+        return np.empty(0, dtype="int32")
+    cdef ParticleTree tree = ParticleTree(pos, num_threads)
+    parent_arr = np.arange(n, dtype="int64")
+    cdef np.int64_t[:] parent = parent_arr
+    cdef np.float64_t link2 = link*link
+    cdef np.int64_t i
+    cdef np.int64_t *stack
+    # Set if the stack of any thread could not be allocated
+    cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+    with nogil, parallel(num_threads=num_threads):
+        stack = <np.int64_t *> malloc(STACK_SIZE*sizeof(np.int64_t))
+        if stack == NULL:
+            failed[0] = 1
+        for i in prange(n, schedule="dynamic", chunksize=256):
+            if stack == NULL:
+                continue
+            tree.link_neighbors(i, link2, &parent[0], stack)
+        free(stack)
+    if failed[0]:
+        raise MemoryError
+    with nogil:
+        for i in prange(n, num_threads=num_threads):
+            parent[i] = uf_find(&parent[0], i)
+    tags = np.empty(n, dtype="int32")
+    tags[tree.order] = _number_groups(parent_arr, min_members)
+    return tags
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def threaded_hop(xpos, ypos, zpos, mass, np.float64_t threshold = 160.0,
+                 np.float64_t normalize_to = 1.0, int num_threads = 0):
+    r"""Find HOP groups of particles in a periodic unit box.
+
+    This is a thread-parallel counterpart of ``RunHOP``, following the same
+    steps with the same parameters (Eisenstein & Hut 1998).  The density of
+    every particle is smoothed over its 64 nearest neighbors, each particle
+    hops to its densest neighbor, and the chains of hops end at the density
+    peaks that define the initial groups.  The densities and hops are found
+    by all threads at once, with the symmetric density contributions added
+    atomically.  The densest boundaries between the groups are then
+    gathered in parallel, and groups are merged and cut at *threshold* as
+    the ``regroup`` step of the C implementation does.
+
+    Parameters
+    ----------
+    xpos, ypos, zpos : arrays of floats
+        The particle positions, in units of the box size.
+    mass : array of floats
+        The particle masses.
+    threshold : float
+        The outer density threshold, relative to the mean density.  Groups
+        are merged across boundaries denser than 2.5 times this, and only
+        groups peaking above 3 times this may be centers.  Default: 160.
+    normalize_to : float
+        The total mass is divided by this when computing the mean density.
+        Default: 1.
+    num_threads : int
+        The number of threads to use, where 0 uses every core.  Default: 0.
+
+    Returns
+    -------
+    densities : array of floats
+        The density of each particle, relative to the mean density.
+    tags : array of ints
+        The group of each particle, with groups numbered from 0 by
+        decreasing size, or -1 for particles not in a group.
+    """
+    pos = _unit_positions(xpos, ypos, zpos)
+    cdef np.int64_t n = pos.shape[0]
+    mass = np.asarray(mass, dtype="float64")
+    if n < HOP_NSMOOTH:
+        tags = np.empty(n, dtype="int32")
+        tags.fill(-1)
+        return np.zeros(n, dtype="float64"), tags
+    cdef ParticleTree tree = ParticleTree(pos, num_threads)
+    cdef np.float64_t[:] m = mass[tree.order] * (normalize_to / mass.sum())
+    dens_arr = np.zeros(n, dtype="float64")
+    hop_arr = np.empty(n, dtype="int64")
+    cdef np.float64_t[:] dens = dens_arr
+    cdef np.int64_t[:] hop = hop_arr
+    cdef np.int64_t i, j, best
+    cdef int k, s
+    cdef np.float64_t ih2, fnorm, r2, rs, di, maxden
+    cdef np.float64_t *hd
+    cdef np.int64_t *hi
+    cdef np.int64_t *stack
+    # Set if the buffers of any thread could not be allocated
+    cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+    cdef int allocated
+    with nogil, parallel(num_threads=num_threads):
+        hd = <np.float64_t *> malloc(HOP_NSMOOTH*sizeof(np.float64_t))
+        hi = <np.int64_t *> malloc(HOP_NSMOOTH*sizeof(np.int64_t))
+        stack = <np.int64_t *> malloc(STACK_SIZE*sizeof(np.int64_t))
+        allocated = hd != NULL and hi != NULL and stack != NULL
+        if not allocated:
+            failed[0] = 1
+        for i in prange(n, schedule="dynamic", chunksize=64):
+            if not allocated:
+                continue
+            # The 64 nearest particles are smoothed over a kernel reaching
+            # the 65th, which is at the top of the heap.
+            k = tree.knn(i, HOP_NSMOOTH, hd, hi, stack)
+            ih2 = 4.0/hd[0]
+            fnorm = 0.5*ih2*sqrt(ih2)/M_PI
+            di = 0.0
+            for s in range(1, k):
+                r2 = hd[s]*ih2
+                rs = 2.0 - sqrt(r2)
+                if r2 < 1.0:
+                    rs = 1.0 - 0.75*rs*r2
+                else:
+                    rs = 0.25*rs*rs*rs
+                rs = rs*fnorm
+                di = di + rs*m[hi[s]]
+                atomic_add_float64(&dens[hi[s]], rs*m[i])
+            atomic_add_float64(&dens[i], di)
+        for i in prange(n, schedule="dynamic", chunksize=64):
+            if not allocated:
+                continue
+            k = tree.knn(i, HOP_NSMOOTH, hd, hi, stack)
+            sort_neighbors(hd, hi, k)
+            best = i
+            maxden = 0.0
+            for s in range(min(k - 1, HOP_NHOP)):
+                if dens[hi[s]] > maxden:
+                    best = hi[s]
+                    maxden = dens[hi[s]]
+            hop[i] = best
+        free(hd)
+        free(hi)
+        free(stack)
+    if failed[0]:
+        raise MemoryError
+    # Two particles hopping to each other have the same density; the later
+    # one becomes the peak, as it does in the C implementation.
+    cdef np.int64_t[:] root = np.empty(n, dtype="int64")
+    with nogil:
+        for i in prange(n, num_threads=num_threads):
+            if hop[i] < i and hop[hop[i]] == i:
+                hop[i] = i
+    with nogil:
+        for i in prange(n, num_threads=num_threads):
+            j = i
+            while hop[j] != j:
+                j = hop[j]
+            root[i] = j
+    group_arr = _number_groups(np.asarray(root), 1)
+    peaks = np.where(hop_arr == np.arange(n))[0]
+    gdens = np.empty(peaks.size, dtype="float64")
+    gdens[group_arr[peaks]] = dens_arr[peaks]
+    g1, g2, bdens = _group_boundaries(tree, group_arr, dens_arr, num_threads)
+    idmerge = _merge_groups(gdens, g1, g2, bdens, HOP_PEAK*threshold,
+                            HOP_SADDLE*threshold, threshold)
+    # Particles below the threshold are cut, and the merged groups are
+    # numbered by decreasing size.
+    merged = idmerge[group_arr]
+    merged[dens_arr < threshold] = -1
+    nmerged = idmerge.max() + 1
+    gsize = np.bincount(merged[merged >= 0], minlength=nmerged)
+    newnum = np.empty(nmerged + 1, dtype="int64")
+    newnum[np.argsort(-gsize, kind="mergesort")] = np.arange(nmerged)
+    newnum[nmerged] = -1
+    densities = np.empty(n, dtype="float64")
+    densities[tree.order] = dens_arr
+    tags = np.empty(n, dtype="int32")
+    tags[tree.order] = newnum[merged]
+    return densities, tags
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _group_boundaries(ParticleTree tree, np.int64_t[:] group,
+                      np.float64_t[:] dens, int num_threads):
+    # For every pair of groups that are neighbors, the highest average
+    # density of a particle and one of its 5 nearest in the other group.
+    cdef np.int64_t n = group.shape[0]
+    cdef np.int64_t i, j, g1, g2
+    cdef int k, s
+    cdef np.float64_t *hd
+    cdef np.int64_t *hi
+    cdef np.int64_t *stack
+    cdef BoundaryBuffer *buf
+    # Set if the buffers of any thread could not be allocated or grown
+    cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+    cdef int allocated
+    pieces = []
+    with nogil, parallel(num_threads=num_threads):
+        hd = <np.float64_t *> malloc(HOP_NMERGE*sizeof(np.float64_t))
+        hi = <np.int64_t *> malloc(HOP_NMERGE*sizeof(np.int64_t))
+        stack = <np.int64_t *> malloc(STACK_SIZE*sizeof(np.int64_t))
+        buf = <BoundaryBuffer *> malloc(sizeof(BoundaryBuffer))
+        if buf != NULL:
+            buf.n = 0
+            buf.size = 1024
+            buf.groups = <np.int64_t *> malloc(2*buf.size*sizeof(np.int64_t))
+            buf.dens = <np.float64_t *> malloc(buf.size*sizeof(np.float64_t))
+        allocated = hd != NULL and hi != NULL and stack != NULL and \
+                    buf != NULL and buf.groups != NULL and buf.dens != NULL
+        if not allocated:
+            failed[0] = 1
+        for i in prange(n, schedule="dynamic", chunksize=64):
+            if not allocated:
+                continue
+            k = tree.knn(i, HOP_NMERGE, hd, hi, stack)
+            for s in range(k):
+                j = hi[s]
+                if group[j] == group[i]:
+                    continue
+                g1 = min(group[i], group[j])
+                g2 = max(group[i], group[j])
+                if add_boundary(buf, g1, g2, 0.5*(dens[i] + dens[j])) < 0:
+                    failed[0] = 1
+        if failed[0] == 0:
+            with gil:
+                if buf.n > 0:
+                    pieces.append((
+                        np.array(<np.int64_t[:2*buf.n]> buf.groups),
+                        np.array(<np.float64_t[:buf.n]> buf.dens)))
+        if buf != NULL:
+            free(buf.groups)
+            free(buf.dens)
+            free(buf)
+        free(hd)
+        free(hi)
+        free(stack)
+    if failed[0]:
+        raise MemoryError
+    if len(pieces) == 0:
+        return (np.empty(0, dtype="int64"), np.empty(0, dtype="int64"),
+                np.empty(0, dtype="float64"))
+    pairs = np.concatenate([p[0] for p in pieces]).reshape(-1, 2)
+    bdens = np.concatenate([p[1] for p in pieces])
+    order = np.lexsort((bdens, pairs[:, 1], pairs[:, 0]))
+    pairs = pairs[order]
+    bdens = bdens[order]
+    # the densest boundary of each pair is the last of its run
+    nb = bdens.size
+    last = np.ones(nb, dtype="bool")
+    last[:nb - 1] = np.any(pairs[1:] != pairs[:nb - 1], axis=1)
+    return (np.ascontiguousarray(pairs[last, 0]),
+            np.ascontiguousarray(pairs[last, 1]), bdens[last])
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _merge_groups(np.float64_t[:] gdens, np.int64_t[:] g1s,
+                  np.int64_t[:] g2s, np.float64_t[:] bdens,
+                  np.float64_t peak_thresh, np.float64_t saddle_thresh,
+                  np.float64_t dens_thresh):
+    # The merging of merge_groups_boundaries in hop_regroup.c: groups peaking
+    # above peak_thresh are joined across boundaries denser than
+    # saddle_thresh, and the other groups join the group they share their
+    # densest boundary with, if it is above dens_thresh.  Returns the merged
+    # group of each group, or -1.
+    cdef np.int64_t ngroups = gdens.shape[0]
+    cdef np.int64_t nb = g1s.shape[0]
+    idmerge_arr = np.empty(ngroups, dtype="int64")
+    cdef np.int64_t[:] idmerge = idmerge_arr
+    cdef np.float64_t[:] densestbound = np.empty(ngroups, dtype="float64")
+    cdef np.int64_t[:] densestboundgroup = np.empty(ngroups, dtype="int64")
+    cdef np.int64_t[:] fringe = np.empty(nb, dtype="int64")
+    cdef np.int64_t j, b, g1, g2, t, nfringe = 0, nnew = 0, changes
+    cdef np.float64_t d
+    if dens_thresh < MINDENS:
+        dens_thresh = MINDENS
+    with nogil:
+        for j in range(ngroups):
+            if gdens[j] < peak_thresh:
+                idmerge[j] = -1
+            else:
+                idmerge[j] = j
+            densestbound[j] = 2.0*MINDENS
+            densestboundgroup[j] = -1
+        for b in range(nb):
+            g1 = g1s[b]
+            g2 = g2s[b]
+            d = bdens[b]
+            if gdens[g1] < peak_thresh and gdens[g2] < peak_thresh:
+                if gdens[g1] > dens_thresh and gdens[g2] > dens_thresh and \
+                   d > dens_thresh:
+                    fringe[nfringe] = b
+                    nfringe += 1
+                continue
+            if gdens[g1] >= peak_thresh and gdens[g2] >= peak_thresh:
+                if d < saddle_thresh:
+                    continue
+                while g1 != idmerge[g1]:
+                    g1 = idmerge[g1]
+                while g2 != idmerge[g2]:
+                    g2 = idmerge[g2]
+                if g1 < g2:
+                    idmerge[g2] = g1
+                else:
+                    idmerge[g1] = g2
+                continue
+            if gdens[g1] < gdens[g2]:
+                t = g1
+                g1 = g2
+                g2 = t
+            if d > densestbound[g2]:
+                densestbound[g2] = d
+                densestboundgroup[g2] = g1
+        # Propagate connections to the dense groups along the boundaries
+        # between the other groups.
+        changes = 1
+        while changes > 0:
+            changes = 0
+            for b in range(nfringe):
+                g1 = g1s[fringe[b]]
+                g2 = g2s[fringe[b]]
+                d = bdens[fringe[b]]
+                if densestbound[g2] > densestbound[g1]:
+                    t = g1
+                    g1 = g2
+                    g2 = t
+                if d > densestbound[g2] and \
+                   densestbound[g1] > densestbound[g2]:
+                    changes += 1
+                    if d < densestbound[g1]:
+                        densestbound[g2] = d
+                    else:
+                        densestbound[g2] = densestbound[g1]
+                    densestboundgroup[g2] = densestboundgroup[g1]
+        for j in range(ngroups):
+            if densestbound[j] >= dens_thresh:
+                idmerge[j] = densestboundgroup[j]
+        for j in range(ngroups):
+            if idmerge[j] == j:
+                idmerge[j] = -2 - nnew
+                nnew += 1
+        for j in range(ngroups):
+            if idmerge[j] < 0:
+                continue
+            g1 = j
+            while True:
+                g1 = idmerge[g1]
+                if g1 < 0:
+                    break
+            idmerge[j] = g1
+        for j in range(ngroups):
+            idmerge[j] = -2 - idmerge[j]
+    return idmerge_arr
@@ -27,6 +27,8 @@ import numpy as np
 from yt.funcs import mylog, get_pbar
 from yt.units.yt_array import YTArray
 from yt.utilities.physical_constants import mp
+from yt.utilities.parallel_tools.local_parallelism import \
+     local_imap
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
      parallel_objects
 from yt.units.yt_array import uconcatenate
@@ -89,37 +91,15 @@ class ThermalPhotonModel(PhotonModel):
 
     def __call__(self, data_source, parameters):
 
-        ds = data_source.ds
-
-        exp_time = parameters["FiducialExposureTime"]
-        area = parameters["FiducialArea"]
-        redshift = parameters["FiducialRedshift"]
-        D_A = parameters["FiducialAngularDiameterDistance"].in_cgs()
-        dist_fac = 1.0/(4.*np.pi*D_A.value*D_A.value*(1.+redshift)**2)
-        src_ctr = parameters["center"]
-
-        my_kT_min, my_kT_max = data_source.quantities.extrema("kT")
-
-        self.spectral_model.prepare_spectrum(redshift)
-        emid = self.spectral_model.emid
-        ebins = self.spectral_model.ebins
-        nchan = len(emid)
+        setup = self._setup(data_source, parameters)
 
         citer = data_source.chunks([], "io")
 
         photons = {}
-        photons["x"] = []
-        photons["y"] = []
-        photons["z"] = []
-        photons["vx"] = []
-        photons["vy"] = []
-        photons["vz"] = []
-        photons["dx"] = []
-        photons["Energy"] = []
+        for key in photon_units:
+            photons[key] = []
         photons["NumberOfPhotons"] = []
 
-        spectral_norm = area.v*exp_time.v*dist_fac
-
         tot_num_cells = data_source.ires.shape[0]
 
         pbar = get_pbar("Generating photons ", tot_num_cells)
@@ -128,121 +108,14 @@ class ThermalPhotonModel(PhotonModel):
 
         for chunk in parallel_objects(citer):
 
-            kT = chunk["kT"].v
-            num_cells = len(kT)
-            if num_cells == 0:
+            chunk_photons, num_cells = \
+              self._generate_photons(chunk, setup, self.prng)
+            cell_counter += num_cells
+            pbar.update(cell_counter)
+            if chunk_photons is None:
                 continue
-            vol = chunk["cell_volume"].in_cgs().v
-            EM = (chunk["density"]/mp).in_cgs().v**2
-            EM *= 0.5*(1.+self.X_H)*self.X_H*vol
-
-            if isinstance(self.Zmet, string_types):
-                metalZ = chunk[self.Zmet].v
-            else:
-                metalZ = self.Zmet*np.ones(num_cells)
-
-            idxs = np.argsort(kT)
-
-            kT_bins = np.linspace(kT_min, max(my_kT_max.v, kT_max), num=n_kT+1)
-            dkT = kT_bins[1]-kT_bins[0]
-            kT_idxs = np.digitize(kT[idxs], kT_bins)
-            kT_idxs = np.minimum(np.maximum(1, kT_idxs), n_kT) - 1
-            bcounts = np.bincount(kT_idxs).astype("int")
-            bcounts = bcounts[bcounts > 0]
-            n = int(0)
-            bcell = []
-            ecell = []
-            for bcount in bcounts:
-                bcell.append(n)
-                ecell.append(n+bcount)
-                n += bcount
-            kT_idxs = np.unique(kT_idxs)
-
-            cell_em = EM[idxs]*spectral_norm
-
-            number_of_photons = np.zeros(num_cells, dtype="uint64")
-            energies = np.zeros(self.photons_per_chunk)
-
-            start_e = 0
-            end_e = 0
-
-            for ibegin, iend, ikT in zip(bcell, ecell, kT_idxs):
-
-                kT = kT_bins[ikT] + 0.5*dkT
-
-                n_current = iend-ibegin
-
-                cem = cell_em[ibegin:iend]
-
-                cspec, mspec = self.spectral_model.get_spectrum(kT)
-
-                tot_ph_c = cspec.d.sum()
-                tot_ph_m = mspec.d.sum()
-
-                u = self.prng.uniform(size=n_current)
-
-                cell_norm_c = tot_ph_c*cem
-                cell_norm_m = tot_ph_m*metalZ[ibegin:iend]*cem
-                cell_norm = np.modf(cell_norm_c + cell_norm_m)
-                cell_n = np.uint64(cell_norm[1]) + np.uint64(cell_norm[0] >= u)
-
-                number_of_photons[ibegin:iend] = cell_n
-
-                end_e += int(cell_n.sum())
-
-                if end_e > self.photons_per_chunk:
-                    raise RuntimeError("Number of photons generated for this chunk "+
-                                       "exceeds photons_per_chunk (%d)! " % self.photons_per_chunk +
-                                       "Increase photons_per_chunk!")
-
-                if self.method == "invert_cdf":
-                    cumspec_c = np.cumsum(cspec.d)
-                    cumspec_m = np.cumsum(mspec.d)
-                    cumspec_c = np.insert(cumspec_c, 0, 0.0)
-                    cumspec_m = np.insert(cumspec_m, 0, 0.0)
-
-                ei = start_e
-                for cn, Z in zip(number_of_photons[ibegin:iend], metalZ[ibegin:iend]):
-                    if cn == 0: continue
-                    # The rather verbose form of the few next statements is a
-                    # result of code optimization and shouldn't be changed
-                    # without checking for performance degradation. See
-                    # https://bitbucket.org/yt_analysis/yt/pull-requests/1766
-                    # for details.
-                    if self.method == "invert_cdf":
-                        cumspec = cumspec_c
-                        cumspec += Z * cumspec_m
-                        norm_factor = 1.0 / cumspec[-1]
-                        cumspec *= norm_factor
-                        randvec = self.prng.uniform(size=cn)
-                        randvec.sort()
-                        cell_e = np.interp(randvec, cumspec, ebins)
-                    elif self.method == "accept_reject":
-                        tot_spec = cspec.d
-                        tot_spec += Z * mspec.d
-                        norm_factor = 1.0 / tot_spec.sum()
-                        tot_spec *= norm_factor
-                        eidxs = self.prng.choice(nchan, size=cn, p=tot_spec)
-                        cell_e = emid[eidxs]
-                    energies[int(ei):int(ei + cn)] = cell_e
-                    cell_counter += 1
-                    pbar.update(cell_counter)
-                    ei += cn
-
-                start_e = end_e
-
-            active_cells = number_of_photons > 0
-            idxs = idxs[active_cells]
-
-            photons["NumberOfPhotons"].append(number_of_photons[active_cells])
-            photons["Energy"].append(ds.arr(energies[:end_e].copy(), "keV"))
-            photons["x"].append((chunk["x"][idxs]-src_ctr[0]).in_units("kpc"))
-            photons["y"].append((chunk["y"][idxs]-src_ctr[1]).in_units("kpc"))
-            photons["z"].append((chunk["z"][idxs]-src_ctr[2]).in_units("kpc"))
-            photons["vx"].append(chunk["velocity_x"][idxs].in_units("km/s"))
-            photons["vy"].append(chunk["velocity_y"][idxs].in_units("km/s"))
-            photons["vz"].append(chunk["velocity_z"][idxs].in_units("km/s"))
-            photons["dx"].append(chunk["dx"][idxs].in_units("kpc"))
+            for key in photons:
+                photons[key].append(chunk_photons[key])
 
         pbar.finish()
 
@@ -260,3 +133,195 @@ class ThermalPhotonModel(PhotonModel):
         self.spectral_model.cleanup_spectrum()
 
         return photons
+
+    def iter_chunks(self, data_source, parameters, njobs=1):
+        r"""
+        Generate the photons of *data_source* one io chunk at a time.
+
+        This yields a *photons* dictionary, of the same form as that
+        returned by calling the model, for each chunk with photons, so that
+        the photons never have to be held in memory all at once.  Each chunk
+        draws from its own random number generator, seeded from *prng*, so
+        the photons do not depend on *njobs*, the number of local processes
+        the chunks are generated in (0 for ``local_parallel_processes``).
+        """
+        setup = self._setup(data_source, parameters)
+
+        # The io chunks are listed once, before any processes are forked,
+        # and each task reads the fields of its own chunk only.
+        data_source.get_data()
+        chunks = list(data_source.index._chunk(data_source, "io"))
+        seeds = self.prng.randint(0, np.iinfo(np.int32).max,
+                                  size=len(chunks))
+
+        def generate(i):
+            with data_source._chunked_read(chunks[i]):
+                chunk_photons, num_cells = \
+                  self._generate_photons(data_source, setup,
+                                         np.random.RandomState(seeds[i]))
+            return chunk_photons
+
+        n_ph = 0
+        n_cells = 0
+        try:
+            for chunk_photons in local_imap(generate, range(len(chunks)),
+                                            njobs=njobs):
+                if chunk_photons is None:
+                    continue
+                n_ph += int(np.sum(chunk_photons["NumberOfPhotons"]))
+                n_cells += len(chunk_photons["x"])
+                yield chunk_photons
+        finally:
+            self.spectral_model.cleanup_spectrum()
+
+        mylog.info("Number of photons generated: %d" % n_ph)
+        mylog.info("Number of cells with photons: %d" % n_cells)
+
+    def _setup(self, data_source, parameters):
+        # The quantities shared by the photons of every chunk
+        setup = {}
+
+        exp_time = parameters["FiducialExposureTime"]
+        area = parameters["FiducialArea"]
+        redshift = parameters["FiducialRedshift"]
+        D_A = parameters["FiducialAngularDiameterDistance"].in_cgs()
+        dist_fac = 1.0/(4.*np.pi*D_A.value*D_A.value*(1.+redshift)**2)
+        setup["src_ctr"] = parameters["center"]
+
+        my_kT_min, my_kT_max = data_source.quantities.extrema("kT")
+
+        self.spectral_model.prepare_spectrum(redshift)
+
+        setup["spectral_norm"] = area.v*exp_time.v*dist_fac
+        setup["kT_bins"] = np.linspace(kT_min, max(my_kT_max.v, kT_max),
+                                       num=n_kT+1)
+        return setup
+
+    def _generate_photons(self, chunk, setup, prng):
+        # Returns the photons of the cells of a chunk, or None if it has no
+        # cells, and the number of cells.
+
+        ds = chunk.ds
+
+        emid = self.spectral_model.emid
+        ebins = self.spectral_model.ebins
+        nchan = len(emid)
+        src_ctr = setup["src_ctr"]
+        spectral_norm = setup["spectral_norm"]
+        kT_bins = setup["kT_bins"]
+
+        kT = chunk["kT"].v
+        num_cells = len(kT)
+        if num_cells == 0:
+            return None, 0
+        vol = chunk["cell_volume"].in_cgs().v
+        EM = (chunk["density"]/mp).in_cgs().v**2
+        EM *= 0.5*(1.+self.X_H)*self.X_H*vol
+
+        if isinstance(self.Zmet, string_types):
+            metalZ = chunk[self.Zmet].v
+        else:
+            metalZ = self.Zmet*np.ones(num_cells)
+
+        idxs = np.argsort(kT)
+
+        dkT = kT_bins[1]-kT_bins[0]
+        kT_idxs = np.digitize(kT[idxs], kT_bins)
+        kT_idxs = np.minimum(np.maximum(1, kT_idxs), n_kT) - 1
+        bcounts = np.bincount(kT_idxs).astype("int")
+        bcounts = bcounts[bcounts > 0]
+        n = int(0)
+        bcell = []
+        ecell = []
+        for bcount in bcounts:
+            bcell.append(n)
+            ecell.append(n+bcount)
+            n += bcount
+        kT_idxs = np.unique(kT_idxs)
+
+        cell_em = EM[idxs]*spectral_norm
+
+        number_of_photons = np.zeros(num_cells, dtype="uint64")
+        energies = np.zeros(self.photons_per_chunk)
+
+        start_e = 0
+        end_e = 0
+
+        for ibegin, iend, ikT in zip(bcell, ecell, kT_idxs):
+
+            kT = kT_bins[ikT] + 0.5*dkT
+
+            n_current = iend-ibegin
+
+            cem = cell_em[ibegin:iend]
+
+            cspec, mspec = self.spectral_model.get_spectrum(kT)
+
+            tot_ph_c = cspec.d.sum()
+            tot_ph_m = mspec.d.sum()
+
+            u = prng.uniform(size=n_current)
+
+            cell_norm_c = tot_ph_c*cem
+            cell_norm_m = tot_ph_m*metalZ[ibegin:iend]*cem
+            cell_norm = np.modf(cell_norm_c + cell_norm_m)
+            cell_n = np.uint64(cell_norm[1]) + np.uint64(cell_norm[0] >= u)
+
+            number_of_photons[ibegin:iend] = cell_n
+
+            end_e += int(cell_n.sum())
+
+            if end_e > self.photons_per_chunk:
+                raise RuntimeError("Number of photons generated for this chunk "+
+                                   "exceeds photons_per_chunk (%d)! " % self.photons_per_chunk +
+                                   "Increase photons_per_chunk!")
+
+            if self.method == "invert_cdf":
+                cumspec_c = np.cumsum(cspec.d)
+                cumspec_m = np.cumsum(mspec.d)
+                cumspec_c = np.insert(cumspec_c, 0, 0.0)
+                cumspec_m = np.insert(cumspec_m, 0, 0.0)
+
+            ei = start_e
+            for cn, Z in zip(number_of_photons[ibegin:iend], metalZ[ibegin:iend]):
+                if cn == 0: continue
+                # The rather verbose form of the few next statements is a
+                # result of code optimization and shouldn't be changed
+                # without checking for performance degradation. See
+                # https://bitbucket.org/yt_analysis/yt/pull-requests/1766
+                # for details.
+                if self.method == "invert_cdf":
+                    cumspec = cumspec_c
+                    cumspec += Z * cumspec_m
+                    norm_factor = 1.0 / cumspec[-1]
+                    cumspec *= norm_factor
+                    randvec = prng.uniform(size=cn)
+                    randvec.sort()
+                    cell_e = np.interp(randvec, cumspec, ebins)
+                elif self.method == "accept_reject":
+                    tot_spec = cspec.d
+                    tot_spec += Z * mspec.d
+                    norm_factor = 1.0 / tot_spec.sum()
+                    tot_spec *= norm_factor
+                    eidxs = prng.choice(nchan, size=cn, p=tot_spec)
+                    cell_e = emid[eidxs]
+                energies[int(ei):int(ei + cn)] = cell_e
+                ei += cn
+
+            start_e = end_e
+
+        active_cells = number_of_photons > 0
+        idxs = idxs[active_cells]
+
+        photons = {}
+        photons["NumberOfPhotons"] = number_of_photons[active_cells]
+        photons["Energy"] = ds.arr(energies[:end_e].copy(), "keV")
+        photons["x"] = (chunk["x"][idxs]-src_ctr[0]).in_units("kpc")
+        photons["y"] = (chunk["y"][idxs]-src_ctr[1]).in_units("kpc")
+        photons["z"] = (chunk["z"][idxs]-src_ctr[2]).in_units("kpc")
+        photons["vx"] = chunk["velocity_x"][idxs].in_units("km/s")
+        photons["vy"] = chunk["velocity_y"][idxs].in_units("km/s")
+        photons["vz"] = chunk["velocity_z"][idxs].in_units("km/s")
+        photons["dx"] = chunk["dx"][idxs].in_units("kpc")
+
+        return photons, num_cells
@@ -35,11 +35,15 @@ from yt.visualization.fits_image import assert_same_wcs
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
     communication_system, parallel_root_only, get_mpi_type, \
     parallel_capable
+from yt.utilities.parallel_tools.local_parallelism import \
+    local_imap
 from yt.units.yt_array import YTQuantity, YTArray, uconcatenate
 from yt.utilities.on_demand_imports import _h5py as h5py
 from yt.utilities.on_demand_imports import _astropy
 import warnings
 import os
+import shutil
+import tempfile
 
 comm = communication_system.communicators[-1]
 
@@ -80,14 +84,60 @@ def validate_parameters(first, second, skip=[]):
                 raise RuntimeError("The values for the parameter '%s' in the two inputs" % k1 +
                                    " are not identical (%s vs. %s)!" % (v1, v2))
 
+# The datasets of a photon file each photon field is stored in, and its units
+photon_datasets = {"x": ("x", "kpc"),
+                   "y": ("y", "kpc"),
+                   "z": ("z", "kpc"),
+                   "vx": ("vx", "km/s"),
+                   "vy": ("vy", "km/s"),
+                   "vz": ("vz", "km/s"),
+                   "dx": ("dx", "kpc"),
+                   "NumberOfPhotons": ("num_photons", None),
+                   "Energy": ("energy", "keV")}
+
+def _read_photon_dataset(d, key, start=None, end=None):
+    name, units = photon_datasets[key]
+    data = d[name][start:end]
+    if units is None:
+        return data
+    return YTArray(data, units)
+
+class _PhotonFileFields(object):
+    # The photons of a photon file, each field of which is read from the
+    # file when it is asked for.
+    def __init__(self, filename):
+        self.filename = filename
+
+    def keys(self):
+        return list(photon_datasets.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def __getitem__(self, key):
+        if key not in photon_datasets:
+            raise KeyError(key)
+        with h5py.File(self.filename, "r") as f:
+            return _read_photon_dataset(f["/data"], key)
+
+    def __contains__(self, key):
+        return key in photon_datasets
+
+    def __repr__(self):
+        return "<photons in %s>" % self.filename
+
 class PhotonList(object):
 
-    def __init__(self, photons, parameters, cosmo, p_bins):
+    def __init__(self, photons, parameters, cosmo, p_bins, filename=None):
         self.photons = photons
         self.parameters = parameters
         self.cosmo = cosmo
         self.p_bins = p_bins
-        self.num_cells = len(photons["x"])
+        self.num_cells = len(p_bins) - 1
+        self.filename = filename
 
     def keys(self):
         return self.photons.keys()
@@ -112,7 +162,8 @@ class PhotonList(object):
 
     def __getitem__(self, key):
         if key == "Energy":
-            return [self.photons["Energy"][self.p_bins[i]:self.p_bins[i+1]]
+            energy = self.photons["Energy"]
+            return [energy[self.p_bins[i]:self.p_bins[i+1]]
                     for i in range(self.num_cells)]
         else:
             return self.photons[key]
@@ -124,9 +175,15 @@ class PhotonList(object):
         return self.photons.__repr__()
 
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, in_memory=True):
         r"""
         Initialize a PhotonList from the HDF5 file *filename*.
+
+        If *in_memory* is False, the photons are left in the file, each
+        field being read from it when it is asked for, and
+        `~yt.analysis_modules.photon_simulator.photon_simulator.PhotonList.project_photons`
+        reads them a chunk of cells at a time.  This is not supported in
+        parallel with MPI.
         """
 
         photons = {}
@@ -147,6 +204,20 @@ class PhotonList(object):
 
         d = f["/data"]
 
+        if not in_memory:
+            if parallel_capable:
+                f.close()
+                raise RuntimeError("Photon files cannot be read lazily "
+                                   "in parallel with MPI.")
+            p_bins = np.cumsum(d["num_photons"][:])
+            p_bins = np.insert(p_bins, 0, [np.uint64(0)])
+            f.close()
+            cosmo = Cosmology(hubble_constant=parameters["HubbleConstant"],
+                              omega_matter=parameters["OmegaMatter"],
+                              omega_lambda=parameters["OmegaLambda"])
+            return cls(_PhotonFileFields(filename), parameters, cosmo,
+                       p_bins, filename=filename)
+
         num_cells = d["x"][:].shape[0]
         start_c = comm.rank*num_cells//comm.size
         end_c = (comm.rank+1)*num_cells//comm.size
@@ -185,7 +256,8 @@ class PhotonList(object):
     @classmethod
     def from_scratch(cls, data_source, redshift, area,
                      exp_time, photon_model, parameters=None,
-                     center=None, dist=None, cosmology=None):
+                     center=None, dist=None, cosmology=None,
+                     photonfile=None, njobs=1):
         r"""
         Initialize a PhotonList from a photon model. The redshift, collecting area,
         exposure time, and cosmology are stored in the *parameters* dictionary which
@@ -217,6 +289,18 @@ class PhotonList(object):
             Cosmological information. If not supplied, we try to get
             the cosmology from the dataset. Otherwise, \LambdaCDM with
             the default yt parameters is assumed.
+        photonfile : string, optional
+            If set, the photons are written to this HDF5 file as they are
+            generated, one chunk at a time if the *photon_model* has an
+            ``iter_chunks`` method (as `ThermalPhotonModel` does), and the
+            PhotonList returned reads them from the file when they are
+            needed, so that they never have to be held in memory all at
+            once.  Not supported in parallel with MPI.
+        njobs : integer, optional
+            The number of local processes the chunks of photons are
+            generated in by a *photon_model* with an ``iter_chunks`` method,
+            with 0 for the ``local_parallel_processes`` configuration
+            option.  Default: 1.
 
         Examples
         --------
@@ -358,7 +442,34 @@ class PhotonList(object):
         parameters["Dimension"] = 2*dimension
         parameters["Width"] = 2.*width.in_units("kpc")
 
-        photons = photon_model(data_source, parameters)
+        iter_chunks = getattr(photon_model, "iter_chunks", None)
+
+        if photonfile is not None:
+            if parallel_capable:
+                raise RuntimeError("Photons cannot be written to a file as "
+                                   "they are generated in parallel with MPI.")
+            if iter_chunks is None:
+                chunks = [photon_model(data_source, parameters)]
+            else:
+                chunks = iter_chunks(data_source, parameters, njobs=njobs)
+            with _PhotonFileWriter(photonfile, parameters) as writer:
+                for photons in chunks:
+                    writer.append(photons)
+            mylog.info("Finished generating photons.")
+            return cls.from_file(photonfile, in_memory=False)
+
+        if njobs != 1 and iter_chunks is not None and not parallel_capable:
+            chunks = list(iter_chunks(data_source, parameters, njobs=njobs))
+            photons = {}
+            for key in photon_datasets:
+                if len(chunks) > 0:
+                    photons[key] = uconcatenate([c[key] for c in chunks])
+                elif photon_datasets[key][1] is None:
+                    photons[key] = np.array([], dtype="uint64")
+                else:
+                    photons[key] = YTArray([], photon_datasets[key][1])
+        else:
+            photons = photon_model(data_source, parameters)
 
         mylog.info("Finished generating photons.")
 
@@ -449,16 +560,7 @@ class PhotonList(object):
 
             # Parameters
 
-            p = f.create_group("parameters")
-            p.create_dataset("fid_area", data=float(self.parameters["FiducialArea"]))
-            p.create_dataset("fid_exp_time", data=float(self.parameters["FiducialExposureTime"]))
-            p.create_dataset("fid_redshift", data=self.parameters["FiducialRedshift"])
-            p.create_dataset("hubble", data=self.parameters["HubbleConstant"])
-            p.create_dataset("omega_matter", data=self.parameters["OmegaMatter"])
-            p.create_dataset("omega_lambda", data=self.parameters["OmegaLambda"])
-            p.create_dataset("fid_d_a", data=float(self.parameters["FiducialAngularDiameterDistance"]))
-            p.create_dataset("dimension", data=self.parameters["Dimension"])
-            p.create_dataset("width", data=float(self.parameters["Width"]))
+            _write_photon_parameters(f, self.parameters)
 
             # Data
 
@@ -482,7 +584,9 @@ class PhotonList(object):
                         absorb_model=None, psf_sigma=None,
                         sky_center=None, responses=None,
                         convolve_energies=False, no_shifting=False,
-                        north_vector=None, prng=np.random):
+                        north_vector=None, prng=np.random,
+                        cells_per_chunk=None, events_file=None,
+                        clobber=False, njobs=1):
         r"""
         Projects photons onto an image plane given a line of sight.
 
@@ -525,6 +629,27 @@ class PhotonList(object):
             A pseudo-random number generator. Typically will only be specified if you
             have a reason to generate the same set of random numbers, such as for a                                    
             test. Default is the numpy.random module.                                                                            
+        cells_per_chunk : integer, optional
+            If set, the photons are projected this many cells at a time,
+            reading them from disk if the photon list was opened with
+            ``in_memory=False``, so that only one chunk of photons is held in
+            memory.  This is the default, with chunks of 1000000 cells, for
+            photon lists on disk.  The photons observed in each chunk are
+            drawn as if from all of the photons at once, but with their own
+            random numbers, so the events differ from those of an unchunked
+            projection.  Not supported in parallel with MPI.
+        events_file : string, optional
+            If set, the events of each chunk are appended to this HDF5 file,
+            or FITS file if its name ends in ".fits", instead of being
+            returned in an `EventList`, and None is returned.  The files are
+            those written by `EventList.write_h5_file` and
+            `EventList.write_fits_file`.
+        clobber : boolean, optional
+            Set to True to overwrite a previous *events_file*.
+        njobs : integer, optional
+            The number of local processes chunks are projected in, with 0
+            for the ``local_parallel_processes`` configuration option.
+            Default: 1.
 
         Examples
         --------
@@ -538,25 +663,37 @@ class PhotonList(object):
             mylog.error("You may specify a new redshift or distance, "+
                         "but not both!")
 
+        chunked = self.filename is not None or \
+          cells_per_chunk is not None or events_file is not None
+        if chunked and parallel_capable:
+            raise RuntimeError("Photons cannot be projected in chunks "
+                               "in parallel with MPI.")
+
         if sky_center is None:
             sky_center = YTArray([30.,45.], "degree")
         else:
             sky_center = YTArray(sky_center, "degree")
 
-        dx = self.photons["dx"].d
         nx = self.parameters["Dimension"]
         if psf_sigma is not None:
              psf_sigma = parse_value(psf_sigma, "degree")
 
+        proj = {"normal": normal, "no_shifting": no_shifting}
         if not isinstance(normal, string_types):
             L = np.array(normal)
             orient = Orientation(L, north_vector=north_vector)
-            x_hat = orient.unit_vectors[0]
-            y_hat = orient.unit_vectors[1]
-            z_hat = orient.unit_vectors[2]
-
-        n_ph = self.photons["NumberOfPhotons"]
-        n_ph_tot = n_ph.sum()
+            proj["x_hat"] = orient.unit_vectors[0]
+            proj["y_hat"] = orient.unit_vectors[1]
+            proj["z_hat"] = orient.unit_vectors[2]
+
+        if chunked:
+            if cells_per_chunk is None:
+                cells_per_chunk = 1000000
+            cell_chunks = self._cell_chunks(cells_per_chunk)
+            n_ph_tot = np.uint64(sum(end_e - start_e for start_c, end_c,
+                                     start_e, end_e in cell_chunks))
+        else:
+            n_ph_tot = self.photons["NumberOfPhotons"].sum()
 
         eff_area = None
 
@@ -615,6 +752,7 @@ class PhotonList(object):
                                   "get inconsistent results.")
                 f.close()
                 Aratio = eff_area.max()/self.parameters["FiducialArea"].v
+                proj["earf"] = earf
             else:
                 mylog.info("Using constant effective area.")
                 Aratio = parse_value(area_new, "cm**2")/self.parameters["FiducialArea"]
@@ -646,70 +784,139 @@ class PhotonList(object):
         if comm.rank == 0:
             mylog.info("Total number of photons to use: %d" % (n_obs_all))
 
-        if my_n_obs == n_ph_tot:
-            idxs = np.arange(my_n_obs,dtype='uint64')
+        proj["scale_factor"] = scale_factor
+        proj["eff_area"] = eff_area
+        if absorb_model is not None:
+            absorb_model.prepare_spectrum()
+            proj["absorb"] = (absorb_model.emid, absorb_model.get_spectrum())
+            absorb_model.cleanup_spectrum()
+
+        dx_min = self.parameters["Width"]/self.parameters["Dimension"]
+        dtheta = YTQuantity(np.rad2deg(dx_min/D_A), "degree")
+        proj["dx_min"] = dx_min
+        proj["nx"] = nx
+        if psf_sigma is not None:
+            proj["psf_sigma"] = (psf_sigma/dtheta).v
+
+        if exp_time_new is None:
+            parameters["ExposureTime"] = self.parameters["FiducialExposureTime"]
+        else:
+            parameters["ExposureTime"] = exp_time_new
+        if area_new is None:
+            parameters["Area"] = self.parameters["FiducialArea"]
+        else:
+            parameters["Area"] = area_new
+        parameters["Redshift"] = zobs
+        parameters["AngularDiameterDistance"] = D_A.in_units("Mpc")
+        parameters["sky_center"] = sky_center
+        parameters["pix_center"] = np.array([0.5*(nx+1)]*2)
+        parameters["dtheta"] = dtheta
+
+        if chunked:
+            return self._project_in_chunks(
+                cell_chunks, my_n_obs, proj, parameters, prng,
+                convolve_energies=convolve_energies, mat_key=mat_key,
+                events_file=events_file, clobber=clobber, njobs=njobs)
+
+        events = self._project_cells(self.photons, self.p_bins, my_n_obs,
+                                     proj, prng)
+
+        events = comm.par_combine_object(events, datatype="dict", op="cat")
+
+        if psf_sigma is not None:
+            events["xpix"] += prng.normal(scale=proj["psf_sigma"],
+                                          size=events["xpix"].shape)
+            events["ypix"] += prng.normal(scale=proj["psf_sigma"],
+                                          size=events["ypix"].shape)
+
+        num_events = len(events["xpix"])
+
+        if comm.rank == 0:
+            mylog.info("Total number of observed photons: %d" % num_events)
+
+        if "RMF" in parameters and convolve_energies:
+            events, info = self._convolve_with_rmf(parameters["RMF"], events, 
+                                                   mat_key, prng)
+            for k, v in info.items():
+                parameters[k] = v
+
+        return EventList(events, parameters)
+
+    def _project_cells(self, photons, p_bins, n_obs, proj, prng):
+        """
+        Project *n_obs* photons drawn at random from the cells in the
+        *photons* dictionary, whose energies are bounded by *p_bins*.
+        """
+        normal = proj["normal"]
+        dx = photons["dx"].d
+        n_ph_tot = p_bins[-1]
+
+        if n_obs == n_ph_tot:
+            idxs = np.arange(n_obs,dtype='uint64')
         else:
-            idxs = prng.permutation(n_ph_tot)[:my_n_obs].astype("uint64")
-        obs_cells = np.searchsorted(self.p_bins, idxs, side='right')-1
+            idxs = prng.permutation(n_ph_tot)[:n_obs].astype("uint64")
+        obs_cells = np.searchsorted(p_bins, idxs, side='right')-1
         delta = dx[obs_cells]
 
         if isinstance(normal, string_types):
 
-            xsky = prng.uniform(low=-0.5,high=0.5,size=my_n_obs)
-            ysky = prng.uniform(low=-0.5,high=0.5,size=my_n_obs)
+            xsky = prng.uniform(low=-0.5,high=0.5,size=n_obs)
+            ysky = prng.uniform(low=-0.5,high=0.5,size=n_obs)
             xsky *= delta
             ysky *= delta
-            xsky += self.photons[axes_lookup[normal][0]][obs_cells]
-            ysky += self.photons[axes_lookup[normal][1]][obs_cells]
+            xsky += photons[axes_lookup[normal][0]][obs_cells].d
+            ysky += photons[axes_lookup[normal][1]][obs_cells].d
 
-            if not no_shifting:
-                vz = self.photons["v%s" % normal]
+            if not proj["no_shifting"]:
+                vz = photons["v%s" % normal]
 
         else:
-            x = prng.uniform(low=-0.5,high=0.5,size=my_n_obs)
-            y = prng.uniform(low=-0.5,high=0.5,size=my_n_obs)
-            z = prng.uniform(low=-0.5,high=0.5,size=my_n_obs)
+            x_hat = proj["x_hat"]
+            y_hat = proj["y_hat"]
+            z_hat = proj["z_hat"]
 
-            if not no_shifting:
-                vz = self.photons["vx"]*z_hat[0] + \
-                     self.photons["vy"]*z_hat[1] + \
-                     self.photons["vz"]*z_hat[2]
+            x = prng.uniform(low=-0.5,high=0.5,size=n_obs)
+            y = prng.uniform(low=-0.5,high=0.5,size=n_obs)
+            z = prng.uniform(low=-0.5,high=0.5,size=n_obs)
+
+            if not proj["no_shifting"]:
+                vz = photons["vx"]*z_hat[0] + \
+                     photons["vy"]*z_hat[1] + \
+                     photons["vz"]*z_hat[2]
 
             x *= delta
             y *= delta
             z *= delta
-            x += self.photons["x"][obs_cells].d
-            y += self.photons["y"][obs_cells].d
-            z += self.photons["z"][obs_cells].d
+            x += photons["x"][obs_cells].d
+            y += photons["y"][obs_cells].d
+            z += photons["z"][obs_cells].d
 
             xsky = x*x_hat[0] + y*x_hat[1] + z*x_hat[2]
             ysky = x*y_hat[0] + y*y_hat[1] + z*y_hat[2]
 
-        if no_shifting:
-            eobs = self.photons["Energy"][idxs]
+        if proj["no_shifting"]:
+            eobs = photons["Energy"][idxs]
         else:
             shift = -vz.in_cgs()/clight
             shift = np.sqrt((1.-shift)/(1.+shift))
-            eobs = self.photons["Energy"][idxs]*shift[obs_cells]
-        eobs *= scale_factor
+            eobs = photons["Energy"][idxs]*shift[obs_cells]
+        eobs *= proj["scale_factor"]
 
-        if absorb_model is None:
+        if "absorb" not in proj:
             not_abs = np.ones(eobs.shape, dtype='bool')
         else:
             mylog.info("Absorbing.")
-            absorb_model.prepare_spectrum()
-            emid = absorb_model.emid
-            aspec = absorb_model.get_spectrum()
+            emid, aspec = proj["absorb"]
             absorb = np.interp(eobs, emid, aspec, left=0.0, right=0.0)
             randvec = aspec.max()*prng.uniform(size=eobs.shape)
             not_abs = randvec < absorb
-            absorb_model.cleanup_spectrum()
 
+        eff_area = proj["eff_area"]
         if eff_area is None:
             detected = np.ones(eobs.shape, dtype='bool')
         else:
             mylog.info("Applying energy-dependent effective area.")
-            earea = np.interp(eobs, earf, eff_area, left=0.0, right=0.0)
+            earea = np.interp(eobs, proj["earf"], eff_area, left=0.0, right=0.0)
             randvec = eff_area.max()*prng.uniform(size=eobs.shape)
             detected = randvec < earea
 
@@ -717,46 +924,132 @@ class PhotonList(object):
 
         events = {}
 
-        dx_min = self.parameters["Width"]/self.parameters["Dimension"]
-        dtheta = YTQuantity(np.rad2deg(dx_min/D_A), "degree")
+        dx_min = proj["dx_min"]
+        nx = proj["nx"]
 
         events["xpix"] = xsky[detected]/dx_min.v + 0.5*(nx+1)
         events["ypix"] = ysky[detected]/dx_min.v + 0.5*(nx+1)
         events["eobs"] = eobs[detected]
 
-        events = comm.par_combine_object(events, datatype="dict", op="cat")
-
-        if psf_sigma is not None:
-            events["xpix"] += prng.normal(sigma=psf_sigma/dtheta)
-            events["ypix"] += prng.normal(sigma=psf_sigma/dtheta)
-
-        num_events = len(events["xpix"])
-
-        if comm.rank == 0:
-            mylog.info("Total number of observed photons: %d" % num_events)
-
-        if "RMF" in parameters and convolve_energies:
-            events, info = self._convolve_with_rmf(parameters["RMF"], events, 
-                                                   mat_key, prng)
-            for k, v in info.items():
-                parameters[k] = v
-
-        if exp_time_new is None:
-            parameters["ExposureTime"] = self.parameters["FiducialExposureTime"]
-        else:
-            parameters["ExposureTime"] = exp_time_new
-        if area_new is None:
-            parameters["Area"] = self.parameters["FiducialArea"]
-        else:
-            parameters["Area"] = area_new
-        parameters["Redshift"] = zobs
-        parameters["AngularDiameterDistance"] = D_A.in_units("Mpc")
-        parameters["sky_center"] = sky_center
-        parameters["pix_center"] = np.array([0.5*(nx+1)]*2)
-        parameters["dtheta"] = dtheta
+        return events
 
+    def _project_in_chunks(self, cell_chunks, n_obs, proj, parameters,
+                           prng, convolve_energies=False, mat_key=None,
+                           events_file=None, clobber=False, njobs=1):
+        """
+        Project the photons of each chunk of cells in turn, either
+        collecting the events or appending them to *events_file*.
+        """
+        # Share the photons to observe out among the chunks as if they
+        # were drawn from all of the photons at once.
+        n_ph_left = np.sum([end_e - start_e for start_c, end_c,
+                            start_e, end_e in cell_chunks])
+        n_obs_left = n_obs
+        chunk_n_obs = []
+        for start_c, end_c, start_e, end_e in cell_chunks:
+            n_ph = end_e - start_e
+            if n_obs_left == n_ph_left:
+                my_n_obs = n_ph
+            elif n_obs_left == 0 or n_ph == 0:
+                my_n_obs = 0
+            else:
+                my_n_obs = prng.hypergeometric(n_ph, n_ph_left - n_ph,
+                                               n_obs_left)
+            chunk_n_obs.append(np.uint64(my_n_obs))
+            n_obs_left -= my_n_obs
+            n_ph_left -= n_ph
+        seeds = prng.randint(0, np.iinfo(np.int32).max,
+                             size=len(cell_chunks))
+
+        convolve = "RMF" in parameters and convolve_energies
+
+        def project(i):
+            chunk_prng = np.random.RandomState(seeds[i])
+            photons = self._read_cells(*cell_chunks[i])
+            p_bins = np.cumsum(photons["NumberOfPhotons"])
+            p_bins = np.insert(p_bins, 0, [np.uint64(0)])
+            events = self._project_cells(photons, p_bins, chunk_n_obs[i],
+                                         proj, chunk_prng)
+            del photons
+            if "psf_sigma" in proj:
+                events["xpix"] += chunk_prng.normal(
+                    scale=proj["psf_sigma"], size=events["xpix"].shape)
+                events["ypix"] += chunk_prng.normal(
+                    scale=proj["psf_sigma"], size=events["ypix"].shape)
+            info = {}
+            if convolve:
+                events, info = self._convolve_with_rmf(
+                    parameters["RMF"], events, mat_key, chunk_prng)
+            return events, info
+
+        writer = None
+        if events_file is not None:
+            writer = _event_writer(events_file, clobber=clobber)
+        all_events = []
+        num_events = 0
+        try:
+            for events, info in local_imap(project, range(len(cell_chunks)),
+                                           njobs=njobs):
+                for k, v in info.items():
+                    parameters[k] = v
+                num_events += len(events["xpix"])
+                if writer is not None:
+                    writer.append(events, parameters)
+                else:
+                    all_events.append(events)
+                del events
+            if writer is not None:
+                writer.finish(parameters)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        mylog.info("Total number of observed photons: %d" % num_events)
+
+        if writer is not None:
+            return None
+        events = {}
+        for key in ["xpix", "ypix", "eobs", parameters.get("ChannelType")]:
+            if key is None:
+                continue
+            if len(all_events) == 0:
+                events[key] = np.array([])
+            else:
+                events[key] = uconcatenate([e[key] for e in all_events])
+        if "eobs" in events and not isinstance(events["eobs"], YTArray):
+            events["eobs"] = YTArray(events["eobs"], "keV")
         return EventList(events, parameters)
 
+    def _cell_chunks(self, cells_per_chunk):
+        # The ranges of cells, and of their photons, of each chunk of cells
+        cells_per_chunk = max(int(cells_per_chunk), 1)
+        chunks = []
+        for start_c in range(0, self.num_cells, cells_per_chunk):
+            end_c = min(start_c + cells_per_chunk, self.num_cells)
+            chunks.append((start_c, end_c, int(self.p_bins[start_c]),
+                           int(self.p_bins[end_c])))
+        return chunks
+
+    def _read_cells(self, start_c, end_c, start_e, end_e):
+        # The photons of a chunk of cells, read from the photon file if
+        # the photons are not in memory.
+        photons = {}
+        if self.filename is None:
+            for key in photon_datasets:
+                if key == "Energy":
+                    photons[key] = self.photons[key][start_e:end_e]
+                else:
+                    photons[key] = self.photons[key][start_c:end_c]
+            return photons
+        with h5py.File(self.filename, "r") as f:
+            d = f["/data"]
+            for key in photon_datasets:
+                if key == "Energy":
+                    photons[key] = _read_photon_dataset(d, key, start_e, end_e)
+                else:
+                    photons[key] = _read_photon_dataset(d, key, start_c, end_c)
+        return photons
+
     def _normalize_arf(self, respfile, mat_key):
         rmf = _astropy.pyfits.open(respfile)
         table = rmf[mat_key]
@@ -843,18 +1136,309 @@ class PhotonList(object):
 
         return events, info
 
+def _write_photon_parameters(f, parameters):
+    p = f.create_group("parameters")
+    p.create_dataset("fid_area", data=float(parameters["FiducialArea"]))
+    p.create_dataset("fid_exp_time", data=float(parameters["FiducialExposureTime"]))
+    p.create_dataset("fid_redshift", data=parameters["FiducialRedshift"])
+    p.create_dataset("hubble", data=parameters["HubbleConstant"])
+    p.create_dataset("omega_matter", data=parameters["OmegaMatter"])
+    p.create_dataset("omega_lambda", data=parameters["OmegaLambda"])
+    p.create_dataset("fid_d_a", data=float(parameters["FiducialAngularDiameterDistance"]))
+    p.create_dataset("dimension", data=parameters["Dimension"])
+    p.create_dataset("width", data=float(parameters["Width"]))
+
+class _PhotonFileWriter(object):
+    # Appends the photons of each chunk of cells to a photon file, of the
+    # form written by PhotonList.write_h5_file.
+    def __init__(self, filename, parameters, chunk_size=65536):
+        self.f = h5py.File(filename, "w")
+        _write_photon_parameters(self.f, parameters)
+        d = self.f.create_group("data")
+        for key, (name, units) in photon_datasets.items():
+            if units is None:
+                dtype = "uint64"
+            else:
+                dtype = "float64"
+            d.create_dataset(name, shape=(0,), maxshape=(None,),
+                             dtype=dtype, chunks=(chunk_size,),
+                             compression="gzip")
+
+    def append(self, photons):
+        d = self.f["/data"]
+        for key, (name, units) in photon_datasets.items():
+            data = photons[key]
+            if units is not None:
+                data = data.in_units(units).d
+            n = d[name].shape[0]
+            d[name].resize((n + data.size,))
+            d[name][n:] = data
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _events_wcs(parameters):
+    wcs = _astropy.pywcs.WCS(naxis=2)
+    wcs.wcs.crpix = parameters["pix_center"]
+    wcs.wcs.crval = parameters["sky_center"].d
+    wcs.wcs.cdelt = [-parameters["dtheta"].value, parameters["dtheta"].value]
+    wcs.wcs.ctype = ["RA---TAN","DEC--TAN"]
+    wcs.wcs.cunit = ["deg"]*2
+    return wcs
+
+def _write_event_parameters(f, parameters):
+    p = f.create_group("parameters")
+    p.create_dataset("exp_time", data=float(parameters["ExposureTime"]))
+    area = parameters["Area"]
+    if not isinstance(area, string_types):
+        area = float(area)
+    p.create_dataset("area", data=area)
+    p.create_dataset("redshift", data=parameters["Redshift"])
+    p.create_dataset("d_a", data=float(parameters["AngularDiameterDistance"]))
+    if "ARF" in parameters:
+        p.create_dataset("arf", data=parameters["ARF"])
+    if "RMF" in parameters:
+        p.create_dataset("rmf", data=parameters["RMF"])
+    if "ChannelType" in parameters:
+        p.create_dataset("channel_type", data=parameters["ChannelType"])
+    if "Mission" in parameters:
+        p.create_dataset("mission", data=parameters["Mission"])
+    if "Telescope" in parameters:
+        p.create_dataset("telescope", data=parameters["Telescope"])
+    if "Instrument" in parameters:
+        p.create_dataset("instrument", data=parameters["Instrument"])
+    p.create_dataset("sky_center", data=parameters["sky_center"].d)
+    p.create_dataset("pix_center", data=parameters["pix_center"])
+    p.create_dataset("dtheta", data=float(parameters["dtheta"]))
+
+def _write_events_header(header, parameters, t_begin, t_end):
+    exp_time = float(parameters["ExposureTime"])
+    header["MTYPE1"] = "sky"
+    header["MFORM1"] = "x,y"
+    header["MTYPE2"] = "EQPOS"
+    header["MFORM2"] = "RA,DEC"
+    header["TCTYP2"] = "RA---TAN"
+    header["TCTYP3"] = "DEC--TAN"
+    header["TCRVL2"] = float(parameters["sky_center"][0])
+    header["TCRVL3"] = float(parameters["sky_center"][1])
+    header["TCDLT2"] = -float(parameters["dtheta"])
+    header["TCDLT3"] = float(parameters["dtheta"])
+    header["TCRPX2"] = parameters["pix_center"][0]
+    header["TCRPX3"] = parameters["pix_center"][1]
+    header["TLMIN2"] = 0.5
+    header["TLMIN3"] = 0.5
+    header["TLMAX2"] = 2.*parameters["pix_center"][0]-0.5
+    header["TLMAX3"] = 2.*parameters["pix_center"][1]-0.5
+    header["EXPOSURE"] = exp_time
+    header["TSTART"] = 0.0
+    header["TSTOP"] = exp_time
+    if isinstance(parameters["Area"], string_types):
+        header["AREA"] = parameters["Area"]
+    else:
+        header["AREA"] = float(parameters["Area"])
+    header["D_A"] = float(parameters["AngularDiameterDistance"])
+    header["REDSHIFT"] = parameters["Redshift"]
+    header["HDUVERS"] = "1.1.0"
+    header["RADECSYS"] = "FK5"
+    header["EQUINOX"] = 2000.0
+    header["HDUCLASS"] = "OGIP"
+    header["HDUCLAS1"] = "EVENTS"
+    header["HDUCLAS2"] = "ACCEPTED"
+    header["DATE"] = t_begin.tt.isot
+    header["DATE-OBS"] = t_begin.tt.isot
+    header["DATE-END"] = t_end.tt.isot
+    if "RMF" in parameters:
+        header["RESPFILE"] = parameters["RMF"]
+        f = _astropy.pyfits.open(parameters["RMF"])
+        nchan = int(f["EBOUNDS"].header["DETCHANS"])
+        header["PHA_BINS"] = nchan
+        f.close()
+    if "ARF" in parameters:
+        header["ANCRFILE"] = parameters["ARF"]
+    if "ChannelType" in parameters:
+        header["CHANTYPE"] = parameters["ChannelType"]
+    if "Mission" in parameters:
+        header["MISSION"] = parameters["Mission"]
+    if "Telescope" in parameters:
+        header["TELESCOP"] = parameters["Telescope"]
+    if "Instrument" in parameters:
+        header["INSTRUME"] = parameters["Instrument"]
+
+def _gti_hdu(exp_time, t_begin, t_end):
+    pyfits = _astropy.pyfits
+    start = pyfits.Column(name='START', format='1D', unit='s',
+                          array=np.array([0.0]))
+    stop = pyfits.Column(name='STOP', format='1D', unit='s',
+                         array=np.array([exp_time]))
+
+    tbhdu_gti = pyfits.BinTableHDU.from_columns([start,stop])
+    tbhdu_gti.update_ext_name("STDGTI")
+    tbhdu_gti.header["TSTART"] = 0.0
+    tbhdu_gti.header["TSTOP"] = exp_time
+    tbhdu_gti.header["HDUCLASS"] = "OGIP"
+    tbhdu_gti.header["HDUCLAS1"] = "GTI"
+    tbhdu_gti.header["HDUCLAS2"] = "STANDARD"
+    tbhdu_gti.header["RADECSYS"] = "FK5"
+    tbhdu_gti.header["EQUINOX"] = 2000.0
+    tbhdu_gti.header["DATE"] = t_begin.tt.isot
+    tbhdu_gti.header["DATE-OBS"] = t_begin.tt.isot
+    tbhdu_gti.header["DATE-END"] = t_end.tt.isot
+
+    return tbhdu_gti
+
+def _event_columns(parameters):
+    # The columns of the events table of an events FITS file, with empty
+    # arrays, and the big-endian dtype of its records
+    pyfits = _astropy.pyfits
+    cols = [pyfits.Column(name='ENERGY', format='E', unit='eV',
+                          array=np.zeros(0, dtype="float32")),
+            pyfits.Column(name='X', format='D', unit='pixel',
+                          array=np.zeros(0)),
+            pyfits.Column(name='Y', format='D', unit='pixel',
+                          array=np.zeros(0))]
+    dtype = [("ENERGY", ">f4"), ("X", ">f8"), ("Y", ">f8")]
+    if "ChannelType" in parameters:
+        chantype = parameters["ChannelType"]
+        if chantype == "PHA":
+            cunit = "adu"
+        elif chantype == "PI":
+            cunit = "Chan"
+        cols.append(pyfits.Column(name=chantype.upper(), format='1J',
+                                  unit=cunit,
+                                  array=np.zeros(0, dtype="int32")))
+        cols.append(pyfits.Column(name="TIME", format='1D', unit='s',
+                                  array=np.zeros(0)))
+        dtype += [(chantype.upper(), ">i4"), ("TIME", ">f8")]
+    return cols, np.dtype(dtype)
+
+class _H5EventWriter(object):
+    # Appends the events of each chunk to an HDF5 file of the form written
+    # by EventList.write_h5_file.
+    def __init__(self, h5file, clobber=False, chunk_size=65536):
+        if os.path.exists(h5file) and not clobber:
+            raise IOError("File exists: %s" % h5file)
+        self.f = h5py.File(h5file, "w")
+        self.chunk_size = chunk_size
+        self.f.create_group("data")
+        self.wcs = None
+
+    def _append(self, name, data):
+        d = self.f["/data"]
+        if name not in d:
+            d.create_dataset(name, shape=(0,), maxshape=(None,),
+                             dtype=data.dtype, chunks=(self.chunk_size,),
+                             compression="gzip")
+        n = d[name].shape[0]
+        d[name].resize((n + data.size,))
+        d[name][n:] = data
+
+    def append(self, events, parameters):
+        if self.wcs is None:
+            self.wcs = _events_wcs(parameters)
+        xpix = np.asarray(events["xpix"], dtype="float64")
+        ypix = np.asarray(events["ypix"], dtype="float64")
+        xsky, ysky = self.wcs.wcs_pix2world(xpix, ypix, 1)
+        self._append("xpix", xpix)
+        self._append("ypix", ypix)
+        self._append("xsky", np.asarray(xsky, dtype="float64"))
+        self._append("ysky", np.asarray(ysky, dtype="float64"))
+        self._append("eobs", events["eobs"].in_units("keV").d)
+        for key in ["PI", "PHA"]:
+            if key in events:
+                self._append(key.lower(), np.asarray(events[key]))
+
+    def finish(self, parameters):
+        for name in ["xpix", "ypix", "xsky", "ysky", "eobs"]:
+            if name not in self.f["/data"]:
+                self._append(name, np.zeros(0))
+        _write_event_parameters(self.f, parameters)
+
+    def close(self):
+        self.f.close()
+
+class _FITSEventWriter(object):
+    # Appends the records of the events of each chunk to a temporary file,
+    # from which the events table of a FITS file of the form written by
+    # EventList.write_fits_file is made when the events are finished.
+    def __init__(self, fitsfile, clobber=False):
+        if os.path.exists(fitsfile) and not clobber:
+            raise IOError("File exists: %s" % fitsfile)
+        self.fitsfile = fitsfile
+        dirname = os.path.dirname(os.path.abspath(fitsfile))
+        self.records = tempfile.NamedTemporaryFile(dir=dirname,
+                                                   suffix=".events")
+        self.num_events = 0
+
+    def append(self, events, parameters):
+        n = len(events["xpix"])
+        cols, dtype = _event_columns(parameters)
+        records = np.zeros(n, dtype=dtype)
+        records["ENERGY"] = events["eobs"].in_units("eV").d
+        records["X"] = events["xpix"]
+        records["Y"] = events["ypix"]
+        if "ChannelType" in parameters:
+            chantype = parameters["ChannelType"]
+            records[chantype.upper()] = events[chantype]
+            records["TIME"] = np.random.uniform(
+                size=n, low=0.0, high=float(parameters["ExposureTime"]))
+        self.records.write(records.tobytes())
+        self.num_events += n
+
+    def finish(self, parameters):
+        pyfits = _astropy.pyfits
+        Time = _astropy.time.Time
+        TimeDelta = _astropy.time.TimeDelta
+
+        if "ChannelType" in parameters:
+            mylog.info("Generating times for events assuming uniform time "
+                       "distribution. In future versions this will be made "
+                       "more general.")
+
+        exp_time = float(parameters["ExposureTime"])
+        t_begin = Time.now()
+        dt = TimeDelta(exp_time, format='sec')
+        t_end = t_begin + dt
+
+        cols, dtype = _event_columns(parameters)
+        tbhdu = pyfits.BinTableHDU.from_columns(pyfits.ColDefs(cols))
+        tbhdu.name = "EVENTS"
+        _write_events_header(tbhdu.header, parameters, t_begin, t_end)
+        tbhdu.header["NAXIS2"] = self.num_events
+
+        self.records.flush()
+        self.records.seek(0)
+        with open(self.fitsfile, "wb") as f:
+            f.write(pyfits.PrimaryHDU().header.tostring().encode("ascii"))
+            f.write(tbhdu.header.tostring().encode("ascii"))
+            shutil.copyfileobj(self.records, f)
+            nbytes = self.num_events*dtype.itemsize
+            f.write(b"\0"*(-nbytes % 2880))
+
+        if "ChannelType" in parameters:
+            gti = _gti_hdu(exp_time, t_begin, t_end)
+            pyfits.append(self.fitsfile, gti.data, gti.header)
+
+    def close(self):
+        self.records.close()
+
+def _event_writer(events_file, clobber=False):
+    if events_file.endswith(".fits") or events_file.endswith(".fits.gz"):
+        return _FITSEventWriter(events_file, clobber=clobber)
+    return _H5EventWriter(events_file, clobber=clobber)
+
 class EventList(object):
 
     def __init__(self, events, parameters):
         self.events = events
         self.parameters = parameters
         self.num_events = events["xpix"].shape[0]
-        self.wcs = _astropy.pywcs.WCS(naxis=2)
-        self.wcs.wcs.crpix = parameters["pix_center"]
-        self.wcs.wcs.crval = parameters["sky_center"].d
-        self.wcs.wcs.cdelt = [-parameters["dtheta"].value, parameters["dtheta"].value]
-        self.wcs.wcs.ctype = ["RA---TAN","DEC--TAN"]
-        self.wcs.wcs.cunit = ["deg"]*2
+        self.wcs = _events_wcs(parameters)
 
     def keys(self):
         return self.events.keys()
@@ -1056,79 +1640,12 @@ class EventList(object):
         tbhdu = pyfits.BinTableHDU.from_columns(coldefs)
         tbhdu.update_ext_name("EVENTS")
 
-        tbhdu.header["MTYPE1"] = "sky"
-        tbhdu.header["MFORM1"] = "x,y"
-        tbhdu.header["MTYPE2"] = "EQPOS"
-        tbhdu.header["MFORM2"] = "RA,DEC"
-        tbhdu.header["TCTYP2"] = "RA---TAN"
-        tbhdu.header["TCTYP3"] = "DEC--TAN"
-        tbhdu.header["TCRVL2"] = float(self.parameters["sky_center"][0])
-        tbhdu.header["TCRVL3"] = float(self.parameters["sky_center"][1])
-        tbhdu.header["TCDLT2"] = -float(self.parameters["dtheta"])
-        tbhdu.header["TCDLT3"] = float(self.parameters["dtheta"])
-        tbhdu.header["TCRPX2"] = self.parameters["pix_center"][0]
-        tbhdu.header["TCRPX3"] = self.parameters["pix_center"][1]
-        tbhdu.header["TLMIN2"] = 0.5
-        tbhdu.header["TLMIN3"] = 0.5
-        tbhdu.header["TLMAX2"] = 2.*self.parameters["pix_center"][0]-0.5
-        tbhdu.header["TLMAX3"] = 2.*self.parameters["pix_center"][1]-0.5
-        tbhdu.header["EXPOSURE"] = exp_time
-        tbhdu.header["TSTART"] = 0.0
-        tbhdu.header["TSTOP"] = exp_time
-        if isinstance(self.parameters["Area"], string_types):
-            tbhdu.header["AREA"] = self.parameters["Area"]
-        else:
-            tbhdu.header["AREA"] = float(self.parameters["Area"])
-        tbhdu.header["D_A"] = float(self.parameters["AngularDiameterDistance"])
-        tbhdu.header["REDSHIFT"] = self.parameters["Redshift"]
-        tbhdu.header["HDUVERS"] = "1.1.0"
-        tbhdu.header["RADECSYS"] = "FK5"
-        tbhdu.header["EQUINOX"] = 2000.0
-        tbhdu.header["HDUCLASS"] = "OGIP"
-        tbhdu.header["HDUCLAS1"] = "EVENTS"
-        tbhdu.header["HDUCLAS2"] = "ACCEPTED"
-        tbhdu.header["DATE"] = t_begin.tt.isot
-        tbhdu.header["DATE-OBS"] = t_begin.tt.isot
-        tbhdu.header["DATE-END"] = t_end.tt.isot
-        if "RMF" in self.parameters:
-            tbhdu.header["RESPFILE"] = self.parameters["RMF"]
-            f = pyfits.open(self.parameters["RMF"])
-            nchan = int(f["EBOUNDS"].header["DETCHANS"])
-            tbhdu.header["PHA_BINS"] = nchan
-            f.close()
-        if "ARF" in self.parameters:
-            tbhdu.header["ANCRFILE"] = self.parameters["ARF"]
-        if "ChannelType" in self.parameters:
-            tbhdu.header["CHANTYPE"] = self.parameters["ChannelType"]
-        if "Mission" in self.parameters:
-            tbhdu.header["MISSION"] = self.parameters["Mission"]
-        if "Telescope" in self.parameters:
-            tbhdu.header["TELESCOP"] = self.parameters["Telescope"]
-        if "Instrument" in self.parameters:
-            tbhdu.header["INSTRUME"] = self.parameters["Instrument"]
+        _write_events_header(tbhdu.header, self.parameters, t_begin, t_end)
 
         hdulist = [pyfits.PrimaryHDU(), tbhdu]
 
         if "ChannelType" in self.parameters:
-            start = pyfits.Column(name='START', format='1D', unit='s',
-                                  array=np.array([0.0]))
-            stop = pyfits.Column(name='STOP', format='1D', unit='s',
-                                 array=np.array([exp_time]))
-
-            tbhdu_gti = pyfits.BinTableHDU.from_columns([start,stop])
-            tbhdu_gti.update_ext_name("STDGTI")
-            tbhdu_gti.header["TSTART"] = 0.0
-            tbhdu_gti.header["TSTOP"] = exp_time
-            tbhdu_gti.header["HDUCLASS"] = "OGIP"
-            tbhdu_gti.header["HDUCLAS1"] = "GTI"
-            tbhdu_gti.header["HDUCLAS2"] = "STANDARD"
-            tbhdu_gti.header["RADECSYS"] = "FK5"
-            tbhdu_gti.header["EQUINOX"] = 2000.0
-            tbhdu_gti.header["DATE"] = t_begin.tt.isot
-            tbhdu_gti.header["DATE-OBS"] = t_begin.tt.isot
-            tbhdu_gti.header["DATE-END"] = t_end.tt.isot
-
-            hdulist.append(tbhdu_gti)
+            hdulist.append(_gti_hdu(exp_time, t_begin, t_end))
 
         pyfits.HDUList(hdulist).writeto(fitsfile, clobber=clobber)
 
@@ -1224,29 +1741,7 @@ class EventList(object):
         """
         f = h5py.File(h5file, "w")
 
-        p = f.create_group("parameters")
-        p.create_dataset("exp_time", data=float(self.parameters["ExposureTime"]))
-        area = self.parameters["Area"]
-        if not isinstance(area, string_types):
-            area = float(area)
-        p.create_dataset("area", data=area)
-        p.create_dataset("redshift", data=self.parameters["Redshift"])
-        p.create_dataset("d_a", data=float(self.parameters["AngularDiameterDistance"]))
-        if "ARF" in self.parameters:
-            p.create_dataset("arf", data=self.parameters["ARF"])
-        if "RMF" in self.parameters:
-            p.create_dataset("rmf", data=self.parameters["RMF"])
-        if "ChannelType" in self.parameters:
-            p.create_dataset("channel_type", data=self.parameters["ChannelType"])
-        if "Mission" in self.parameters:
-            p.create_dataset("mission", data=self.parameters["Mission"])
-        if "Telescope" in self.parameters:
-            p.create_dataset("telescope", data=self.parameters["Telescope"])
-        if "Instrument" in self.parameters:
-            p.create_dataset("instrument", data=self.parameters["Instrument"])
-        p.create_dataset("sky_center", data=self.parameters["sky_center"].d)
-        p.create_dataset("pix_center", data=self.parameters["pix_center"])
-        p.create_dataset("dtheta", data=float(self.parameters["dtheta"]))
+        _write_event_parameters(f, self.parameters)
 
         d = f.create_group("data")
         d.create_dataset("xpix", data=self["xpix"])
@@ -0,0 +1,152 @@
+"""
+Tests for generating and projecting photons a chunk at a time.
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import warnings
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from yt.analysis_modules.photon_simulator.api import \
+        SpectralModel, ThermalPhotonModel, PhotonList, EventList
+from yt.config import ytcfg
+from yt.frontends.stream.api import load_uniform_grid
+from yt.testing import \
+    assert_equal, \
+    assert_allclose, \
+    requires_module
+from yt.units.yt_array import YTArray
+from yt.utilities.on_demand_imports import _astropy
+from yt.utilities.physical_ratios import \
+    K_per_keV, mass_hydrogen_grams
+import numpy as np
+from numpy.random import RandomState
+import os
+import shutil
+import tempfile
+
+def setup():
+    global old_processes
+    ytcfg["yt", "__withintesting"] = "True"
+    old_processes = ytcfg.get("yt", "local_parallel_processes")
+    ytcfg["yt", "local_parallel_processes"] = "2"
+
+def teardown():
+    ytcfg["yt", "local_parallel_processes"] = old_processes
+
+class LineModel(SpectralModel):
+    # A spectrum of a single line, broadened with the temperature
+    def __init__(self, nchan=100):
+        SpectralModel.__init__(self, 0.1, 10.0, nchan)
+
+    def prepare_spectrum(self, zobs):
+        self.zobs = zobs
+
+    def get_spectrum(self, kT):
+        line = np.exp(-0.5*((self.emid.d-6.0)/(0.1*kT))**2)
+        cspec = YTArray(1.0e-18*line, "cm**3/s")
+        mspec = YTArray(1.0e-19*line, "cm**3/s")
+        return cspec, mspec
+
+    def cleanup_spectrum(self):
+        pass
+
+def _cluster():
+    nx = 16
+    ddims = (nx,)*3
+    x, y, z = np.mgrid[-1:1:nx*1j, -1:1:nx*1j, -1:1:nx*1j]
+    r = np.sqrt(x**2+y**2+z**2)
+    prng = RandomState(25)
+    data = {}
+    data["density"] = (0.04*mass_hydrogen_grams/(1.+(r/0.2)**2)**1.5,
+                       "g/cm**3")
+    data["temperature"] = (K_per_keV*(4.+prng.uniform(size=ddims)), "K")
+    data["velocity_x"] = (np.zeros(ddims), "cm/s")
+    data["velocity_y"] = (np.zeros(ddims), "cm/s")
+    data["velocity_z"] = (prng.normal(scale=1.0e7, size=ddims), "cm/s")
+    bbox = np.array([[-0.5,0.5],[-0.5,0.5],[-0.5,0.5]])
+    return load_uniform_grid(data, ddims, length_unit=(2, "Mpc"),
+                             nprocs=8, bbox=bbox)
+
+def _make_photons(ds, **kwargs):
+    thermal_model = ThermalPhotonModel(LineModel(), prng=RandomState(24))
+    return PhotonList.from_scratch(ds.all_data(), 0.05, 3000., 3.0e5,
+                                   thermal_model, **kwargs)
+
+def _assert_same_events(events1, events2):
+    for key in ["xpix", "ypix", "eobs"]:
+        assert_equal(np.asarray(events1[key]), np.asarray(events2[key]))
+
+@requires_module("h5py")
+@requires_module("astropy")
+def test_streaming():
+    tmpdir = tempfile.mkdtemp()
+    curdir = os.getcwd()
+    os.chdir(tmpdir)
+
+    ds = _cluster()
+
+    # Photons written to a file as they are generated are the same as
+    # those generated in memory, in any number of processes.
+    photons = _make_photons(ds, njobs=2)
+    on_disk = _make_photons(ds, photonfile="photons.h5")
+    assert_equal(on_disk.filename, "photons.h5")
+    assert_equal(on_disk.num_cells, photons.num_cells)
+    assert_equal(on_disk.p_bins, photons.p_bins)
+    for key in ["x", "vz", "dx", "NumberOfPhotons", "Energy"]:
+        assert_equal(on_disk.photons[key], photons.photons[key])
+    assert_equal(on_disk["Energy"][3], photons["Energy"][3])
+    assert photons.num_cells > 1000
+
+    # Chunked projections observe every photon, as an unchunked one does.
+    all_events = photons.project_photons("z", prng=RandomState(12))
+    events = photons.project_photons("z", cells_per_chunk=1000,
+                                     prng=RandomState(12))
+    assert_equal(events.num_events, all_events.num_events)
+    assert_allclose(np.sort(events["eobs"]), np.sort(all_events["eobs"]))
+
+    # The events of a chunked projection depend only on the random numbers,
+    # whether the photons are read from disk or not, in any number of
+    # processes.
+    kwargs = {"area_new": 2000., "exp_time_new": 1.0e5, "psf_sigma": 0.5,
+              "cells_per_chunk": 1000}
+    events = photons.project_photons("z", prng=RandomState(12), **kwargs)
+    assert 0 < events.num_events < all_events.num_events
+    disk_events = on_disk.project_photons("z", prng=RandomState(12),
+                                          njobs=2, **kwargs)
+    _assert_same_events(events, disk_events)
+
+    # Events streamed to files are those returned in an EventList.
+    kwargs.pop("cells_per_chunk")
+    events = on_disk.project_photons([0.1, 0.2, 0.3],
+                                     prng=RandomState(12), **kwargs)
+    for fn in ["events.h5", "events.fits"]:
+        ret = on_disk.project_photons([0.1, 0.2, 0.3], prng=RandomState(12),
+                                      events_file=fn, **kwargs)
+        assert ret is None
+    _assert_same_events(events, EventList.from_h5_file("events.h5"))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        f = _astropy.pyfits.open("events.fits")
+        assert_equal(f["EVENTS"].header["NAXIS2"], events.num_events)
+        assert_equal(f["EVENTS"].data.field("X"), events["xpix"])
+        assert_allclose(f["EVENTS"].data.field("ENERGY"),
+                        events["eobs"].in_units("eV").d, rtol=1.0e-6)
+        f.close()
+    events.write_h5_file("events_memory.h5")
+    events_memory = EventList.from_h5_file("events_memory.h5")
+    assert_equal(events_memory.parameters["pix_center"],
+                 EventList.from_h5_file("events.h5").parameters["pix_center"])
+
+    os.chdir(curdir)
+    shutil.rmtree(tmpdir)
@@ -1,6 +1,7 @@
 """
 Projection class for the Sunyaev-Zeldovich effect. Requires SZpack (at least
-version 1.1.1) to be downloaded and installed:
+version 1.1.1) to be downloaded and installed, unless only the
+non-relativistic signal is computed:
 
 http://www.chluba.de/SZpack/
 
@@ -20,18 +21,24 @@ Chluba, Switzer, Nagai, Nelson, MNRAS, 2012, arXiv:1211.3206
 
 from yt.config import \
     ytcfg
-from yt.utilities.physical_constants import sigma_thompson, clight, hcgs, kboltz, mh, Tcmb
+from yt.utilities.physical_constants import sigma_thompson, clight, hcgs, kboltz, mh, Tcmb, me
 from yt.funcs import fix_axis, get_pbar
 from yt.visualization.volume_rendering.off_axis_projection import \
     off_axis_projection
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
-    communication_system, parallel_root_only
+    communication_system, parallel_root_only, parallel_capable
+from yt.utilities.parallel_tools.local_parallelism import \
+    local_imap
 from yt import units
 from yt.utilities.on_demand_imports import _astropy
 
 import numpy as np
 
 I0 = (2*(kboltz*Tcmb)**3/((hcgs*clight)**2)/units.sr).in_units("MJy/steradian")
+me_keV = float((me*clight*clight).in_units("keV"))
+
+# The number of rows of pixels SZpack is called for in each block
+rows_per_block = 8
 
 try:
     import SZpack
@@ -65,6 +72,21 @@ def setup_sunyaev_zeldovich_fields(ds):
     ds.add_field(("gas","t_sz"), function = _t_sz,
                  units="keV*g/cm**3")
 
+def nonrelativistic_distortion(x, tau, Te, bpar):
+    r"""The change in the photon occupation number of the CMB at the
+    dimensionless frequencies *x*, for the optical depths *tau*,
+    temperatures *Te* (in keV), and line-of-sight velocities *bpar* (in
+    units of the speed of light) of each pixel, from the thermal and
+    kinematic S-Z effects to lowest order in the temperature and velocity.
+    The result has the shape of *x* followed by the shape of the pixels.
+    """
+    x = np.asarray(x, dtype="float64").reshape((-1,) + (1,)*np.ndim(tau))
+    ex = np.exp(x)
+    G = x*ex/(ex-1.)**2
+    Y0 = G*(x*(ex+1.)/(ex-1.) - 4.)
+    theta = Te/me_keV
+    return tau*(theta*Y0 + bpar*G)
+
 def generate_beta_par(L):
     def _beta_par(field, data):
         vpar = data["density"]*(data["velocity_x"]*L[0]+
@@ -86,17 +108,25 @@ class SZProjection(object):
         Mean molecular weight for determining the electron number density.
     high_order : boolean, optional
         Should we calculate high-order moments of velocity and temperature?
+    relativistic : boolean, optional
+        If False, the signal is computed with NumPy to lowest order in the
+        temperature and velocity, without relativistic corrections, instead
+        of with SZpack.  This is much faster, and does not need SZpack, but
+        is only accurate for temperatures of a few keV or less.  The
+        high-order moments are not used.
 
     Examples
     --------
     >>> freqs = [90., 180., 240.]
     >>> szprj = SZProjection(ds, freqs, high_order=True)
     """
-    def __init__(self, ds, freqs, mue=1.143, high_order=False):
+    def __init__(self, ds, freqs, mue=1.143, high_order=False,
+                 relativistic=True):
 
         self.ds = ds
         self.num_freqs = len(freqs)
-        self.high_order = high_order
+        self.high_order = high_order and relativistic
+        self.relativistic = relativistic
         self.freqs = ds.arr(freqs, "GHz")
         self.mueinv = 1./mue
         self.xinit = hcgs*self.freqs.in_units("Hz")/(kboltz*Tcmb)
@@ -110,7 +140,8 @@ class SZProjection(object):
         for f, field in zip(self.freqs, self.freq_fields):
             self.display_names[field] = r"$\mathrm{\Delta{I}_{%d\ GHz}}$" % int(f)
 
-    def on_axis(self, axis, center="c", width=(1, "unitary"), nx=800, source=None):
+    def on_axis(self, axis, center="c", width=(1, "unitary"), nx=800, source=None,
+                njobs=1):
         r""" Make an on-axis projection of the SZ signal.
 
         Parameters
@@ -151,6 +182,10 @@ class SZProjection(object):
             The dimensions on a side of the projection image.
         source : yt.data_objects.data_containers.YTSelectionContainer, optional
             If specified, this will be the data source used for selecting regions to project.
+        njobs : integer, optional
+            The number of local processes blocks of pixels are handed to
+            SZpack in, with 0 for the ``local_parallel_processes``
+            configuration option.  Default: 1.
 
         Examples
         --------
@@ -189,12 +224,14 @@ class SZProjection(object):
 
         self._compute_intensity(np.array(tau), np.array(Te), np.array(bpar),
                                 np.array(omega1), np.array(sigma1),
-                                np.array(kappa1), np.array(bperp2))
+                                np.array(kappa1), np.array(bperp2),
+                                njobs=njobs)
 
         self.ds.field_info.pop(("gas","beta_par"))
 
     def off_axis(self, L, center="c", width=(1.0, "unitary"), depth=(1.0,"unitary"),
-                 nx=800, nz=800, north_vector=None, no_ghost=False, source=None):
+                 nx=800, nz=800, north_vector=None, no_ghost=False, source=None,
+                 njobs=1):
         r""" Make an off-axis projection of the SZ signal.
 
         Parameters
@@ -255,6 +292,10 @@ class SZProjection(object):
         source : yt.data_objects.data_containers.YTSelectionContainer, optional
             If specified, this will be the data source used for selecting regions 
             to project.
+        njobs : integer, optional
+            The number of local processes blocks of pixels are handed to
+            SZpack in, with 0 for the ``local_parallel_processes``
+            configuration option.  Default: 1.
 
         Examples
         --------
@@ -304,11 +345,28 @@ class SZProjection(object):
 
         self._compute_intensity(np.array(tau), np.array(Te), np.array(bpar),
                                 np.array(omega1), np.array(sigma1),
-                                np.array(kappa1), np.array(bperp2))
+                                np.array(kappa1), np.array(bperp2),
+                                njobs=njobs)
 
         self.ds.field_info.pop(("gas","beta_par"))
 
-    def _compute_intensity(self, tau, Te, bpar, omega1, sigma1, kappa1, bperp2):
+    def _compute_intensity(self, tau, Te, bpar, omega1, sigma1, kappa1, bperp2,
+                           njobs=1):
+
+        if self.relativistic:
+            signal = self._compute_szpack_signal(tau, Te, bpar, omega1,
+                                                 sigma1, kappa1, bperp2,
+                                                 njobs=njobs)
+        else:
+            signal = nonrelativistic_distortion(self.xinit.d, tau, Te, bpar)
+
+        for i, field in enumerate(self.freq_fields):
+            self.data[field] = I0*self.xinit[i]**3*signal[i,:,:]
+        self.data["Tau"] = self.ds.arr(tau, "dimensionless")
+        self.data["TeSZ"] = self.ds.arr(Te, "keV")
+
+    def _compute_szpack_signal(self, tau, Te, bpar, omega1, sigma1, kappa1,
+                               bperp2, njobs=1):
 
         # Bad hack, but we get NaNs if we don't do something like this
         small_beta = np.abs(bpar) < 1.0e-20
@@ -318,33 +376,41 @@ class SZProjection(object):
 
         nx, ny = self.nx,self.nx
         signal = np.zeros((self.num_freqs,nx,ny))
-        xo = np.zeros(self.num_freqs)
-
-        k = int(0)
+        xinit = np.array(self.xinit)
 
         start_i = comm.rank*nx//comm.size
         end_i = (comm.rank+1)*nx//comm.size
+        blocks = [(i, min(i+rows_per_block, end_i))
+                  for i in range(start_i, end_i, rows_per_block)]
+
+        def compute_block(block):
+            i0, i1 = block
+            block_signal = np.zeros((self.num_freqs,i1-i0,ny))
+            xo = np.zeros(self.num_freqs)
+            for i in range(i0, i1):
+                for j in range(ny):
+                    xo[:] = xinit
+                    SZpack.compute_combo_means(xo, tau[i,j], Te[i,j],
+                                               bpar[i,j], omega1[i,j],
+                                               sigma1[i,j], kappa1[i,j], bperp2[i,j])
+                    block_signal[:,i-i0,j] = xo
+            return block_signal
 
         pbar = get_pbar("Computing SZ signal.", nx*nx)
 
-        for i in range(start_i, end_i):
-            for j in range(ny):
-                xo[:] = self.xinit[:]
-                SZpack.compute_combo_means(xo, tau[i,j], Te[i,j],
-                                           bpar[i,j], omega1[i,j],
-                                           sigma1[i,j], kappa1[i,j], bperp2[i,j])
-                signal[:,i,j] = xo[:]
-                pbar.update(k)
-                k += 1
+        if parallel_capable:
+            results = (compute_block(block) for block in blocks)
+        else:
+            results = local_imap(compute_block, blocks, njobs=njobs)
+        for (i0, i1), block_signal in zip(blocks, results):
+            signal[:,i0:i1,:] = block_signal
+            pbar.update((i1-start_i)*ny)
 
         signal = comm.mpi_allreduce(signal)
 
         pbar.finish()
 
-        for i, field in enumerate(self.freq_fields):
-            self.data[field] = I0*self.xinit[i]**3*signal[i,:,:]
-        self.data["Tau"] = self.ds.arr(tau, "dimensionless")
-        self.data["TeSZ"] = self.ds.arr(Te, "keV")
+        return signal
 
     @parallel_root_only
     def write_fits(self, filename, sky_scale=None, sky_center=None, overwrite=True,
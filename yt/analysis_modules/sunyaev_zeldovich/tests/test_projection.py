@@ -22,8 +22,9 @@ from yt.utilities.physical_constants import \
     Tcmb, \
     hcgs, \
     clight, \
+    me, \
     sigma_thompson
-from yt.testing import requires_module, assert_almost_equal
+from yt.testing import requires_module, assert_almost_equal, assert_equal
 from yt.utilities.answer_testing.framework import requires_ds, \
     GenericArrayTest, data_dir_load, GenericImageTest
 try:
@@ -116,6 +117,44 @@ def test_projection():
         assert_almost_equal(
             deltaI[i,:,:], np.array(szprj["%d_GHz" % int(freqs[i])]), 6)
 
+def nonrelativistic3d(ds, xo):
+    data = ds.index.grids[0]
+    dz = ds.index.get_smallest_dx().in_units("cm")
+    Dtau = np.array(sigma_thompson*data["density"]/(mh*mue)*dz)
+    theta = np.array(data["kT"]/(me*clight*clight))
+    betac = np.array(data["velocity_z"]/clight)
+    G = xo*np.exp(xo)/(np.exp(xo)-1.)**2
+    Y0 = G*(xo/np.tanh(0.5*xo)-4.)
+    dn = Dtau*(theta*Y0 + betac*G)
+    return np.array(I0*xo**3*np.sum(dn, axis=2))
+
+def test_nonrelativistic():
+    ds = setup_cluster()
+    nx,ny,nz = ds.domain_dimensions
+    xinit = np.array(1.0e9*hcgs*freqs/(kboltz*Tcmb))
+    szprj = SZProjection(ds, freqs, mue=mue, relativistic=False)
+    szprj.on_axis(2, nx=nx)
+    for i in range(3):
+        deltaI = nonrelativistic3d(ds, xinit[i])
+        assert_almost_equal(
+            deltaI, np.array(szprj["%d_GHz" % int(freqs[i])]), 6)
+
+@requires_module("SZpack")
+def test_projection_njobs():
+    from yt.config import ytcfg
+    old_processes = ytcfg.get("yt", "local_parallel_processes")
+    ytcfg["yt", "local_parallel_processes"] = "2"
+    try:
+        ds = setup_cluster()
+        szprj = SZProjection(ds, freqs, mue=mue, high_order=True)
+        szprj.on_axis(2, nx=32)
+        szprj2 = SZProjection(ds, freqs, mue=mue, high_order=True)
+        szprj2.on_axis(2, nx=32, njobs=2)
+    finally:
+        ytcfg["yt", "local_parallel_processes"] = old_processes
+    for field in szprj.keys():
+        assert_equal(szprj[field], szprj2[field])
+
 M7 = "DD0010/moving7_0010"
 @requires_module("SZpack")
 @requires_ds(M7)
@@ -67,6 +67,20 @@ ytcfg_defaults = dict(
     thread_field_detection = 'False',
     ignore_invalid_unit_operation_errors = 'False',
     chunk_size = '1000',
+    chunked_field_generation = 'False',
+    streaming_reductions = 'True',
+    selection_cache_size = '128',
+    memory_mapped_io = 'True',
+    hierarchy_cache = 'True',
+    lightweight_grids = 'False',
+    local_parallel_processes = '1',
+    ramses_amr_processes = '1',
+    ramses_octree_cache = 'False',
+    compact_octrees = 'False',
+    smoothing_neighbor_cache_size = '256',
+    sph_direct_pixelization = 'True',
+    bvh_cache = 'False',
+    particle_id_index_cache = 'False',
     xray_data_dir = '/does/not/exist',
     supp_data_dir = '/does/not/exist',
     default_colormap = 'arbre',
@@ -266,6 +266,11 @@ class YTQuadTreeProj(YTSelectionContainer2D):
             if any(nodal_flag):
                 raise RuntimeError("Nodal fields are currently not supported for projections.")
 
+        # SPH fields that are pixelized directly from the particles are not
+        # projected until they are asked for.
+        field = [f for f in field if
+                 self.ds.coordinates._sph_field_source(self, f) is None]
+
         if not self.deserialize(field):
             self.get_data(field)
             self.serialize()
@@ -746,7 +751,7 @@ class YTCoveringGrid(YTSelectionContainer3D):
         return self.right_edge
 
     def deposit(self, positions, fields = None, method = None,
-                kernel_name = 'cubic'):
+                kernel_name = 'cubic', num_threads = 1):
         cls = getattr(particle_deposit, "deposit_%s" % method, None)
         if cls is None:
             raise YTParticleDepositionNotImplemented(method)
@@ -759,7 +764,7 @@ class YTCoveringGrid(YTSelectionContainer3D):
         # one grid
         op = cls(nvals + (1,), kernel_name)
         op.initialize()
-        op.process_grid(self, positions, fields)
+        op.process_grid(self, positions, fields, num_threads)
         # Fortran-ordered, so transpose.
         vals = op.finalize().transpose()
         # squeeze dummy dimension we appended above
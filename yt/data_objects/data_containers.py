@@ -23,6 +23,7 @@ import shelve
 from collections import defaultdict
 from contextlib import contextmanager
 
+from yt.config import ytcfg
 from yt.fields.derived_field import \
     DerivedField
 from yt.frontends.ytdata.utilities import \
@@ -36,7 +37,8 @@ from yt.funcs import \
 from yt.units.unit_object import UnitParseError
 from yt.units.yt_array import \
     YTArray, \
-    YTQuantity
+    YTQuantity, \
+    uconcatenate
 import yt.units.dimensions as ytdims
 from yt.utilities.exceptions import \
     YTUnitConversionError, \
@@ -67,6 +69,7 @@ from yt.geometry.selection_routines import \
     compose_selector
 from yt.extern.six import add_metaclass, string_types
 from yt.data_objects.field_data import YTFieldData
+from yt.data_objects.field_plan import FieldGenerationPlan
 from yt.data_objects.profiles import create_profile
 
 data_object_registry = {}
@@ -1139,9 +1142,13 @@ class YTDataContainer(object):
             obj._current_particle_type = ftype
         else:
             obj._current_fluid_type = ftype
-        yield
-        obj._current_particle_type = old_particle_type
-        obj._current_fluid_type = old_fluid_type
+        try:
+            yield
+        finally:
+            # Generation may be put off by a GenerationInProgress, so restore
+            # the types even when the field could not be generated yet.
+            obj._current_particle_type = old_particle_type
+            obj._current_fluid_type = old_fluid_type
 
     def _determine_fields(self, fields):
         fields = ensure_list(fields)
@@ -1225,6 +1232,7 @@ class YTSelectionContainer(YTDataContainer, ParallelAnalysisInterface):
     _dimensionality = None
     _max_level = None
     _min_level = None
+    _field_plan = None
 
     def __init__(self, ds, field_parameters, data_source=None):
         ParallelAnalysisInterface.__init__(self)
@@ -1346,6 +1354,9 @@ class YTSelectionContainer(YTDataContainer, ParallelAnalysisInterface):
             return
         elif self._locked is True:
             raise GenerationInProgress(fields)
+        if self._can_generate_by_chunk(fields_to_get + fields_to_generate):
+            self._generate_fields_by_chunk(fields_to_get + fields_to_generate)
+            return
         # Track which ones we want in the end
         ofields = set(list(self.field_data.keys())
                     + fields_to_get
@@ -1379,13 +1390,53 @@ class YTSelectionContainer(YTDataContainer, ParallelAnalysisInterface):
             self.field_data[f].convert_to_units(finfos[f].output_units)
 
         fields_to_generate += gen_fluids + gen_particles
-        self._generate_fields(fields_to_generate)
+        self._generate_fields(fields_to_generate, keep=ofields)
         for field in list(self.field_data.keys()):
             if field not in ofields:
                 self.field_data.pop(field)
 
-    def _generate_fields(self, fields_to_generate):
-        index = 0
+    def _can_generate_by_chunk(self, fields):
+        # Evaluating chunk-by-chunk only pays off when at least one of the
+        # fields is derived, and only makes sense for the full selection.
+        if not ytcfg.getboolean("yt", "chunked_field_generation"):
+            return False
+        if self._spatial or self._current_chunk is None or \
+           self._current_chunk.chunk_type != "all":
+            return False
+        return any(f not in self.ds.field_list for f in fields)
+
+    def _generate_fields_by_chunk(self, fields):
+        """
+        Generate *fields* one io chunk at a time and concatenate the results.
+        Only the requested fields are ever held at full size; every
+        dependency and intermediate lives only for the duration of a chunk.
+        """
+        pieces = defaultdict(list)
+        peak_memory = 0
+        for chunk in self.chunks(fields, "io", cache = False):
+            for field in fields:
+                pieces[field].append(self.field_data[field])
+            if self._field_plan is not None:
+                peak_memory = max(peak_memory, self._field_plan.peak_memory)
+        for field in fields:
+            if len(pieces[field]) == 0:
+                finfo = self.ds._get_field_info(*field)
+                self.field_data[field] = self.ds.arr(
+                    np.empty(0, dtype="float64"), finfo.output_units)
+            else:
+                self.field_data[field] = uconcatenate(pieces.pop(field))
+        mylog.debug("Generated %s fields by chunk, peak chunk field memory "
+                    "%0.3e bytes", len(fields), peak_memory)
+
+    def _generate_fields(self, fields_to_generate, keep=None):
+        # The plan orders the fields so that each one is generated after the
+        # derived fields it depends on, and releases anything not in ``keep``
+        # as soon as its last consumer has been generated.
+        plan = FieldGenerationPlan(self, fields_to_generate,
+                                   keep=keep if keep is not None else
+                                   set(self.field_data.keys()) |
+                                   set(fields_to_generate))
+        self._field_plan = plan
         with self._field_lock():
             # At this point, we assume that any fields that are necessary to
             # *generate* a field are in fact already available to us.  Note
@@ -1393,10 +1444,11 @@ class YTSelectionContainer(YTDataContainer, ParallelAnalysisInterface):
             # fields have a spatial requirement.  This will be checked inside
             # _generate_field, at which point additional dependencies may
             # actually be noted.
-            while any(f not in self.field_data for f in fields_to_generate):
-                field = fields_to_generate[index % len(fields_to_generate)]
-                index += 1
-                if field in self.field_data: continue
+            while not plan.done:
+                field = plan.next_field()
+                if field in self.field_data:
+                    plan.complete(field)
+                    continue
                 fi = self.ds._get_field_info(*field)
                 try:
                     fd = self._generate_field(field)
@@ -1434,10 +1486,10 @@ class YTSelectionContainer(YTDataContainer, ParallelAnalysisInterface):
                     except UnitParseError:
                         raise YTFieldUnitParseError(fi)
                     self.field_data[field] = fd
+                    plan.complete(field)
                 except GenerationInProgress as gip:
-                    for f in gip.fields:
-                        if f not in fields_to_generate:
-                            fields_to_generate.append(f)
+                    plan.add_dependencies(field, gip.fields)
+        plan.report()
 
     def __or__(self, other):
         if not isinstance(other, YTSelectionContainer):
@@ -2012,17 +2064,21 @@ class YTSelectionContainer3D(YTSelectionContainer):
                                num_levels+1)
         else:
             cons = np.linspace(min_val, max_val, num_levels+1)
+        if cumulative:
+            max_vals = [max_val] * num_levels
+        else:
+            max_vals = cons[1:]
+        from yt.data_objects.level_sets.contour_finder import \
+            identify_contour_levels
+        from yt.data_objects.level_sets.clump_handling import \
+            add_contour_field
+        # All the levels are found with a single pass over the data.
+        level_sets = identify_contour_levels(self, field, cons[:num_levels],
+                                             max_vals)
         contours = {}
         for level in range(num_levels):
             contours[level] = {}
-            if cumulative:
-                mv = max_val
-            else:
-                mv = cons[level+1]
-            from yt.data_objects.level_sets.api import identify_contours
-            from yt.data_objects.level_sets.clump_handling import \
-                add_contour_field
-            nj, cids = identify_contours(self, field, cons[level], mv)
+            nj, cids = level_sets[level]
             unique_contours = set([])
             for sl_list in cids.values():
                 for sl, ff in sl_list:
@@ -17,6 +17,7 @@ points -- are excluded here, and left to the EnzoDerivedFields.)
 
 import numpy as np
 
+from yt.config import ytcfg
 from yt.funcs import \
     camelcase_to_underscore, \
     ensure_list
@@ -63,7 +64,7 @@ class DerivedQuantity(ParallelAnalysisInterface):
         # create the index if it doesn't exist yet
         self.data_source.ds.index
         self.count_values(*args, **kwargs)
-        chunks = self.data_source.chunks([], chunking_style="io")
+        chunks = self._get_chunks(*args, **kwargs)
         storage = {}
         for sto, ds in parallel_objects(chunks, -1, storage = storage):
             sto.result = self.process_chunk(ds, *args, **kwargs)
@@ -79,6 +80,30 @@ class DerivedQuantity(ParallelAnalysisInterface):
         values = self.reduce_intermediate(values)
         return values
 
+    def _get_chunks(self, *args, **kwargs):
+        # Quantities are reduced one io chunk at a time, so that only a
+        # single chunk's worth of field data (and dependencies) is ever held
+        # in memory.  If the fields have already been read into the data
+        # source we reduce those arrays directly rather than reading them
+        # again, and the streaming path can be switched off entirely, in
+        # which case the whole data source is read as one chunk.
+        dobj = self.data_source
+        fields = self.required_fields(*args, **kwargs)
+        if fields is not None and len(fields) > 0:
+            fields = dobj._determine_fields(fields)
+            if all(f in dobj.field_data for f in fields):
+                return [dobj]
+        if not ytcfg.getboolean("yt", "streaming_reductions"):
+            return dobj.chunks([], chunking_style="all")
+        return dobj.chunks([], chunking_style="io")
+
+    def required_fields(self, *args, **kwargs):
+        """
+        The fields this quantity reads, given the arguments it was called
+        with, or None if that is not known.
+        """
+        return None
+
     def process_chunk(self, data, *args, **kwargs):
         raise NotImplementedError
 
@@ -136,6 +161,9 @@ class WeightedAverageQuantity(DerivedQuantity):
         # This is a list now
         self.num_vals = len(fields) + 1
 
+    def required_fields(self, fields, weight):
+        return ensure_list(fields) + [weight]
+
     def __call__(self, fields, weight):
         fields = ensure_list(fields)
         rv = super(WeightedAverageQuantity, self).__call__(fields, weight)
@@ -173,6 +201,9 @@ class TotalQuantity(DerivedQuantity):
         # This is a list now
         self.num_vals = len(fields)
 
+    def required_fields(self, fields):
+        return ensure_list(fields)
+
     def __call__(self, fields):
         fields = ensure_list(fields)
         rv = super(TotalQuantity, self).__call__(fields)
@@ -395,6 +426,9 @@ class WeightedVariance(DerivedQuantity):
         # This is a list now
         self.num_vals = 2 * len(fields) + 1
 
+    def required_fields(self, fields, weight):
+        return ensure_list(fields) + [weight]
+
     def __call__(self, fields, weight):
         fields = ensure_list(fields)
         rv = super(WeightedVariance, self).__call__(fields, weight)
@@ -537,6 +571,9 @@ class Extrema(DerivedQuantity):
     def count_values(self, fields, non_zero):
         self.num_vals = len(fields) * 2
 
+    def required_fields(self, fields, non_zero):
+        return ensure_list(fields)
+
     def __call__(self, fields, non_zero = False):
         fields = ensure_list(fields)
         rv = super(Extrema, self).__call__(fields, non_zero)
@@ -587,6 +624,9 @@ class SampleAtMaxFieldValues(DerivedQuantity):
         # field itself, then index, then the number of sample fields
         self.num_vals = 1 + len(sample_fields)
 
+    def required_fields(self, field, sample_fields):
+        return [field] + list(sample_fields)
+
     def __call__(self, field, sample_fields):
         rv = super(SampleAtMaxFieldValues, self).__call__(field, sample_fields)
         if len(rv) == 1: rv = rv[0]
@@ -0,0 +1,160 @@
+"""
+Dependency-aware scheduling of derived field generation.
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+from yt.funcs import mylog
+
+
+class FieldGenerationPlan(object):
+    r"""An evaluation order for a set of derived fields.
+
+    The dependency information recorded by the field detector only lists the
+    on-disk fields a derived field ultimately consumes, so the edges between
+    derived fields are learned the first time they are generated (every time
+    a field has to be put off because it needs another derived field) and
+    kept on the dataset.  From then on fields are ordered topologically,
+    so that each field is generated after the derived fields it consumes,
+    and for every dependency we remember the position of its last consumer.
+    Fields that are not part of the result set can then be released as soon
+    as that consumer has run, rather than surviving until the end of
+    ``get_data``.
+
+    Parameters
+    ----------
+    dobj : YTSelectionContainer
+        The data object the fields will be generated on.
+    fields : list of tuples
+        The (ftype, fname) fields to be generated.
+    keep : iterable of tuples, optional
+        Fields that must remain in ``dobj.field_data`` once the plan has
+        been executed.  Everything else consumed by the plan is considered
+        an intermediate and is released after its last use.
+    """
+    def __init__(self, dobj, fields, keep=None):
+        self.dobj = dobj
+        self.keep = set(keep or ())
+        self.dependencies = {}
+        self.order = []
+        self.last_consumer = {}
+        self.freed = set()
+        self.peak_memory = 0
+        self._position = 0
+        ds = dobj.ds
+        if ds._field_generation_graph is None:
+            ds._field_generation_graph = {}
+        self.graph = ds._field_generation_graph
+        self.add_fields(fields)
+
+    def _get_dependencies(self, field):
+        if field in self.dependencies:
+            return self.dependencies[field]
+        ds = self.dobj.ds
+        fd = ds.field_dependencies.get(field, None) or \
+             ds.field_dependencies.get(field[1], None)
+        requested = []
+        if fd is not None:
+            # The field detector reports these with whatever field type it
+            # guessed, so we resolve them without disturbing the guess the
+            # data object will make for the next field it is asked for.
+            last_freq, last_finfo = ds._last_freq, ds._last_finfo
+            try:
+                requested = self.dobj._determine_fields(
+                    list(set(fd.requested)))
+            except Exception:
+                requested = []
+            ds._last_freq, ds._last_finfo = last_freq, last_finfo
+        deps = [d for d in requested if d != field]
+        deps.extend(d for d in self.graph.get(field, ()) if d not in deps)
+        self.dependencies[field] = deps
+        return deps
+
+    def add_fields(self, fields):
+        """
+        Schedule *fields*, placing them (and any derived dependencies that
+        are also scheduled) into topological order among the fields that
+        have not been generated yet.
+        """
+        remaining = self.order[self._position:]
+        pending = [f for f in fields if f not in remaining]
+        if len(pending) == 0:
+            return
+        self._reorder(remaining + pending)
+
+    def add_dependencies(self, field, deps):
+        """
+        Record that *field* turned out to need *deps*, which the dependency
+        detection did not report, and schedule them ahead of it.
+        """
+        known = self._get_dependencies(field)
+        learned = self.graph.setdefault(field, [])
+        for dep in deps:
+            if dep == field: continue
+            if dep not in known: known.append(dep)
+            if dep not in learned: learned.append(dep)
+        self._reorder(self.order[self._position:] +
+                      [d for d in deps if d not in self.order[self._position:]])
+
+    def _reorder(self, fields):
+        targets = set(fields)
+        ordered = []
+        visiting = set()
+        def visit(field):
+            if field in ordered or field in visiting:
+                # Already scheduled, or a dependency cycle; in the latter
+                # case we fall back to the requested order.
+                return
+            visiting.add(field)
+            for dep in self._get_dependencies(field):
+                if dep in targets:
+                    visit(dep)
+            visiting.discard(field)
+            ordered.append(field)
+        for field in fields:
+            visit(field)
+        self.order = self.order[:self._position] + ordered
+        self.last_consumer = {}
+        for i, field in enumerate(self.order):
+            for dep in self._get_dependencies(field):
+                self.last_consumer[dep] = i
+
+    @property
+    def done(self):
+        return self._position >= len(self.order)
+
+    def next_field(self):
+        return self.order[self._position]
+
+    def complete(self, field):
+        """
+        Called once *field* has been generated.  Records the current field
+        memory and drops every intermediate whose last consumer was *field*.
+        """
+        field_data = self.dobj.field_data
+        self.peak_memory = max(self.peak_memory, _field_memory(field_data))
+        position = self._position
+        self._position += 1
+        for dep in self._get_dependencies(field):
+            if dep in self.keep or self.last_consumer.get(dep) != position:
+                continue
+            if dep in field_data:
+                field_data.pop(dep)
+                self.freed.add(dep)
+
+    def report(self):
+        mylog.debug("Generated %s fields (%s intermediates released early), "
+                    "peak field memory %0.3e bytes", len(self.order),
+                    len(self.freed), self.peak_memory)
+
+def _field_memory(field_data):
+    return sum(getattr(v, "nbytes", 0) for v in field_data.values())
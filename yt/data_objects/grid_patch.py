@@ -365,7 +365,7 @@ class AMRGridPatch(YTSelectionContainer):
         raise NotImplementedError
 
     def deposit(self, positions, fields = None, method = None,
-                kernel_name = 'cubic'):
+                kernel_name = 'cubic', num_threads = 1):
         # Here we perform our particle deposition.
         cls = getattr(particle_deposit, "deposit_%s" % method, None)
         if cls is None:
@@ -379,7 +379,7 @@ class AMRGridPatch(YTSelectionContainer):
         # one grid
         op = cls(nvals + (1,), kernel_name)
         op.initialize()
-        op.process_grid(self, positions, fields)
+        op.process_grid(self, positions, fields, num_threads)
         vals = op.finalize()
         if vals is None: return
         # Fortran-ordered, so transpose.
@@ -395,14 +395,19 @@ class AMRGridPatch(YTSelectionContainer):
         if self._cache_mask and hash(selector) == self._last_selector_id:
             mask = self._last_mask
         else:
-            mask = selector.fill_mask(self)
+            cache = self._index.selection_cache if self._cache_mask else None
+            cached = cache.get_mask(selector, self.id) if cache else None
+            if cached is not None:
+                mask, count = cached
+            else:
+                mask = selector.fill_mask(self)
+                count = 0 if mask is None else mask.sum()
+                if cache is not None:
+                    cache.store_mask(selector, self.id, mask, count)
             if self._cache_mask:
                 self._last_mask = mask
             self._last_selector_id = hash(selector)
-            if mask is None:
-                self._last_count = 0
-            else:
-                self._last_count = mask.sum()
+            self._last_count = count
         return mask
 
     def select(self, selector, source, dest, offset):
@@ -420,6 +425,11 @@ class AMRGridPatch(YTSelectionContainer):
         return count
 
     def count(self, selector):
+        if self._cache_mask and hash(selector) != self._last_selector_id:
+            # Counting does not need the mask itself, so avoid unpacking it.
+            count = self._index.selection_cache.get_count(selector, self.id)
+            if count is not None:
+                return count
         mask = self._get_selector_mask(selector)
         if mask is None: return 0
         return self._last_count
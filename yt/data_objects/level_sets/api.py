@@ -14,7 +14,8 @@ API for level_sets
 #-----------------------------------------------------------------------------
 
 from .contour_finder import \
-    identify_contours
+    identify_contours, \
+    identify_contour_levels
 
 from .clump_handling import \
     Clump, \
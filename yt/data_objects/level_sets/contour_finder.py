@@ -17,65 +17,80 @@ import numpy as np
 
 from collections import defaultdict
 
-from yt.funcs import mylog, get_pbar
+from yt.funcs import mylog
 from yt.utilities.lib.contour_finding import \
-    ContourTree, TileContourTree, link_node_contours, \
-    update_joins
+    find_tile_boundaries, \
+    join_tile_labels, \
+    label_tile_levels
 from yt.utilities.lib.partitioned_grid import \
     PartitionedGrid
 
 def identify_contours(data_source, field, min_val, max_val,
-                          cached_fields=None):
-    tree = ContourTree()
-    gct = TileContourTree(min_val, max_val)
-    total_contours = 0
-    contours = {}
-    node_ids = []
+                          cached_fields=None, num_threads=0):
+    return identify_contour_levels(data_source, field, [min_val], [max_val],
+                                   num_threads=num_threads)[0]
+
+def identify_contour_levels(data_source, field, min_vals, max_vals,
+                            num_threads=0):
+    r"""Find the sets of connected cells of *data_source* with values of
+    *field* between each pair of *min_vals* and *max_vals*.
+
+    The field is read once for all the levels.  The tiles of the data source
+    are labeled by several threads at once, and the sets of cells touching
+    across the boundaries of the tiles, which are only found once, are then
+    joined for each level.  When every range is contained in the one before
+    it, as for increasing thresholds, only the cells of the previous level
+    are examined at the next one.
+
+    Returns a list with, for each level, the number of connected sets and a
+    dictionary of the slices of the grids and their set numbers, from 1, or
+    -1 outside any set, as :func:`identify_contours` does.
+    """
+    min_vals = np.asarray(min_vals, dtype="float64")
+    max_vals = np.asarray(max_vals, dtype="float64")
+    n_levels = min_vals.size
+    nested = bool(np.all(np.diff(min_vals) >= 0) and
+                  np.all(np.diff(max_vals) <= 0))
+    tiles = []
+    grid_ids = []
+    slices = []
     DLE = data_source.ds.domain_left_edge
     masks = dict((g.id, m) for g, m in data_source.blocks)
     for (g, node, (sl, dims, gi)) in data_source.tiles.slice_traverse():
         g.field_parameters.update(data_source.field_parameters)
-        node.node_ind = len(node_ids)
-        nid = node.node_id
-        node_ids.append(nid)
+        node.node_ind = len(tiles)
         values = g[field][sl].astype("float64")
-        contour_ids = np.zeros(dims, "int64") - 1
         mask = masks[g.id][sl].astype("uint8")
-        total_contours += gct.identify_contours(values, contour_ids,
-                                                mask, total_contours)
-        new_contours = tree.cull_candidates(contour_ids)
-        tree.add_contours(new_contours)
-        # Now we can create a partitioned grid with the contours.
         LE = (DLE + g.dds * gi).in_units("code_length").ndarray_view()
         RE = LE + (dims * g.dds).in_units("code_length").ndarray_view()
-        pg = PartitionedGrid(g.id,
-            [contour_ids.view("float64")], mask,
-            LE, RE, dims.astype("int64"))
-        contours[nid] = (g.Level, node.node_ind, pg, sl)
-    node_ids = np.array(node_ids).astype("int64")
-    if node_ids.size == 0:
-        return 0, {}
-    trunk = data_source.tiles.tree.trunk
-    mylog.info("Linking node (%s) contours.", len(contours))
-    link_node_contours(trunk, contours, tree, node_ids)
-    mylog.info("Linked.")
-    #joins = tree.cull_joins(bt)
-    #tree.add_joins(joins)
-    joins = tree.export()
-    contour_ids = defaultdict(list)
-    pbar = get_pbar("Updating joins ... ", len(contours))
-    final_joins = np.unique(joins[:,1])
-    for i, nid in enumerate(sorted(contours)):
-        level, node_ind, pg, sl = contours[nid]
-        ff = pg.my_data[0].view("int64")
-        update_joins(joins, ff, final_joins)
-        contour_ids[pg.parent_grid_id].append((sl, ff))
-        pbar.update(i)
-    pbar.finish()
-    rv = dict()
-    rv.update(contour_ids)
-    # NOTE: Because joins can appear in both a "final join" and a subsequent
-    # "join", we can't know for sure how many unique joins there are without
-    # checking if no cells match or doing an expensive operation checking for
-    # the unique set of final join values.
-    return final_joins.size, rv
+        tiles.append((values, mask, LE, RE, dims.astype("int64")))
+        grid_ids.append(g.id)
+        slices.append(sl)
+    if len(tiles) == 0:
+        return [(0, {}) for level in range(n_levels)]
+    sizes = np.array([t[0].size for t in tiles], dtype="int64")
+    offsets = np.zeros(sizes.size, dtype="int64")
+    np.cumsum(sizes[:-1], out=offsets[1:])
+    labels = np.empty((n_levels, sizes.sum()), dtype="int64")
+    tile_labels = []
+    for i, (values, mask, LE, RE, dims) in enumerate(tiles):
+        ids = [labels[level, offsets[i]:offsets[i] + sizes[i]].reshape(dims)
+               for level in range(n_levels)]
+        tile_labels.append(ids)
+        tiles[i] = PartitionedGrid(grid_ids[i],
+            [values] + [ff.view("float64") for ff in ids], mask,
+            LE, RE, dims)
+    mylog.info("Identifying contours of %s levels in %s tiles.",
+               n_levels, len(tiles))
+    label_tile_levels(tiles, offsets, min_vals, max_vals, nested=nested,
+                      num_threads=num_threads)
+    pairs = find_tile_boundaries(data_source.tiles.tree.trunk, tiles, offsets)
+    del tiles
+    rv = []
+    for level in range(n_levels):
+        nj = join_tile_labels(labels[level], pairs, num_threads=num_threads)
+        contour_ids = defaultdict(list)
+        for i, sl in enumerate(slices):
+            contour_ids[grid_ids[i]].append((sl, tile_labels[i][level]))
+        rv.append((nj, dict(contour_ids)))
+    return rv
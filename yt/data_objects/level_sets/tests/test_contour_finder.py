@@ -0,0 +1,96 @@
+"""
+Contour finder tests
+
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import itertools
+import numpy as np
+
+from yt.data_objects.level_sets.api import \
+    identify_contours, \
+    identify_contour_levels
+from yt.frontends.stream.api import \
+    load_uniform_grid
+from yt.testing import \
+    assert_array_equal, \
+    assert_equal
+
+def _flood_fill(inside):
+    # the connected sets of cells touching by faces, edges or corners
+    labels = -np.ones(inside.shape, dtype="int64")
+    offsets = [o for o in itertools.product((-1, 0, 1), repeat=3)
+               if o != (0, 0, 0)]
+    n = 0
+    for start in zip(*np.where(inside)):
+        if labels[start] > -1:
+            continue
+        n += 1
+        labels[start] = n
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            for o in offsets:
+                other = tuple(c + d for c, d in zip(cell, o))
+                if any(c < 0 or c >= s for c, s in zip(other, inside.shape)):
+                    continue
+                if inside[other] and labels[other] == -1:
+                    labels[other] = n
+                    stack.append(other)
+    return n, labels
+
+def _grid_labels(ds, cids):
+    labels = -np.ones(ds.domain_dimensions, dtype="int64")
+    for grid in ds.index.grids:
+        si = grid.get_global_startindex()
+        for sl, ff in cids.get(grid.id, []):
+            gsl = tuple(slice(s.start + i, s.stop + i)
+                        for s, i in zip(sl, si))
+            labels[gsl] = ff
+    return labels
+
+def _assert_same_sets(labels1, labels2):
+    assert_array_equal(labels1 == -1, labels2 == -1)
+    inside = labels1 > -1
+    pairs = np.unique(labels1[inside] * (labels2.max() + 1) +
+                      labels2[inside])
+    assert_equal(pairs.size, np.unique(labels1[inside]).size)
+    assert_equal(pairs.size, np.unique(labels2[inside]).size)
+
+def test_contour_levels():
+    np.random.seed(0x4d3d3d3)
+    dims = (16, 16, 16)
+    density = np.random.random(dims)
+    ds = load_uniform_grid({"density": density}, dims, nprocs=8)
+    dd = ds.all_data()
+    thresholds = [0.3, 0.5, 0.7, 0.9]
+    level_sets = identify_contour_levels(dd, "density", thresholds,
+                                         [1.0] * len(thresholds))
+    for threshold, (nj, cids) in zip(thresholds, level_sets):
+        expected_nj, expected = _flood_fill(density >= threshold)
+        assert_equal(nj, expected_nj)
+        labels = _grid_labels(ds, cids)
+        _assert_same_sets(labels, expected)
+        assert_equal(np.unique(labels[labels > -1]), np.arange(1, nj + 1))
+        # The levels are the same when found one at a time.
+        nj1, cids1 = identify_contours(dd, "density", threshold, 1.0)
+        assert_equal(nj1, nj)
+        assert_array_equal(_grid_labels(ds, cids1), labels)
+    # Ranges that are not nested
+    level_sets = identify_contour_levels(dd, "density", [0.2, 0.6],
+                                         [0.6, 0.8])
+    for (low, high), (nj, cids) in zip([(0.2, 0.6), (0.6, 0.8)], level_sets):
+        expected_nj, expected = _flood_fill((density >= low) &
+                                            (density <= high))
+        assert_equal(nj, expected_nj)
+        _assert_same_sets(_grid_labels(ds, cids), expected)
@@ -15,8 +15,10 @@ Subsets of octrees
 #-----------------------------------------------------------------------------
 
 from contextlib import contextmanager
+import hashlib
 import numpy as np
 
+from yt.config import ytcfg
 from yt.data_objects.data_containers import \
     YTSelectionContainer
 from yt.data_objects.field_data import \
@@ -26,6 +28,8 @@ import yt.geometry.particle_smooth as particle_smooth
 
 from yt.funcs import mylog
 from yt.utilities.lib.geometry_utils import compute_morton
+from yt.geometry.oct_container import \
+    LinearOctreeContainer
 from yt.geometry.particle_oct_container import \
     ParticleOctreeContainer
 from yt.units.yt_array import YTArray
@@ -37,11 +41,19 @@ from yt.utilities.exceptions import \
 
 def cell_count_cache(func):
     def cc_cache_func(self, dobj):
+        key = self._selection_cache_key
+        cache = self.ds.index.selection_cache if key is not None else None
         if hash(dobj.selector) != self._last_selector_id:
             self._cell_count = -1
+            if cache is not None:
+                count = cache.get_count(dobj.selector, key)
+                if count is not None:
+                    self._cell_count = count
         rv = func(self, dobj)
         self._cell_count = rv.shape[0]
         self._last_selector_id = hash(dobj.selector)
+        if cache is not None:
+            cache.store_count(dobj.selector, key, self._cell_count)
         return rv
     return cc_cache_func
 
@@ -54,6 +66,7 @@ class OctreeSubset(YTSelectionContainer):
     _domain_offset = 0
     _cell_count = -1
     _block_reorder = None
+    _smoothing_neighbors = None
 
     def __init__(self, base_region, domain, ds, over_refine_factor = 1):
         super(OctreeSubset, self).__init__(ds, None)
@@ -109,12 +122,29 @@ class OctreeSubset(YTSelectionContainer):
 
     _domain_ind = None
 
-    def mask_refinement(self, selector):
+    @property
+    def _selection_cache_key(self):
+        # The key under which selections of this subset are shared through
+        # the index's selection cache; None if they cannot be shared.
+        return ("octree", self.domain_id)
+
+    def _get_oct_mask(self, selector):
+        key = self._selection_cache_key
+        cache = self.ds.index.selection_cache if key is not None else None
+        cached = cache.get_mask(selector, key) if cache else None
+        if cached is not None:
+            return cached[0]
         mask = self.oct_handler.mask(selector, domain_id = self.domain_id)
+        if cache is not None:
+            cache.store_mask(selector, key, mask, mask.sum())
+        return mask
+
+    def mask_refinement(self, selector):
+        mask = self._get_oct_mask(selector)
         return mask
 
     def select_blocks(self, selector):
-        mask = self.oct_handler.mask(selector, domain_id = self.domain_id)
+        mask = self._get_oct_mask(selector)
         slicer = OctreeSubsetBlockSlice(self)
         for i, sl in slicer:
             yield sl, np.atleast_3d(mask[i,...])
@@ -140,7 +170,7 @@ class OctreeSubset(YTSelectionContainer):
         return self._domain_ind
 
     def deposit(self, positions, fields = None, method = None,
-                kernel_name='cubic'):
+                kernel_name='cubic', num_threads = 1):
         r"""Operate on the mesh, in a particle-against-mesh fashion, with
         exclusively local input.
 
@@ -167,6 +197,11 @@ class OctreeSubset(YTSelectionContainer):
             This is the name of the smoothing kernel to use. Current supported
             kernel names include `cubic`, `quartic`, `quintic`, `wendland2`,
             `wendland4`, and `wendland6`.
+        num_threads : integer, default 1
+            The number of threads to deposit with.  Particles are grouped by
+            the oct they fall in and each oct is handled by a single thread,
+            so the result does not depend on the number of threads.  0 uses
+            the OpenMP default.
 
         Returns
         -------
@@ -190,14 +225,14 @@ class OctreeSubset(YTSelectionContainer):
         # need no casting.
         fields = [np.ascontiguousarray(f, dtype="float64") for f in fields]
         op.process_octree(self.oct_handler, self.domain_ind, pos, fields,
-            self.domain_id, self._domain_offset)
+            self.domain_id, self._domain_offset, num_threads)
         vals = op.finalize()
         if vals is None: return
         return np.asfortranarray(vals)
 
     def smooth(self, positions, fields = None, index_fields = None,
                method = None, create_octree = False, nneighbors = 64,
-               kernel_name = 'cubic'):
+               kernel_name = 'cubic', num_threads = 1):
         r"""Operate on the mesh, in a particle-against-mesh fashion, with
         non-local input.
 
@@ -227,21 +262,42 @@ class OctreeSubset(YTSelectionContainer):
             Should we construct a new octree for indexing the particles?  In
             cases where we are applying an operation on a subset of the
             particles used to construct the mesh octree, this will ensure that
-            we are able to find and identify all relevant particles.
+            we are able to find and identify all relevant particles.  The
+            octs of a compacted (linear) octree cannot be searched for
+            neighbors, so one is always constructed for those.
         nneighbors : int, default 64
             The number of neighbors to examine during the process.
         kernel_name : string, default 'cubic'
             This is the name of the smoothing kernel to use. Current supported
             kernel names include `cubic`, `quartic`, `quintic`, `wendland2`,
             `wendland4`, and `wendland6`.
+        num_threads : integer, default 1
+            The number of threads to search for neighbors with; 0 uses the
+            OpenMP default.
 
         Returns
         -------
         List of fortran-ordered, mesh-like arrays.
+
+        Notes
+        -----
+        The nearest particles to each cell are kept (up to the
+        ``smoothing_neighbor_cache_size`` configuration option), so smoothing
+        other fields of the same particles, with any kernel, does not search
+        for them again.
         """
         # Here we perform our particle deposition.
         positions.convert_to_units("code_length")
-        if create_octree:
+        if isinstance(self.oct_handler, LinearOctreeContainer):
+            create_octree = True
+        key = (hashlib.md5(np.ascontiguousarray(positions, dtype="float64"))
+               .hexdigest(), nneighbors, create_octree)
+        neighbors = None
+        if self._smoothing_neighbors is not None and \
+           self._smoothing_neighbors[0] == key:
+            neighbors = self._smoothing_neighbors[1]
+            particle_octree = pdom_ind = None
+        elif create_octree:
             morton = compute_morton(
                 positions[:,0], positions[:,1], positions[:,2],
                 self.ds.domain_left_edge,
@@ -274,10 +330,16 @@ class OctreeSubset(YTSelectionContainer):
         # Pointer operations within 'process_octree' require arrays to be
         # contiguous cf. https://bitbucket.org/yt_analysis/yt/issues/1079
         fields = [np.ascontiguousarray(f, dtype="float64") for f in fields]
-        op.process_octree(self.oct_handler, mdom_ind, positions,
+        # The neighbors of the cells are only kept if they fit in the cache;
+        # otherwise they are found one cell at a time, and None is returned.
+        max_size = ytcfg.getint("yt", "smoothing_neighbor_cache_size")
+        neighbors = op.process_octree(self.oct_handler, mdom_ind, positions,
             self.fcoords, fields,
             self.domain_id, self._domain_offset, self.ds.periodicity,
-            index_fields, particle_octree, pdom_ind, self.ds.geometry)
+            index_fields, particle_octree, pdom_ind, self.ds.geometry,
+            neighbors, num_threads, max(max_size, 0) * 1024**2)
+        if neighbors is not None:
+            self._smoothing_neighbors = (key, neighbors)
         # If there are 0s in the smoothing field this will not throw an error,
         # but silently return nans for vals where dividing by 0
         # Same as what is currently occurring, but suppressing the div by zero
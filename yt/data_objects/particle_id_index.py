@@ -0,0 +1,176 @@
+"""
+An index from particle IDs to where particles are stored
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import hashlib
+import os
+import zipfile
+
+import numpy as np
+
+from yt.config import ytcfg
+from yt.funcs import mylog
+from yt.utilities.exceptions import YTIllDefinedParticleData
+
+class ParticleIDIndex(object):
+    r"""Locates particles of a dataset by their IDs.
+
+    For every particle of *ptype*, the index holds its ID, the IO chunk of
+    ``ds.all_data()`` it is read in and its offset among the particles of
+    that chunk, sorted by ID.  Looking up a set of IDs then takes a binary
+    search, and their fields can be read from only the chunks that hold
+    them.  If the ``particle_id_index_cache`` configuration option is set,
+    the index is saved next to the dataset in a ``.pidx.npz`` file, which
+    is read instead of building the index again.
+
+    Parameters
+    ----------
+    ds : ~yt.data_objects.static_output.Dataset
+        The dataset whose particles are indexed.
+    ptype : str, optional
+        The particle type to index.  Default: 'all'.
+    """
+    def __init__(self, ds, ptype="all"):
+        self.ds = ds
+        self.ptype = ptype
+        self.dd = ds.all_data()
+        self.id_field = self.dd._determine_fields((ptype, "particle_index"))[0]
+        self.num_chunks = sum(1 for chunk in self.dd.index._chunk(
+            self.dd, "io"))
+        index = None
+        use_cache = ytcfg.getboolean("yt", "particle_id_index_cache")
+        if use_cache:
+            index = self._load_index()
+        if index is None:
+            index = self._build_index()
+            if use_cache:
+                self._write_index(index)
+        self.ids, self.chunks, self.offsets = index
+
+    def _build_index(self):
+        ids = []
+        chunks = []
+        offsets = []
+        for ci, chunk in enumerate(self.dd.chunks([], "io")):
+            chunk_ids = chunk[self.id_field].d.astype("int64")
+            ids.append(chunk_ids)
+            chunks.append(np.full(chunk_ids.size, ci, dtype="int32"))
+            offsets.append(np.arange(chunk_ids.size, dtype="int64"))
+        if len(ids) == 0:
+            return (np.empty(0, dtype="int64"), np.empty(0, dtype="int32"),
+                    np.empty(0, dtype="int64"))
+        ids = np.concatenate(ids)
+        order = np.argsort(ids, kind="mergesort")
+        return (ids[order], np.concatenate(chunks)[order],
+                np.concatenate(offsets)[order])
+
+    @property
+    def _cache_filename(self):
+        return "%s.%s.pidx.npz" % (self.ds.parameter_filename, self.ptype)
+
+    @property
+    def _signature(self):
+        st = os.stat(self.ds.parameter_filename)
+        s = "%s;%s;%s;%s" % (self.id_field, self.num_chunks,
+                             st.st_mtime, st.st_size)
+        return hashlib.md5(s.encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        cache_fn = self._cache_filename
+        if not os.path.exists(cache_fn):
+            return None
+        try:
+            with np.load(cache_fn) as data:
+                if str(data["signature"]) != self._signature:
+                    mylog.debug("Particle ID index %s is out of date.",
+                                cache_fn)
+                    return None
+                return data["ids"], data["chunks"], data["offsets"]
+        except (IOError, OSError, ValueError, KeyError,
+                zipfile.BadZipfile) as e:
+            mylog.debug("Could not read particle ID index %s: %s",
+                        cache_fn, e)
+            return None
+
+    def _write_index(self, index):
+        if not os.path.isfile(self.ds.parameter_filename):
+            return
+        cache_fn = self._cache_filename
+        tmp_fn = "%s.%s.tmp" % (cache_fn, os.getpid())
+        try:
+            with open(tmp_fn, "wb") as f:
+                np.savez(f, signature=self._signature, ids=index[0],
+                         chunks=index[1], offsets=index[2])
+            os.rename(tmp_fn, cache_fn)
+        except (IOError, OSError) as e:
+            mylog.debug("Could not write particle ID index %s: %s",
+                        cache_fn, e)
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+
+    def locate(self, ids):
+        r"""Find where the particles with the given IDs are stored.
+
+        Parameters
+        ----------
+        ids : array_like
+            The particle IDs to look for.
+
+        Returns
+        -------
+        found : array of int
+            The positions in *ids* of the particles present in the dataset.
+        chunks, offsets : arrays of int
+            The IO chunk each of these particles is in and its offset in it.
+        """
+        ids = np.asarray(ids, dtype="int64")
+        # An ID requested several times is matched to as many particles.
+        order = np.argsort(ids, kind="mergesort")
+        uniq, first, counts = np.unique(ids[order], return_index=True,
+                                        return_counts=True)
+        occurrence = np.empty(ids.size, dtype="int64")
+        occurrence[order] = np.arange(ids.size) - np.repeat(first, counts)
+        requested = np.empty(ids.size, dtype="int64")
+        requested[order] = np.repeat(counts, counts)
+        left = np.searchsorted(self.ids, ids, side="left")
+        available = np.searchsorted(self.ids, ids, side="right") - left
+        if np.any(available > requested):
+            raise YTIllDefinedParticleData(
+                "This dataset contains duplicate particle indices!")
+        found = np.where(occurrence < available)[0]
+        pos = left[found] + occurrence[found]
+        return found, self.chunks[pos], self.offsets[pos]
+
+def read_particle_fields(data_source, fields, chunks, offsets):
+    r"""Read particle fields at the locations found by a
+    :class:`~yt.data_objects.particle_id_index.ParticleIDIndex`.
+
+    Only the IO chunks of *data_source*, which must be the ``all_data()``
+    object of the indexed dataset, that are in *chunks* are read.  The fields
+    are returned as a dictionary of unitless arrays, in the order of
+    *chunks*.
+    """
+    fields = data_source._determine_fields(fields)
+    data = dict((field, np.empty(chunks.size, dtype="float64"))
+                for field in fields)
+    needed = np.unique(chunks)
+    for ci, chunk in zip(needed, data_source.chunks(
+            fields, "io", chunk_ind=needed.tolist())):
+        sel = np.where(chunks == ci)[0]
+        for field in fields:
+            values = chunk[field].d
+            if values.dtype != data[field].dtype:
+                data[field] = data[field].astype(values.dtype)
+            data[field][sel] = values[offsets[sel]]
+    return data
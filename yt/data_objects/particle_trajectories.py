@@ -12,13 +12,15 @@ from __future__ import print_function
 #-----------------------------------------------------------------------------
 
 from yt.data_objects.field_data import YTFieldData
+from yt.data_objects.particle_id_index import \
+    ParticleIDIndex, \
+    read_particle_fields
 from yt.utilities.lib.particle_mesh_operations import CICSample_3
 from yt.utilities.parallel_tools.parallel_analysis_interface import \
     parallel_root_only
 from yt.funcs import mylog, get_pbar
 from yt.units.yt_array import array_like_field
 from yt.config import ytcfg
-from yt.utilities.exceptions import YTIllDefinedParticleData
 from collections import OrderedDict
 
 import numpy as np
@@ -66,9 +68,7 @@ class ParticleTrajectories(object):
         indices.sort() # Just in case the caller wasn't careful
         self.field_data = YTFieldData()
         self.data_series = outputs
-        self.masks = []
-        self.sorts = []
-        self.array_indices = []
+        self.locations = {}
         self.indices = indices
         self.num_indices = len(indices)
         self.num_steps = len(outputs)
@@ -86,29 +86,22 @@ class ParticleTrajectories(object):
         dd_first = ds_first.all_data()
 
         fds = {}
-        for field in (
-                "particle_index",
-                "particle_position_x", "particle_position_y", "particle_position_z"):
+        for field in ("particle_position_%s" % ax for ax in "xyz"):
             fds[field] = self._get_full_field_name(field)[0]
 
         my_storage = {}
         pbar = get_pbar("Constructing trajectory information", len(self.data_series))
         for i, (sto, ds) in enumerate(self.data_series.piter(storage=my_storage)):
-            dd = ds.all_data()
-            newtags = dd[fds["particle_index"]].d.astype("int64")
-            mask = np.in1d(newtags, indices, assume_unique=True)
-            sort = np.argsort(newtags[mask])
-            array_indices = np.where(np.in1d(indices, newtags, assume_unique=True))[0]
-            self.array_indices.append(array_indices)
-            self.masks.append(mask)
-            self.sorts.append(sort)
-
-            pfields = {}
-            for field in ("particle_position_%s" % ax for ax in "xyz"):
-                pfields[field] = dd[fds[field]].ndarray_view()[mask][sort]
-
-            sto.result_id = ds.parameter_filename
-            sto.result = (ds.current_time, array_indices, pfields)
+            # The particles are found through an index of their IDs, and
+            # only the chunks of the dataset that hold them are read.
+            pindex = ParticleIDIndex(ds, ptype=self.ptype or "all")
+            array_indices, chunks, offsets = pindex.locate(indices)
+            data = read_particle_fields(pindex.dd, list(fds.values()),
+                                        chunks, offsets)
+            pfields = dict((field, data[fds[field]]) for field in fds)
+
+            sto.result = (ds.current_time, (array_indices, chunks, offsets),
+                          pfields)
             pbar.update(i)
         pbar.finish()
 
@@ -116,22 +109,17 @@ class ParticleTrajectories(object):
             mylog.setLevel(old_level)
 
         times = []
-        for fn, (time, indices, pfields) in sorted(my_storage.items()):
+        for i, (time, location, pfields) in sorted(my_storage.items()):
             times.append(time)
+            self.locations[i] = location
         self.times = self.data_series[0].arr([time for time in times], times[0].units)
 
         self.particle_fields = []
         output_field = np.empty((self.num_indices, self.num_steps))
         output_field.fill(np.nan)
         for field in ("particle_position_%s" % ax for ax in "xyz"):
-            for i, (fn, (time, indices, pfields)) in enumerate(sorted(my_storage.items())):
-                try:
-                    # This will fail if particles ids are
-                    # duplicate. This is due to the fact that the rhs
-                    # would then have a different shape as the lhs
-                    output_field[indices, i] = pfields[field]
-                except ValueError:
-                    raise YTIllDefinedParticleData("This dataset contains duplicate particle indices!")
+            for i, (time, location, pfields) in sorted(my_storage.items()):
+                output_field[location[0], i] = pfields[field]
             self.field_data[field] = array_like_field(
                 dd_first, output_field.copy(), fds[field])
             self.particle_fields.append(field)
@@ -240,52 +228,61 @@ class ParticleTrajectories(object):
 
         grid_fields = [field for field in missing_fields
                        if field not in self.particle_fields]
-        step = int(0)
         pbar = get_pbar("Generating [%s] fields in trajectories" %
                         ", ".join(missing_fields), self.num_steps)
         my_storage = {}
 
         for i, (sto, ds) in enumerate(self.data_series.piter(storage=my_storage)):
-            mask = self.masks[i]
-            sort = self.sorts[i]
+            step = sto.result_id
+            array_indices, chunks, offsets = self.locations[step]
             pfield = {}
 
             if new_particle_fields:  # there's at least one particle field
-                dd = ds.all_data()
+                # This is easy... just read the particles from their chunks
+                data = read_particle_fields(
+                    ds.all_data(), [fds[field] for field in new_particle_fields],
+                    chunks, offsets)
                 for field in new_particle_fields:
-                    # This is easy... just get the particle fields
-                    pfield[field] = dd[fds[field]].d[mask][sort]
+                    pfield[field] = data[fds[field]]
 
             if grid_fields:
-                # This is hard... must loop over grids
+                # Each particle is sampled in the leaf grid it is in, and
+                # each of these grids is visited once for all its particles.
                 for field in grid_fields:
-                    pfield[field] = np.zeros(self.num_indices)
-                x = self["particle_position_x"][:,step].d
-                y = self["particle_position_y"][:,step].d
-                z = self["particle_position_z"][:,step].d
-                particle_grids, particle_grid_inds = ds.index._find_points(x,y,z)
-
+                    pfield[field] = np.zeros(array_indices.size)
+                x = self["particle_position_x"][array_indices, step].d
+                y = self["particle_position_y"][array_indices, step].d
+                z = self["particle_position_z"][array_indices, step].d
                 # This will fail for non-grid index objects
-                for grid in particle_grids:
+                particle_grids, particle_grid_inds = ds.index._find_points(x,y,z)
+                order = np.argsort(particle_grid_inds, kind="mergesort")
+                grid_inds, starts = np.unique(particle_grid_inds[order],
+                                              return_index=True)
+                ends = np.append(starts[1:], order.size)
+                for gi, start, end in zip(grid_inds, starts, ends):
+                    if gi < 0: continue
+                    grid = ds.index.grids[gi]
+                    sel = order[start:end]
                     cube = grid.retrieve_ghost_zones(1, grid_fields)
+                    # The edge and dimensions of the grid with its ghost zones
+                    left_edge = (grid.LeftEdge - grid.dds).d.astype(np.float64)
+                    dims = (grid.ActiveDimensions + 2).astype(np.int32)
                     for field in grid_fields:
-                        CICSample_3(x, y, z, pfield[field],
-                                    self.num_indices,
-                                    cube[fds[field]],
-                                    np.array(grid.LeftEdge).astype(np.float64),
-                                    np.array(grid.ActiveDimensions).astype(np.int32),
-                                    grid.dds[0])
-            sto.result_id = ds.parameter_filename
-            sto.result = (self.array_indices[i], pfield)
-            pbar.update(step)
-            step += 1
+                        sample = np.zeros(sel.size)
+                        CICSample_3(x[sel], y[sel], z[sel], sample,
+                                    sel.size,
+                                    cube[fds[field]].d.astype(np.float64),
+                                    left_edge, dims, grid.dds[0].d)
+                        pfield[field][sel] = sample
+            sto.result = (array_indices, pfield)
+            pbar.update(i)
         pbar.finish()
 
         output_field = np.empty((self.num_indices,self.num_steps))
         output_field.fill(np.nan)
         for field in missing_fields:
             fd = fds[field]
-            for i, (fn, (indices, pfield)) in enumerate(sorted(my_storage.items())):
+            for i, (indices, pfield) in sorted(my_storage.items()):
                 output_field[indices, i] = pfield[field]
             self.field_data[field] = array_like_field(dd_first, output_field.copy(), fd)
 
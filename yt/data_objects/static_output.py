@@ -36,6 +36,8 @@ from yt.funcs import \
     ensure_list
 from yt.utilities.cosmology import \
     Cosmology
+from yt.utilities.file_handler import \
+    close_mapped_files
 from yt.utilities.exceptions import \
     YTObjectNotImplemented, \
     YTFieldNotFound, \
@@ -245,6 +247,7 @@ class Dataset(object):
     _instantiated = False
     _particle_type_counts = None
     _ionization_label_format = 'roman_numeral'
+    _load_args = None
 
     def __new__(cls, filename=None, *args, **kwargs):
         if not isinstance(filename, string_types):
@@ -265,7 +268,9 @@ class Dataset(object):
             if obj._skip_cache is False:
                 _cached_datasets[cache_key] = obj
         else:
-            obj = _cached_datasets[cache_key]
+            return _cached_datasets[cache_key]
+        # Kept so that the dataset can be loaded again in another process.
+        obj._load_args = (filename, args, kwargs)
         return obj
 
     def __init__(self, filename, dataset_type=None, file_style=None,
@@ -436,7 +441,7 @@ class Dataset(object):
         return [], True
 
     def close(self):
-        pass
+        close_mapped_files(self.fullpath)
 
     def __getitem__(self, key):
         """ Returns units, parameters, or conversion_factors in that order. """
@@ -553,6 +558,7 @@ class Dataset(object):
 
     def create_field_info(self):
         self.field_dependencies = {}
+        self._field_generation_graph = {}
         self.derived_field_list = []
         self.filtered_particle_types = []
         self.field_info = self._field_info_class(self, self.field_list)
@@ -753,6 +759,7 @@ class Dataset(object):
 
     _last_freq = (None, None)
     _last_finfo = None
+    _field_generation_graph = None
     def _get_field_info(self, ftype, fname = None):
         self.index
         if fname is None:
@@ -1253,9 +1260,15 @@ class Dataset(object):
         self.field_info._show_field_errors.append(name)
         deps, _ = self.field_info.check_derived_fields([name])
         self.field_dependencies.update(deps)
+        if self._field_generation_graph:
+            # Any edges learned for a previous definition are stale now.
+            for key in list(self._field_generation_graph):
+                if name in (key, key[1]):
+                    self._field_generation_graph.pop(key)
 
     def add_deposited_particle_field(self, deposit_field, method, kernel_name='cubic',
-                                     weight_field='particle_mass'):
+                                     weight_field='particle_mass',
+                                     num_threads=1):
         """Add a new deposited particle field
 
         Creates a new deposited field based on the particle *deposit_field*.
@@ -1279,6 +1292,12 @@ class Dataset(object):
            `wendland2`, `wendland4`, and `wendland6`.
         weight_field : string, default 'particle_mass'
            Weighting field name for deposition method `weighted_mean`.
+        num_threads : integer, default 1
+           The number of threads to deposit with; 0 uses the OpenMP default.
+           On octrees the result is independent of the number of threads.
+           On grids, `cic` deposits may differ in the last bits of the
+           floating point sums, and `simple_smooth` and `nearest` always
+           deposit with a single thread.
 
         Returns
         -------
@@ -1317,7 +1336,8 @@ class Dataset(object):
                 fields.append(data[ptype, weight_field])
             fields = [np.ascontiguousarray(f) for f in fields]
             d = data.deposit(pos, fields, method=method,
-                             kernel_name=kernel_name)
+                             kernel_name=kernel_name,
+                             num_threads=num_threads)
             d = data.ds.arr(d, input_units=units)
             if method == 'weighted_mean':
                 d[np.isnan(d)] = 0.0
@@ -54,3 +54,42 @@ def test_ds_hold():
     assert_true(dd.ds.__hash__() == ds1.__hash__())
     assert_true(dd.index is ds1.index)
     assert_equal(dd["ones"].size, 64**3)
+
+def test_chunked_field_generation():
+    from yt.config import ytcfg
+    fields = ["velocity_magnitude", "kinetic_energy", "cell_mass"]
+    ds = fake_random_ds(32, nprocs = 8,
+        fields = ("density", "velocity_x", "velocity_y", "velocity_z"),
+        units = ("g/cm**3", "cm/s", "cm/s", "cm/s"))
+    ref = ds.all_data()
+    ref.get_data(fields)
+    ytcfg["yt", "chunked_field_generation"] = "True"
+    try:
+        for dobj in (ds.all_data(), ds.sphere("c", (0.3, "unitary"))):
+            dobj.get_data(fields)
+            for field in fields:
+                assert_true(dobj._determine_fields(field)[0] in dobj.field_data)
+            # Only the requested fields survive the chunked evaluation
+            assert_equal(len(dobj.field_data), len(fields))
+        dd = ds.all_data()
+        for field in fields:
+            assert_equal(dd[field], ref[field])
+            assert_equal(dd[field].units, ref[field].units)
+    finally:
+        ytcfg["yt", "chunked_field_generation"] = "False"
+
+def test_field_generation_plan():
+    ds = fake_random_ds(16,
+        fields = ("density", "velocity_x", "velocity_y", "velocity_z"),
+        units = ("g/cm**3", "cm/s", "cm/s", "cm/s"))
+    dd = ds.all_data()
+    ke = dd["kinetic_energy"]
+    plan = dd._field_plan
+    order = plan.order
+    # Every derived field is generated after the derived fields it consumes
+    for i, field in enumerate(order):
+        for dep in plan.dependencies[field]:
+            if dep in order:
+                assert_true(order.index(dep) < i)
+    assert_true(plan.peak_memory >= ke.nbytes)
+    assert_equal(list(dd.field_data.keys()), [("gas", "kinetic_energy")])
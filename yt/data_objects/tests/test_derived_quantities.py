@@ -148,3 +148,29 @@ def test_derived_quantities_with_particle_types():
     #Check spin parameter values
     assert_almost_equal(ad.quantities.spin_parameter(use_gas=False,use_particles=True),655.7311454765503)
     assert_almost_equal(ad.quantities.spin_parameter(use_gas=False,use_particles=True,particle_type='low_x'),1309.164886405665)
+
+def test_streaming_reductions():
+    from yt.config import ytcfg
+    ds = fake_random_ds(16, nprocs = 8, fields = ("density", "temperature"),
+                        units = ("g/cm**3", "K"))
+    results = []
+    for streaming in ["True", "False"]:
+        ytcfg["yt", "streaming_reductions"] = streaming
+        try:
+            ad = ds.all_data()
+            rv = [ad.max("density"), ad.min("density"), ad.ptp("density"),
+                  ad.sum("cell_mass"), ad.mean("temperature"),
+                  ad.std("temperature"), ad.argmax("density")[0]]
+            # Reductions must not leave full fields behind on the object
+            assert_equal(len(ad.field_data), 0)
+            results.append(rv)
+        finally:
+            ytcfg["yt", "streaming_reductions"] = "True"
+    for v1, v2 in zip(*results):
+        assert_rel_equal(v1, v2, 12)
+    # Fields that have already been read are reduced in place
+    ad = ds.all_data()
+    ad["density"]
+    assert_equal(ad.quantities.extrema("density"),
+                 [ad["density"].min(), ad["density"].max()])
+    assert_rel_equal(ad.sum("density"), ad["density"].sum(), 12)
@@ -2,9 +2,13 @@ import glob
 import os
 import numpy as np
 from numpy.testing import \
-    assert_raises
+    assert_raises, \
+    assert_equal, \
+    assert_almost_equal
 
 from yt.config import ytcfg
+from yt.data_objects.particle_id_index import \
+    ParticleIDIndex
 from yt.data_objects.time_series import DatasetSeries
 from yt.utilities.answer_testing.framework import \
     requires_ds, \
@@ -94,3 +98,47 @@ def test_ptype():
 
     # Build trajectories
     ts.particle_trajectories(ids, ptype='dummy')
+
+def test_trajectories_from_index():
+    from yt.frontends.stream.api import load_uniform_grid
+    n_particles = 1000
+    n_steps = 3
+    prng = np.random.RandomState(0x4d3d3d3)
+    dims = (16, 16, 16)
+    x = (np.arange(dims[0]) + 0.5) / dims[0]
+    density = np.tile(x[:, None, None], (1, dims[1], dims[2]))
+    all_ds = []
+    for i in range(n_steps):
+        # The particles move and are stored in a different order, split
+        # among several grids, at each step.
+        order = prng.permutation(n_particles)
+        data = {"density": (density, "g/cm**3")}
+        for ax in "xyz":
+            pos = prng.uniform(0.1, 0.9, size=n_particles)
+            data["io", "particle_position_%s" % ax] = (pos[order], "cm")
+        data["io", "particle_index"] = (np.arange(n_particles)[order], "")
+        data["io", "particle_mass"] = (np.arange(n_particles)[order] + 1.0,
+                                       "g")
+        all_ds.append(load_uniform_grid(data, dims, nprocs=8))
+    ts = DatasetSeries(all_ds)
+    indices = np.array([7, 3, 500, 999, 998])
+    traj = ts.particle_trajectories(indices, fields=["particle_mass",
+                                                     "density"])
+    indices.sort()
+    for i, ds in enumerate(all_ds):
+        ad = ds.all_data()
+        pids = ad["particle_index"].d.astype("int64")
+        order = np.argsort(pids)[indices]
+        for field in ("particle_position_x", "particle_position_y",
+                      "particle_mass"):
+            assert_equal(traj[field][:, i].d, ad[field].d[order])
+        # Density increases linearly with x, so it is sampled exactly.
+        assert_almost_equal(traj["density"][:, i].d,
+                            ad["particle_position_x"].d[order], 10)
+    # IDs missing from the dataset, or requested more often than they
+    # appear in it, are not found.
+    pindex = ParticleIDIndex(all_ds[0])
+    found, chunks, offsets = pindex.locate([3, 3, 1001])
+    assert_equal(found, [0])
+    pids = all_ds[0].all_data()["particle_index"].d
+    assert_equal(pids[offsets], [3])
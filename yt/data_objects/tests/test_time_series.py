@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+from yt.data_objects.time_series import \
+    DatasetPrefetcher, \
+    DatasetSeries
+from yt.testing import \
+    assert_equal, \
+    assert_raises, \
+    assert_true, \
+    fake_random_ds, \
+    requires_module
+
+def _write_series(tmpdir, n):
+    filenames = []
+    for i in range(n):
+        ds = fake_random_ds(16, nprocs=2)
+        fn = os.path.join(tmpdir, "series_%04d.h5" % i)
+        filenames.append(ds.all_data().save_as_dataset(fn, ["density"]))
+    return filenames
+
+@requires_module("h5py")
+def test_prefetch():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filenames = _write_series(tmpdir, 5)
+        ts = DatasetSeries(filenames)
+        expected = [float(ds.all_data()["grid", "density"].sum())
+                    for ds in ts]
+        loaded = []
+        ts = DatasetSeries(filenames, setup_function=loaded.append,
+                           prefetch=2, prefetch_fields=[("grid", "density")])
+        values = []
+        for ds in ts:
+            assert_true(ds.prefetched_data.field_data)
+            values.append(float(ds.prefetched_data["grid", "density"].sum()))
+        assert_equal(values, expected)
+        assert_equal(len(loaded), 5)
+        storage = {}
+        for sto, ds in ts.piter(storage=storage):
+            sto.result = float(ds.all_data()["grid", "density"].sum())
+        assert_equal([storage[i] for i in range(5)], expected)
+        # The stride is learned, and outputs are only loaded once.
+        del loaded[:]
+        prefetcher = DatasetPrefetcher(ts, 2)
+        assert_equal([prefetcher[i].parameter_filename for i in (0, 2)],
+                     filenames[0:3:2])
+        assert_equal(prefetcher.stride, 2)
+        assert_true(4 in prefetcher._threads)
+        assert_equal(prefetcher[4].parameter_filename, filenames[4])
+        assert_equal(len(loaded), 3)
+        # Nothing is loaded ahead beyond the memory budget.
+        prefetcher = DatasetPrefetcher(ts, 4, fields=[("grid", "density")],
+                                       memory=0, stride=1)
+        prefetcher[0]
+        assert_equal(len(prefetcher._threads), 1)
+        # Errors while loading are raised when the output is requested.
+        ts = DatasetSeries(filenames + [os.path.join(tmpdir, "missing")],
+                           prefetch=1)
+        assert_raises(Exception, list, ts)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -18,6 +18,7 @@ import functools
 import glob
 import numpy as np
 import os
+import threading
 import weakref
 
 from functools import wraps
@@ -44,6 +45,8 @@ from yt.utilities.exceptions import \
     YTOutputNotIdentified
 from yt.utilities.parallel_tools.parallel_analysis_interface \
     import parallel_objects, parallel_root_only, communication_system
+from yt.utilities.parallel_tools.local_parallelism import \
+    local_processes
 from yt.utilities.parameter_file_storage import \
     simulation_time_series_registry
      
@@ -100,6 +103,97 @@ class TimeSeriesParametersContainer(object):
             return self.data_object.eval(get_ds_prop(attr)())
         raise AttributeError(attr)
 
+class DatasetPrefetcher(object):
+    r"""Loads the outputs of a time series ahead of the loop over them.
+
+    Each output is loaded in a background thread, which also builds its
+    index, calls the series' setup function and reads *fields* for the
+    whole domain.  Up to *depth* outputs are loaded ahead of the one last
+    requested, as long as the field data of those loaded but not yet
+    requested takes less than *memory* megabytes; the next one is always
+    loaded.  Outputs are expected to be requested with a constant *stride*,
+    which is learned from the first two requests if it is not given.
+    """
+    def __init__(self, ts, depth, fields=None, memory=1024, stride=None):
+        self.ts = ts
+        self.depth = depth
+        self.fields = ensure_list(fields) if fields is not None else []
+        self.memory = memory * 1024**2
+        self.stride = stride
+        self._last = None
+        self._nbytes = 0
+        self._threads = {}
+        self._loaded = {}
+
+    def _load(self, index):
+        ds = self.ts._load_output(self.ts._pre_outputs[index])
+        ds.index
+        if len(self.fields) == 0:
+            return ds, 0
+        ds.prefetched_data = ds.all_data()
+        ds.prefetched_data.get_data(self.fields)
+        nbytes = sum(v.nbytes for v in
+                     ds.prefetched_data.field_data.values())
+        return ds, nbytes
+
+    def _prefetch(self, index):
+        try:
+            self._loaded[index] = self._load(index) + (None,)
+        except Exception as e:
+            self._loaded[index] = (None, 0, e)
+
+    def _schedule(self, index):
+        if self.stride is None:
+            return
+        # Outputs still loading are assumed to be as large as the last one
+        # requested.
+        loaded = [v for i, v in list(self._loaded.items())
+                  if i in self._threads]
+        pending = sum(nbytes for ds, nbytes, e in loaded) + \
+          (len(self._threads) - len(loaded)) * self._nbytes
+        for k in range(1, self.depth + 1):
+            next_index = index + k * self.stride
+            if next_index >= len(self.ts._pre_outputs):
+                break
+            if next_index in self._threads:
+                continue
+            if pending >= self.memory and len(self._threads) > 0:
+                break
+            if not isinstance(self.ts._pre_outputs[next_index],
+                              string_types):
+                continue
+            thread = threading.Thread(target=self._prefetch,
+                                      args=(next_index,))
+            thread.daemon = True
+            thread.start()
+            self._threads[next_index] = thread
+            pending += self._nbytes
+
+    def __getitem__(self, index):
+        if self._last is not None and self.stride is None and \
+          index > self._last:
+            self.stride = index - self._last
+        self._last = index
+        thread = self._threads.pop(index, None)
+        # Outputs skipped over will not be asked for again.
+        for i in [i for i in self._threads if i < index]:
+            self._threads.pop(i).join()
+            self._loaded.pop(i)
+        # The next outputs start loading while this one is finished.
+        self._schedule(index)
+        if thread is None:
+            ds, self._nbytes = self._load(index)
+            return ds
+        thread.join()
+        ds, nbytes, error = self._loaded.pop(index)
+        if error is not None:
+            raise error
+        # The size estimate is only updated here, so that it does not
+        # depend on the order the loading threads finish in.
+        self._nbytes = nbytes
+        self._schedule(index)
+        return ds
+
 class DatasetSeries(object):
     r"""The DatasetSeries object is a container of multiple datasets,
     allowing easy iteration and computation on them.
@@ -133,6 +227,20 @@ class DatasetSeries(object):
         Set to True if the DatasetSeries will load different dataset types, set
         to False if loading dataset of a single type as this will result in a
         considerable speed up from not having to figure out the dataset type.
+    prefetch : int, default 0
+        The number of datasets to load in background threads ahead of the
+        one being analyzed when iterating over the series, so that parsing
+        their parameters, building their indices and calling
+        *setup_function* overlaps with the analysis.  See
+        :class:`~yt.data_objects.time_series.DatasetPrefetcher`.
+    prefetch_fields : list of fields, optional
+        Fields to read for the whole domain of each prefetched dataset.  The
+        data object they are read into is available as its
+        ``prefetched_data`` attribute.
+    prefetch_memory : float, default 1024
+        The number of megabytes the prefetched fields of datasets that have
+        not been reached yet may take.  No more datasets are prefetched
+        while this is exceeded.
 
     Examples
     --------
@@ -164,7 +272,8 @@ class DatasetSeries(object):
         return ret
 
     def __init__(self, outputs, parallel = True, setup_function = None,
-                 mixed_dataset_types = False, **kwargs):
+                 mixed_dataset_types = False, prefetch = 0,
+                 prefetch_fields = None, prefetch_memory = 1024, **kwargs):
         # This is needed to properly set _pre_outputs for Simulation subclasses.
         self._mixed_dataset_types = mixed_dataset_types
         if iterable(outputs) and not isinstance(outputs, string_types):
@@ -178,17 +287,32 @@ class DatasetSeries(object):
             setattr(self, type_name, functools.partial(
                 DatasetSeriesObject, self, type_name))
         self.parallel = parallel
+        self.prefetch = prefetch
+        self.prefetch_fields = prefetch_fields
+        self.prefetch_memory = prefetch_memory
         self.kwargs = kwargs
 
     def __iter__(self):
+        if self.prefetch > 0:
+            prefetcher = self._get_prefetcher(stride=1)
+            for i in range(len(self._pre_outputs)):
+                yield prefetcher[i]
+            return
         # We can make this fancier, but this works
         for o in self._pre_outputs:
-            if isinstance(o, string_types):
-                ds = self._load(o, **self.kwargs)
-                self._setup_function(ds)
-                yield ds
-            else:
-                yield o
+            yield self._load_output(o)
+
+    def _load_output(self, o):
+        if isinstance(o, string_types):
+            ds = self._load(o, **self.kwargs)
+            self._setup_function(ds)
+            return ds
+        return o
+
+    def _get_prefetcher(self, stride=None):
+        return DatasetPrefetcher(self, self.prefetch,
+                                 fields=self.prefetch_fields,
+                                 memory=self.prefetch_memory, stride=stride)
 
     def __getitem__(self, key):
         if isinstance(key, slice):
@@ -196,11 +320,7 @@ class DatasetSeries(object):
                 return self.get_range(key.start, key.stop)
             # This will return a sliced up object!
             return DatasetSeries(self._pre_outputs[key], self.parallel)
-        o = self._pre_outputs[key]
-        if isinstance(o, string_types):
-            o = self._load(o, **self.kwargs)
-            self._setup_function(o)
-        return o
+        return self._load_output(self._pre_outputs[key])
 
     def __len__(self):
         return len(self._pre_outputs)
@@ -272,6 +392,16 @@ class DatasetSeries(object):
         ...     print "% 4i  %0.3e" % (i, v)
         ...
 
+        Without MPI, the same loops can be spread over the cores of a
+        single machine by setting the ``local_parallel_processes``
+        configuration option, in which case each dataset is loaded by the
+        process it is dispatched to:
+
+        >>> ytcfg["yt", "local_parallel_processes"] = "8"
+        >>> for sto, ds in ts.piter(storage=my_storage):
+        ...     sto.result = ds.current_time
+        ...
+
         This shows how to dispatch 4 processors to each dataset:
 
         >>> ts = DatasetSeries("DD*/DD*.index",
@@ -288,6 +418,10 @@ class DatasetSeries(object):
                 njobs = -1
             else:
                 njobs = self.parallel
+        elif local_processes() > 1 and \
+          communication_system.communicators[-1].size == 1:
+            # Local processes balance the load among themselves.
+            njobs = -1
         else:
             my_communicator = communication_system.communicators[-1]
             nsize = my_communicator.size
@@ -298,16 +432,26 @@ class DatasetSeries(object):
             else:
                 njobs = nsize - 1
 
-        for output in parallel_objects(self._pre_outputs, njobs=njobs,
+        if self.prefetch > 0 and not dynamic:
+            # Every process prefetches the outputs of its own share.
+            serial = self.parallel is False or \
+              (communication_system.communicators[-1].size == 1 and
+               local_processes() == 1)
+            prefetcher = self._get_prefetcher(stride=1 if serial else None)
+            outputs = range(len(self._pre_outputs))
+        else:
+            prefetcher = None
+            outputs = self._pre_outputs
+
+        for output in parallel_objects(outputs, njobs=njobs,
                                        storage=storage, dynamic=dynamic):
             if storage is not None:
                 sto, output = output
 
-            if isinstance(output, string_types):
-                ds = self._load(output, **self.kwargs)
-                self._setup_function(ds)
+            if prefetcher is not None:
+                ds = prefetcher[output]
             else:
-                ds = output
+                ds = self._load_output(output)
 
             if storage is not None:
                 next_ret = (sto, ds)
@@ -113,7 +113,7 @@ class UnstructuredMesh(YTSelectionContainer):
         raise NotImplementedError
 
     def deposit(self, positions, fields = None, method = None,
-                kernel_name = 'cubic'):
+                kernel_name = 'cubic', num_threads = 1):
         raise NotImplementedError
         # Here we perform our particle deposition.
         cls = getattr(particle_deposit, "deposit_%s" % method, None)
@@ -67,6 +67,9 @@ class FieldInfoContainer(dict):
         self.slice_info = slice_info
         self.field_aliases = {}
         self.species_names = []
+        # Maps smoothed fields to the particle type, particle field and
+        # smoothing length field they are smoothed from.
+        self.smoothed_field_sources = {}
         self.setup_fluid_aliases()
 
     def setup_fluid_fields(self):
@@ -162,9 +165,13 @@ class FieldInfoContainer(dict):
                 ptype, "particle_position", "particle_mass",
                 sml_name, "density", alias_name, self,
                 num_neighbors)
+            source = (ptype, alias_name, sml_name)
             if 'particle_' in alias_name:
                 alias_name = alias_name.replace('particle_', '')
             new_aliases.append(((ftype, alias_name), fn[0]))
+            if sml_name is not None:
+                self.smoothed_field_sources[fn[0]] = source
+                self.smoothed_field_sources[ftype, alias_name] = source
         for alias, source in new_aliases:
             #print "Aliasing %s => %s" % (alias, source)
             self.alias(alias, source)
@@ -1586,7 +1586,7 @@ cdef class ARTIORootMeshContainer:
         nf = len(fields)
         cdef np.float64_t[::cython.view.indirect, ::1] field_pointers 
         if nf > 0: field_pointers = OnceIndirect(fields)
-        cdef np.float64_t[:] field_vals = np.empty(nf, dtype="float64")
+        cdef np.float64_t[:] field_vals = np.empty(max(nf, 1), dtype="float64")
         cdef np.ndarray[np.uint8_t, ndim=1, cast=True] mask
         mask = self.mask(selector, -1)
         cdef np.ndarray[np.int64_t, ndim=1] domain_ind
@@ -1622,7 +1622,7 @@ cdef class ARTIORootMeshContainer:
             for j in range(3):
                 left_edge[j] = coords[j] * self.dds[j] + self.DLE[j]
             pdeposit.process(dims, left_edge, self.dds,
-                         offset, pos, field_vals, sfc)
+                         offset, pos, &field_vals[0], sfc)
             if pdeposit.update_values == 1:
                 for j in range(nf):
                     field_pointers[j][i] = field_vals[j]
@@ -51,6 +51,8 @@ class ARTIOOctreeSubset(OctreeSubset):
     _domain_offset = 0
     domain_id = -1
     _con_args = ("base_region", "sfc_start", "sfc_end", "oct_handler", "ds")
+    # Each subset carries its own octree, so selections cannot be shared.
+    _selection_cache_key = None
     _type_name = 'octree_subset'
     _num_zones = 2
 
@@ -137,7 +139,7 @@ class ARTIORootMeshSubset(ARTIOOctreeSubset):
         return tr
 
     def deposit(self, positions, fields = None, method = None,
-                kernel_name = 'cubic'):
+                kernel_name = 'cubic', num_threads = 1):
         # Here we perform our particle deposition.
         if fields is None: fields = []
         cls = getattr(particle_deposit, "deposit_%s" % method, None)
@@ -17,6 +17,8 @@ import os
 import numpy as np
 from collections import defaultdict
 
+from yt.utilities.file_handler import \
+    get_mapped_file
 from yt.utilities.io_handler import \
     BaseIOHandler
 from yt.funcs import mylog
@@ -84,12 +86,12 @@ class IOHandlerBoxlib(BaseIOHandler):
         lo = box[0]
         hi = box[1]
         shape = hi - lo + 1
-        with open(filename, "rb") as f:
-            f.seek(offset)
-            f.readline()  # always skip the first line
-            arr = np.fromfile(f, 'float64', np.product(shape))
-            arr = arr.reshape(shape, order='F')
-        return arr
+        f = get_mapped_file(filename)
+        # always skip the first line, remembering where it ends
+        if offset not in f.offsets:
+            f.offsets[offset] = f.line_end(offset)
+        return f.record(f.offsets[offset], 'float64', np.product(shape),
+                        shape=tuple(shape), order='F')
 
     def _read_chunk_data(self, chunk, fields):
         data = {}
@@ -105,21 +107,21 @@ class IOHandlerBoxlib(BaseIOHandler):
             grids = grids_by_file[filename]
             grids.sort(key = lambda a: a._offset)
             f = open(filename, "rb")
+            mf = get_mapped_file(filename)
             for grid in grids:
                 data[grid.id] = {}
-                local_offset = grid._get_offset(f) - f.tell()
+                offset = grid._get_offset(f)
                 count = grid.ActiveDimensions.prod()
                 size = count * bpr
                 for field in self.ds.index.field_order:
                     if field in fields:
-                        # We read it ...
-                        f.seek(local_offset, os.SEEK_CUR)
-                        v = np.fromfile(f, dtype=dtype, count=count)
-                        v = v.reshape(grid.ActiveDimensions, order='F')
-                        data[grid.id][field] = v
-                        local_offset = 0
-                    else:
-                        local_offset += size
+                        # We only take a view of the mapped file here; the
+                        # selected values are copied out by grid.select.
+                        data[grid.id][field] = mf.record(
+                            offset, dtype, count,
+                            shape=tuple(grid.ActiveDimensions), order='F')
+                    offset += size
+            f.close()
         return data
 
     def _read_particle_coords(self, chunks, ptf):
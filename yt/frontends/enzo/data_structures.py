@@ -23,24 +23,29 @@ import os
 import stat
 import string
 import time
-import re
 
 from yt.utilities.on_demand_imports import \
     _libconf as libconf
 from collections import defaultdict
 from yt.extern.six.moves import zip as izip
 
+from yt.config import ytcfg
+from yt.frontends.enzo.hierarchy import \
+    load_hierarchy_cache, \
+    parse_hierarchy, \
+    write_hierarchy_cache
 from yt.frontends.enzo.misc import \
     cosmology_get_units
 from yt.funcs import \
     ensure_list, \
     ensure_tuple, \
-    get_pbar, \
     setdefaultattr
 from yt.data_objects.grid_patch import \
     AMRGridPatch
 from yt.geometry.grid_geometry_handler import \
     GridIndex
+from yt.geometry.grid_store import \
+    GridStore
 from yt.geometry.geometry_handler import \
     YTDataChunk
 from yt.data_objects.static_output import \
@@ -73,17 +78,7 @@ class EnzoGrid(AMRGridPatch):
         """
         Intelligently set the filename.
         """
-        if filename is None:
-            self.filename = filename
-            return
-        if self.index._strip_path:
-            self.filename = os.path.join(self.index.directory,
-                                         os.path.basename(filename))
-        elif filename[0] == os.path.sep:
-            self.filename = filename
-        else:
-            self.filename = os.path.join(self.index.directory, filename)
-        return
+        self.filename = self.index._resolve_filename(filename)
 
     def __repr__(self):
         return "EnzoGrid_%04i" % (self.id)
@@ -197,6 +192,17 @@ class EnzoHierarchy(GridIndex):
         self.dataset.dataset_type = self.dataset_type
 
     def _count_grids(self):
+        self._hierarchy_data = None
+        if ytcfg.getboolean("yt", "hierarchy_cache"):
+            self._hierarchy_data = load_hierarchy_cache(
+                self._hierarchy_cache_filename, self.index_filename)
+        if self._hierarchy_data is not None:
+            info = self._hierarchy_data.info
+            self.num_grids = self._hierarchy_data.num_grids
+            self.num_stars = info["num_stars"]
+            self._test_grid = info["test_grid"], info["test_grid_id"]
+            self._guess_dataset_type(self.ds.dimensionality, *self._test_grid)
+            return
         self.num_grids = None
         test_grid = test_grid_id = None
         self.num_stars = 0
@@ -213,8 +219,13 @@ class EnzoHierarchy(GridIndex):
                 test_grid_id = int(line.split("=")[-1])
                 if test_grid is not None:
                     break
+        self._test_grid = test_grid, test_grid_id
         self._guess_dataset_type(self.ds.dimensionality, test_grid, test_grid_id)
 
+    @property
+    def _hierarchy_cache_filename(self):
+        return "%s.cache" % self.index_filename
+
     def _guess_dataset_type(self, rank, test_grid, test_grid_id):
         if test_grid[0] != os.path.sep:
             test_grid = os.path.join(self.directory, test_grid)
@@ -240,69 +251,82 @@ class EnzoHierarchy(GridIndex):
         else:
             raise NotImplementedError
 
-    # Sets are sorted, so that won't work!
-    def _parse_index(self):
-        def _next_token_line(token, f):
-            for line in f:
-                if line.startswith(token):
-                    return line.split()[2:]
-        pattern = r"Pointer: Grid\[(\d*)\]->NextGrid(Next|This)Level = (\d*)\s+$"
-        patt = re.compile(pattern)
-        f = open(self.index_filename, "rt")
-        self.grids = [self.grid(1, self)]
-        self.grids[0].Level = 0
-        si, ei, LE, RE, fn, npart = [], [], [], [], [], []
-        pbar = get_pbar("Parsing Hierarchy ", self.num_grids)
+    def _resolve_filename(self, filename):
+        if filename is None:
+            return None
+        if self._strip_path:
+            return os.path.join(self.directory, os.path.basename(filename))
+        elif filename[0] == os.path.sep:
+            return filename
+        return os.path.join(self.directory, filename)
+
+    def _active_particle_types(self):
         version = self.dataset.parameters.get("VersionNumber", None)
         params = self.dataset.parameters
         if version is None and "Internal" in params:
             version = float(params["Internal"]["Provenance"]["VersionNumber"])
         if version >= 3.0:
-            active_particles = True
-            nap = dict((ap_type, []) for ap_type in
-                params["Physics"]["ActiveParticles"]["ActiveParticlesEnabled"])
+            ptypes = params["Physics"]["ActiveParticles"][
+                "ActiveParticlesEnabled"]
+        elif "AppendActiveParticleType" in self.parameters:
+            ptypes = self.parameters.get("AppendActiveParticleType", [])
         else:
-            if "AppendActiveParticleType" in self.parameters:
-                nap = {}
-                active_particles = True
-                for type in self.parameters.get("AppendActiveParticleType", []):
-                    nap[type] = []
-            else:
-                nap = None
-                active_particles = False
-        for grid_id in range(self.num_grids):
-            pbar.update(grid_id)
-            # We will unroll this list
-            si.append(_next_token_line("GridStartIndex", f))
-            ei.append(_next_token_line("GridEndIndex", f))
-            LE.append(_next_token_line("GridLeftEdge", f))
-            RE.append(_next_token_line("GridRightEdge", f))
-            nb = int(_next_token_line("NumberOfBaryonFields", f)[0])
-            fn.append([None])
-            if nb > 0: fn[-1] = _next_token_line("BaryonFileName", f)
-            npart.append(int(_next_token_line("NumberOfParticles", f)[0]))
-            # Below we find out what active particles exist in this grid,
-            # and add their counts individually.
-            if active_particles:
-                ptypes = _next_token_line("PresentParticleTypes", f)
-                counts = [int(c) for c in _next_token_line("ParticleTypeCounts", f)]
-                for ptype in self.parameters.get("AppendActiveParticleType", []):
-                    if ptype in ptypes:
-                        nap[ptype].append(counts[ptypes.index(ptype)])
-                    else:
-                        nap[ptype].append(0)
-            if nb == 0 and npart[-1] > 0: fn[-1] = _next_token_line("ParticleFileName", f)
-            for line in f:
-                if len(line) < 2: break
-                if line.startswith("Pointer:"):
-                    vv = patt.findall(line)[0]
-                    self.__pointer_handler(vv)
-        pbar.finish()
-        self._fill_arrays(ei, si, LE, RE, npart, nap)
-        temp_grids = np.empty(self.num_grids, dtype='object')
-        temp_grids[:] = self.grids
-        self.grids = temp_grids
-        self.filenames = fn
+            return None
+        return list(ptypes)
+
+    def _parse_index(self):
+        ptypes = self._active_particle_types()
+        appended = self.parameters.get("AppendActiveParticleType", []) \
+          if ptypes is not None else []
+        data = self._hierarchy_data
+        if data is None:
+            mylog.debug("Parsing %s", self.index_filename)
+            data = parse_hierarchy(self.index_filename,
+                                   self.ds.dimensionality, appended)
+            if ytcfg.getboolean("yt", "hierarchy_cache"):
+                test_grid, test_grid_id = self._test_grid
+                write_hierarchy_cache(
+                    self._hierarchy_cache_filename, self.index_filename,
+                    data, num_stars = self.num_stars, test_grid = test_grid,
+                    test_grid_id = test_grid_id)
+        self._hierarchy_data = None
+        nap = None
+        if ptypes is not None:
+            nap = dict((ptype, []) for ptype in ptypes)
+            for ptype in appended:
+                nap[ptype] = data.active_particle_counts[ptype]
+        self._fill_arrays(data["end_index"], data["start_index"],
+                          data["left_edge"], data["right_edge"],
+                          data["particle_count"], nap)
+        self.grid_levels.flat[:] = data["levels"]
+        if ytcfg.getboolean("yt", "lightweight_grids"):
+            # Enzo grid ids are one-indexed; the store holds array indices.
+            parents = np.asarray(data["parent_ids"])
+            self.grid_store = GridStore(
+                self, np.where(parents > 0, parents - 1, -1),
+                data["child_offsets"], np.asarray(data["child_ids"]) - 1,
+                data["file_index"],
+                [self._resolve_filename(fn) for fn in data.filenames])
+            return
+        self.grids = np.empty(self.num_grids, dtype='object')
+        for i, (level, parent_id) in enumerate(
+                izip(data["levels"].tolist(), data["parent_ids"].tolist())):
+            grid = self.grid(i + 1, self)
+            grid.Level = level
+            grid._parent_id = parent_id
+            grid._children_ids = data.children(i)
+            self.grids[i] = grid
+        self.filenames = data.grid_filenames()
+
+    def _create_grid(self, i):
+        store = self.grid_store
+        grid = self.grid(i + 1, self)
+        grid.Level = int(self.grid_levels[i, 0])
+        parent = store.parent_ids[i]
+        grid._parent_id = int(parent) + 1 if parent >= 0 else -1
+        grid._children_ids = (store.children(i) + 1).tolist()
+        grid.filename = store.filename(i)
+        return grid
 
     def _initialize_grid_arrays(self):
         super(EnzoHierarchy, self)._initialize_grid_arrays()
@@ -323,26 +347,6 @@ class EnzoHierarchy(GridIndex):
             for ptype in nap:
                 self.grid_active_particle_count[ptype].flat[:] = nap[ptype]
 
-    def __pointer_handler(self, m):
-        sgi = int(m[2])-1
-        if sgi == -1: return # if it's 0, then we're done with that lineage
-        # Okay, so, we have a pointer.  We make a new grid, with an id of the length+1
-        # (recall, Enzo grids are 1-indexed)
-        self.grids.append(self.grid(len(self.grids)+1, self))
-        # We'll just go ahead and make a weakref to cache
-        second_grid = self.grids[sgi] # zero-indexed already
-        first_grid = self.grids[int(m[0])-1]
-        if m[1] == "Next":
-            first_grid._children_ids.append(second_grid.id)
-            second_grid._parent_id = first_grid.id
-            second_grid.Level = first_grid.Level + 1
-        elif m[1] == "This":
-            if first_grid.Parent is not None:
-                first_grid.Parent._children_ids.append(second_grid.id)
-                second_grid._parent_id = first_grid._parent_id
-            second_grid.Level = first_grid.Level
-        self.grid_levels[sgi] = second_grid.Level
-
     def _rebuild_top_grids(self, level = 0):
         mylog.info("Rebuilding grids on level %s", level)
         cmask = (self.grid_levels.flat == (level + 1))
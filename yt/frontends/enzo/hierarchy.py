@@ -0,0 +1,317 @@
+"""
+Parsing and caching of Enzo text hierarchy files
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import json
+import os
+import re
+
+import numpy as np
+
+from yt.utilities.file_handler import \
+    MemoryMappedFileHandler
+from yt.utilities.logger import ytLogger as mylog
+
+HIERARCHY_CACHE_VERSION = 1
+_cache_signature = b"yt-enzo-hierarchy "
+
+_grid_pattern = re.compile(r"^Grid = (\d+)", re.M)
+_pointer_pattern = re.compile(
+    r"^Pointer: Grid\[(\d*)\]->NextGrid(Next|This)Level = (\d*)\s*$", re.M)
+_value_patterns = {}
+
+def _value_pattern(token):
+    if token not in _value_patterns:
+        _value_patterns[token] = re.compile(
+            r"^%s\s*=\s*(.*?)\s*$" % token, re.M)
+    return _value_patterns[token]
+
+def _find_values(token, text, grid_starts):
+    # Every occurrence of a token, with the (chunk-local) index of the grid
+    # it belongs to.
+    gi, values = [], []
+    for m in _value_pattern(token).finditer(text):
+        gi.append(m.start())
+        values.append(m.group(1))
+    gi = np.searchsorted(grid_starts, np.array(gi, dtype="int64"),
+                         side="right") - 1
+    return gi, values
+
+def _per_grid(token, text, grid_starts, dtype, width=None):
+    # Values that every grid has exactly one of.
+    gi, values = _find_values(token, text, grid_starts)
+    if gi.size != grid_starts.size or (gi != np.arange(gi.size)).any():
+        raise RuntimeError("Could not find %s for every grid." % token)
+    arr = np.array(" ".join(values).split(), dtype=dtype)
+    if width is not None:
+        arr = arr.reshape((gi.size, width))
+    return arr
+
+class EnzoHierarchyData(object):
+    r"""The contents of an Enzo hierarchy file, as arrays.
+
+    Grid ``i`` (zero-indexed) has the Enzo grid id ``i + 1``.  Parent and
+    child pointers are stored as grid ids, with -1 for grids that have no
+    parent, and the children of grid ``i`` are
+    ``child_ids[child_offsets[i]:child_offsets[i + 1]]``.  Filenames are
+    stored once, with ``file_index`` giving the position of each grid's
+    file in ``filenames`` (or -1 if the grid has no file).
+    """
+    _array_names = ("start_index", "end_index", "left_edge", "right_edge",
+                    "particle_count", "levels", "parent_ids",
+                    "child_offsets", "child_ids", "file_index")
+
+    def __init__(self, arrays, filenames, active_particle_counts, info):
+        self.arrays = arrays
+        self.filenames = filenames
+        self.active_particle_counts = active_particle_counts
+        self.info = info
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    @property
+    def num_grids(self):
+        return self.arrays["levels"].size
+
+    def grid_filenames(self):
+        return [[self.filenames[i]] if i >= 0 else [None]
+                for i in self.arrays["file_index"]]
+
+    def children(self, i):
+        co = self.arrays["child_offsets"]
+        return self.arrays["child_ids"][co[i]:co[i + 1]].tolist()
+
+def _read_chunks(filename, blocksize):
+    # Yield pieces of the hierarchy that each hold a whole number of grids.
+    rest = ""
+    with open(filename, "rt") as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            text = rest + block
+            cut = text.rfind("\nGrid = ")
+            if cut <= 0:
+                rest = text
+                continue
+            rest = text[cut + 1:]
+            yield text[:cut + 1]
+    if rest:
+        yield rest
+
+def parse_hierarchy(filename, rank, active_particle_types=None,
+                    blocksize=64 * 1024 * 1024):
+    r"""Parse an Enzo ``.hierarchy`` file into an :class:`EnzoHierarchyData`.
+
+    Rather than walking the file line by line, the file is read in large
+    blocks and every attribute is extracted for all the grids of a block at
+    once, with each value assigned to its grid by position.  Only the
+    ``Pointer:`` records, which define levels and parentage, are then
+    walked in order.
+
+    Parameters
+    ----------
+    filename : str
+        The hierarchy file.
+    rank : int
+        The dimensionality of the grids.
+    active_particle_types : list of str, optional
+        If given, the per-grid counts of each of these active particle types
+        are parsed as well.
+    blocksize : int
+        The number of characters to parse at a time.
+    """
+    si, ei, LE, RE, npart = [], [], [], [], []
+    file_index = []
+    filenames = []
+    file_ids = {}
+    pointers = []
+    num_grids = 0
+    apc = dict((ptype, []) for ptype in active_particle_types or [])
+    for text in _read_chunks(filename, blocksize):
+        grid_starts, grid_ids = [], []
+        for m in _grid_pattern.finditer(text):
+            grid_starts.append(m.start())
+            grid_ids.append(int(m.group(1)))
+        if len(grid_starts) == 0:
+            continue
+        grid_starts = np.array(grid_starts, dtype="int64")
+        ng = grid_starts.size
+        if grid_ids != list(range(num_grids + 1, num_grids + ng + 1)):
+            raise RuntimeError("Grids in %s are not numbered sequentially."
+                               % filename)
+        si.append(_per_grid("GridStartIndex", text, grid_starts, "int32",
+                            rank))
+        ei.append(_per_grid("GridEndIndex", text, grid_starts, "int32",
+                            rank))
+        LE.append(_per_grid("GridLeftEdge", text, grid_starts, "float64",
+                            rank))
+        RE.append(_per_grid("GridRightEdge", text, grid_starts, "float64",
+                            rank))
+        nb = _per_grid("NumberOfBaryonFields", text, grid_starts, "int64")
+        np_ = _per_grid("NumberOfParticles", text, grid_starts, "int64")
+        npart.append(np_)
+        # Grids with baryon fields are read from their BaryonFileName; the
+        # others, if they have particles, from their ParticleFileName.
+        fns = [None] * ng
+        pgi, pvals = _find_values("ParticleFileName", text, grid_starts)
+        for i, v in zip(pgi, pvals):
+            if nb[i] == 0 and np_[i] > 0:
+                fns[i] = v.split()[0]
+        bgi, bvals = _find_values("BaryonFileName", text, grid_starts)
+        for i, v in zip(bgi, bvals):
+            if nb[i] > 0:
+                fns[i] = v.split()[0]
+        for fn in fns:
+            if fn is None:
+                file_index.append(-1)
+                continue
+            if fn not in file_ids:
+                file_ids[fn] = len(filenames)
+                filenames.append(fn)
+            file_index.append(file_ids[fn])
+        if apc:
+            tgi, tvals = _find_values("PresentParticleTypes", text,
+                                      grid_starts)
+            cgi, cvals = _find_values("ParticleTypeCounts", text,
+                                      grid_starts)
+            counts = dict((ptype, np.zeros(ng, dtype="int64"))
+                          for ptype in apc)
+            ptypes = dict(zip(tgi, tvals))
+            for i, v in zip(cgi, cvals):
+                types = ptypes.get(i, "").split()
+                for ptype, c in zip(types, v.split()):
+                    if ptype in counts:
+                        counts[ptype][i] = int(c)
+            for ptype in apc:
+                apc[ptype].append(counts[ptype])
+        pointers.extend((int(a), b == "Next", int(c))
+                        for a, b, c in _pointer_pattern.findall(text))
+        num_grids += ng
+    if num_grids == 0:
+        raise RuntimeError("No grids found in %s." % filename)
+    levels = np.zeros(num_grids, dtype="int32")
+    parents = -np.ones(num_grids, dtype="int64")
+    children = [[] for i in range(num_grids)]
+    for first, is_next, second in pointers:
+        if second == 0:
+            continue
+        fi, si_ = first - 1, second - 1
+        if is_next:
+            children[fi].append(second)
+            parents[si_] = first
+            levels[si_] = levels[fi] + 1
+        else:
+            if parents[fi] != -1:
+                children[parents[fi] - 1].append(second)
+                parents[si_] = parents[fi]
+            levels[si_] = levels[fi]
+    child_offsets = np.zeros(num_grids + 1, dtype="int64")
+    child_offsets[1:] = np.cumsum([len(c) for c in children])
+    child_ids = np.array([c for cs in children for c in cs], dtype="int64")
+    arrays = dict(
+        start_index = np.concatenate(si),
+        end_index = np.concatenate(ei),
+        left_edge = np.concatenate(LE),
+        right_edge = np.concatenate(RE),
+        particle_count = np.concatenate(npart),
+        levels = levels,
+        parent_ids = parents,
+        child_offsets = child_offsets,
+        child_ids = child_ids,
+        file_index = np.array(file_index, dtype="int32"))
+    apc = dict((ptype, np.concatenate(apc[ptype])) for ptype in apc)
+    return EnzoHierarchyData(arrays, filenames, apc, {})
+
+def _file_signature(filename):
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime]
+
+def write_hierarchy_cache(cache_filename, hierarchy_filename, data, **info):
+    r"""Write *data* (an :class:`EnzoHierarchyData`) to *cache_filename*.
+
+    The cache is a single JSON header line, describing the arrays and
+    recording the size and modification time of the hierarchy it was built
+    from, followed by the raw arrays, so that it can be memory-mapped.  Any
+    keyword arguments are stored in the header and restored as
+    ``data.info``.  Returns False if the cache could not be written.
+    """
+    arrays = [(name, np.ascontiguousarray(data[name]))
+              for name in EnzoHierarchyData._array_names]
+    arrays.extend(("active_particle_count/%s" % ptype,
+                   np.ascontiguousarray(count)) for ptype, count
+                  in sorted(data.active_particle_counts.items()))
+    header = dict(version = HIERARCHY_CACHE_VERSION,
+                  hierarchy = _file_signature(hierarchy_filename),
+                  filenames = data.filenames,
+                  info = info,
+                  arrays = [])
+    offset = 0
+    for name, arr in arrays:
+        header["arrays"].append(
+            [name, offset, arr.dtype.str, list(arr.shape)])
+        # Keep every array aligned to its item size.
+        offset += -(-arr.nbytes // 8) * 8
+    header = _cache_signature + json.dumps(header).encode("utf-8") + b"\n"
+    start = -(-len(header) // 8) * 8
+    tmp_filename = "%s.%s.tmp" % (cache_filename, os.getpid())
+    try:
+        with open(tmp_filename, "wb") as f:
+            f.write(header.ljust(start, b" "))
+            for name, arr in arrays:
+                f.write(arr.tobytes())
+                f.write(b"\0" * (-arr.nbytes % 8))
+        os.rename(tmp_filename, cache_filename)
+    except (IOError, OSError) as e:
+        mylog.debug("Could not write hierarchy cache %s: %s",
+                    cache_filename, e)
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return False
+    return True
+
+def load_hierarchy_cache(cache_filename, hierarchy_filename):
+    r"""Return the :class:`EnzoHierarchyData` stored in *cache_filename*,
+    with its arrays memory-mapped, or None if there is no cache or it is out
+    of date with respect to *hierarchy_filename*.
+    """
+    if not os.path.exists(cache_filename):
+        return None
+    try:
+        f = MemoryMappedFileHandler(cache_filename, mmap=True)
+        end = f.line_end(0)
+        header = f.record(0, "uint8", end).tobytes()
+        if not header.startswith(_cache_signature):
+            return None
+        header = json.loads(header[len(_cache_signature):].decode("utf-8"))
+        if header["version"] != HIERARCHY_CACHE_VERSION or \
+           header["hierarchy"] != _file_signature(hierarchy_filename):
+            mylog.debug("Hierarchy cache %s is out of date.", cache_filename)
+            return None
+        start = -(-end // 8) * 8
+        arrays, apc = {}, {}
+        for name, offset, dtype, shape in header["arrays"]:
+            count = int(np.prod(shape))
+            arr = f.record(start + offset, dtype, count, shape=tuple(shape))
+            if name.startswith("active_particle_count/"):
+                apc[name.split("/", 1)[1]] = arr
+            else:
+                arrays[name] = arr
+    except (IOError, OSError, ValueError, KeyError) as e:
+        mylog.debug("Could not read hierarchy cache %s: %s",
+                    cache_filename, e)
+        return None
+    return EnzoHierarchyData(arrays, header["filenames"], apc,
+                             header["info"])
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from yt.frontends.enzo.hierarchy import \
+    load_hierarchy_cache, \
+    parse_hierarchy, \
+    write_hierarchy_cache
+from yt.testing import \
+    assert_equal, \
+    assert_true
+
+_grid_template = """
+Grid = %(id)s
+Task              = 0
+GridRank          = 3
+GridDimension     = 14 14 14
+GridStartIndex    = 3 3 3
+GridEndIndex      = %(end)s %(end)s %(end)s
+GridLeftEdge      = %(le)s %(le)s %(le)s
+GridRightEdge     = %(re)s %(re)s %(re)s
+Time              = 646.75066015177
+SubgridsAreStatic = 0
+NumberOfBaryonFields = %(nb)s
+FieldType = 0 1 4 5 6
+%(baryon)sCourantSafetyNumber    = 0.300000
+NumberOfParticles   = %(npart)s
+%(particle)sGravityBoundaryType = 0
+Pointer: Grid[%(id)s]->NextGridThisLevel = %(this)s
+Pointer: Grid[%(id)s]->NextGridNextLevel = %(next)s
+"""
+
+# A root grid with two children, the second of which has no baryon fields
+# and a child of its own.
+_grids = [dict(id = 1, end = 10, le = 0.0, re = 1.0, nb = 5, npart = 10,
+               this = 0, next = 2, fn = "cpu0000"),
+          dict(id = 2, end = 12, le = 0.1, re = 0.2, nb = 5, npart = 0,
+               this = 3, next = 0, fn = "cpu0001"),
+          dict(id = 3, end = 11, le = 0.5, re = 0.7, nb = 0, npart = 4,
+               this = 0, next = 4, fn = "cpu0000"),
+          dict(id = 4, end = 13, le = 0.55, re = 0.6, nb = 0, npart = 0,
+               this = 0, next = 0, fn = None)]
+
+def _write_hierarchy(fn):
+    with open(fn, "w") as f:
+        for g in _grids:
+            g = g.copy()
+            g["baryon"] = g["particle"] = ""
+            if g["nb"] > 0:
+                g["baryon"] = "BaryonFileName = ./DD0000/data.%s\n" % g["fn"]
+            if g["npart"] > 0:
+                g["particle"] = "ParticleFileName = ./DD0000/data.%s\n" % \
+                    g["fn"]
+            f.write(_grid_template % g)
+
+def _check_hierarchy(data):
+    assert_equal(data.num_grids, 4)
+    assert_equal(data["start_index"], 3)
+    assert_equal(data["end_index"][:, 1], [g["end"] for g in _grids])
+    assert_equal(data["left_edge"][:, 2], [g["le"] for g in _grids])
+    assert_equal(data["right_edge"][:, 0], [g["re"] for g in _grids])
+    assert_equal(data["particle_count"], [g["npart"] for g in _grids])
+    assert_equal(data["levels"], [0, 1, 1, 2])
+    assert_equal(data["parent_ids"], [-1, 1, 1, 3])
+    assert_equal([data.children(i) for i in range(4)], [[2, 3], [], [4], []])
+    assert_equal(data.grid_filenames(),
+                 [["./DD0000/data.%s" % g["fn"]] if g["fn"] else [None]
+                  for g in _grids])
+
+def test_parse_hierarchy():
+    tmpdir = tempfile.mkdtemp()
+    fn = os.path.join(tmpdir, "DD0000.hierarchy")
+    _write_hierarchy(fn)
+    for blocksize in (64, 1000, 1 << 20):
+        _check_hierarchy(parse_hierarchy(fn, 3, blocksize = blocksize))
+    data = parse_hierarchy(fn, 3)
+    cache_fn = fn + ".cache"
+    assert_true(load_hierarchy_cache(cache_fn, fn) is None)
+    assert_true(write_hierarchy_cache(cache_fn, fn, data, num_stars = 5))
+    cached = load_hierarchy_cache(cache_fn, fn)
+    _check_hierarchy(cached)
+    assert_equal(cached.info["num_stars"], 5)
+    assert_true(isinstance(cached["left_edge"].base, np.memmap))
+    # Touching the hierarchy invalidates the cache
+    with open(fn, "a") as f:
+        f.write("\n")
+    assert_true(load_hierarchy_cache(cache_fn, fn) is None)
+    shutil.rmtree(tmpdir)
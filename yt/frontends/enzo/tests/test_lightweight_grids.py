@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from yt.config import ytcfg
+from yt.convenience import load
+from yt.geometry.grid_store import GridProxy
+from yt.testing import \
+    assert_array_equal, \
+    assert_equal, \
+    assert_true, \
+    requires_module
+from yt.utilities.on_demand_imports import _h5py as h5py
+
+_parameters = """InitialTime = 0.0
+VersionNumber = 2.0
+TopGridRank = 3
+TopGridDimensions = 16 16 16
+DomainLeftEdge = 0.0 0.0 0.0
+DomainRightEdge = 1.0 1.0 1.0
+RefineBy = 2
+LeftFaceBoundaryCondition = 3 3 3
+ComovingCoordinates = 0
+HydroMethod = 0
+DualEnergyFormalism = 0
+MultiSpecies = 0
+Gamma = 1.6667
+NumberOfParticles = 0
+MaximumRefinementLevel = 2
+DataLabel[0] = Density
+CurrentTimeIdentifier = 1
+"""
+
+_grid_template = """
+Grid = %(id)s
+GridRank          = 3
+GridDimension     = %(gdim)s %(gdim)s %(gdim)s
+GridStartIndex    = 3 3 3
+GridEndIndex      = %(end)s %(end)s %(end)s
+GridLeftEdge      = %(le)s %(le)s %(le)s
+GridRightEdge     = %(re)s %(re)s %(re)s
+Time              = 0.0
+NumberOfBaryonFields = 1
+FieldType = 0
+BaryonFileName = ./DD0000.cpu0000
+NumberOfParticles   = 0
+Pointer: Grid[%(id)s]->NextGridThisLevel = %(this)s
+Pointer: Grid[%(id)s]->NextGridNextLevel = %(next)s
+"""
+
+# A root grid with two children, the second of which has a child of its own.
+_grids = [dict(id = 1, n = 16, le = 0.0, re = 1.0, this = 0, next = 2),
+          dict(id = 2, n = 8, le = 0.25, re = 0.5, this = 3, next = 0),
+          dict(id = 3, n = 8, le = 0.5, re = 0.75, this = 0, next = 4),
+          dict(id = 4, n = 8, le = 0.5, re = 0.625, this = 0, next = 0)]
+
+def _write_dataset(dirname):
+    fn = os.path.join(dirname, "DD0000")
+    with open(fn, "w") as f:
+        f.write(_parameters)
+    with open(fn + ".hierarchy", "w") as f:
+        for g in _grids:
+            f.write(_grid_template % dict(g, gdim = g["n"] + 6,
+                                          end = g["n"] + 2))
+    np.random.seed(0x4d3d3d3)
+    with h5py.File(fn + ".cpu0000", "w") as f:
+        for g in _grids:
+            f["Grid%08i/Density" % g["id"]] = np.random.random((g["n"],) * 3)
+    return fn
+
+def _load(fn, lightweight):
+    old = ytcfg.get("yt", "lightweight_grids")
+    ytcfg["yt", "lightweight_grids"] = str(lightweight)
+    try:
+        ds = load(fn)
+        ds.index
+    finally:
+        ytcfg["yt", "lightweight_grids"] = old
+    return ds
+
+@requires_module("h5py")
+def test_lightweight_grids():
+    tmpdir = tempfile.mkdtemp()
+    fn = _write_dataset(tmpdir)
+    ds = _load(fn, False)
+    dsl = _load(fn, True)
+    assert_true(ds.index.grid_store is None)
+    assert_true(dsl.index.grid_store is not None)
+    assert_true(isinstance(dsl.index.grids[0], GridProxy))
+    assert_equal(len(dsl.index.grids), len(ds.index.grids))
+    for g, gl in zip(ds.index.grids, dsl.index.grids):
+        assert_equal(gl.id, g.id)
+        assert_equal(gl.Level, g.Level)
+        assert_equal(gl.filename, g.filename)
+        assert_array_equal(gl.LeftEdge, g.LeftEdge)
+        assert_array_equal(gl.dds, g.dds)
+        assert_array_equal(gl.get_global_startindex(),
+                           g.get_global_startindex())
+        assert_array_equal(gl.child_mask, g.child_mask)
+        assert_equal([c.id for c in gl.Children], [c.id for c in g.Children])
+        assert_equal(getattr(gl.Parent, "id", None),
+                     getattr(g.Parent, "id", None))
+    # Nothing has needed a grid object yet
+    assert_equal(len(dsl.index.grid_store.materialized_grids()), 0)
+    for d in (ds, dsl):
+        d.index.selection_cache.clear()
+    for obj in ("all_data", "sphere", "region"):
+        if obj == "all_data":
+            dobjs = [d.all_data() for d in (ds, dsl)]
+        elif obj == "sphere":
+            dobjs = [d.sphere([0.55, 0.5, 0.55], 0.2) for d in (ds, dsl)]
+        else:
+            dobjs = [d.r[0.3:0.6, 0.4:0.9, 0.45:0.7] for d in (ds, dsl)]
+        for field in ("density", "cell_volume", "x"):
+            assert_array_equal(dobjs[1][field], dobjs[0][field])
+    for ax in range(3):
+        p = [d.proj("density", ax) for d in (ds, dsl)]
+        assert_array_equal(p[1]["density"], p[0]["density"])
+        sl = [d.slice(ax, 0.55) for d in (ds, dsl)]
+        assert_array_equal(sl[1]["density"], sl[0]["density"])
+    cg = [d.covering_grid(2, [0.0, 0.0, 0.0], [64] * 3) for d in (ds, dsl)]
+    assert_array_equal(cg[1]["density"], cg[0]["density"])
+    # Grids are created on demand, and share their data while in use
+    g = dsl.index.grids[3]
+    assert_array_equal(g["density"], ds.index.grids[3]["density"])
+    assert_true(g == dsl.index.grids[3])
+    assert_true(g._get_grid() is dsl.index.grids[3]._get_grid())
+    shutil.rmtree(tmpdir)
@@ -16,9 +16,10 @@ from __future__ import print_function
 #-----------------------------------------------------------------------------
 
 import numpy as np
-import os
 
 from yt.extern.six import string_types
+from yt.utilities.file_handler import \
+    get_mapped_file
 from yt.utilities.io_handler import \
     BaseIOHandler
 from yt.utilities.lib.geometry_utils import \
@@ -266,14 +267,12 @@ class IOHandlerGadgetBinary(BaseIOHandler):
         for data_file in sorted(data_files):
             poff = data_file.field_offsets
             tp = data_file.total_particles
-            f = open(data_file.filename, "rb")
+            f = get_mapped_file(data_file.filename)
             for ptype in ptf:
                 # This is where we could implement sub-chunking
-                f.seek(poff[ptype, "Coordinates"], os.SEEK_SET)
                 pos = self._read_field_from_file(
-                    f, tp[ptype], "Coordinates")
+                    f, poff[ptype, "Coordinates"], tp[ptype], "Coordinates")
                 yield ptype, (pos[:, 0], pos[:, 1], pos[:, 2])
-            f.close()
 
     def _read_particle_fields(self, chunks, ptf, selector):
         data_files = set([])
@@ -283,11 +282,10 @@ class IOHandlerGadgetBinary(BaseIOHandler):
         for data_file in sorted(data_files):
             poff = data_file.field_offsets
             tp = data_file.total_particles
-            f = open(data_file.filename, "rb")
+            f = get_mapped_file(data_file.filename)
             for ptype, field_list in sorted(ptf.items()):
-                f.seek(poff[ptype, "Coordinates"], os.SEEK_SET)
                 pos = self._read_field_from_file(
-                    f, tp[ptype], "Coordinates")
+                    f, poff[ptype, "Coordinates"], tp[ptype], "Coordinates")
                 mask = selector.select_points(
                     pos[:, 0], pos[:, 1], pos[:, 2], 0.0)
                 del pos
@@ -301,13 +299,12 @@ class IOHandlerGadgetBinary(BaseIOHandler):
                         data[:] = m
                         yield (ptype, field), data
                         continue
-                    f.seek(poff[ptype, field], os.SEEK_SET)
-                    data = self._read_field_from_file(f, tp[ptype], field)
+                    data = self._read_field_from_file(
+                        f, poff[ptype, field], tp[ptype], field)
                     data = data[mask, ...]
                     yield (ptype, field), data
-            f.close()
 
-    def _read_field_from_file(self, f, count, name):
+    def _read_field_from_file(self, f, offset, count, name):
         if count == 0:
             return
         if name == "ParticleIDs":
@@ -317,11 +314,13 @@ class IOHandlerGadgetBinary(BaseIOHandler):
         dt = np.dtype(dt)
         if name in self._vector_fields:
             count *= self._vector_fields[name]
-        arr = np.fromfile(f, dtype=dt, count=count)
+        # This is a view of the mapped file, so only the values we go on
+        # to select are ever copied.
+        arr = f.record(offset, dt, count)
         # ensure data are in native endianness to avoid errors
         # when field data are passed to cython
         dt = dt.newbyteorder('N')
-        arr = arr.astype(dt)
+        arr = arr.astype(dt, copy=False)
         if name in self._vector_fields:
             factor = self._vector_fields[name]
             arr = arr.reshape((count // factor, factor), order="C")
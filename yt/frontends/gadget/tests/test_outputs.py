@@ -21,7 +21,10 @@ import shutil
 import tempfile
 
 import yt
-from yt.testing import requires_file
+from yt.config import ytcfg
+from yt.testing import \
+    assert_equal, \
+    requires_file
 from yt.utilities.answer_testing.framework import \
     data_dir_load, \
     requires_ds, \
@@ -120,3 +123,26 @@ def test_bigendian_field_access():
     ds = data_dir_load(BE_Gadget)
     data = ds.all_data()
     data['Halo', 'Velocities']
+
+
+def test_gadget_binary_mmap():
+    curdir = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    fields = [("Halo", "Coordinates"), ("Halo", "ParticleIDs"),
+              ("Gas", "Density"), ("Stars", "Velocities")]
+    for endian, fmt in product('<>', [1, 2]):
+        fake_snap = fake_gadget_binary(endian=endian, fmt=fmt)
+        ds = yt.load(fake_snap)
+        sp = ds.sphere("c", 0.4)
+        mapped = dict((f, sp[f]) for f in fields)
+        ytcfg["yt", "memory_mapped_io"] = "False"
+        try:
+            sp = ds.sphere("c", 0.4)
+            for f in fields:
+                assert_equal(mapped[f], sp[f])
+        finally:
+            ytcfg["yt", "memory_mapped_io"] = "True"
+        os.remove(fake_snap)
+    os.chdir(curdir)
+    shutil.rmtree(tmpdir)
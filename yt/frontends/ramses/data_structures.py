@@ -15,13 +15,16 @@ from __future__ import print_function, absolute_import
 # The full license is in the file COPYING.txt, distributed with this software.
 #-----------------------------------------------------------------------------
 
+import multiprocessing
 import os
 import numpy as np
 import stat
 import weakref
+import zipfile
 from collections import defaultdict
 from glob import glob
 
+from yt.config import ytcfg
 from yt.extern.six import string_types
 from yt.funcs import \
     mylog, \
@@ -44,6 +47,7 @@ from .hilbert import get_cpu_list
 from .particle_handlers import get_particle_handlers
 from .field_handlers import get_field_handlers
 from yt.utilities.cython_fortran_utils import FortranFile as fpu
+from yt.utilities.file_handler import MemoryMappedFileHandler
 from yt.geometry.oct_container import \
     RAMSESOctreeContainer
 from yt.arraytypes import blankRecordArray
@@ -51,35 +55,123 @@ from yt.arraytypes import blankRecordArray
 from yt.utilities.lib.cosmology_time import \
     friedman
 
-from .io_utils import read_amr, fill_hydro
+from .io_utils import add_amr_blocks, read_amr_positions, fill_hydro
+
+def _domain_basename(ds, domain_id):
+    # The file name of every file of a domain, with %s for the file type.
+    num = os.path.basename(ds.parameter_filename).split("."
+            )[0].split("_")[1]
+    if ds.num_groups > 0:
+        igroup = ((domain_id-1) // ds.group_size) + 1
+        return "%s/group_%05i/%%s_%s.out%05i" % (
+            ds.root_folder, igroup, num, domain_id)
+    basedir = os.path.abspath(os.path.dirname(ds.parameter_filename))
+    return "%s/%%s_%s.out%05i" % (basedir, num, domain_id)
+
+def _read_amr_header(f):
+    hvals = {}
+    f.seek(0)
+
+    for header in ramses_header(hvals):
+        hvals.update(f.read_attrs(header))
+    # For speedup, skip reading of 'headl' and 'taill'
+    f.skip(2)
+    hvals['numbl'] = f.read_vector('i')
+
+    # That's the header, now we skip a few.
+    hvals['numbl'] = np.array(hvals['numbl']).reshape(
+        (hvals['nlevelmax'], hvals['ncpu']))
+    f.skip()
+    if hvals['nboundary'] > 0:
+        f.skip(2)
+        ngridbound = f.read_vector('i').astype("int64")
+    else:
+        ngridbound = np.zeros(hvals['nlevelmax'], dtype='int64')
+    free_mem = f.read_attrs((('free_mem', 5, 'i'), ) )  # NOQA
+    ordering = f.read_vector('c')  # NOQA
+    f.skip(4)
+    # Now we're at the tree itself
+    return hvals, ngridbound, f.tell()
+
+def _octree_cache_filename(amr_fn):
+    return "%s.octs.npz" % amr_fn
+
+def _octree_cache_signature(amr_fn, min_level):
+    st = os.stat(amr_fn)
+    return np.array([st.st_size, st.st_mtime, min_level], dtype="float64")
+
+def _load_octree_cache(amr_fn, min_level):
+    cache_fn = _octree_cache_filename(amr_fn)
+    if not os.path.exists(cache_fn):
+        return None
+    try:
+        with np.load(cache_fn) as data:
+            if not np.array_equal(data["signature"],
+                    _octree_cache_signature(amr_fn, min_level)):
+                mylog.debug("Octree cache %s is out of date.", cache_fn)
+                return None
+            return data["pos"], data["blocks"]
+    except (IOError, OSError, ValueError, KeyError,
+            zipfile.BadZipfile) as e:
+        mylog.debug("Could not read octree cache %s: %s", cache_fn, e)
+        return None
+
+def _write_octree_cache(amr_fn, min_level, pos, blocks):
+    cache_fn = _octree_cache_filename(amr_fn)
+    tmp_fn = "%s.%s.tmp" % (cache_fn, os.getpid())
+    try:
+        with open(tmp_fn, "wb") as f:
+            np.savez(f, pos=pos, blocks=blocks,
+                     signature=_octree_cache_signature(amr_fn, min_level))
+        os.rename(tmp_fn, cache_fn)
+    except (IOError, OSError) as e:
+        mylog.debug("Could not write octree cache %s: %s", cache_fn, e)
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+
+def _read_amr_structure(args):
+    """
+    Read the header of an AMR file and the positions of its octs, from the
+    octree cache if there is an up-to-date one.  This only involves the file
+    itself, so that it can be run in a worker process; the positions are
+    inserted into an octree by the domain.
+    """
+    amr_fn, min_level, use_cache = args
+    f = fpu(amr_fn)
+    try:
+        hvals, ngridbound, offset = _read_amr_header(f)
+        octs = None
+        if use_cache:
+            octs = _load_octree_cache(amr_fn, min_level)
+        if octs is None:
+            f.seek(offset)
+            octs = read_amr_positions(f, hvals, ngridbound, min_level)
+            if use_cache:
+                _write_octree_cache(amr_fn, min_level, *octs)
+    finally:
+        f.close()
+    return (hvals, ngridbound, offset) + tuple(octs)
 
 class RAMSESDomainFile(object):
     _last_mask = None
     _last_selector_id = None
 
-    def __init__(self, ds, domain_id):
+    def __init__(self, ds, domain_id, amr_structure=None):
         self.ds = ds
         self.domain_id = domain_id
 
-        num = os.path.basename(ds.parameter_filename).split("."
-                )[0].split("_")[1]
-        rootdir = ds.root_folder
         basedir = os.path.abspath(
             os.path.dirname(ds.parameter_filename))
-        basename = "%s/%%s_%s.out%05i" % (
-            basedir, num, domain_id)
+        basename = _domain_basename(ds, domain_id)
         part_file_descriptor = "%s/part_file_descriptor.txt" % basedir
-        if ds.num_groups > 0:
-            igroup = ((domain_id-1) // ds.group_size) + 1
-            basename = "%s/group_%05i/%%s_%s.out%05i" % (
-                rootdir, igroup, num, domain_id)
-        else:
-            basename = "%s/%%s_%s.out%05i" % (
-                basedir, num, domain_id)
         for t in ['grav', 'amr']:
             setattr(self, "%s_fn" % t, basename % t)
         self._part_file_descriptor = part_file_descriptor
-        self._read_amr_header()
+        if amr_structure is None:
+            amr_structure = _read_amr_structure(
+                (self.amr_fn, ds.min_level,
+                 ytcfg.getboolean("yt", "ramses_octree_cache")))
+        self._set_amr_header(*amr_structure[:3])
 
         # Autodetect field files
         field_handlers = [FH(self)
@@ -102,7 +194,7 @@ class RAMSESDomainFile(object):
             # self._add_ptype(ph.ptype)
 
         # Load the AMR structure
-        self._read_amr()
+        self._read_amr(*amr_structure[3:])
 
     _hydro_offset = None
     _level_count = None
@@ -132,42 +224,18 @@ class RAMSESDomainFile(object):
         f.seek(0)
         return f
 
-    def _read_amr_header(self):
-        hvals = {}
-        f = self.amr_file
-        f.seek(0)
-
-        for header in ramses_header(hvals):
-            hvals.update(f.read_attrs(header))
-        # For speedup, skip reading of 'headl' and 'taill'
-        f.skip(2)
-        hvals['numbl'] = f.read_vector('i')
-
-        # That's the header, now we skip a few.
-        hvals['numbl'] = np.array(hvals['numbl']).reshape(
-            (hvals['nlevelmax'], hvals['ncpu']))
-        f.skip()
-        if hvals['nboundary'] > 0:
-            f.skip(2)
-            self.ngridbound = f.read_vector('i').astype("int64")
-        else:
-            self.ngridbound = np.zeros(hvals['nlevelmax'], dtype='int64')
-        free_mem = f.read_attrs((('free_mem', 5, 'i'), ) )  # NOQA
-        ordering = f.read_vector('c')  # NOQA
-        f.skip(4)
-        # Now we're at the tree itself
-        # Now we iterate over each level and each CPU.
+    def _set_amr_header(self, hvals, ngridbound, amr_offset):
         self.amr_header = hvals
-        self.amr_offset = f.tell()
+        self.ngridbound = ngridbound
+        self.amr_offset = amr_offset
         self.local_oct_count = hvals['numbl'][self.ds.min_level:, self.domain_id - 1].sum()
         self.total_oct_count = hvals['numbl'][self.ds.min_level:,:].sum(axis=0)
 
-    def _read_amr(self):
-        """Open the oct file, read in octs level-by-level.
+    def _read_amr(self, pos, blocks):
+        """Insert the octs of the AMR file, as read by read_amr_positions,
+           into the octree of this domain.
            For each oct, only the position, index, level and domain
            are needed - its position in the octree is found automatically.
-           The most important is finding all the information to feed
-           oct_handler.add
         """
         self.oct_handler = RAMSESOctreeContainer(self.ds.domain_dimensions/2,
                 self.ds.domain_left_edge, self.ds.domain_right_edge)
@@ -176,17 +244,10 @@ class RAMSESDomainFile(object):
         mylog.debug("Reading domain AMR % 4i (%0.3e, %0.3e)",
             self.domain_id, self.total_oct_count.sum(), self.ngridbound.sum())
 
-        f = self.amr_file
-        f.seek(self.amr_offset)
-
-        min_level = self.ds.min_level
-        max_level = read_amr(f, self.amr_header, self.ngridbound, min_level, self.oct_handler)
-
-        self.max_level = max_level
+        self.max_level = add_amr_blocks(self.oct_handler, pos, blocks)
         self.oct_handler.finalize()
-
-        # Close AMR file
-        f.close()
+        if ytcfg.getboolean("yt", "compact_octrees"):
+            self.oct_handler = self.oct_handler.compact()
 
     def included(self, selector):
         if getattr(selector, "domain_id", None) is not None:
@@ -199,29 +260,67 @@ class RAMSESDomainSubset(OctreeSubset):
     _domain_offset = 1
     _block_reorder = "F"
 
-    def fill(self, fd, fields, selector, file_handler):
+    def select_file_cells(self, selector):
+        """
+        Return the number of cells of this domain selected by *selector*,
+        and the level, cell and position in the file of each of them.  The
+        result can be passed to ``fill`` for every file of the domain.
+        """
+        cell_count = selector.count_oct_cells(self.oct_handler, self.domain_id)
+        levels, cell_inds, file_inds = self.oct_handler.file_index_octs(
+            selector, self.domain_id, cell_count)
+        return cell_count, levels, cell_inds, file_inds
+
+    def fill(self, fd, fields, selector, file_handler, selection=None):
         ndim = self.ds.dimensionality
-        # Here we get a copy of the file, which we skip through and read the
-        # bits we want.
         oct_handler = self.oct_handler
         all_fields = [f for ft, f in file_handler.field_list]
         fields = [f for ft, f in fields]
         tr = {}
-        cell_count = selector.count_oct_cells(self.oct_handler, self.domain_id)
-
-        levels, cell_inds, file_inds = self.oct_handler.file_index_octs(
-            selector, self.domain_id, cell_count)
+        if selection is None:
+            selection = self.select_file_cells(selector)
+        cell_count, levels, cell_inds, file_inds = selection
 
         # Initializing data container
         for field in fields:
             tr[field] = np.zeros(cell_count, 'float64')
 
-        fill_hydro(fd, file_handler.offset,
-                   file_handler.level_count, levels, cell_inds,
-                   file_inds, ndim, all_fields, fields, tr,
-                   oct_handler)
+        if isinstance(fd, MemoryMappedFileHandler):
+            self._fill_records(fd, file_handler, levels, cell_inds,
+                               file_inds, all_fields, fields, tr)
+        else:
+            # Here we skip through a copy of the file and read the bits we
+            # want.
+            fill_hydro(fd, file_handler.offset,
+                       file_handler.level_count, levels, cell_inds,
+                       file_inds, ndim, all_fields, fields, tr,
+                       oct_handler)
         return tr
 
+    def _fill_records(self, fd, file_handler, levels, cell_inds, file_inds,
+                      all_fields, fields, tr):
+        # On each level the file holds, for each of the 2**ndim cells of an
+        # oct, one record per field of level_count values.  The file
+        # handler's offset table tells us where the records of each field
+        # are, so we only touch those of the fields we want, and only on
+        # the levels we have selected cells on.
+        offsets = file_handler.record_offsets
+        level_count = file_handler.level_count
+        twotondim, nvar = offsets.shape[1:]
+        ifields = [all_fields.index(field) for field in fields]
+        for ilevel in np.unique(levels):
+            if offsets[ilevel, 0, 0] == -1:
+                continue
+            nc = level_count[ilevel]
+            tmp = {}
+            for field, ifield in zip(fields, ifields):
+                # The records of one field are nvar records apart.
+                tmp[field] = fd.fortran_records(
+                    offsets[ilevel, 0, ifield] - 4, "float64", nc,
+                    twotondim, stride = nvar * (8 * nc + 8)).T
+            self.oct_handler.fill_level(ilevel, levels, cell_inds, file_inds,
+                                        tr, tmp)
+
 class RAMSESIndex(OctreeIndex):
 
     def __init__(self, ds, dataset_type='ramses'):
@@ -241,13 +340,53 @@ class RAMSESIndex(OctreeIndex):
         else:
             cpu_list = range(self.dataset['ncpu'])
 
-        self.domains = [RAMSESDomainFile(self.dataset, i + 1)
-                        for i in cpu_list]
+        self.domains = [RAMSESDomainFile(self.dataset, i + 1, amr_structure=s)
+                        for i, s in zip(cpu_list,
+                                        self._read_amr_structures(cpu_list))]
         total_octs = sum(dom.local_oct_count #+ dom.ngridbound.sum()
                          for dom in self.domains)
         self.max_level = max(dom.max_level for dom in self.domains)
         self.num_grids = total_octs
 
+    _parallel_amr_threshold = 64
+    def _read_amr_structures(self, cpu_list):
+        # Reading the AMR files is independent for every domain, so with
+        # many domains we spread it over a pool of processes.  The oct
+        # positions come back to us, in order, to be inserted into the
+        # octrees.
+        ds = self.dataset
+        use_cache = ytcfg.getboolean("yt", "ramses_octree_cache")
+        args = [(_domain_basename(ds, i + 1) % "amr", ds.min_level, use_cache)
+                for i in cpu_list]
+        nprocs = ytcfg.getint("yt", "ramses_amr_processes")
+        if nprocs == 0:
+            if ytcfg.getboolean("yt", "__parallel") or \
+               len(args) < self._parallel_amr_threshold:
+                nprocs = 1
+            else:
+                nprocs = multiprocessing.cpu_count()
+        nprocs = min(nprocs, len(args))
+        if not hasattr(os, "fork"):
+            nprocs = 1
+        if nprocs <= 1:
+            for a in args:
+                yield _read_amr_structure(a)
+            return
+        mylog.debug("Reading %s AMR files with %s processes",
+                    len(args), nprocs)
+        if hasattr(multiprocessing, "get_context"):
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing
+        pool = context.Pool(nprocs)
+        try:
+            chunksize = max(len(args) // (4 * nprocs), 1)
+            for structure in pool.imap(_read_amr_structure, args, chunksize):
+                yield structure
+        finally:
+            pool.terminate()
+            pool.join()
+
     def _detect_output_fields(self):
         dsl = set([])
 
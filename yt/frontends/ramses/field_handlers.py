@@ -1,4 +1,5 @@
 import os
+import numpy as np
 from yt.utilities.cython_fortran_utils import FortranFile
 import glob
 from yt.extern.six import add_metaclass, PY2
@@ -250,6 +251,33 @@ class FieldFileHandler(object):
         self._level_count = level_count
         return self._offset
 
+    @property
+    def record_offsets(self):
+        '''
+        Return the byte offsets of the data of every record of the
+        domain, as an array of shape (levels, 2**ndim, nvar): record
+        (l, c, f) holds field f of cell c of the octs on level l.
+        Levels without octs have offsets of -1.
+
+        Every record of a level holds the same number of values, so the
+        table follows from the level offsets and is computed once per
+        file, rather than skipping through the records on every read.
+        '''
+        if getattr(self, '_record_offsets', None) is not None:
+            return self._record_offsets
+
+        offset, level_count = self.offset, self.level_count
+        twotondim = 2**self.domain.amr_header['ndim']
+        nvar = self.parameters['nvar']
+        # Each record is the data plus a 4 byte marker on either side
+        record_size = 8 * level_count + 8
+        irec = np.arange(twotondim * nvar).reshape((twotondim, nvar))
+        table = offset[:, None, None] + 4 + \
+            record_size[:, None, None] * irec[None, :, :]
+        table[offset == -1] = -1
+        self._record_offsets = table
+        return table
+
 
 class HydroFieldFileHandler(FieldFileHandler):
     ftype = 'ramses'
@@ -16,11 +16,12 @@ RAMSES-specific IO
 from collections import defaultdict
 import numpy as np
 
+from yt.utilities.file_handler import \
+    get_mapped_file
 from yt.utilities.io_handler import \
     BaseIOHandler
 from yt.utilities.logger import ytLogger as mylog
 from yt.utilities.physical_ratios import cm_per_km, cm_per_mpc
-from yt.utilities.cython_fortran_utils import FortranFile
 from yt.utilities.exceptions import YTFieldTypeNotFound, YTParticleOutputFormatNotImplemented, \
     YTFileNotParseable
 import re
@@ -71,25 +72,25 @@ def _ramses_particle_file_handler(fname, foffsets, data_types,
     '''
     tr = {}
     ds = subset.domain.ds
-    with FortranFile(fname) as fd:
-        # We do *all* conversion into boxlen here.
-        # This means that no other conversions need to be applied to convert
-        # positions into the same domain as the octs themselves.
-        for field in sorted(fields, key=lambda a: foffsets[a]):
-            if count == 0:
-                tr[field] = np.empty(0, dtype=data_types[field])
-                continue
-            fd.seek(foffsets[field])
-            dt = data_types[field]
-            tr[field] = fd.read_vector(dt)
-            if field[1].startswith("particle_position"):
-                np.divide(tr[field], ds["boxlen"], tr[field])
-            if ds.cosmological_simulation and field[1] == "particle_birth_time":
-                conformal_age = tr[field]
-                tr[field] = convert_ramses_ages(ds, conformal_age)
-                # arbitrarily set particles with zero conformal_age to zero
-                # particle_age. This corresponds to DM particles.
-                tr[field][conformal_age == 0] = 0
+    fd = get_mapped_file(fname)
+    # We do *all* conversion into boxlen here.
+    # This means that no other conversions need to be applied to convert
+    # positions into the same domain as the octs themselves.
+    for field in sorted(fields, key=lambda a: foffsets[a]):
+        if count == 0:
+            tr[field] = np.empty(0, dtype=data_types[field])
+            continue
+        # This is a read-only view of the mapped file, so anything we
+        # modify has to be copied first.
+        tr[field] = fd.fortran_record(foffsets[field], data_types[field])[0]
+        if field[1].startswith("particle_position"):
+            tr[field] = tr[field] / ds["boxlen"]
+        if ds.cosmological_simulation and field[1] == "particle_birth_time":
+            conformal_age = tr[field]
+            tr[field] = convert_ramses_ages(ds, conformal_age)
+            # arbitrarily set particles with zero conformal_age to zero
+            # particle_age. This corresponds to DM particles.
+            tr[field][conformal_age == 0] = 0
     return tr
 
 
@@ -99,33 +100,34 @@ class IOHandlerRAMSES(BaseIOHandler):
     def _read_fluid_selection(self, chunks, selector, fields, size):
         tr = defaultdict(list)
 
-        # Set of field types
-        ftypes = set(f[0] for f in fields)
+        # Gather fields by type to minimize i/o operations
+        ftypes = []
+        for ft, f in fields:
+            if ft not in ftypes:
+                ftypes.append(ft)
+        field_subs = dict((ft, [f for f in fields if f[0] == ft])
+                          for ft in ftypes)
         for chunk in chunks:
-            # Gather fields by type to minimize i/o operations
-            for ft in ftypes:
-                # Get all the fields of the same type
-                field_subs = list(
-                    filter(lambda f: f[0]==ft, fields))
-
-                # Loop over subsets
-                for subset in chunk.objs:
-                    fname = None
-                    for fh in subset.domain.field_handlers:
-                        if fh.ftype == ft:
-                            file_handler = fh
-                            fname = fh.fname
-                            break
-
-                    if fname is None:
+            # Loop over subsets
+            for subset in chunk.objs:
+                handlers = dict((fh.ftype, fh)
+                                for fh in subset.domain.field_handlers)
+                # The selected cells are the same for every file of the
+                # domain, so we only find them once.
+                selection = None
+                for ft in ftypes:
+                    if ft not in handlers:
                         raise YTFieldTypeNotFound(ft)
-
-                    # Now we read the entire thing
-                    with FortranFile(fname) as fd:
-                        # This contains the boundary information, so we skim through
-                        # and pick off the right vectors
-                        rv = subset.fill(fd, field_subs, selector, file_handler)
-                    for ft, f in field_subs:
+                    file_handler = handlers[ft]
+                    if selection is None:
+                        selection = subset.select_file_cells(selector)
+                    # The file handler knows where every record of the
+                    # file is, so we go straight to the ones we want, in
+                    # place if the file can be mapped.
+                    fd = get_mapped_file(file_handler.fname)
+                    rv = subset.fill(fd, field_subs[ft], selector,
+                                     file_handler, selection)
+                    for ft, f in field_subs[ft]:
                         d = rv.pop(f)
                         mylog.debug("Filling %s with %s (%0.3e %0.3e) (%s zones)",
                             f, d.size, d.min(), d.max(), d.size)
@@ -17,12 +17,33 @@ def read_amr(FortranFile f, dict headers,
              np.ndarray[np.int64_t, ndim=1] ngridbound, INT64_t min_level,
              RAMSESOctreeContainer oct_handler):
 
-    cdef INT64_t ncpu, nboundary, max_level, nlevelmax, ncpu_and_bound
+    pos, blocks = read_amr_positions(f, headers, ngridbound, min_level)
+    return add_amr_blocks(oct_handler, pos, blocks)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+@cython.nonecheck(False)
+def read_amr_positions(FortranFile f, dict headers,
+                       np.ndarray[np.int64_t, ndim=1] ngridbound,
+                       INT64_t min_level):
+    """Read the positions of the octs in an AMR file, without inserting them
+    into an octree.
+
+    Returns the positions, as an (N, 3) array, and an (M, 3) array of the
+    blocks they were stored in, each row giving the cpu (one-indexed), the
+    level (relative to *min_level*) and the number of octs of the block.
+    The two can be handed to ``add_amr_blocks``, possibly in another
+    process.
+    """
+
+    cdef INT64_t ncpu, nboundary, nlevelmax, ncpu_and_bound
     cdef DOUBLE_t nx, ny, nz
-    cdef INT64_t ilevel, icpu, n, ndim, skip_len
-    cdef INT32_t ng, buffer_size
+    cdef INT64_t ilevel, icpu, ndim, skip_len, noct, nblock, ib
+    cdef INT32_t ng
     cdef np.ndarray[np.int32_t, ndim=2] numbl
     cdef np.ndarray[np.float64_t, ndim=2] pos
+    cdef np.ndarray[np.int64_t, ndim=2] blocks
 
     ndim = headers['ndim']
     numbl = headers['numbl']
@@ -33,8 +54,19 @@ def read_amr(FortranFile f, dict headers,
 
     ncpu_and_bound = nboundary + ncpu
 
-    pos = np.empty((0, 3), dtype=np.float64)
-    buffer_size = 0
+    # Count the octs we will keep, so that we only allocate once.
+    noct = nblock = 0
+    for ilevel in range(min_level, nlevelmax):
+        for icpu in range(ncpu_and_bound):
+            if icpu < ncpu:
+                ng = numbl[ilevel, icpu]
+            else:
+                ng = ngridbound[icpu - ncpu + nboundary*ilevel]
+            if ng > 0:
+                noct += ng
+                nblock += 1
+    pos = np.empty((noct, 3), dtype="d")
+    blocks = np.empty((nblock, 3), dtype="int64")
     # Compute number of fields to skip. This should be 31 in 3 dimensions
     skip_len = (1          # father index
                 + 2*ndim   # neighbor index
@@ -42,8 +74,7 @@ def read_amr(FortranFile f, dict headers,
                 + 2**ndim  # cpu map
                 + 2**ndim  # refinement map
     )
-    # Initialize values
-    max_level = 0
+    noct = ib = 0
     for ilevel in range(nlevelmax):
         for icpu in range(ncpu_and_bound):
             if icpu < ncpu:
@@ -57,23 +88,44 @@ def read_amr(FortranFile f, dict headers,
             # to build the linked list in RAMSES)
             f.skip(3)
 
-            # Allocate more memory if required
-            if ng > buffer_size:
-                pos = np.empty((ng, 3), dtype="d")
-                buffer_size = ng
+            if ilevel < min_level:
+                f.skip(3 + skip_len)
+                continue
 
-            pos[:ng, 0] = f.read_vector("d") - nx
-            pos[:ng, 1] = f.read_vector("d") - ny
-            pos[:ng, 2] = f.read_vector("d") - nz
+            pos[noct:noct + ng, 0] = f.read_vector("d") - nx
+            pos[noct:noct + ng, 1] = f.read_vector("d") - ny
+            pos[noct:noct + ng, 2] = f.read_vector("d") - nz
+            blocks[ib, 0] = icpu + 1
+            blocks[ib, 1] = ilevel - min_level
+            blocks[ib, 2] = ng
+            noct += ng
+            ib += 1
 
             # Skip father, neighbor, son, cpu map and refinement map
             f.skip(skip_len)
-            # Note that we're adding *grids*, not individual cells.
-            if ilevel >= min_level:
-                n = oct_handler.add(icpu + 1, ilevel - min_level, pos[:ng, :],
-                                    count_boundary = 1)
-                if n > 0:
-                    max_level = max(ilevel - min_level, max_level)
+
+    return pos, blocks
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+@cython.nonecheck(False)
+def add_amr_blocks(RAMSESOctreeContainer oct_handler,
+                   np.ndarray[np.float64_t, ndim=2] pos,
+                   np.ndarray[np.int64_t, ndim=2] blocks):
+    """Insert the octs returned by ``read_amr_positions`` into *oct_handler*,
+    returning the deepest level at which octs were added."""
+
+    cdef INT64_t ib, start, n, max_level
+    # Note that we're adding *grids*, not individual cells.
+    max_level = start = 0
+    for ib in range(blocks.shape[0]):
+        n = oct_handler.add(blocks[ib, 0], blocks[ib, 1],
+                            pos[start:start + blocks[ib, 2], :],
+                            count_boundary = 1)
+        if n > 0:
+            max_level = max(blocks[ib, 1], max_level)
+        start += blocks[ib, 2]
 
     return max_level
 
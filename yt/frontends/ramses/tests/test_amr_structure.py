@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from yt.config import ytcfg
+from yt.frontends.ramses.data_structures import \
+    RAMSESIndex, \
+    _octree_cache_filename, \
+    _read_amr_structure
+from yt.frontends.ramses.io_utils import add_amr_blocks
+from yt.geometry.oct_container import RAMSESOctreeContainer
+from yt.testing import \
+    assert_equal, \
+    assert_true
+
+_nlevelmax = 3
+
+def _write_records(fp, records):
+    for rec in records:
+        size = np.array(rec.nbytes, dtype="i4")
+        fp.write(size.tobytes())
+        fp.write(rec.tobytes())
+        fp.write(size.tobytes())
+
+def _i4(*v):
+    return np.array(v, dtype="i4")
+
+def _f8(*v):
+    return np.array(v, dtype="f8")
+
+def _write_amr(fn, ncpu, octs):
+    # octs maps (level, cpu) to the positions of the octs of that block
+    numbl = np.zeros((_nlevelmax, ncpu), dtype="i4")
+    for (level, cpu), pos in octs.items():
+        numbl[level, cpu] = len(pos)
+    zeros = [0.0] * _nlevelmax
+    records = [_i4(ncpu), _i4(3), _i4(1, 1, 1), _i4(_nlevelmax), _i4(100),
+               _i4(0), _i4(numbl.sum()), _f8(1.0), _i4(1, 1, 1),
+               _f8(0.0), _f8(0.0), _f8(0.0), _f8(*zeros), _f8(*zeros),
+               _i4(0, 0), _f8(0, 0, 0), _f8(*[0.0] * 7), _f8(*[0.0] * 5),
+               _f8(0.0), _i4(0), _i4(0), numbl.ravel(), _i4(0),
+               _i4(0, 0, 0, 0, 0),
+               np.frombuffer(b"hilbert".ljust(128), "S1"),
+               _i4(0), _i4(0), _i4(0), _i4(0)]
+    for level in range(_nlevelmax):
+        for cpu in range(ncpu):
+            pos = octs.get((level, cpu))
+            if pos is None:
+                continue
+            n = len(pos)
+            records += [np.arange(n, dtype="i4")] * 3
+            records += [np.ascontiguousarray(pos[:, i]) for i in range(3)]
+            records += [np.zeros(n, dtype="i4")] * 31
+    with open(fn, "wb") as fp:
+        _write_records(fp, records)
+
+def _octs():
+    c = np.array([0.25, 0.75])
+    level1 = np.array([[x, y, z] for x in c for y in c for z in c])
+    level2 = 0.125 + 0.25 * np.array([[0, 0, 0], [1, 0, 0]])
+    return {(0, 0): np.array([[0.5, 0.5, 0.5]]),
+            (1, 0): level1[:5], (1, 1): level1[5:],
+            (2, 0): level2}
+
+def test_read_amr_structure():
+    tmpdir = tempfile.mkdtemp()
+    fn = os.path.join(tmpdir, "amr_00001.out00001")
+    octs = _octs()
+    _write_amr(fn, 2, octs)
+    hvals, ngridbound, offset, pos, blocks = \
+        _read_amr_structure((fn, 0, False))
+    assert_equal(hvals["numbl"], [[1, 0], [5, 3], [2, 0]])
+    assert_equal(ngridbound, 0)
+    assert_equal(blocks, [[1, 0, 1], [1, 1, 5], [2, 1, 3], [1, 2, 2]])
+    assert_equal(pos, np.concatenate([octs[0, 0], octs[1, 0], octs[1, 1],
+                                      octs[2, 0]]))
+    oct_handler = RAMSESOctreeContainer(np.ones(3, dtype="int64"),
+                                        np.zeros(3), np.ones(3))
+    oct_handler.allocate_domains(hvals["numbl"].sum(axis=0), 1)
+    assert_equal(add_amr_blocks(oct_handler, pos, blocks), 2)
+    assert_equal(oct_handler.nocts, 11)
+    # Levels below min_level are skipped
+    pos1, blocks1 = _read_amr_structure((fn, 1, False))[3:]
+    assert_equal(pos1, pos[1:])
+    assert_equal(blocks1, [[1, 0, 5], [2, 0, 3], [1, 1, 2]])
+    # The cache is written, reused, and invalidated by changes to the file
+    cache_fn = _octree_cache_filename(fn)
+    assert_true(not os.path.exists(cache_fn))
+    _read_amr_structure((fn, 0, True))
+    assert_true(os.path.exists(cache_fn))
+    mtime = os.stat(cache_fn).st_mtime
+    cached = _read_amr_structure((fn, 0, True))
+    assert_equal(cached[3], pos)
+    assert_equal(cached[4], blocks)
+    assert_equal(os.stat(cache_fn).st_mtime, mtime)
+    _write_amr(fn, 2, dict((k, v) for k, v in octs.items() if k[0] < 2))
+    os.utime(fn, (mtime + 10, mtime + 10))
+    assert_equal(_read_amr_structure((fn, 0, True))[4][:, 2], [1, 5, 3])
+    shutil.rmtree(tmpdir)
+
+def test_parallel_amr_structures():
+    class FakeDataset(object):
+        num_groups = 0
+        min_level = 0
+    class FakeIndex(object):
+        _parallel_amr_threshold = 64
+    tmpdir = tempfile.mkdtemp()
+    ds = FakeDataset()
+    ds.parameter_filename = os.path.join(tmpdir, "info_00001.txt")
+    octs = _octs()
+    for i in range(4):
+        _write_amr(os.path.join(tmpdir, "amr_00001.out%05i" % (i + 1)), 2,
+                   dict((k, v + 0.01 * i) for k, v in octs.items()))
+    index = FakeIndex()
+    index.dataset = ds
+    old = ytcfg.get("yt", "ramses_amr_processes")
+    results = []
+    try:
+        for nprocs in ("1", "2"):
+            ytcfg["yt", "ramses_amr_processes"] = nprocs
+            results.append(list(RAMSESIndex._read_amr_structures(
+                index, [3, 0, 2])))
+    finally:
+        ytcfg["yt", "ramses_amr_processes"] = old
+    for serial, parallel in zip(*results):
+        assert_equal(parallel[3], serial[3])
+        assert_equal(parallel[4], serial[4])
+    assert_equal([r[3][0, 0] for r in results[1]], [0.53, 0.5, 0.52])
+    shutil.rmtree(tmpdir)
@@ -20,6 +20,8 @@ import numpy as np
 from numpy.lib.recfunctions import append_fields
 import os
 
+from yt.utilities.file_handler import \
+    get_mapped_file
 from yt.utilities.io_handler import \
     BaseIOHandler
 from yt.utilities.lib.geometry_utils import \
@@ -108,14 +110,15 @@ class IOHandlerTipsyBinary(BaseIOHandler):
         for data_file in sorted(data_files):
             poff = data_file.field_offsets
             tp = data_file.total_particles
-            f = open(data_file.filename, "rb")
+            f = get_mapped_file(data_file.filename)
             for ptype, field_list in sorted(ptf.items(),
                                             key=lambda a: poff[a[0]]):
-                f.seek(poff[ptype], os.SEEK_SET)
                 total = 0
+                itemsize = self._pdtypes[ptype].itemsize
                 while total < tp[ptype]:
                     count = min(self._chunksize, tp[ptype] - total)
-                    p = np.fromfile(f, self._pdtypes[ptype], count=count)
+                    p = f.record(poff[ptype] + total * itemsize,
+                                 self._pdtypes[ptype], count)
                     total += p.size
                     d = [p["Coordinates"][ax].astype("float64")
                          for ax in 'xyz']
@@ -133,7 +136,7 @@ class IOHandlerTipsyBinary(BaseIOHandler):
             aux_fields_offsets = \
                 self._calculate_particle_offsets_aux(data_file)
             tp = data_file.total_particles
-            f = open(data_file.filename, "rb")
+            f = get_mapped_file(data_file.filename)
 
             # we need to open all aux files for chunking to work
             aux_fh = {}
@@ -142,16 +145,19 @@ class IOHandlerTipsyBinary(BaseIOHandler):
 
             for ptype, field_list in sorted(ptf.items(),
                                             key=lambda a: poff[a[0]]):
-                f.seek(poff[ptype], os.SEEK_SET)
                 afields = list(set(field_list).intersection(self._aux_fields))
                 for afield in afields:
                     aux_fh[afield].seek(
                         aux_fields_offsets[afield][ptype][0], os.SEEK_SET)
 
                 total = 0
+                itemsize = self._pdtypes[ptype].itemsize
                 while total < tp[ptype]:
                     count = min(self._chunksize, tp[ptype] - total)
-                    p = np.fromfile(f, self._pdtypes[ptype], count=count)
+                    # The particles are a view of the mapped file; only the
+                    # selected ones are copied, by _fill_fields.
+                    p = f.record(poff[ptype] + total * itemsize,
+                                 self._pdtypes[ptype], count)
 
                     auxdata = []
                     for afield in afields:
@@ -189,7 +195,6 @@ class IOHandlerTipsyBinary(BaseIOHandler):
                         yield (ptype, field), tf.pop(field)
 
             # close all file handles
-            f.close()
             for fh in list(aux_fh.values()):
                 fh.close()
 
@@ -38,6 +38,7 @@ from .fields import \
     YTGridFieldInfo
 
 from .utilities import \
-    save_as_dataset
+    save_as_dataset, \
+    StreamingDatasetWriter
 
 from . import tests
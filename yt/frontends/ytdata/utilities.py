@@ -89,6 +89,143 @@ def save_as_dataset(ds, filename, data, field_types=None,
 
     mylog.info("Saving field data to yt dataset: %s." % filename)
 
+    fh = h5py.File(filename, "w")
+    _write_dataset_attrs(fh, ds, extra_attrs)
+
+    for field in data:
+        if field_types is None:
+            field_type = "data"
+        else:
+            field_type = field_types[field]
+        if field_type not in fh:
+            fh.create_group(field_type)
+
+        if isinstance(field, tuple):
+            field_name = field[1]
+        else:
+            field_name = field
+
+        # for python3
+        if data[field].dtype.kind == 'U':
+            data[field] = data[field].astype('|S')
+
+        _yt_array_hdf5(fh[field_type], field_name, data[field])
+        if "num_elements" not in fh[field_type].attrs:
+            fh[field_type].attrs["num_elements"] = data[field].size
+    fh.close()
+
+class StreamingDatasetWriter(object):
+    r"""Write field arrays to a reloadable yt dataset a piece at a time.
+
+    This writes the same files as
+    :func:`~yt.frontends.ytdata.utilities.save_as_dataset`, but the fields
+    are extendable, chunked and compressed hdf5 datasets to which each call
+    to ``append`` adds the next piece of every field, so that the fields
+    never have to be held in memory all at once.  The units of each field
+    are those of its first piece.
+
+    Parameters
+    ----------
+    ds : dataset or dict
+        The dataset associated with the fields or a dictionary of
+        parameters.
+    filename : str
+        The name of the file to be written.
+    field_types: dict, optional
+        A dictionary denoting the group name to which each field is to
+        be saved.  If not given, "data" will be used.
+    extra_attrs: dict, optional
+        A dictionary of additional attributes to be saved.  More can be
+        added with ``add_attrs`` before the file is closed.
+    chunk_size : int, optional
+        The number of elements in each hdf5 chunk.
+        Default: 32768.
+    compression : str, optional
+        The hdf5 compression filter applied to the fields.
+        Default: "gzip".
+
+    Examples
+    --------
+
+    >>> writer = StreamingDatasetWriter(ds, "pieces.h5")
+    >>> for piece in pieces:
+    ...     writer.append({"density": piece["density"]})
+    >>> writer.close()
+    >>> new_ds = yt.load("pieces.h5")
+
+    """
+    def __init__(self, ds, filename, field_types=None, extra_attrs=None,
+                 chunk_size=32768, compression="gzip"):
+        mylog.info("Streaming field data to yt dataset: %s." % filename)
+        self.filename = filename
+        self.field_types = field_types
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.num_elements = {}
+        self.fh = h5py.File(filename, "w")
+        _write_dataset_attrs(self.fh, ds, extra_attrs)
+
+    def append(self, data):
+        r"""Append a dictionary of field arrays to the fields in the file."""
+        for field in data:
+            if self.field_types is None:
+                field_type = "data"
+            else:
+                field_type = self.field_types[field]
+            if field_type not in self.fh:
+                self.fh.create_group(field_type)
+            group = self.fh[field_type]
+
+            if isinstance(field, tuple):
+                field_name = field[1]
+            else:
+                field_name = field
+
+            val = data[field]
+            if val.dtype.kind == 'U':
+                val = val.astype('|S')
+
+            if field_name not in group:
+                dataset = group.create_dataset(
+                    str(field_name), shape=(0,) + val.shape[1:],
+                    maxshape=(None,) + val.shape[1:], dtype=val.dtype,
+                    chunks=(self.chunk_size,) + val.shape[1:],
+                    compression=self.compression)
+                units = ""
+                if isinstance(val, YTArray):
+                    units = str(val.units)
+                dataset.attrs["units"] = units
+            dataset = group[field_name]
+            if isinstance(val, YTArray) and \
+              str(val.units) != dataset.attrs["units"]:
+                val = val.in_units(dataset.attrs["units"])
+            start = dataset.shape[0]
+            dataset.resize((start + val.shape[0],) + val.shape[1:])
+            dataset[start:] = val
+            self.num_elements[field_type] = \
+              max(self.num_elements.get(field_type, 0), dataset.shape[0])
+
+    def add_attrs(self, attrs):
+        r"""Save a dictionary of additional attributes."""
+        for attr, val in attrs.items():
+            _yt_array_hdf5_attr(self.fh, attr, val)
+
+    def close(self):
+        r"""Record the sizes of the fields and close the file."""
+        if self.fh is None:
+            return
+        for field_type, num_elements in self.num_elements.items():
+            self.fh[field_type].attrs["num_elements"] = num_elements
+        self.fh.close()
+        self.fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _write_dataset_attrs(fh, ds, extra_attrs):
     if extra_attrs is None: extra_attrs = {}
     base_attrs  = ["dimensionality",
                    "domain_left_edge", "domain_right_edge",
@@ -99,7 +236,6 @@ def save_as_dataset(ds, filename, data, field_types=None,
                    "length_unit", "mass_unit", "time_unit",
                    "velocity_unit", "magnetic_unit"]
 
-    fh = h5py.File(filename, "w")
     if ds is None: ds = {}
 
     if hasattr(ds, "parameters") and isinstance(ds.parameters, dict):
@@ -129,28 +265,6 @@ def save_as_dataset(ds, filename, data, field_types=None,
     if "data_type" not in extra_attrs:
         fh.attrs["data_type"] = "yt_array_data"
 
-    for field in data:
-        if field_types is None:
-            field_type = "data"
-        else:
-            field_type = field_types[field]
-        if field_type not in fh:
-            fh.create_group(field_type)
-
-        if isinstance(field, tuple):
-            field_name = field[1]
-        else:
-            field_name = field
-
-        # for python3
-        if data[field].dtype.kind == 'U':
-            data[field] = data[field].astype('|S')
-
-        _yt_array_hdf5(fh[field_type], field_name, data[field])
-        if "num_elements" not in fh[field_type].attrs:
-            fh[field_type].attrs["num_elements"] = data[field].size
-    fh.close()
-
 def _hdf5_yt_array(fh, field, ds=None):
     r"""Load an hdf5 dataset as a YTArray.
 
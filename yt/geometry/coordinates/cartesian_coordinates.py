@@ -21,12 +21,14 @@ from .coordinate_handler import \
     _get_vert_fields, \
     cartesian_to_cylindrical, \
     cylindrical_to_cartesian
+from yt.config import ytcfg
 from yt.funcs import mylog
 from yt.units.yt_array import uvstack, YTArray
 from yt.utilities.lib.pixelization_routines import \
     pixelize_element_mesh, pixelize_off_axis_cartesian, \
     pixelize_cartesian, pixelize_cartesian_nodal, \
-    pixelize_element_mesh_line
+    pixelize_element_mesh_line, pixelize_sph_kernel_projection, \
+    pixelize_sph_kernel_slice
 from yt.data_objects.unstructured_mesh import SemiStructuredMesh
 from yt.utilities.nodal_data_utils import get_nodal_data
 
@@ -222,6 +224,10 @@ class CartesianCoordinateHandler(CoordinateHandler):
 
         buff = np.zeros((size[1], size[0]), dtype="f8")
 
+        if self._sph_field_source(data_source, field) is not None:
+            return self._sph_pixelize(data_source, field, bounds, buff, dim,
+                                      periodic)
+
         finfo = self.ds._get_field_info(field)
         nodal_flag = finfo.nodal_flag
         if np.any(nodal_flag):
@@ -240,6 +246,129 @@ class CartesianCoordinateHandler(CoordinateHandler):
                                period, int(periodic))
         return buff
 
+    def _sph_field_source(self, data_source, field):
+        """
+        Returns the particle type, particle field and smoothing length field
+        an SPH field is smoothed from, if slices or projections of it can be
+        pixelized directly from the particles, and None otherwise.
+        """
+        if not ytcfg.getboolean("yt", "sph_direct_pixelization"):
+            return None
+        if not hasattr(self.ds, "kernel_name"):
+            return None
+        if data_source._type_name == "proj":
+            if data_source.method != "integrate" or data_source._sum_only:
+                return None
+        elif data_source._type_name != "slice":
+            return None
+        sources = self.ds.field_info.smoothed_field_sources
+        source = sources.get(data_source._determine_fields(field)[0])
+        if source is None or data_source._type_name == "slice":
+            return source
+        # Weights must be smoothed from the same particles
+        weight = data_source.weight_field
+        if weight is not None and \
+           sources.get(weight, (None,))[0] != source[0]:
+            return None
+        return source
+
+    def _sph_pixelize(self, data_source, field, bounds, buff, dim, periodic):
+        # SPH fields are pixelized straight from the particles with the kernel
+        # of the dataset, rather than from the cells of their octree.
+        field = data_source._determine_fields(field)[0]
+        ptype, fname, sml_name = self._sph_field_source(data_source, field)
+        xax = self.x_axis[dim]
+        yax = self.y_axis[dim]
+        bounds = np.array(bounds, dtype="float64")
+        center = 0.5 * (bounds[0::2] + bounds[1::2])
+        half_width = 0.5 * (bounds[1::2] - bounds[0::2])
+        is_proj = data_source._type_name == "proj"
+        if is_proj:
+            source = data_source.data_source
+        else:
+            source = data_source._data_source or self.ds.all_data()
+
+        def _position(ax):
+            pos = source[ptype, "particle_position_%s" % self.axis_name[ax]]
+            return pos.in_units("code_length").d
+
+        pos = [_position(xax), _position(yax)]
+        hsml = source[ptype, sml_name].in_units("code_length").d
+        # The particles are moved to their periodic images closest to the
+        # center of the image, and drawn there and, as pixelize_cartesian
+        # does for cells, at the images one period away on either side, so
+        # that kernels reaching across the domain boundary are drawn on
+        # both sides of it.
+        shifts = []
+        for i, ax in enumerate((xax, yax)):
+            if periodic and self.ds.periodicity[ax]:
+                period = self.ds.domain_width[ax].in_units("code_length").d
+                pos[i] -= period * np.round((pos[i] - center[i]) / period)
+                shifts.append((0.0, -period, period))
+            else:
+                shifts.append((0.0,))
+        near = np.ones(hsml.size, dtype="bool")
+        if not is_proj:
+            coord = data_source.coord
+            if hasattr(coord, "in_units"):
+                coord = coord.in_units("code_length").d
+            pdz = _position(dim) - coord
+            if periodic and self.ds.periodicity[dim]:
+                period = self.ds.domain_width[dim].in_units("code_length").d
+                pdz -= period * np.round(pdz / period)
+            near &= np.abs(pdz) < hsml
+        # Only the images whose kernels overlap the image are pixelized.
+        mask, px, py = [], [], []
+        for sx in shifts[0]:
+            for sy in shifts[1]:
+                x = pos[0] + sx
+                y = pos[1] + sy
+                ind = np.where(
+                    near &
+                    (np.abs(x - center[0]) <= half_width[0] + hsml) &
+                    (np.abs(y - center[1]) <= half_width[1] + hsml))[0]
+                mask.append(ind)
+                px.append(x[ind])
+                py.append(y[ind])
+        mask = np.concatenate(mask)
+        px = np.concatenate(px)
+        py = np.concatenate(py)
+        hsml = hsml[mask]
+        if not is_proj:
+            pdz = pdz[mask]
+        # The pixelizers only need the volume of each particle, m / rho, so
+        # it is passed as the mass, with unit densities.
+        pvol = source[ptype, "particle_mass"][mask] / \
+            source[ptype, "density"][mask]
+        pvol = pvol.in_units("code_length**3").d
+        ones = np.ones(pvol.size, dtype="float64")
+        quantity = source[ptype, fname][mask]
+        units = self.ds._get_field_info(*field).units
+        if units is not None:
+            quantity.convert_to_units(units)
+        kernel_name = self.ds.kernel_name
+        if not is_proj:
+            pixelize_sph_kernel_slice(buff, px, py, pdz, hsml, pvol, ones,
+                                      quantity.d, bounds, kernel_name)
+            return YTArray(buff, quantity.units)
+        if data_source.weight_field is None:
+            pixelize_sph_kernel_projection(buff, px, py, hsml, pvol, ones,
+                                           quantity.d, bounds, kernel_name)
+            path_length = self.ds.quan(1.0, "code_length").in_units(
+                self.ds.unit_system["length"])
+            return YTArray(buff, quantity.units) * path_length
+        wtype, wname, _ = self._sph_field_source(data_source,
+                                                 data_source.weight_field)
+        weight = source[wtype, wname][mask].d
+        pixelize_sph_kernel_projection(buff, px, py, hsml, pvol, ones,
+                                       quantity.d * weight, bounds,
+                                       kernel_name)
+        weight_buff = np.zeros_like(buff)
+        pixelize_sph_kernel_projection(weight_buff, px, py, hsml, pvol, ones,
+                                       weight, bounds, kernel_name)
+        np.divide(buff, weight_buff, out=buff, where=weight_buff > 0)
+        return YTArray(buff, quantity.units)
+
     def _oblique_pixelize(self, data_source, field, bounds, size, antialias):
         indices = np.argsort(data_source['pdx'])[::-1].astype(np.int_)
         buff = np.zeros((size[1], size[0]), dtype="f8")
@@ -89,6 +89,11 @@ class CoordinateHandler(object):
     def pixelize_line(self, field, start_point, end_point, npoints):
         raise NotImplementedError
 
+    def _sph_field_source(self, data_source, field):
+        # This should return the particle fields an SPH field can be
+        # pixelized from directly, if it can be
+        return None
+
     def distance(self, start, end):
         p1 = self.convert_to_cartesian(start)
         p2 = self.convert_to_cartesian(end)
@@ -22,6 +22,7 @@ import numpy as np
 
 from yt.config import ytcfg
 from yt.funcs import iterable
+from yt.geometry.selection_cache import SelectionMaskCache
 from yt.units.yt_array import \
     YTArray, uconcatenate
 from yt.utilities.io_handler import io_registry
@@ -57,6 +58,19 @@ class Index(ParallelAnalysisInterface):
         mylog.debug("Detecting fields.")
         self._detect_output_fields()
 
+    _selection_cache = None
+
+    @property
+    def selection_cache(self):
+        """
+        Selection masks and counts shared by all data objects on this index,
+        so that repeated or identical selections skip recomputing them.
+        """
+        if self._selection_cache is None:
+            self._selection_cache = SelectionMaskCache(
+                ytcfg.getint("yt", "selection_cache_size") * 1024**2)
+        return self._selection_cache
+
     def _initialize_state_variables(self):
         self._parallel_locking = False
         self._data_file = None
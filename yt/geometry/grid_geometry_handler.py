@@ -19,6 +19,7 @@ import numpy as np
 import weakref
 
 from collections import defaultdict
+from contextlib import contextmanager
 
 from yt.arraytypes import blankRecordArray
 from yt.config import ytcfg
@@ -30,6 +31,8 @@ from yt.utilities.definitions import MAXLEVEL
 from yt.utilities.logger import ytLogger as mylog
 from .grid_container import \
     GridTree, MatchPointsToGrids
+from .grid_store import \
+    GridProxyArray
 
 
 class GridIndex(Index):
@@ -39,6 +42,13 @@ class GridIndex(Index):
     _index_properties = ("grid_left_edge", "grid_right_edge",
                          "grid_levels", "grid_particle_count",
                          "grid_dimensions")
+    # Frontends that can describe their grids entirely with arrays set this
+    # to a GridStore in _parse_index, in which case grid objects are only
+    # created when they are needed.
+    grid_store = None
+    # Set by cached_grid_data to a dictionary of the fields read from each
+    # grid, keyed by grid id and field.
+    _grid_data_cache = None
 
     def _setup_geometry(self):
         mylog.debug("Counting grids.")
@@ -50,8 +60,14 @@ class GridIndex(Index):
         mylog.debug("Parsing index.")
         self._parse_index()
 
-        mylog.debug("Constructing grid objects.")
-        self._populate_grid_objects()
+        if self.grid_store is not None:
+            mylog.debug("Setting up grid store.")
+            self.grid_store.setup()
+            self.grids = GridProxyArray(self.grid_store)
+            self.max_level = self.grid_levels.max()
+        else:
+            mylog.debug("Constructing grid objects.")
+            self._populate_grid_objects()
 
         mylog.debug("Re-examining index")
         self._initialize_level_stats()
@@ -110,7 +126,11 @@ class GridIndex(Index):
         This routine clears all the data currently being held onto by the grids
         and the data io handler.
         """
-        for g in self.grids: g.clear_data()
+        if self.grid_store is not None:
+            grids = self.grid_store.materialized_grids()
+        else:
+            grids = self.grids
+        for g in grids: g.clear_data()
         self.io.queue.clear()
 
     def get_smallest_dx(self):
@@ -161,6 +181,14 @@ class GridIndex(Index):
         and the like.
         """
         mylog.info("Locking grids to parents.")
+        store = self.grid_store
+        if store is not None:
+            dds = store.dds.d
+            LE = self.ds.domain_left_edge.d + dds * store.start_index
+            self.grid_left_edge[:] = self.ds.arr(LE, "code_length")
+            self.grid_right_edge[:] = self.ds.arr(
+                LE + self.grid_dimensions * dds, "code_length")
+            return
         for i, g in enumerate(self.grids):
             si = g.get_global_startindex()
             g.LeftEdge = self.ds.domain_left_edge + g.dds * si
@@ -253,6 +281,9 @@ class GridIndex(Index):
 
     def _get_grid_tree(self):
 
+        if self.grid_store is not None:
+            return self.grid_store.grid_tree()
+
         left_edge = self.ds.arr(np.zeros((self.num_grids, 3)),
                                'code_length')
         right_edge = self.ds.arr(np.zeros((self.num_grids, 3)),
@@ -286,9 +317,7 @@ class GridIndex(Index):
             dobj._chunk_info = np.empty(1, dtype='object')
             dobj._chunk_info[0] = weakref.proxy(dobj)
         elif getattr(dobj, "_grids", None) is None:
-            gi = dobj.selector.select_grids(self.grid_left_edge,
-                                            self.grid_right_edge,
-                                            self.grid_levels)
+            gi = self._get_selected_grids(dobj.selector)
             if any([g.filename is not None for g in self.grids[gi]]):
                 _gsort = _grid_sort_mixed
             else:
@@ -307,13 +336,70 @@ class GridIndex(Index):
         dobj._current_chunk = list(self._chunk_all(dobj, cache = False,
                                    fast_index = fast_index))[0]
 
+    def _get_selected_grids(self, selector):
+        cached = self.selection_cache.get_mask(selector, "grids")
+        if cached is not None:
+            return cached[0]
+        gi = selector.select_grids(self.grid_left_edge,
+                                   self.grid_right_edge,
+                                   self.grid_levels)
+        self.selection_cache.store_mask(selector, "grids", gi, gi.sum())
+        return gi
+
     def _count_selection(self, dobj, grids = None, fast_index = None):
         if fast_index is not None:
             return fast_index.count(dobj.selector)
         if grids is None: grids = dobj._chunk_info
+        if (len(grids) > 1 or self.grid_store is not None) and \
+           dobj.selector.can_fill_grid_masks:
+            return int(self._fill_grid_masks(dobj.selector, grids).sum())
         count = sum((g.count(dobj.selector) for g in grids))
         return count
 
+    def _fill_grid_masks(self, selector, grids):
+        # Select the cells of many grids in one parallel pass, rather than
+        # through fill_mask one grid at a time.  The packed masks are handed
+        # to the selection cache, where the grids will find them when they
+        # are read.
+        cache = self.selection_cache
+        counts = np.zeros(len(grids), dtype="int64")
+        todo = []
+        for i, g in enumerate(grids):
+            count = cache.get_count(selector, g.id) if cache.enabled else None
+            if count is None:
+                todo.append(i)
+            else:
+                counts[i] = count
+        if len(todo) == 0:
+            return counts
+        gs = [grids[i] for i in todo]
+        store = self.grid_store
+        if store is not None:
+            # Everything we need is already in the grid store.
+            ind = np.array([g.id - g._id_offset for g in gs], dtype="int64")
+            nchild = np.diff(store.child_offsets)[ind]
+            counts[todo], masks = selector.fill_grid_masks(
+                self.grid_left_edge.d[ind].astype("float64"),
+                store.dds.d[ind], self.grid_dimensions[ind],
+                self.grid_levels[ind, 0],
+                child_masks = [store.child_mask(i) if n > 0 else None
+                               for i, n in zip(ind, nchild)],
+                return_masks = cache.enabled)
+        else:
+            counts[todo], masks = selector.fill_grid_masks(
+                np.array([g.LeftEdge.d for g in gs]),
+                np.array([g.dds.d for g in gs]),
+                np.array([g.ActiveDimensions for g in gs]),
+                np.array([g.Level for g in gs]),
+                child_masks = [g.child_mask if len(g.Children) > 0 or
+                               g.OverlappingSiblings else None for g in gs],
+                return_masks = cache.enabled)
+        if cache.enabled:
+            for g, count, mask in zip(gs, counts[todo], masks):
+                cache.store_bits(selector, g.id, mask,
+                                 tuple(g.ActiveDimensions), count)
+        return counts
+
     def _chunk_all(self, dobj, cache = True, fast_index = None):
         gobjs = getattr(dobj._current_chunk, "objs", dobj._chunk_info)
         fast_index = fast_index or getattr(dobj._current_chunk, "_fast_index",
@@ -388,6 +474,67 @@ class GridIndex(Index):
                             4.0 * size):
                     yield dc
 
+    @contextmanager
+    def cached_grid_data(self):
+        r"""Keep the fluid fields read from each grid while in this context.
+
+        Inside it, the first data object that selects a fluid field from a
+        grid reads the whole field of that grid, and the cells of every later
+        object overlapping the same grid are selected from this copy rather
+        than read again.  This lets a batch of nearby objects, such as the
+        spheres around neighboring halos, read each grid once.  The selected
+        values are identical to those read without the cache, which is
+        emptied when the context exits.
+        """
+        if self._grid_data_cache is not None:
+            yield
+            return
+        self._grid_data_cache = {}
+        try:
+            yield
+        finally:
+            self._grid_data_cache = None
+
+    def _read_fluid_fields(self, fields, dobj, chunk = None):
+        cache = self._grid_data_cache
+        if cache is None or dobj._type_name == "grid" or len(fields) == 0:
+            return super(GridIndex, self)._read_fluid_fields(
+                fields, dobj, chunk)
+        fields_to_read, fields_to_generate = self._split_fields(fields)
+        if len(fields_to_read) == 0:
+            return {}, fields_to_generate
+        if any(any(self.ds._get_field_info(*field).nodal_flag)
+               for field in fields_to_read):
+            return super(GridIndex, self)._read_fluid_fields(
+                fields, dobj, chunk)
+        selector = dobj.selector
+        if chunk is None:
+            self._identify_base_chunk(dobj)
+            chunk_size = dobj.size
+        else:
+            chunk_size = chunk.data_size
+        rv = dict((field, np.empty(chunk_size, dtype="float64"))
+                  for field in fields_to_read)
+        ind = 0
+        # Grids are visited in the same order as by the IO handlers.
+        for io_chunk in self._chunk_io(dobj, cache = False):
+            for g in io_chunk.objs:
+                if g.count(selector) == 0:
+                    continue
+                missing = [field for field in fields_to_read
+                           if (g.id, field) not in cache]
+                if len(missing) > 0:
+                    data, _ = super(GridIndex, self)._read_fluid_fields(
+                        missing, g)
+                    for field in missing:
+                        cache[g.id, field] = np.asarray(data[field]).reshape(
+                            g.ActiveDimensions)
+                for field in fields_to_read:
+                    count = g.select(selector, cache[g.id, field], rv[field],
+                                     ind)
+                ind += count
+        return rv, fields_to_generate
+
 
 def _grid_sort_id(g):
     return g.id
@@ -0,0 +1,323 @@
+"""
+Array-backed storage for the grids of a GridIndex, and the lightweight
+proxies handed out in place of grid objects.
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import weakref
+
+import numpy as np
+
+from yt.units.yt_array import YTArray
+from .grid_container import GridTree
+
+
+class GridStore(object):
+    r"""The structure of a grid index, held as a set of arrays.
+
+    The levels, edges, dimensions and particle counts of the grids are the
+    ``grid_*`` arrays of the index itself; the store adds parentage (as
+    indices into those arrays, with -1 for root grids), the children of
+    each grid in compressed sparse row form, the file each grid lives in
+    and the cell widths and global start indices of every grid.
+
+    Grid objects are only created when something asks for more than these
+    arrays can provide, such as field data, and are kept for as long as
+    anything refers to them.
+
+    Parameters
+    ----------
+    index : GridIndex
+        The index the grids belong to.  It must implement ``_create_grid``.
+    parent_ids : array of int
+        The index of each grid's parent, or -1.
+    child_offsets, child_ids : arrays of int
+        The children of grid ``i`` are
+        ``child_ids[child_offsets[i]:child_offsets[i + 1]]``.
+    file_index : array of int
+        The position of each grid's file in *filenames*, or -1.
+    filenames : list of str
+        The distinct files the grids are stored in.
+    """
+    def __init__(self, index, parent_ids, child_offsets, child_ids,
+                 file_index, filenames):
+        self.index = weakref.proxy(index)
+        self.parent_ids = np.asarray(parent_ids, dtype="int64")
+        self.child_offsets = np.asarray(child_offsets, dtype="int64")
+        self.child_ids = np.asarray(child_ids, dtype="int64")
+        self.file_index = np.asarray(file_index, dtype="int64")
+        self.filenames = list(filenames)
+        self.id_offset = index.grid._id_offset
+        self.dds = None
+        self.start_index = None
+        self._objects = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return self.parent_ids.size
+
+    def setup(self):
+        """
+        Compute the cell widths and start indices of every grid, one level
+        at a time, clamping the edges of child grids to their parents'
+        cells as ``AMRGridPatch._prepare_grid`` would.
+        """
+        from yt.data_objects.grid_patch import RECONSTRUCT_INDEX
+        index = self.index
+        ds = index.dataset
+        rf = ds.refine_by
+        LE = index.grid_left_edge.d
+        RE = index.grid_right_edge.d
+        dims = index.grid_dimensions
+        levels = index.grid_levels[:, 0]
+        dds = np.empty(LE.shape, dtype="float64")
+        start = np.empty(LE.shape, dtype="int64")
+        def _fix_dds(sel):
+            if ds.dimensionality < 3:
+                dds[sel, 2] = ds.domain_right_edge.d[2] - \
+                    ds.domain_left_edge.d[2]
+        root = self.parent_ids == -1
+        dds[root] = (RE[root] - LE[root]) / dims[root]
+        _fix_dds(root)
+        start[root] = np.rint((LE[root] - ds.domain_left_edge.d)
+                              / dds[root]).astype("int64")
+        for level in np.unique(levels[~root]):
+            # Parents are always on coarser levels, so they have already
+            # been processed.
+            sel = np.where((levels == level) & ~root)[0]
+            p = self.parent_ids[sel]
+            pdds = dds[p]
+            if RECONSTRUCT_INDEX:
+                LE[sel] = np.rint((LE[sel] - LE[p]) / pdds) * pdds + LE[p]
+                RE[sel] = np.rint((RE[sel] - RE[p]) / pdds) * pdds + RE[p]
+            dds[sel] = pdds / rf
+            _fix_dds(sel)
+            di = np.rint((LE[sel] - LE[p]) / pdds)
+            start[sel] = ((start[p] + di) * rf).astype("int64")
+        self.dds = dds.view(YTArray)
+        self.dds.units = index.grid_left_edge.units
+        self.start_index = start
+
+    def children(self, i):
+        return self.child_ids[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def filename(self, i):
+        fi = self.file_index[i]
+        if fi < 0:
+            return None
+        return self.filenames[fi]
+
+    def child_mask(self, i):
+        """
+        The child mask of grid *i*, which is zero where its children are.
+        """
+        dims = self.index.grid_dimensions
+        rf = self.index.dataset.refine_by
+        gi = self.start_index[i]
+        mask = np.ones(dims[i], dtype="bool")
+        for c in self.children(i):
+            cgi = self.start_index[c]
+            si = np.maximum(0, cgi // rf - gi)
+            ei = np.minimum((cgi + dims[c]) // rf - gi, dims[i])
+            ei += (si == ei)
+            mask[si[0]:ei[0], si[1]:ei[1], si[2]:ei[2]] = 0
+        return mask
+
+    def proxy(self, i):
+        return GridProxy(self, i)
+
+    def proxies(self, indices):
+        proxies = np.empty(len(indices), dtype="object")
+        proxies[:] = [GridProxy(self, i) for i in indices]
+        return proxies
+
+    def get_grid(self, i):
+        """
+        Return the grid object for grid *i*, creating it if need be.
+        """
+        grid = self._objects.get(i, None)
+        if grid is None:
+            grid = self.index._create_grid(i)
+            grid._prepare_grid()
+            grid.dds = self.dds[i].copy()
+            grid.start_index = self.start_index[i].copy()
+            self._objects[i] = grid
+        return grid
+
+    def materialized_grids(self):
+        return list(self._objects.values())
+
+    def grid_tree(self):
+        index = self.index
+        num_children = np.diff(self.child_offsets)
+        return GridTree(len(self),
+                        index.grid_left_edge.d.astype("float64"),
+                        index.grid_right_edge.d.astype("float64"),
+                        index.grid_dimensions, self.parent_ids,
+                        index.grid_levels[:, 0].astype("int64"), num_children)
+
+
+class GridProxy(object):
+    r"""A stand-in for a grid, answering from the arrays of a
+    :class:`GridStore`.
+
+    The geometry of the grid, its parent, children and file are read from
+    the store; any other attribute is looked up on the grid object, which
+    is created the first time one is needed.  Attributes set through a
+    proxy are set on that grid object, so they only last as long as it
+    does.
+    """
+    __slots__ = ("_store", "_ind", "_grid", "__weakref__")
+    OverlappingSiblings = None
+
+    def __init__(self, store, ind):
+        self._store = store
+        self._ind = int(ind)
+        self._grid = None
+
+    def _get_grid(self):
+        if self._grid is None:
+            self._grid = self._store.get_grid(self._ind)
+        return self._grid
+
+    @property
+    def _id_offset(self):
+        return self._store.id_offset
+
+    @property
+    def id(self):
+        return self._ind + self._store.id_offset
+
+    @property
+    def Level(self):
+        return int(self._store.index.grid_levels[self._ind, 0])
+
+    @property
+    def LeftEdge(self):
+        return self._store.index.grid_left_edge[self._ind]
+
+    @property
+    def RightEdge(self):
+        return self._store.index.grid_right_edge[self._ind]
+
+    @property
+    def ActiveDimensions(self):
+        return self._store.index.grid_dimensions[self._ind]
+
+    @property
+    def NumberOfParticles(self):
+        return self._store.index.grid_particle_count[self._ind, 0]
+
+    @property
+    def dds(self):
+        return self._store.dds[self._ind]
+
+    @property
+    def filename(self):
+        return self._store.filename(self._ind)
+
+    @property
+    def Parent(self):
+        p = self._store.parent_ids[self._ind]
+        if p < 0:
+            return None
+        return GridProxy(self._store, p)
+
+    @property
+    def Children(self):
+        return [GridProxy(self._store, c)
+                for c in self._store.children(self._ind)]
+
+    @property
+    def child_mask(self):
+        return self._store.child_mask(self._ind)
+
+    def get_global_startindex(self):
+        return self._store.start_index[self._ind]
+
+    def __getattr__(self, name):
+        return getattr(self._get_grid(), name)
+
+    def __setattr__(self, name, value):
+        if name in GridProxy.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._get_grid(), name, value)
+
+    def __getitem__(self, key):
+        return self._get_grid()[key]
+
+    def __setitem__(self, key, value):
+        self._get_grid()[key] = value
+
+    def __delitem__(self, key):
+        del self._get_grid()[key]
+
+    def __eq__(self, other):
+        if isinstance(other, GridProxy):
+            return other._store is self._store and other._ind == self._ind
+        return self._grid is not None and other is self._grid
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._store), self._ind))
+
+    def __int__(self):
+        return self.id
+
+    def __repr__(self):
+        return repr(self._get_grid())
+
+
+class GridProxyArray(object):
+    r"""The grids of a :class:`GridStore`, indexable like an object array.
+
+    Indexing with an integer returns a :class:`GridProxy`; slices, masks and
+    integer arrays return object arrays of proxies.
+    """
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    @property
+    def size(self):
+        return len(self._store)
+
+    @property
+    def shape(self):
+        return (len(self._store),)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 1:
+            key = key[0]
+        n = len(self._store)
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += n
+            if not 0 <= key < n:
+                raise IndexError("grid index %s out of range" % key)
+            return GridProxy(self._store, key)
+        return self._store.proxies(np.arange(n)[key])
+
+    def __iter__(self):
+        for i in range(len(self._store)):
+            yield GridProxy(self._store, i)
+
+    def __array__(self, dtype=None):
+        return self._store.proxies(np.arange(len(self._store)))
+
+    def tolist(self):
+        return list(self)
@@ -19,7 +19,7 @@ cimport numpy as np
 from yt.utilities.lib.fp_utils cimport *
 cimport oct_visitors
 cimport selection_routines
-from .oct_visitors cimport OctVisitor, Oct, cind
+from .oct_visitors cimport OctVisitor, Oct, LinearOct, cind
 from libc.stdlib cimport bsearch, qsort, realloc, malloc, free
 from libc.math cimport floor
 from yt.utilities.lib.allocation_container cimport \
@@ -72,10 +72,10 @@ cdef class OctreeContainer:
     cdef public np.int64_t nocts
     cdef public int num_domains
     cdef Oct *get(self, np.float64_t ppos[3], OctInfo *oinfo = ?,
-                  int max_level = ?)
-    cdef int get_root(self, int ind[3], Oct **o)
+                  int max_level = ?, Oct *storage = ?) except? NULL
+    cdef int get_root(self, int ind[3], Oct **o) except -1
     cdef Oct **neighbors(self, OctInfo *oinfo, np.int64_t *nneighbors,
-                         Oct *o, bint periodicity[3])
+                         Oct *o, bint periodicity[3]) except? NULL
     cdef void oct_bounds(self, Oct *, np.float64_t *, np.float64_t *)
     # This function must return the offset from global-to-local domains; i.e.,
     # AllocationContainer.offset if such a thing exists.
@@ -87,6 +87,10 @@ cdef class OctreeContainer:
     cdef Oct *next_root(self, int domain_id, int ind[3])
     cdef Oct *next_child(self, int domain_id, int ind[3], Oct *parent)
     cdef void append_domain(self, np.int64_t domain_count)
+    cdef np.int64_t num_root_octs(self)
+    # Octs that are not kept as structs (see LinearOctreeContainer) are
+    # filled in to the storage handed to get and root_oct.
+    cdef Oct *root_oct(self, np.int64_t n, np.int64_t ipos[3], Oct *storage)
     # The fill_style is the ordering, C or F, of the octs in the file.  "o"
     # corresponds to C, and "r" is for Fortran.
     cdef public object fill_style
@@ -102,6 +106,14 @@ cdef class SparseOctreeContainer(OctreeContainer):
 cdef class RAMSESOctreeContainer(SparseOctreeContainer):
     pass
 
+cdef class LinearOctreeContainer(OctreeContainer):
+    cdef LinearOct *octs
+    cdef np.int64_t *root_keys
+    cdef np.int64_t *root_inds
+    cdef np.int64_t num_root
+    cdef Oct *fill_oct(self, np.int64_t ind, Oct *storage) except NULL
+    cdef np.int64_t find_root(self, np.int64_t key)
+
 cdef extern from "tsearch.h" nogil:
     void *tsearch(const void *key, void **rootp,
                     int (*compar)(const void *, const void *))
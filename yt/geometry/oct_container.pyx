@@ -188,7 +188,7 @@ cdef class OctreeContainer:
     cdef np.int64_t get_domain_offset(self, int domain_id):
         return 0
 
-    cdef int get_root(self, int ind[3], Oct **o):
+    cdef int get_root(self, int ind[3], Oct **o) except -1:
         cdef int i
         for i in range(3):
             if ind[i] < 0 or ind[i] >= self.nn[i]:
@@ -201,7 +201,7 @@ cdef class OctreeContainer:
     @cython.wraparound(False)
     @cython.cdivision(True)
     cdef Oct *get(self, np.float64_t ppos[3], OctInfo *oinfo = NULL,
-                  int max_level = 99):
+                  int max_level = 99, Oct *storage = NULL) except? NULL:
         #Given a floating point position, retrieve the most
         #refined oct at that time
         cdef int ind32[3]
@@ -265,6 +265,7 @@ cdef class OctreeContainer:
         cdef dict all_octs = {}
         cdef OctInfo oi
         cdef Oct* o = NULL
+        cdef Oct storage
         cdef np.float64_t pos[3]
         cdef np.ndarray[np.uint8_t, ndim=1] recorded
         cdef np.ndarray[np.int64_t, ndim=1] oct_id
@@ -274,7 +275,7 @@ cdef class OctreeContainer:
         for i in range(positions.shape[0]):
             for j in range(3):
                 pos[j] = positions[i,j]
-            o = self.get(pos, &oi)
+            o = self.get(pos, &oi, 99, &storage)
             if o == NULL:
                 raise RuntimeError
             if recorded[o.domain_ind] == 0:
@@ -308,7 +309,7 @@ cdef class OctreeContainer:
     @cython.wraparound(False)
     @cython.cdivision(True)
     cdef Oct** neighbors(self, OctInfo *oi, np.int64_t *nneighbors, Oct *o,
-                         bint periodicity[3]):
+                         bint periodicity[3]) except? NULL:
         cdef Oct* candidate
         nn = 0
         # We are going to do a brute-force search here.
@@ -668,6 +669,54 @@ cdef class OctreeContainer:
         self.nocts += 1
         return next
 
+    cdef np.int64_t num_root_octs(self):
+        return self.nn[0] * self.nn[1] * self.nn[2]
+
+    cdef Oct *root_oct(self, np.int64_t n, np.int64_t ipos[3], Oct *storage):
+        # Root n of num_root_octs, or NULL if there is none; its position
+        # on the root mesh is stored in ipos.
+        ipos[2] = n % self.nn[2]
+        n = n // self.nn[2]
+        ipos[1] = n % self.nn[1]
+        ipos[0] = n // self.nn[1]
+        if self.root_mesh == NULL: return NULL
+        return self.root_mesh[ipos[0]][ipos[1]][ipos[2]]
+
+    def memory_usage(self):
+        """
+        Return the number of bytes used by the octree, as a dict giving the
+        bytes used by the octs themselves ("octs"), by the arrays of
+        pointers to their children ("children"), by the bookkeeping of the
+        root octs ("roots") and in total ("total").
+        """
+        cdef np.int64_t counts[2]
+        cdef np.int64_t n
+        cdef np.int64_t ipos[3]
+        cdef Oct *o
+        cdef Oct storage
+        counts[0] = counts[1] = 0
+        for n in range(self.num_root_octs()):
+            o = self.root_oct(n, ipos, &storage)
+            if o != NULL:
+                _count_octs(o, counts)
+        usage = dict(octs = counts[0] * sizeof(Oct),
+                     children = counts[1] * 8 * sizeof(Oct *),
+                     roots = self._root_memory_usage())
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def _root_memory_usage(self):
+        if self.root_mesh == NULL: return 0
+        return sizeof(void *) * (self.nn[0] * self.nn[1] * self.nn[2]
+                                 + self.nn[0] * self.nn[1] + self.nn[0])
+
+    def compact(self):
+        """
+        Return a :class:`LinearOctreeContainer` holding the same octs as
+        this container.
+        """
+        return LinearOctreeContainer.from_octree(self)
+
     def file_index_octs(self, SelectorObject selector, int domain_id,
                         num_cells = -1):
         # We create oct arrays of the correct size
@@ -787,7 +836,7 @@ cdef class SparseOctreeContainer(OctreeContainer):
     def save_octree(self):
         raise NotImplementedError
 
-    cdef int get_root(self, int ind[3], Oct **o):
+    cdef int get_root(self, int ind[3], Oct **o) except -1:
         o[0] = NULL
         cdef int i
         cdef np.int64_t key = self.ipos_to_key(ind)
@@ -850,6 +899,19 @@ cdef class SparseOctreeContainer(OctreeContainer):
     cdef np.int64_t get_domain_offset(self, int domain_id):
         return 0 # We no longer have a domain offset.
 
+    cdef np.int64_t num_root_octs(self):
+        return self.num_root
+
+    cdef Oct *root_oct(self, np.int64_t n, np.int64_t ipos[3], Oct *storage):
+        self.key_to_ipos(self.root_nodes[n].key, ipos)
+        return self.root_nodes[n].node
+
+    def _root_memory_usage(self):
+        # Each root has a key, and a node in the search tree of three
+        # pointers and a flag.
+        return self.max_root * sizeof(OctKey) + \
+            self.num_root * 4 * sizeof(void *)
+
     cdef Oct* next_root(self, int domain_id, int ind[3]):
         cdef int i
         cdef Oct *next = NULL
@@ -891,6 +953,299 @@ cdef class SparseOctreeContainer(OctreeContainer):
 cdef class RAMSESOctreeContainer(SparseOctreeContainer):
     pass
 
+cdef np.int64_t _morton_key(np.int64_t ipos[3]):
+    # Interleave the bits of the root mesh position, x first, so that keys
+    # are ordered the way cind orders children.
+    cdef np.int64_t key = 0
+    cdef int b, i
+    for b in range(ORDER_MAX - 1, -1, -1):
+        for i in range(3):
+            key = (key << 1) | ((ipos[i] >> b) & 1)
+    return key
+
+cdef void _morton_ipos(np.int64_t key, np.int64_t ipos[3]):
+    cdef int b, i
+    for i in range(3):
+        ipos[i] = 0
+    for b in range(ORDER_MAX - 1, -1, -1):
+        for i in range(3):
+            ipos[i] = (ipos[i] << 1) | ((key >> (3 * b + 2 - i)) & 1)
+
+cdef void _count_octs(Oct *o, np.int64_t counts[2]):
+    # counts[0] is the number of octs, counts[1] the number with children
+    cdef int i
+    counts[0] += 1
+    if o.children == NULL: return
+    counts[1] += 1
+    for i in range(8):
+        if o.children[i] != NULL:
+            _count_octs(o.children[i], counts)
+
+cdef np.int64_t _linearize_octs(Oct *o, LinearOct *octs, np.int64_t n):
+    # Store o and its subtree, depth first, from octs[n]; return the index
+    # after the last of them.
+    cdef np.int64_t i = n
+    cdef int c
+    octs[i].file_ind = o.file_ind
+    octs[i].domain = o.domain
+    octs[i].children = 0
+    n += 1
+    if o.children != NULL:
+        for c in range(8):
+            if o.children[c] != NULL:
+                octs[i].children |= (1 << c)
+                n = _linearize_octs(o.children[c], octs, n)
+    octs[i].next = n
+    return n
+
+cdef class LinearOctreeContainer(OctreeContainer):
+    """
+    An octree stored as a single array of octs, without pointers.
+
+    The roots are sorted by the Morton key of their position on the root
+    mesh, and each is followed by its subtree, depth first, with children in
+    Morton order as well; every oct records which of its children exist and
+    where its subtree ends, so children are found implicitly.  This takes a
+    fraction of the memory of a pointer-based octree and keeps the octs
+    visited together next to each other.  The index of an oct in the array
+    is its domain_ind.
+
+    A linear octree is built from a complete octree with ``from_octree``
+    (or ``OctreeContainer.compact``), and can then be used in its place for
+    selection and IO.  As the octs are not kept as Oct structs, ``get``
+    fills in the Oct storage it is handed by its caller, and ``neighbors``
+    is not supported.
+    """
+
+    def __init__(self, oct_domain_dimensions, domain_left_edge,
+                 domain_right_edge, partial_coverage = 0,
+                 over_refine = 1):
+        cdef int i
+        self.oref = over_refine
+        self.partial_coverage = partial_coverage
+        for i in range(3):
+            self.nn[i] = oct_domain_dimensions[i]
+            self.DLE[i] = domain_left_edge[i]
+            self.DRE[i] = domain_right_edge[i]
+        self.num_domains = 0
+        self.level_offset = 0
+        self.domains = OctObjectPool()
+        self.nocts = 0
+        self.root_mesh = NULL
+        self.octs = NULL
+        self.root_keys = self.root_inds = NULL
+        self.num_root = 0
+        self.fill_style = "o"
+
+    @classmethod
+    def from_octree(cls, OctreeContainer octree):
+        cdef LinearOctreeContainer obj
+        cdef np.int64_t counts[2]
+        cdef np.int64_t i, n, nroot
+        cdef np.int64_t ipos[3]
+        cdef Oct *o
+        cdef Oct storage
+        if isinstance(octree, LinearOctreeContainer):
+            raise NotImplementedError(
+                "A LinearOctreeContainer is already compact.")
+        obj = cls([octree.nn[i] for i in range(3)],
+                  [octree.DLE[i] for i in range(3)],
+                  [octree.DRE[i] for i in range(3)],
+                  octree.partial_coverage, octree.oref)
+        obj.level_offset = octree.level_offset
+        obj.num_domains = octree.num_domains
+        obj.fill_style = octree.fill_style
+        counts[0] = counts[1] = 0
+        roots, keys = [], []
+        for n in range(octree.num_root_octs()):
+            o = octree.root_oct(n, ipos, &storage)
+            if o == NULL: continue
+            _count_octs(o, counts)
+            roots.append(n)
+            keys.append(_morton_key(ipos))
+        nroot = len(roots)
+        order = np.argsort(np.array(keys, dtype="int64"), kind="mergesort")
+        obj.octs = <LinearOct *> malloc(sizeof(LinearOct) * max(counts[0], 1))
+        obj.root_keys = <np.int64_t *> malloc(sizeof(np.int64_t) * max(nroot, 1))
+        obj.root_inds = <np.int64_t *> malloc(sizeof(np.int64_t) * max(nroot, 1))
+        n = 0
+        for i in range(nroot):
+            o = octree.root_oct(roots[order[i]], ipos, &storage)
+            obj.root_keys[i] = keys[order[i]]
+            obj.root_inds[i] = n
+            n = _linearize_octs(o, obj.octs, n)
+        obj.num_root = nroot
+        obj.nocts = n
+        return obj
+
+    @classmethod
+    def load_octree(cls, header):
+        return cls.from_octree(OctreeContainer.load_octree(header))
+
+    def __dealloc__(self):
+        if self.octs != NULL: free(self.octs)
+        if self.root_keys != NULL: free(self.root_keys)
+        if self.root_inds != NULL: free(self.root_inds)
+
+    @property
+    def oct_arrays(self):
+        if self.nocts == 0:
+            return []
+        cdef LinearOct[:] mm = <LinearOct[:self.nocts]> self.octs
+        return [np.asarray(mm)]
+
+    def _root_memory_usage(self):
+        return self.num_root * 2 * sizeof(np.int64_t)
+
+    def memory_usage(self):
+        usage = dict(octs = self.nocts * sizeof(LinearOct),
+                     children = 0,
+                     roots = self._root_memory_usage())
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def add(self, *args, **kwargs):
+        raise NotImplementedError(
+            "Octs cannot be added to a LinearOctreeContainer; build an "
+            "octree and compact it instead.")
+
+    def allocate_domains(self, *args, **kwargs):
+        raise NotImplementedError(
+            "Octs cannot be added to a LinearOctreeContainer; build an "
+            "octree and compact it instead.")
+
+    def finalize(self):
+        # The index of each oct already is its domain_ind.
+        pass
+
+    cdef Oct* next_root(self, int domain_id, int ind[3]):
+        return NULL
+
+    cdef Oct* next_child(self, int domain_id, int ind[3], Oct *parent):
+        return NULL
+
+    cdef np.int64_t num_root_octs(self):
+        return self.num_root
+
+    cdef Oct *fill_oct(self, np.int64_t ind, Oct *storage) except NULL:
+        # Octs handed out are filled in from the array, and have no
+        # children to follow.
+        if storage == NULL:
+            raise RuntimeError(
+                "The octs of a LinearOctreeContainer can only be returned "
+                "in storage supplied by the caller.")
+        storage.file_ind = self.octs[ind].file_ind
+        storage.domain_ind = ind
+        storage.domain = self.octs[ind].domain
+        storage.children = NULL
+        return storage
+
+    cdef Oct *root_oct(self, np.int64_t n, np.int64_t ipos[3], Oct *storage):
+        _morton_ipos(self.root_keys[n], ipos)
+        return self.fill_oct(self.root_inds[n], storage)
+
+    cdef np.int64_t find_root(self, np.int64_t key):
+        cdef np.int64_t lo = 0, hi = self.num_root - 1, mid
+        while lo <= hi:
+            mid = (lo + hi) >> 1
+            if self.root_keys[mid] < key:
+                lo = mid + 1
+            elif self.root_keys[mid] > key:
+                hi = mid - 1
+            else:
+                return mid
+        return -1
+
+    cdef int get_root(self, int ind[3], Oct **o) except -1:
+        # There is no storage to return the root in; see root_oct.
+        raise NotImplementedError(
+            "get_root is not supported by LinearOctreeContainer.")
+
+    @cython.cdivision(True)
+    cdef void visit_all_octs(self, SelectorObject selector,
+                        OctVisitor visitor, int vc = -1):
+        cdef int i, j
+        cdef np.int64_t r
+        if vc == -1:
+            vc = self.partial_coverage
+        visitor.global_index = -1
+        visitor.level = 0
+        cdef np.float64_t pos[3]
+        cdef np.float64_t dds[3]
+        # This dds is the oct-width
+        for i in range(3):
+            dds[i] = (self.DRE[i] - self.DLE[i]) / self.nn[i]
+        for r in range(self.num_root):
+            _morton_ipos(self.root_keys[r], visitor.pos)
+            for j in range(3):
+                pos[j] = self.DLE[j] + (visitor.pos[j] + 0.5) * dds[j]
+            selector.recursively_visit_linear_octs(
+                self.octs, self.root_inds[r], pos, dds, 0, visitor, vc)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef Oct *get(self, np.float64_t ppos[3], OctInfo *oinfo = NULL,
+                  int max_level = 99, Oct *storage = NULL) except? NULL:
+        cdef np.int64_t ipos[3]
+        cdef np.int64_t ind[3]
+        cdef np.float64_t dds[3]
+        cdef np.float64_t cp[3]
+        cdef np.int64_t cur = -1, next = -1, r
+        cdef np.int64_t level = -1
+        cdef int i, c
+        for i in range(3):
+            dds[i] = (self.DRE[i] - self.DLE[i])/self.nn[i]
+            ind[i] = <np.int64_t> (floor((ppos[i] - self.DLE[i])/dds[i]))
+            cp[i] = (ind[i] + 0.5) * dds[i] + self.DLE[i]
+            ipos[i] = 0
+            if ind[i] < 0 or ind[i] >= self.nn[i]:
+                return NULL
+        r = self.find_root(_morton_key(ind))
+        if r != -1:
+            next = self.root_inds[r]
+        while next != -1 and level <= max_level:
+            level += 1
+            for i in range(3):
+                ipos[i] = (ipos[i] << 1) + ind[i]
+            cur = next
+            for i in range(3):
+                dds[i] = dds[i] / 2.0
+                if cp[i] > ppos[i]:
+                    ind[i] = 0
+                    cp[i] -= dds[i] / 2.0
+                else:
+                    ind[i] = 1
+                    cp[i] += dds[i]/2.0
+            c = cind(ind[0], ind[1], ind[2])
+            next = -1
+            if self.octs[cur].children & (1 << c):
+                # Step over the subtrees of the children before this one.
+                next = cur + 1
+                for i in range(c):
+                    if self.octs[cur].children & (1 << i):
+                        next = self.octs[next].next
+        if cur == -1: return NULL
+        self.fill_oct(cur, storage)
+        if oinfo == NULL: return storage
+        cdef int ncells = (1 << self.oref)
+        cdef np.float64_t factor = 1.0 / (1 << (self.oref-1))
+        if self.oref == 0: factor = 2.0
+        for i in range(3):
+            oinfo.dds[i] = dds[i] * factor # Cell width
+            oinfo.ipos[i] = ipos[i]
+            oinfo.left_edge[i] = oinfo.ipos[i] * (oinfo.dds[i] * ncells) + self.DLE[i]
+        oinfo.level = level
+        return storage
+
+    cdef Oct** neighbors(self, OctInfo *oi, np.int64_t *nneighbors, Oct *o,
+                         bint periodicity[3]) except? NULL:
+        # The octs handed out are not persistent, so there are no neighbors
+        # to return.
+        raise NotImplementedError(
+            "Neighbors cannot be found in a LinearOctreeContainer; search a "
+            "pointer-based octree instead.")
+
 cdef class ARTOctreeContainer(OctreeContainer):
     def __init__(self, oct_domain_dimensions, domain_left_edge,
                  domain_right_edge, partial_coverage = 0,
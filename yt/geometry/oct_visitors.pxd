@@ -24,6 +24,15 @@ cdef struct Oct:
     np.int64_t domain       # (opt) addl int index
     Oct **children          # Up to 8 long
 
+# An oct of a LinearOctreeContainer.  The octs are stored depth first, so the
+# children of an oct (those whose bits are set in "children", in cind order)
+# follow it, and "next" is the index of the first oct after its subtree.
+cdef struct LinearOct:
+    np.int64_t file_ind
+    np.int64_t next
+    np.int32_t domain
+    np.uint8_t children
+
 cdef struct OctPadded:
     np.int64_t file_ind
     np.int64_t domain_ind
@@ -21,6 +21,7 @@ cimport cython
 from libc.math cimport sqrt
 
 from yt.utilities.lib.fp_utils cimport *
+from yt.utilities.lib.particle_kernels cimport kernel_func, get_kernel_func
 from .oct_container cimport Oct, OctreeContainer
 
 cdef extern from "platform_dep.h":
@@ -34,103 +35,6 @@ cdef inline int gind(int i, int j, int k, int dims[3]):
     return ((i*dims[1])+j)*dims[2]+k
 
 
-####################################################
-# Standard SPH kernel for use with the Grid method #
-####################################################
-
-cdef inline np.float64_t sph_kernel_cubic(np.float64_t x) nogil:
-    cdef np.float64_t kernel
-    cdef np.float64_t C = 2.5464790894703255
-    if x <= 0.5:
-        kernel = 1.-6.*x*x*(1.-x)
-    elif x>0.5 and x<=1.0:
-        kernel = 2.*(1.-x)*(1.-x)*(1.-x)
-    else:
-        kernel = 0.
-    return kernel * C
-
-########################################################
-# Alternative SPH kernels for use with the Grid method #
-########################################################
-
-# quartic spline
-cdef inline np.float64_t sph_kernel_quartic(np.float64_t x):
-    cdef np.float64_t kernel
-    cdef np.float64_t C = 5.**6/512/np.pi
-    if x < 1:
-        kernel = (1.-x)**4
-        if x < 3./5:
-            kernel -= 5*(3./5-x)**4
-            if x < 1./5:
-                kernel += 10*(1./5-x)**4
-    else:
-        kernel = 0.
-    return kernel * C
-
-# quintic spline
-cdef inline np.float64_t sph_kernel_quintic(np.float64_t x):
-    cdef np.float64_t kernel
-    cdef np.float64_t C = 3.**7/40/np.pi
-    if x < 1:
-        kernel = (1.-x)**5
-        if x < 2./3:
-            kernel -= 6*(2./3-x)**5
-            if x < 1./3:
-                kernel += 15*(1./3-x)**5
-    else:
-        kernel = 0.
-    return kernel * C
-
-# Wendland C2
-cdef inline np.float64_t sph_kernel_wendland2(np.float64_t x):
-    cdef np.float64_t kernel
-    cdef np.float64_t C = 21./2/np.pi
-    if x < 1:
-        kernel = (1.-x)**4 * (1+4*x)
-    else:
-        kernel = 0.
-    return kernel * C
-
-# Wendland C4
-cdef inline np.float64_t sph_kernel_wendland4(np.float64_t x):
-    cdef np.float64_t kernel
-    cdef np.float64_t C = 495./32/np.pi
-    if x < 1:
-        kernel = (1.-x)**6 * (1+6*x+35./3*x**2)
-    else:
-        kernel = 0.
-    return kernel * C
-
-# Wendland C6
-cdef inline np.float64_t sph_kernel_wendland6(np.float64_t x):
-    cdef np.float64_t kernel
-    cdef np.float64_t C = 1365./64/np.pi
-    if x < 1:
-        kernel = (1.-x)**8 * (1+8*x+25*x**2+32*x**3)
-    else:
-        kernel = 0.
-    return kernel * C
-
-# I don't know the way to use a dict in a cdef class.
-# So in order to mimic a registry functionality,
-# I manually created a function to lookup the kernel functions.
-ctypedef np.float64_t (*kernel_func) (np.float64_t)
-cdef inline kernel_func get_kernel_func(str kernel_name):
-    if kernel_name == 'cubic':
-        return sph_kernel_cubic
-    elif kernel_name == 'quartic':
-        return sph_kernel_quartic
-    elif kernel_name == 'quintic':
-        return sph_kernel_quintic
-    elif kernel_name == 'wendland2':
-        return sph_kernel_wendland2
-    elif kernel_name == 'wendland4':
-        return sph_kernel_wendland4
-    elif kernel_name == 'wendland6':
-        return sph_kernel_wendland6
-    else:
-        raise NotImplementedError
-
 cdef class ParticleDepositOperation:
     # We assume each will allocate and define their own temporary storage
     cdef kernel_func sph_kernel
@@ -138,5 +42,15 @@ cdef class ParticleDepositOperation:
     cdef public int update_values
     cdef int process(self, int dim[3], np.float64_t left_edge[3],
                      np.float64_t dds[3], np.int64_t offset,
-                     np.float64_t ppos[3], np.float64_t[:] fields,
-                     np.int64_t domain_ind) except -1
+                     np.float64_t ppos[3], np.float64_t *fields,
+                     np.int64_t domain_ind) nogil except -1
+    cdef int stencil_width(self)
+    cdef int process_groups(self, int dims[3],
+                            np.float64_t[:,::1] left_edges,
+                            np.float64_t[:,::1] dds,
+                            np.int64_t[:] offsets,
+                            np.int64_t[:] domain_inds,
+                            np.int64_t[:] starts,
+                            np.int64_t[:] order,
+                            np.float64_t[:,:] positions,
+                            fields, int ncolors, int num_threads) except -1
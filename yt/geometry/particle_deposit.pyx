@@ -18,6 +18,7 @@ cimport numpy as np
 import numpy as np
 from libc.stdlib cimport malloc, free
 cimport cython
+from cython.parallel cimport prange, parallel
 from libc.math cimport sqrt
 from cpython cimport PyObject
 from yt.utilities.lib.fp_utils cimport *
@@ -36,6 +37,19 @@ cdef append_axes(np.ndarray arr, int naxes):
     arr2.shape = arr2.shape + (1,) * (naxes - arr2.ndim)
     return arr2
 
+def _group_particles(np.ndarray[np.int64_t, ndim=1] group, np.int64_t ngroups):
+    # A stable counting sort of particles by group; particles with a
+    # negative group are dropped.  Returns the start of each group in the
+    # ordering, and the ordering itself.
+    cdef np.ndarray[np.int64_t, ndim=1] starts = np.zeros(ngroups + 1,
+                                                          dtype="int64")
+    cdef np.ndarray[np.int64_t, ndim=1] order
+    valid = group >= 0
+    starts[1:] = np.cumsum(np.bincount(group[valid], minlength=ngroups))
+    order = np.nonzero(valid)[0].astype("int64")
+    order = order[np.argsort(group[valid], kind="mergesort")]
+    return starts, order
+
 cdef class ParticleDepositOperation:
     def __init__(self, nvals, kernel_name):
         # nvals is a tuple containing the active dimensions of the
@@ -57,7 +71,7 @@ cdef class ParticleDepositOperation:
                      np.ndarray[np.int64_t, ndim=1] dom_ind,
                      np.ndarray[np.float64_t, ndim=2] positions,
                      fields = None, int domain_id = -1,
-                     int domain_offset = 0):
+                     int domain_offset = 0, int num_threads = 1):
         cdef int nf, i, j
         if fields is None:
             fields = []
@@ -65,28 +79,39 @@ cdef class ParticleDepositOperation:
         cdef np.float64_t[::cython.view.indirect, ::1] field_pointers 
         if nf > 0: field_pointers = OnceIndirect(fields)
         cdef np.float64_t pos[3]
-        cdef np.float64_t[:] field_vals = np.empty(nf, dtype="float64")
+        cdef np.float64_t[:] field_vals = np.empty(max(nf, 1), dtype="float64")
         cdef int dims[3]
         dims[0] = dims[1] = dims[2] = (1 << octree.oref)
         cdef int nz = dims[0] * dims[1] * dims[2]
         cdef OctInfo oi
         cdef np.int64_t offset, moff
         cdef Oct *oct
+        cdef Oct storage
         cdef np.int64_t numpart = positions.shape[0]
+        # When threading, the particles are first sorted by the oct they
+        # belong to, and each oct is then processed by a single thread.
+        cdef np.int64_t[:] poffsets
+        cdef np.float64_t[:,::1] oct_le, oct_dds
+        cdef np.int64_t[:] oct_dind
+        if num_threads != 1:
+            poffsets = np.empty(numpart, dtype="int64")
+            oct_le = np.empty((dom_ind.shape[0], 3), dtype="float64")
+            oct_dds = np.empty((dom_ind.shape[0], 3), dtype="float64")
+            oct_dind = np.empty(dom_ind.shape[0], dtype="int64")
         moff = octree.get_domain_offset(domain_id + domain_offset)
         for i in range(positions.shape[0]):
             # We should check if particle remains inside the Oct here
-            for j in range(nf):
-                field_vals[j] = field_pointers[j,i]
             for j in range(3):
                 pos[j] = positions[i, j]
+            if num_threads != 1:
+                poffsets[i] = -1
             # This line should be modified to have it return the index into an
             # array based on whatever cutting of the domain we have done.  This
             # may or may not include the domain indices that we have
             # previously generated.  This way we can support not knowing the
             # full octree structure.  All we *really* care about is some
             # arbitrary offset into a field value for deposition.
-            oct = octree.get(pos, &oi)
+            oct = octree.get(pos, &oi, 99, &storage)
             # This next line is unfortunate.  Basically it says, sometimes we
             # might have particles that belong to octs outside our domain.
             # For the distributed-memory octrees, this will manifest as a NULL
@@ -102,23 +127,41 @@ cdef class ParticleDepositOperation:
             # Note that this has to be our local index, not our in-file index.
             offset = dom_ind[oct.domain_ind - moff]
             if offset < 0: continue
+            if num_threads != 1:
+                poffsets[i] = offset
+                for j in range(3):
+                    oct_le[offset, j] = oi.left_edge[j]
+                    oct_dds[offset, j] = oi.dds[j]
+                oct_dind[offset] = oct.domain_ind
+                continue
             # Check that we found the oct ...
+            for j in range(nf):
+                field_vals[j] = field_pointers[j,i]
             self.process(dims, oi.left_edge, oi.dds,
-                         offset, pos, field_vals, oct.domain_ind)
+                         offset, pos, &field_vals[0], oct.domain_ind)
             if self.update_values == 1:
                 for j in range(nf):
                     field_pointers[j][i] = field_vals[j]
+        if num_threads == 1:
+            return
+        starts, order = _group_particles(np.asarray(poffsets),
+                                         dom_ind.shape[0])
+        self.process_groups(dims, oct_le, oct_dds,
+                            np.arange(dom_ind.shape[0], dtype="int64"),
+                            oct_dind, starts, order, positions, fields, 1,
+                            num_threads)
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
+    @cython.cdivision(True)
     def process_grid(self, gobj,
                      np.ndarray[np.float64_t, ndim=2] positions,
-                     fields = None):
+                     fields = None, int num_threads = 1):
         cdef int nf, i, j
         if fields is None:
             fields = []
         nf = len(fields)
-        cdef np.float64_t[:] field_vals = np.empty(nf, dtype="float64")
+        cdef np.float64_t[:] field_vals = np.empty(max(nf, 1), dtype="float64")
         cdef np.float64_t[::cython.view.indirect, ::1] field_pointers 
         if nf > 0: field_pointers = OnceIndirect(fields)
         cdef np.float64_t pos[3]
@@ -132,28 +175,113 @@ cdef class ParticleDepositOperation:
             left_edge[i] = gobj.LeftEdge[i]
             right_edge[i] = gobj.RightEdge[i]
             dims[i] = gobj.ActiveDimensions[i]
+        # The grid is split into slabs along x that are wide enough that the
+        # cells touched by particles in one slab never overlap those touched
+        # from the slab after next; alternate slabs are processed in
+        # parallel, in two passes.
+        cdef int stencil = self.stencil_width()
+        cdef int width = max(2 * stencil, 1)
+        cdef np.int64_t nslab = dims[0] // width
+        if stencil < 0 or nslab < 2:
+            num_threads = 1
+        cdef np.int64_t[:] pslab
+        if num_threads != 1:
+            pslab = np.empty(positions.shape[0], dtype="int64")
         for i in range(positions.shape[0]):
             # Now we process
-            for j in range(nf):
-                field_vals[j] = field_pointers[j,i]
             for j in range(3):
                 pos[j] = positions[i, j]
             continue_loop = False
             for j in range(3):
                 if pos[j] < left_edge[j] or pos[j] > right_edge[j]:
                     continue_loop = True
+            if num_threads != 1:
+                if continue_loop:
+                    pslab[i] = -1
+                else:
+                    j = <int>((pos[0] - left_edge[0]) / dds[0]) // width
+                    pslab[i] = min(j, nslab - 1)
+                continue
             if continue_loop:
                 continue
-            self.process(dims, left_edge, dds, 0, pos, field_vals, gid)
+            for j in range(nf):
+                field_vals[j] = field_pointers[j,i]
+            self.process(dims, left_edge, dds, 0, pos, &field_vals[0], gid)
             if self.update_values == 1:
                 for j in range(nf):
                     field_pointers[j][i] = field_vals[j]
+        if num_threads == 1:
+            return
+        starts, order = _group_particles(np.asarray(pslab), nslab)
+        slab_le = np.empty((nslab, 3), dtype="float64")
+        slab_le[:] = [left_edge[0], left_edge[1], left_edge[2]]
+        slab_dds = np.empty((nslab, 3), dtype="float64")
+        slab_dds[:] = [dds[0], dds[1], dds[2]]
+        self.process_groups(dims, slab_le, slab_dds,
+                            np.zeros(nslab, dtype="int64"),
+                            np.full(nslab, gid, dtype="int64"),
+                            starts, order, positions, fields,
+                            2 if stencil > 0 else 1, num_threads)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int process_groups(self, int dims[3],
+                            np.float64_t[:,::1] left_edges,
+                            np.float64_t[:,::1] dds,
+                            np.int64_t[:] offsets,
+                            np.int64_t[:] domain_inds,
+                            np.int64_t[:] starts,
+                            np.int64_t[:] order,
+                            np.float64_t[:,:] positions,
+                            fields, int ncolors, int num_threads) except -1:
+        # Particles are processed in groups, each of which is handed to a
+        # single thread; groups of the same color (every ncolors-th group)
+        # must never deposit into the same cells.
+        cdef int nf = len(fields)
+        cdef int color, j
+        cdef np.int64_t g, p, i
+        cdef np.int64_t ngroups = starts.shape[0] - 1
+        cdef np.float64_t *ppos
+        cdef np.float64_t *fvals
+        arr = np.empty((max(nf, 1), positions.shape[0]), dtype="float64")
+        for j in range(nf):
+            arr[j] = fields[j]
+        cdef np.float64_t[:,::1] field_vals = arr
+        for color in range(ncolors):
+            with nogil, parallel(num_threads=num_threads):
+                ppos = <np.float64_t *> malloc(sizeof(np.float64_t) * 3)
+                fvals = <np.float64_t *> malloc(sizeof(np.float64_t) *
+                                                (nf + 1))
+                for g in prange(color, ngroups, ncolors, schedule="dynamic"):
+                    for p in range(starts[g], starts[g + 1]):
+                        i = order[p]
+                        for j in range(3):
+                            ppos[j] = positions[i, j]
+                        for j in range(nf):
+                            fvals[j] = field_vals[j, i]
+                        self.process(dims, &left_edges[g, 0], &dds[g, 0],
+                                     offsets[g], ppos, fvals, domain_inds[g])
+                        if self.update_values == 1:
+                            for j in range(nf):
+                                field_vals[j, i] = fvals[j]
+                free(ppos)
+                free(fvals)
+        if self.update_values == 1:
+            for j in range(nf):
+                fields[j][:] = arr[j]
+        return 0
 
     cdef int process(self, int dim[3], np.float64_t left_edge[3],
                      np.float64_t dds[3], np.int64_t offset,
-                     np.float64_t ppos[3], np.float64_t[:] fields,
-                     np.int64_t domain_ind) except -1:
-        raise NotImplementedError
+                     np.float64_t ppos[3], np.float64_t *fields,
+                     np.int64_t domain_ind) nogil except -1:
+        with gil:
+            raise NotImplementedError
+
+    cdef int stencil_width(self):
+        # How many cells to either side of the one containing a particle
+        # it may deposit into, or -1 if that is not bounded.
+        return -1
 
 cdef class CountParticles(ParticleDepositOperation):
     cdef np.int64_t[:,:,:,:] count
@@ -168,9 +296,9 @@ cdef class CountParticles(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset, # offset into IO field
                      np.float64_t ppos[3], # this particle's position
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
         # here we do our thing; this is the kernel
         cdef int ii[3]
         cdef int i
@@ -179,6 +307,9 @@ cdef class CountParticles(ParticleDepositOperation):
         self.count[ii[2], ii[1], ii[0], offset] += 1
         return 0
 
+    cdef int stencil_width(self):
+        return 0
+
     def finalize(self):
         arr = np.asarray(self.count)
         arr.shape = self.nvals
@@ -205,9 +336,9 @@ cdef class SimpleSmooth(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset,
                      np.float64_t ppos[3],
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
         cdef int ii[3]
         cdef int ib0[3]
         cdef int ib1[3]
@@ -264,9 +395,9 @@ cdef class SumParticleField(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset,
                      np.float64_t ppos[3],
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
         cdef int ii[3]
         cdef int i
         for i in range(3):
@@ -274,6 +405,9 @@ cdef class SumParticleField(ParticleDepositOperation):
         self.sum[ii[2], ii[1], ii[0], offset] += fields[0]
         return 0
 
+    cdef int stencil_width(self):
+        return 0
+
     def finalize(self):
         sum = np.asarray(self.sum)
         sum.shape = self.nvals
@@ -306,9 +440,9 @@ cdef class StdParticleField(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset,
                      np.float64_t ppos[3],
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
         cdef int ii[3]
         cdef int i, cell_index
         cdef float k, mk, qk
@@ -328,6 +462,9 @@ cdef class StdParticleField(ParticleDepositOperation):
         self.i[ii[2], ii[1], ii[0], offset] += 1
         return 0
 
+    cdef int stencil_width(self):
+        return 0
+
     def finalize(self):
         # This is the standard variance
         # if we want sample variance divide by (self.oi - 1.0)
@@ -357,9 +494,9 @@ cdef class CICDeposit(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset, # offset into IO field
                      np.float64_t ppos[3], # this particle's position
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
 
         cdef int i, j, k
         cdef np.uint64_t ii
@@ -387,6 +524,9 @@ cdef class CICDeposit(ParticleDepositOperation):
 
         return 0
 
+    cdef int stencil_width(self):
+        return 1
+
     def finalize(self):
         rv = np.asarray(self.field)
         rv.shape = self.nvals
@@ -411,9 +551,9 @@ cdef class WeightedMeanParticleField(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset,
                      np.float64_t ppos[3],
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
         cdef int ii[3]
         cdef int i
         for i in range(3):
@@ -422,6 +562,9 @@ cdef class WeightedMeanParticleField(ParticleDepositOperation):
         self.wf[ii[2], ii[1], ii[0], offset] += fields[0] * fields[1]
         return 0
 
+    cdef int stencil_width(self):
+        return 0
+
     def finalize(self):
         wf = np.asarray(self.wf)
         w = np.asarray(self.w)
@@ -444,12 +587,15 @@ cdef class MeshIdentifier(ParticleDepositOperation):
                       np.float64_t dds[3],
                       np.int64_t offset,
                       np.float64_t ppos[3],
-                      np.float64_t[:] fields,
+                      np.float64_t *fields,
                       np.int64_t domain_ind
-                      ) except -1:
+                      ) nogil except -1:
         fields[0] = domain_ind
         return 0
 
+    cdef int stencil_width(self):
+        return 0
+
     def finalize(self):
         return
 
@@ -471,9 +617,9 @@ cdef class NNParticleField(ParticleDepositOperation):
                      np.float64_t dds[3],
                      np.int64_t offset,
                      np.float64_t ppos[3],
-                     np.float64_t[:] fields,
+                     np.float64_t *fields,
                      np.int64_t domain_ind
-                     ) except -1:
+                     ) nogil except -1:
         # This one is a bit slow.  Every grid cell is going to be iterated
         # over, and we're going to deposit particles in it.
         cdef int i, j, k
@@ -22,7 +22,8 @@ from libc.math cimport sqrt
 
 from yt.utilities.lib.fp_utils cimport *
 from oct_container cimport Oct, OctreeContainer
-from .particle_deposit cimport kernel_func, get_kernel_func, gind
+from .particle_deposit cimport gind
+from yt.utilities.lib.particle_kernels cimport kernel_func, get_kernel_func
 from yt.utilities.lib.distance_queue cimport NeighborList, Neighbor_compare, \
     r2dist, DistanceQueue
 
@@ -39,19 +40,31 @@ cdef class ParticleSmoothOperation:
     cdef bint periodicity[3]
     # Note that we are preallocating here, so this is *not* threadsafe.
     cdef void (*pos_setup)(np.float64_t ipos[3], np.float64_t opos[3])
+    cdef int neighbor_search(self, np.float64_t pos[3], OctreeContainer octree,
+                             np.int64_t **nind, int *nsize, 
+                             np.int64_t nneighbors, np.int64_t domain_id, 
+                             Oct **oct = ?, int extra_layer = ?) except -1
+    cdef void _process_cells(self, OctreeContainer mesh_octree,
+                             np.int64_t[:] mdom_ind,
+                             np.float64_t[:,:] positions,
+                             np.float64_t[:,:] oct_positions,
+                             int domain_id, int domain_offset,
+                             periodicity, OctreeContainer particle_octree,
+                             np.int64_t[:] pdom_ind, geometry,
+                             DistanceQueue dist_queue,
+                             np.float64_t **field_pointers,
+                             np.float64_t **index_field_pointers) except *
     cdef void neighbor_process(self, int dim[3], np.float64_t left_edge[3],
                                np.float64_t dds[3], np.float64_t[:,:] ppos,
-                               np.float64_t **fields, 
-                               np.int64_t[:] doffs, np.int64_t **nind, 
-                               np.int64_t[:] pinds, np.int64_t[:] pcounts,
-                               np.int64_t offset, np.float64_t **index_fields,
+                               np.float64_t **fields,
+                               np.int64_t [:] doffs, np.int64_t **nind,
+                               np.int64_t [:] pinds, np.int64_t[:] pcounts,
+                               np.int64_t offset,
+                               np.float64_t **index_fields,
                                OctreeContainer octree, np.int64_t domain_id,
                                int *nsize, np.float64_t[:,:] oct_left_edges,
-                               np.float64_t[:,:] oct_dds, DistanceQueue dq)
-    cdef int neighbor_search(self, np.float64_t pos[3], OctreeContainer octree,
-                             np.int64_t **nind, int *nsize, 
-                             np.int64_t nneighbors, np.int64_t domain_id, 
-                             Oct **oct = ?, int extra_layer = ?)
+                               np.float64_t[:,:] oct_dds,
+                               DistanceQueue dq) except *
     cdef void neighbor_process_particle(self, np.float64_t cpos[3],
                                np.float64_t[:,:] ppos,
                                np.float64_t **fields, 
@@ -60,7 +73,7 @@ cdef class ParticleSmoothOperation:
                                np.int64_t offset,
                                np.float64_t **index_fields,
                                OctreeContainer octree, np.int64_t domain_id,
-                               int *nsize, DistanceQueue dq)
+                               int *nsize, DistanceQueue dq) except *
     cdef void neighbor_find(self,
                             np.int64_t nneighbors,
                             np.int64_t *nind,
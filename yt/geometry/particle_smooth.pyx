@@ -19,6 +19,7 @@ import numpy as np
 cimport cython
 
 from cpython.exc cimport PyErr_CheckSignals
+from cython.parallel cimport prange, parallel
 from libc.stdlib cimport malloc, free, realloc
 from libc.string cimport memmove
 from libc.math cimport sqrt, fabs, sin, cos
@@ -37,6 +38,138 @@ cdef void cart_coord_setup(np.float64_t ipos[3], np.float64_t opos[3]):
     opos[1] = ipos[1]
     opos[2] = ipos[2]
 
+class SmoothingNeighbors(object):
+    """The nearest particles to every cell of a set of octs.
+
+    For each of the ``ncells`` cells, ``counts`` holds how many neighbors
+    were found (or -1 if the cell was not visited), and ``pn`` the indices
+    of the neighboring particles, nearest first, as offsets into the
+    particles of the subset.  Their squared distances to ``cell_pos`` are
+    not stored, but computed again when the neighbors are used.  These do
+    not depend on the fields being smoothed or the kernel, so they can be
+    reused for every smoothed field of the same particles.
+    """
+    def __init__(self, ncells, nneighbors):
+        self.nneighbors = nneighbors
+        self.counts = np.zeros(ncells, dtype="int32") - 1
+        self.pn = np.zeros((ncells, nneighbors), dtype="int32")
+        self.cell_pos = np.zeros((ncells, 3), dtype="float64")
+
+    @staticmethod
+    def estimate_nbytes(ncells, nneighbors):
+        """The number of bytes the neighbors of *ncells* cells take."""
+        return ncells * (4 * (nneighbors + 1) + 24)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, a).nbytes
+                   for a in ("counts", "pn", "cell_pos"))
+
+def cartesian_positions(positions, geometry, periodicity):
+    # The cartesian positions of the particles, and the periodicity to
+    # search for neighbors with
+    if geometry == "cartesian":
+        return positions, periodicity
+    elif geometry == "spherical":
+        cart_positions = np.empty((positions.shape[0], 3), dtype="float64")
+        cart_positions[:,0] = positions[:,0] * \
+                              np.sin(positions[:,1]) * \
+                              np.cos(positions[:,2])
+        cart_positions[:,1] = positions[:,0] * \
+                              np.sin(positions[:,1]) * \
+                              np.sin(positions[:,2])
+        cart_positions[:,2] = positions[:,0] * \
+                              np.cos(positions[:,1])
+        return cart_positions, (False, False, False)
+    else:
+        raise NotImplementedError
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.initializedcheck(False)
+cdef int find_cell_neighbors(NeighborList *queue, int maxn,
+                             np.int64_t *nind, np.int64_t nneighbors,
+                             np.int64_t[:] doffs, np.int64_t[:] pcounts,
+                             np.int64_t[:] pinds, np.float64_t[:,:] ppos,
+                             np.float64_t cpos[3],
+                             np.float64_t[:,:] oct_left_edges,
+                             np.float64_t[:,:] oct_dds,
+                             np.float64_t DW[3], bint periodicity[3]) nogil:
+    # This is ParticleSmoothOperation.neighbor_find, with the insertion done
+    # by DistanceQueue.neighbor_eval inlined, so that it can be run without
+    # the GIL.  The maxn nearest particles in the Octs listed in nind are
+    # left in queue, nearest first, and their number is returned.
+    cdef int curn = 0
+    cdef int ni, i, j, k, di, nmove
+    cdef np.int64_t offset, pn, pc
+    cdef np.float64_t ex[2]
+    cdef np.float64_t DR[2]
+    cdef np.float64_t r2_trunc, r2, dist, dr
+    for ni in range(nneighbors):
+        # terminate early if all 8 corners of oct are farther away than
+        # most distant currently known neighbor
+        if curn == maxn:
+            r2_trunc = queue[curn - 1].r2
+            r2 = 0.0
+            for k in range(3):
+                ex[0] = oct_left_edges[nind[ni], k]
+                ex[1] = ex[0] + oct_dds[nind[ni], k]
+                dist = 0.0
+                DR[0] = (ex[0] - cpos[k])
+                DR[1] = (cpos[k] - ex[1])
+                for j in range(2):
+                    if not periodicity[k]:
+                        pass
+                    elif (DR[j] > DW[k]/2.0):
+                        DR[j] -= DW[k]
+                    elif (DR[j] < -DW[k]/2.0):
+                        DR[j] += DW[k]
+                    dist = fmax(dist, DR[j])
+                r2 += dist*dist
+            if r2 > r2_trunc:
+                continue
+        offset = doffs[nind[ni]]
+        pc = pcounts[nind[ni]]
+        for i in range(pc):
+            pn = pinds[offset + i]
+            if curn == maxn:
+                r2_trunc = queue[curn - 1].r2
+            else:
+                r2_trunc = -1
+            r2 = 0.0
+            for k in range(3):
+                dr = ppos[pn, k] - cpos[k]
+                if not periodicity[k]:
+                    pass
+                elif (dr > DW[k]/2.0):
+                    dr -= DW[k]
+                elif (dr < -DW[k]/2.0):
+                    dr += DW[k]
+                r2 += dr * dr
+                if r2_trunc >= 0.0 and r2 > r2_trunc:
+                    break
+            if r2_trunc >= 0.0 and r2 > r2_trunc:
+                continue
+            # Now insert in a sorted way
+            di = -1
+            for j in range(curn - 1, -1, -1):
+                if queue[j].r2 < r2:
+                    di = j
+                    break
+            # The outermost one is already too small.
+            if di == maxn - 1:
+                continue
+            nmove = imin(curn, maxn - 1) - (di + 1)
+            if nmove > 0:
+                memmove(<void *> (queue + di + 2), <void *> (queue + di + 1),
+                        sizeof(NeighborList) * nmove)
+            queue[di + 1].pn = pn
+            queue[di + 1].r2 = r2
+            if curn < maxn:
+                curn += 1
+    return curn
+
 cdef class ParticleSmoothOperation:
     def __init__(self, nvals, nfields, max_neighbors, kernel_name):
         # This is the set of cells, in grids, blocks or octs, we are handling.
@@ -52,24 +185,31 @@ cdef class ParticleSmoothOperation:
     def finalize(self, *args):
         raise NotImplementedError
 
+    def _setup_geometry(self, OctreeContainer mesh_octree, positions,
+                        periodicity, geometry):
+        # Returns the cartesian positions of the particles, having set up
+        # the cell positions, domain width and periodicity for the geometry.
+        cdef int i
+        cart_positions, periodicity = cartesian_positions(
+            np.asarray(positions), geometry, periodicity)
+        if geometry == "cartesian":
+            self.pos_setup = cart_coord_setup
+        else:
+            self.pos_setup = spherical_coord_setup
+        for i in range(3):
+            self.DW[i] = (mesh_octree.DRE[i] - mesh_octree.DLE[i])
+            self.periodicity[i] = periodicity[i]
+        return cart_positions
+
     @cython.cdivision(True)
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.initializedcheck(False)
-    def process_octree(self, OctreeContainer mesh_octree,
-                     np.int64_t [:] mdom_ind,
-                     np.float64_t[:,:] positions,
-                     np.float64_t[:,:] oct_positions,
-                     fields = None, int domain_id = -1,
-                     int domain_offset = 0,
-                     periodicity = (True, True, True),
-                     index_fields = None,
-                     OctreeContainer particle_octree = None,
-                     np.int64_t [:] pdom_ind = None,
-                     geometry = "cartesian"):
-        # This will be a several-step operation.
-        #
-        # We first take all of our particles and assign them to Octs.  If they
+    def _assign_particles(self, OctreeContainer particle_octree,
+                          np.int64_t[:] pdom_ind,
+                          np.float64_t[:,:] positions,
+                          int domain_id, int domain_offset):
+        # We take all of our particles and assign them to Octs.  If they
         # are not in an Oct, we will assume they are out of bounds.  Note that
         # this means that if we have loaded neighbor particles for which an Oct
         # does not exist, we are going to be discarding them -- so sparse
@@ -78,98 +218,31 @@ cdef class ParticleSmoothOperation:
         # overhead, but reduces complexity as we will now be able to use
         # argsort.
         #
-        # After the particles have been assigned to Octs, we process each Oct
-        # individually.  We will do this by calling "get" for the *first*
-        # particle in each set of Octs in the sorted list.  After this, we get
-        # neighbors for each Oct.
-        #
-        # Now, with the set of neighbors (and thus their indices) we allocate
-        # an array of particles and their fields, fill these in, and call our
-        # process function.
-        #
-        # This is not terribly efficient -- for starters, the neighbor function
-        # is not the most efficient yet.  We will also need to handle some
-        # mechanism of an expandable array for holding pointers to Octs, so
-        # that we can deal with >27 neighbors.
-        if particle_octree is None:
-            particle_octree = mesh_octree
-            pdom_ind = mdom_ind
-        cdef int nf, i, j, n
-        cdef int dims[3]
-        cdef np.float64_t[:] *field_check
-        cdef np.float64_t **field_pointers
-        cdef np.float64_t *field_vals
+        # This returns the particle indices sorted by Oct, the offset to and
+        # number of the particles of each Oct, and the extent of each Oct.
+        cdef int i, j
         cdef np.float64_t pos[3]
-        cdef np.float64_t dds[3]
-        cdef np.float64_t **octree_field_pointers
-        cdef int nsize = 0
-        cdef np.int64_t *nind = NULL
-        cdef OctInfo moi, poi
         cdef Oct *oct
-        cdef np.int64_t numpart, offset, local_ind, poff
-        cdef np.int64_t moff_p, moff_m
+        cdef Oct storage
+        cdef OctInfo oinfo
+        cdef np.int64_t offset, poff, moff_p
         cdef np.int64_t[:] pind, doff, pdoms, pcount
-        cdef np.int64_t[:,:] doff_m
-        cdef np.ndarray[np.float64_t, ndim=1] tarr
-        cdef np.ndarray[np.float64_t, ndim=4] iarr
-        cdef np.float64_t[:,:] cart_positions
         cdef np.float64_t[:,:] oct_left_edges, oct_dds
-        cdef OctInfo oinfo
-        if geometry == "cartesian":
-            self.pos_setup = cart_coord_setup
-            cart_positions = positions
-        elif geometry == "spherical":
-            self.pos_setup = spherical_coord_setup
-            cart_positions = np.empty((positions.shape[0], 3), dtype="float64")
-
-            cart_positions[:,0] = positions[:,0] * \
-                                  np.sin(positions[:,1]) * \
-                                  np.cos(positions[:,2])
-            cart_positions[:,1] = positions[:,0] * \
-                                  np.sin(positions[:,1]) * \
-                                  np.sin(positions[:,2])
-            cart_positions[:,2] = positions[:,0] * \
-                                  np.cos(positions[:,1])
-            periodicity = (False, False, False)
-        else:
-            raise NotImplementedError
-        dims[0] = dims[1] = dims[2] = (1 << mesh_octree.oref)
-        cdef int nz = dims[0] * dims[1] * dims[2]
-        numpart = positions.shape[0]
         # pcount is the number of particles per oct.
         pcount = np.zeros_like(pdom_ind)
         oct_left_edges = np.zeros((pdom_ind.shape[0], 3), dtype='float64')
         oct_dds = np.zeros_like(oct_left_edges)
         # doff is the offset to a given oct in the sorted particles.
         doff = np.zeros_like(pdom_ind) - 1
-        doff_m = np.zeros((mdom_ind.shape[0], 2), dtype="int64")
         moff_p = particle_octree.get_domain_offset(domain_id + domain_offset)
-        moff_m = mesh_octree.get_domain_offset(domain_id + domain_offset)
         # pdoms points particles at their octs.  So the value in this array, for
         # a given index, is the local oct index.
         pdoms = np.zeros(positions.shape[0], dtype="int64") - 1
-        nf = len(fields)
-        if fields is None:
-            fields = []
-        field_pointers = <np.float64_t**> alloca(sizeof(np.float64_t *) * nf)
-        for i in range(nf):
-            tarr = fields[i]
-            field_pointers[i] = <np.float64_t *> tarr.data
-        if index_fields is None:
-            index_fields = []
-        nf = len(index_fields)
-        index_field_pointers = <np.float64_t**> alloca(sizeof(np.float64_t *) * nf)
-        for i in range(nf):
-            iarr = index_fields[i]
-            index_field_pointers[i] = <np.float64_t *> iarr.data
-        for i in range(3):
-            self.DW[i] = (mesh_octree.DRE[i] - mesh_octree.DLE[i])
-            self.periodicity[i] = periodicity[i]
         cdef np.float64_t factor = (1 << (particle_octree.oref))
         for i in range(positions.shape[0]):
             for j in range(3):
                 pos[j] = positions[i, j]
-            oct = particle_octree.get(pos, &oinfo)
+            oct = particle_octree.get(pos, &oinfo, 99, &storage)
             if oct == NULL or (domain_id > 0 and oct.domain != domain_id):
                 continue
             # Note that this has to be our local index, not our in-file index.
@@ -199,37 +272,312 @@ cdef class ParticleSmoothOperation:
             # If we have yet to assign the starting index to this oct, we do so
             # now.
             if doff[offset] < 0: doff[offset] = i
-        #print domain_id, domain_offset, moff_p, moff_m
-        #raise RuntimeError
         # Now doff is full of offsets to the first entry in the pind that
         # refers to that oct's particles.
+        return pind, doff, pcount, oct_left_edges, oct_dds
+
+    @cython.cdivision(True)
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.initializedcheck(False)
+    def process_octree(self, OctreeContainer mesh_octree,
+                     np.int64_t [:] mdom_ind,
+                     np.float64_t[:,:] positions,
+                     np.float64_t[:,:] oct_positions,
+                     fields = None, int domain_id = -1,
+                     int domain_offset = 0,
+                     periodicity = (True, True, True),
+                     index_fields = None,
+                     OctreeContainer particle_octree = None,
+                     np.int64_t [:] pdom_ind = None,
+                     geometry = "cartesian",
+                     neighbors = None, int num_threads = 0,
+                     np.int64_t cache_size = -1):
+        # We apply our operation to every cell, in turn, using the list of
+        # its nearest particles.  If the neighbors of all of the cells fit
+        # in cache_size bytes (or cache_size is negative), they are found
+        # for every cell first (see find_neighbors), unless we have been
+        # handed the neighbors found by a previous call for the same
+        # particles and mesh, and returned, so that they can be reused for
+        # other fields and kernels.  Otherwise, as when cache_size is 0, the
+        # neighbors of each cell are found just before it is processed and
+        # None is returned, so that only the neighbors of one cell are held
+        # at a time.
+        if particle_octree is None:
+            particle_octree = mesh_octree
+            pdom_ind = mdom_ind
+        cdef int nf, i, j, k, m, n
+        cdef int dims[3]
+        cdef np.float64_t **field_pointers
+        cdef np.float64_t **index_field_pointers
+        cdef np.float64_t pos[3]
+        cdef np.float64_t ppos[3]
+        cdef np.int64_t o, offset, c, nsel, pn
+        cdef np.ndarray[np.float64_t, ndim=1] tarr
+        cdef np.ndarray[np.float64_t, ndim=4] iarr
+        cdef np.float64_t[:,:] cart_positions
+        dims[0] = dims[1] = dims[2] = (1 << mesh_octree.oref)
+        cdef int nz = dims[0] * dims[1] * dims[2]
+        nsel = (np.asarray(mdom_ind) >= 0).sum()
+        if fields is None:
+            fields = []
+        nf = len(fields)
+        field_pointers = <np.float64_t**> alloca(sizeof(np.float64_t *) * nf)
+        for i in range(nf):
+            tarr = fields[i]
+            field_pointers[i] = <np.float64_t *> tarr.data
+        if index_fields is None:
+            index_fields = []
+        nf = len(index_fields)
+        index_field_pointers = <np.float64_t**> alloca(sizeof(np.float64_t *) * nf)
+        for i in range(nf):
+            iarr = index_fields[i]
+            index_field_pointers[i] = <np.float64_t *> iarr.data
+        cdef DistanceQueue dist_queue = DistanceQueue(self.maxn)
+        if neighbors is None:
+            nbytes = SmoothingNeighbors.estimate_nbytes(nsel * nz, self.maxn)
+            if positions.shape[0] >= 2**31 or cache_size == 0 or \
+               0 < cache_size < nbytes:
+                self._process_cells(mesh_octree, mdom_ind, positions,
+                    oct_positions, domain_id, domain_offset, periodicity,
+                    particle_octree, pdom_ind, geometry, dist_queue,
+                    field_pointers, index_field_pointers)
+                return None
+            neighbors = self.find_neighbors(
+                mesh_octree, mdom_ind, positions, oct_positions, domain_id,
+                domain_offset, periodicity, particle_octree, pdom_ind,
+                geometry, num_threads)
+        if neighbors.nneighbors != self.maxn:
+            raise RuntimeError(
+                "Neighbor lists hold %s neighbors, but %s are needed." %
+                (neighbors.nneighbors, self.maxn))
+        cart_positions = self._setup_geometry(mesh_octree, positions,
+                                              periodicity, geometry)
+        cdef np.float64_t[:,::1] cell_pos = neighbors.cell_pos
+        cdef np.int32_t[:] counts = neighbors.counts
+        cdef np.int32_t[:,::1] nbr_pn = neighbors.pn
+        if counts.shape[0] != nsel * nz:
+            raise RuntimeError(
+                "Neighbor lists are for %s cells, but there are %s." %
+                (counts.shape[0], nsel * nz))
+        for o in range(nsel):
+            if (o % 10000) == 0:
+                PyErr_CheckSignals()
+            offset = o * nz
+            for i in range(dims[0]):
+                for j in range(dims[1]):
+                    for k in range(dims[2]):
+                        c = offset + gind(i, j, k, dims)
+                        if counts[c] < 0: continue
+                        dist_queue.curn = counts[c]
+                        for m in range(counts[c]):
+                            pn = nbr_pn[c, m]
+                            for n in range(3):
+                                ppos[n] = cart_positions[pn, n]
+                            dist_queue.neighbors[m].pn = pn
+                            dist_queue.neighbors[m].r2 = r2dist(
+                                ppos, &cell_pos[c, 0], self.DW,
+                                self.periodicity, -1)
+                        self.process(offset, i, j, k, dims, &cell_pos[c, 0],
+                                     field_pointers, index_field_pointers,
+                                     dist_queue)
+        return neighbors
+
+    @cython.cdivision(True)
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.initializedcheck(False)
+    cdef void _process_cells(self, OctreeContainer mesh_octree,
+                             np.int64_t[:] mdom_ind,
+                             np.float64_t[:,:] positions,
+                             np.float64_t[:,:] oct_positions,
+                             int domain_id, int domain_offset,
+                             periodicity, OctreeContainer particle_octree,
+                             np.int64_t[:] pdom_ind, geometry,
+                             DistanceQueue dist_queue,
+                             np.float64_t **field_pointers,
+                             np.float64_t **index_field_pointers) except *:
+        # After the particles have been assigned to Octs, we process each
+        # mesh Oct individually, finding the neighbors of each of its cells
+        # in turn, so that we only hold the neighbors of one cell at a time.
+        cdef int i, j
+        cdef int dims[3]
+        cdef np.float64_t pos[3]
+        cdef int nsize = 0
+        cdef np.int64_t *nind = NULL
+        cdef OctInfo moi
+        cdef Oct *oct
+        cdef Oct storage
+        cdef np.int64_t offset, moff_m
+        cdef np.int64_t[:] pind, doff, pcount
+        cdef np.float64_t[:,:] cart_positions
+        cdef np.float64_t[:,:] oct_left_edges, oct_dds
+        cart_positions = self._setup_geometry(mesh_octree, positions,
+                                              periodicity, geometry)
+        pind, doff, pcount, oct_left_edges, oct_dds = self._assign_particles(
+            particle_octree, pdom_ind, cart_positions, domain_id,
+            domain_offset)
+        dims[0] = dims[1] = dims[2] = (1 << mesh_octree.oref)
+        cdef int nz = dims[0] * dims[1] * dims[2]
+        moff_m = mesh_octree.get_domain_offset(domain_id + domain_offset)
         cdef np.ndarray[np.uint8_t, ndim=1] visited
         visited = np.zeros(mdom_ind.shape[0], dtype="uint8")
-        cdef int nproc = 0
-        # This should be thread-private if we ever go to OpenMP
-        cdef DistanceQueue dist_queue = DistanceQueue(self.maxn)
         dist_queue._setup(self.DW, self.periodicity)
         for i in range(oct_positions.shape[0]):
             if (i % 10000) == 0:
                 PyErr_CheckSignals()
             for j in range(3):
                 pos[j] = oct_positions[i, j]
-            oct = mesh_octree.get(pos, &moi)
+            oct = mesh_octree.get(pos, &moi, 99, &storage)
             offset = mdom_ind[oct.domain_ind - moff_m] * nz
             if visited[oct.domain_ind - moff_m] == 1: continue
             visited[oct.domain_ind - moff_m] = 1
             if offset < 0: continue
-            nproc += 1
             self.neighbor_process(
-                dims, moi.left_edge, moi.dds, cart_positions, field_pointers, doff,
-                &nind, pind, pcount, offset, index_field_pointers,
+                dims, moi.left_edge, moi.dds, cart_positions, field_pointers,
+                doff, &nind, pind, pcount, offset, index_field_pointers,
                 particle_octree, domain_id, &nsize, oct_left_edges,
                 oct_dds, dist_queue)
-        #print "VISITED", visited.sum(), visited.size,
-        #print 100.0*float(visited.sum())/visited.size
         if nind != NULL:
             free(nind)
 
+    @cython.cdivision(True)
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.initializedcheck(False)
+    def find_neighbors(self, OctreeContainer mesh_octree,
+                       np.int64_t [:] mdom_ind,
+                       np.float64_t[:,:] positions,
+                       np.float64_t[:,:] oct_positions,
+                       int domain_id = -1, int domain_offset = 0,
+                       periodicity = (True, True, True),
+                       OctreeContainer particle_octree = None,
+                       np.int64_t [:] pdom_ind = None,
+                       geometry = "cartesian", int num_threads = 0):
+        # This will be a several-step operation.
+        #
+        # We first assign all of our particles to Octs (see
+        # _assign_particles).
+        #
+        # After the particles have been assigned to Octs, we visit each cell
+        # of each mesh Oct and find the particle Octs neighboring it; cells
+        # that share the Oct they are in share the same set of neighboring
+        # Octs.
+        #
+        # Finally, the particles in the neighboring Octs of every cell are
+        # searched for the nearest ones, with the cells split between threads.
+        # The result is a SmoothingNeighbors object holding, for every cell,
+        # the indices of its nearest particles.
+        if particle_octree is None:
+            particle_octree = mesh_octree
+            pdom_ind = mdom_ind
+        if positions.shape[0] >= 2**31:
+            raise RuntimeError("Neighbor lists can only be kept for fewer "
+                               "than 2**31 particles.")
+        cdef int i, j, k, m, n
+        cdef int dims[3]
+        cdef np.float64_t pos[3]
+        cdef np.float64_t cpos[3]
+        cdef np.float64_t opos[3]
+        cdef int nsize = 0
+        cdef np.int64_t *nind = NULL
+        cdef np.int64_t nneighbors = 0
+        cdef OctInfo moi
+        cdef Oct *oct
+        cdef Oct storage
+        cdef Oct *poct
+        cdef Oct *last_poct
+        cdef np.int64_t offset, c, s, nset, nsel
+        cdef np.int64_t moff_m
+        cdef np.int64_t[:] pind, doff, pcount
+        cdef np.float64_t[:,:] cart_positions
+        cdef np.float64_t[:,:] oct_left_edges, oct_dds
+        cart_positions = self._setup_geometry(mesh_octree, positions,
+                                              periodicity, geometry)
+        pind, doff, pcount, oct_left_edges, oct_dds = self._assign_particles(
+            particle_octree, pdom_ind, cart_positions, domain_id,
+            domain_offset)
+        dims[0] = dims[1] = dims[2] = (1 << mesh_octree.oref)
+        cdef int nz = dims[0] * dims[1] * dims[2]
+        moff_m = mesh_octree.get_domain_offset(domain_id + domain_offset)
+        nsel = (np.asarray(mdom_ind) >= 0).sum()
+        cdef np.float64_t[:,::1] cell_pos = np.zeros((nsel * nz, 3),
+                                                     dtype="float64")
+        cdef np.int64_t[:] cell_set = np.zeros(nsel * nz, dtype="int64") - 1
+        set_octs = []
+        nset = 0
+        cdef np.ndarray[np.uint8_t, ndim=1] visited
+        visited = np.zeros(mdom_ind.shape[0], dtype="uint8")
+        for i in range(oct_positions.shape[0]):
+            if (i % 10000) == 0:
+                PyErr_CheckSignals()
+            for j in range(3):
+                pos[j] = oct_positions[i, j]
+            oct = mesh_octree.get(pos, &moi, 99, &storage)
+            offset = mdom_ind[oct.domain_ind - moff_m] * nz
+            if visited[oct.domain_ind - moff_m] == 1: continue
+            visited[oct.domain_ind - moff_m] = 1
+            if offset < 0: continue
+            poct = NULL
+            cpos[0] = moi.left_edge[0] + 0.5*moi.dds[0]
+            for j in range(dims[0]):
+                cpos[1] = moi.left_edge[1] + 0.5*moi.dds[1]
+                for k in range(dims[1]):
+                    cpos[2] = moi.left_edge[2] + 0.5*moi.dds[2]
+                    for m in range(dims[2]):
+                        self.pos_setup(cpos, opos)
+                        c = offset + gind(j, k, m, dims)
+                        last_poct = poct
+                        nneighbors = self.neighbor_search(opos,
+                            particle_octree, &nind, &nsize, nneighbors,
+                            domain_id, &poct, 0)
+                        # Cells within the same particle Oct share the Octs
+                        # their neighbors are drawn from.
+                        if poct != last_poct or nset == 0:
+                            set_octs.append(np.array(
+                                [nind[n] for n in range(nneighbors)
+                                 if nind[n] >= 0], dtype="int64"))
+                            nset += 1
+                        cell_set[c] = nset - 1
+                        for n in range(3):
+                            cell_pos[c, n] = opos[n]
+                        cpos[2] += moi.dds[2]
+                    cpos[1] += moi.dds[1]
+                cpos[0] += moi.dds[0]
+        if nind != NULL:
+            free(nind)
+        cdef np.int64_t[:] set_start = np.zeros(nset + 1, dtype="int64")
+        for s in range(nset):
+            set_start[s + 1] = set_start[s] + set_octs[s].size
+        cdef np.int64_t[:] cands = np.concatenate(
+            set_octs + [np.zeros(1, dtype="int64")])
+        neighbors = SmoothingNeighbors(nsel * nz, self.maxn)
+        cdef np.int32_t[:] counts = neighbors.counts
+        cdef np.int32_t[:,::1] nbr_pn = neighbors.pn
+        neighbors.cell_pos = np.asarray(cell_pos)
+        cdef int maxn = self.maxn
+        cdef NeighborList *queue
+        # Set if the queue of any thread could not be allocated
+        cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+        with nogil, parallel(num_threads=num_threads):
+            queue = <NeighborList *> malloc(sizeof(NeighborList) * maxn)
+            if queue == NULL:
+                failed[0] = 1
+            for c in prange(nsel * nz, schedule="dynamic"):
+                s = cell_set[c]
+                if s < 0 or queue == NULL: continue
+                n = find_cell_neighbors(queue, maxn, &cands[set_start[s]],
+                        set_start[s + 1] - set_start[s], doff, pcount, pind,
+                        cart_positions, &cell_pos[c, 0], oct_left_edges,
+                        oct_dds, self.DW, self.periodicity)
+                counts[c] = n
+                for m in range(n):
+                    nbr_pn[c, m] = <np.int32_t> queue[m].pn
+            free(queue)
+        if failed[0]:
+            raise MemoryError
+        return neighbors
+
     @cython.cdivision(True)
     @cython.boundscheck(False)
     @cython.wraparound(False)
@@ -259,6 +607,7 @@ cdef class ParticleSmoothOperation:
         cdef np.int64_t *nind = NULL
         cdef OctInfo moi, poi
         cdef Oct *oct
+        cdef Oct storage
         cdef Oct **neighbors = NULL
         cdef np.int64_t nneighbors, numpart, offset, local_ind
         cdef np.int64_t moff_p, moff_m, pind0, poff
@@ -301,7 +650,7 @@ cdef class ParticleSmoothOperation:
         for i in range(positions.shape[0]):
             for j in range(3):
                 pos[j] = positions[i, j]
-            oct = particle_octree.get(pos)
+            oct = particle_octree.get(pos, NULL, 99, &storage)
             if oct == NULL or (domain_id > 0 and oct.domain != domain_id):
                 continue
             # Note that this has to be our local index, not our in-file index.
@@ -356,15 +705,17 @@ cdef class ParticleSmoothOperation:
     cdef int neighbor_search(self, np.float64_t pos[3], OctreeContainer octree,
                              np.int64_t **nind, int *nsize,
                              np.int64_t nneighbors, np.int64_t domain_id,
-                             Oct **oct = NULL, int extra_layer = 0):
+                             Oct **oct = NULL,
+                             int extra_layer = 0) except -1:
         cdef OctInfo oi
+        cdef Oct storage
         cdef Oct *ooct
         cdef Oct **neighbors
         cdef Oct **first_layer
         cdef int j, total_neighbors = 0, initial_layer = 0
         cdef int layer_ind = 0
         cdef np.int64_t moff = octree.get_domain_offset(domain_id)
-        ooct = octree.get(pos, &oi)
+        ooct = octree.get(pos, &oi, 99, &storage)
         if oct != NULL and ooct == oct[0]:
             return nneighbors
         oct[0] = ooct
@@ -515,11 +866,12 @@ cdef class ParticleSmoothOperation:
                                OctreeContainer octree, np.int64_t domain_id,
                                int *nsize, np.float64_t[:,:] oct_left_edges,
                                np.float64_t[:,:] oct_dds,
-                               DistanceQueue dq):
+                               DistanceQueue dq) except *:
         # Note that we assume that fields[0] == smoothing length in the native
         # units supplied.  We can now iterate over every cell in the block and
         # every particle to find the nearest.  We will use a priority heap.
-        cdef int i, j, k, ntot, nntot, m, nneighbors
+        cdef int i, j, k
+        cdef np.int64_t nneighbors = 0
         cdef np.float64_t cpos[3]
         cdef np.float64_t opos[3]
         cdef Oct* oct = NULL
@@ -536,13 +888,6 @@ cdef class ParticleSmoothOperation:
                                        pinds, ppos, opos, oct_left_edges,
                                        oct_dds, dq)
                     # Now we have all our neighbors in our neighbor list.
-                    if dq.curn <-1*dq.maxn:
-                        ntot = nntot = 0
-                        for m in range(nneighbors):
-                            if nind[0][m] < 0: continue
-                            nntot += 1
-                            ntot += pcounts[nind[0][m]]
-                        print "SOMETHING WRONG", dq.curn, nneighbors, ntot, nntot
                     self.process(offset, i, j, k, dim, opos, fields,
                                  index_fields, dq)
                     cpos[2] += dds[2]
@@ -562,7 +907,7 @@ cdef class ParticleSmoothOperation:
                                np.float64_t **index_fields,
                                OctreeContainer octree,
                                np.int64_t domain_id, int *nsize,
-                               DistanceQueue dq):
+                               DistanceQueue dq) except *:
         # Note that we assume that fields[0] == smoothing length in the native
         # units supplied.  We can now iterate over every cell in the block and
         # every particle to find the nearest.  We will use a priority heap.
@@ -0,0 +1,139 @@
+"""
+A bounded cache of selection masks and counts, shared by every data object
+built on an index.
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+from collections import OrderedDict
+
+from yt.utilities.lib.bitarray import bitarray
+
+
+class SelectionMaskCache(object):
+    r"""A least-recently-used cache of selection masks.
+
+    Selectors hash their defining parameters, so two spheres (or regions,
+    or boolean combinations) built with identical arguments share a hash
+    even though they are distinct objects.  Masks are stored bit-packed,
+    keyed by that hash and by the object the mask was computed for (a grid
+    id, or an octree domain), and evicted in least-recently-used order once
+    *max_size* bytes are in use.  Counts are kept alongside the masks, so
+    that counting a selection does not require unpacking them.
+
+    Parameters
+    ----------
+    max_size : int
+        The number of bytes of packed masks to retain.  Zero disables the
+        cache.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._masks = OrderedDict()
+        self._counts = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _touch(self, store, key):
+        # OrderedDict.move_to_end is not available on Python 2.
+        value = store.pop(key)
+        store[key] = value
+        return value
+
+    def get_mask(self, selector, obj_key):
+        """
+        Return ``(mask, count)`` for *selector* applied to *obj_key*, or None
+        if it has not been cached.  A mask of None means nothing was
+        selected.
+        """
+        key = (hash(selector), obj_key)
+        if key not in self._masks:
+            self.misses += 1
+            return None
+        self.hits += 1
+        bits, shape, count = self._touch(self._masks, key)
+        if bits is None:
+            return None, 0
+        return bits.as_bool_array().reshape(shape), count
+
+    def get_count(self, selector, obj_key):
+        """
+        Return the number of cells of *obj_key* selected by *selector*, or
+        None if it has not been cached.
+        """
+        key = (hash(selector), obj_key)
+        if key in self._masks:
+            self.hits += 1
+            return self._touch(self._masks, key)[2]
+        if key in self._counts:
+            self.hits += 1
+            return self._touch(self._counts, key)
+        self.misses += 1
+        return None
+
+    def store_mask(self, selector, obj_key, mask, count):
+        if not self.enabled: return
+        if mask is None:
+            self.store_bits(selector, obj_key, None, None, count)
+        else:
+            self.store_bits(selector, obj_key, bitarray(arr = mask.ravel()),
+                            mask.shape, count)
+
+    def store_bits(self, selector, obj_key, bits, shape, count):
+        """
+        Store a mask that is already bit-packed, as returned by
+        ``SelectorObject.fill_grid_masks``.
+        """
+        if not self.enabled: return
+        key = (hash(selector), obj_key)
+        self._discard(key)
+        nbytes = 0 if bits is None else bits.ibuf.nbytes
+        if bits is None: shape = None
+        if nbytes > self.max_size:
+            self.store_count(selector, obj_key, count)
+            return
+        self._masks[key] = (bits, shape, count)
+        self.nbytes += nbytes
+        self._evict()
+
+    def store_count(self, selector, obj_key, count):
+        if not self.enabled: return
+        key = (hash(selector), obj_key)
+        self._counts.pop(key, None)
+        self._counts[key] = count
+        # Counts are tiny, but we still do not want them to grow without
+        # bound when iterating over many distinct objects.
+        while len(self._counts) > max(self.max_size >> 10, 1):
+            self._counts.popitem(last = False)
+
+    def _discard(self, key):
+        entry = self._masks.pop(key, None)
+        if entry is not None and entry[0] is not None:
+            self.nbytes -= entry[0].ibuf.nbytes
+
+    def _evict(self):
+        while self.nbytes > self.max_size and len(self._masks) > 0:
+            key = next(iter(self._masks))
+            self._discard(key)
+
+    def clear(self):
+        self._masks.clear()
+        self._counts.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._masks) + len(self._counts)
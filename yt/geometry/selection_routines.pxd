@@ -15,7 +15,7 @@ Geometry selection routine imports.
 #-----------------------------------------------------------------------------
 
 cimport numpy as np
-from oct_visitors cimport Oct, OctVisitor
+from oct_visitors cimport Oct, OctVisitor, LinearOct
 from grid_visitors cimport GridTreeNode, GridVisitorData, \
     grid_visitor_function, check_child_masked
 
@@ -40,6 +40,12 @@ cdef class SelectorObject:
                         int level,
                         OctVisitor visitor,
                         int visit_covered = ?)
+    cdef void recursively_visit_linear_octs(self, LinearOct *octs,
+                        np.int64_t ind,
+                        np.float64_t pos[3], np.float64_t dds[3],
+                        int level,
+                        OctVisitor visitor,
+                        int visit_covered = ?)
     cdef void visit_oct_cells(self, Oct *root, Oct *ch,
                               np.float64_t spos[3], np.float64_t sdds[3],
                               OctVisitor visitor, int i, int j, int k)
@@ -58,6 +64,10 @@ cdef class SelectorObject:
                                 np.ndarray[np.uint8_t, ndim=3, cast=True] child_mask,
                                 np.ndarray[np.uint8_t, ndim=3] mask,
                                 int level)
+    cdef np.int64_t fill_mask_packed(self, np.float64_t left_edge[3],
+                                     np.float64_t dds[3], np.int32_t dim[3],
+                                     int level, np.uint8_t *child_mask,
+                                     np.uint8_t *mask) nogil
     cdef void visit_grid_cells(self, GridVisitorData *data,
                     grid_visitor_function *func, np.uint8_t *cached_mask = ?)
 
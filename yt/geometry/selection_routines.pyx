@@ -28,7 +28,8 @@ from yt.utilities.lib.volume_container cimport \
     VolumeContainer
 from yt.utilities.lib.grid_traversal cimport \
     sampler_function, walk_volume
-from yt.utilities.lib.bitarray cimport ba_get_value, ba_set_value
+from yt.utilities.lib.bitarray cimport ba_get_value, ba_set_value, bitarray
+from cython.parallel import prange
 
 cdef extern from "math.h":
     double exp(double x) nogil
@@ -112,6 +113,10 @@ def mask_fill(np.ndarray[np.float64_t, ndim=1] out,
 
 cdef class SelectorObject:
 
+    # Whether select_cell may be called concurrently from several threads
+    # without the GIL; see fill_grid_masks.
+    _parallel_masks = True
+
     def __cinit__(self, dobj, *args):
         self._hash_initialized = 0
         cdef np.float64_t [:] DLE
@@ -163,6 +168,109 @@ cdef class SelectorObject:
                 gridi[n] = self.select_grid(LE, RE, levels[n, 0])
         return gridi.astype("bool")
 
+    @property
+    def can_fill_grid_masks(self):
+        # Selectors that supply their own fill_mask (slices, rays, ...) do
+        # not select grid cells purely through select_cell, so they cannot
+        # be batched by fill_grid_masks.
+        return self._parallel_masks and \
+            type(self).fill_mask is SelectorObject.fill_mask
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    def fill_grid_masks(self, left_edges, cell_widths, dims, levels,
+                        child_masks = None, int return_masks = 1,
+                        int num_threads = 0):
+        r"""Select the cells of many grids at once.
+
+        This is the batched equivalent of calling ``fill_mask`` on every grid
+        in turn.  The grids are processed in parallel, without the GIL, and
+        the masks are returned bit-packed, so that they can be stored
+        compactly (for instance in the index selection cache).
+
+        Parameters
+        ----------
+        left_edges : array_like, shape (N, 3)
+            The left edges of the grids, in code units.
+        cell_widths : array_like, shape (N, 3)
+            The cell widths (``dds``) of the grids, in code units.
+        dims : array_like, shape (N, 3)
+            The number of cells along each axis of every grid.
+        levels : array_like, shape (N,) or (N, 1)
+            The refinement level of every grid.
+        child_masks : list, optional
+            For every grid, either None (no cells are covered by finer grids)
+            or the grid's ``child_mask``.
+        return_masks : bool
+            If false, only the counts are computed.
+        num_threads : int
+            The number of OpenMP threads to use; zero uses the default.
+
+        Returns
+        -------
+        counts : array of int64
+            The number of selected cells in every grid.
+        masks : list
+            For every grid a :class:`~yt.utilities.lib.bitarray.bitarray`
+            holding its flattened mask, or None if nothing was selected (or
+            ``return_masks`` is false).
+        """
+        cdef int n
+        cdef np.int64_t offset
+        cdef int ng = len(left_edges)
+        cdef np.float64_t[:, ::1] LE = np.ascontiguousarray(
+            _ensure_code(left_edges), dtype="float64")
+        cdef np.float64_t[:, ::1] dds = np.ascontiguousarray(
+            _ensure_code(cell_widths), dtype="float64")
+        cdef np.int32_t[:, ::1] dim = np.ascontiguousarray(dims, dtype="int32")
+        cdef np.int32_t[::1] level = np.ascontiguousarray(
+            np.reshape(levels, ng), dtype="int32")
+        cdef np.int64_t[::1] counts = np.zeros(ng, dtype="int64")
+        cdef np.int64_t[::1] cm_offsets = np.empty(ng, dtype="int64")
+        cdef np.uint8_t[::1] cm_buf
+        cdef np.uint8_t *cm
+        cdef np.uint8_t **mask_bufs
+        cdef bitarray bits
+        if ng == 0:
+            return np.asarray(counts), []
+        cm_offsets[:] = -1
+        buffers = []
+        offset = 0
+        if child_masks is not None:
+            for n, child_mask in enumerate(child_masks):
+                if child_mask is None: continue
+                flat = np.asarray(child_mask, dtype="uint8").ravel()
+                buffers.append(flat)
+                cm_offsets[n] = offset
+                offset += flat.size
+        if offset == 0:
+            buffers = [np.zeros(1, dtype="uint8")]
+        cm_buf = np.concatenate(buffers)
+        masks = []
+        mask_bufs = <np.uint8_t **> malloc(sizeof(np.uint8_t *) * ng)
+        for n in range(ng):
+            mask_bufs[n] = NULL
+            if return_masks:
+                bits = bitarray(size = dim[n, 0] * dim[n, 1] * dim[n, 2])
+                mask_bufs[n] = bits.buf
+                masks.append(bits)
+        for n in prange(ng, nogil = True, schedule = "dynamic",
+                        num_threads = num_threads):
+            cm = NULL
+            if cm_offsets[n] >= 0:
+                cm = &cm_buf[cm_offsets[n]]
+            counts[n] = self.fill_mask_packed(&LE[n, 0], &dds[n, 0],
+                                              &dim[n, 0], level[n],
+                                              cm, mask_bufs[n])
+        free(mask_bufs)
+        if return_masks:
+            masks = [m if c > 0 else None
+                     for m, c in zip(masks, np.asarray(counts))]
+        else:
+            masks = [None] * ng
+        return np.asarray(counts), masks
+
     def count_octs(self, OctreeContainer octree, int domain_id = -1):
         cdef oct_visitors.CountTotalOcts visitor
         visitor = oct_visitors.CountTotalOcts(octree, domain_id)
@@ -275,6 +383,99 @@ cdef class SelectorObject:
             this_level = 0 # We turn this off for the second pass.
             iter += 1
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef void recursively_visit_linear_octs(self, LinearOct *octs,
+                        np.int64_t ind,
+                        np.float64_t pos[3], np.float64_t dds[3],
+                        int level,
+                        OctVisitor visitor,
+                        int visit_covered = 0):
+        # This is recursively_visit_octs for the octs of a
+        # LinearOctreeContainer, which have no pointers to their children.
+        # Visitors and selectors are handed an Oct filled in from octs[ind];
+        # its children are never followed, only compared to NULL, so when
+        # the oct has children we point them at the oct itself.
+        cdef Oct root
+        cdef LinearOct *lo = &octs[ind]
+        root.file_ind = lo.file_ind
+        root.domain_ind = ind
+        root.domain = lo.domain
+        root.children = NULL
+        if lo.children != 0:
+            root.children = <Oct **> &root
+        cdef np.float64_t LE[3]
+        cdef np.float64_t RE[3]
+        cdef np.float64_t sdds[3]
+        cdef np.float64_t spos[3]
+        cdef int i, j, k, res
+        cdef np.int64_t ci
+        cdef Oct *ch
+        for i in range(3):
+            sdds[i] = dds[i]/2.0
+            LE[i] = pos[i] - dds[i]/2.0
+            RE[i] = pos[i] + dds[i]/2.0
+        res = self.select_grid(LE, RE, level, &root)
+        if res == 1 and visitor.domain > 0 and root.domain != visitor.domain:
+            res = -1
+        cdef int increment = 1
+        cdef int next_level, this_level
+        next_level = this_level = 1
+        if res == -1:
+            next_level = 1
+            this_level = 0
+        elif level == self.max_level:
+            next_level = 0
+        elif level < self.min_level or level > self.max_level:
+            this_level = 0
+        if res == 0 and this_level == 1:
+            return
+        cdef int iter = 1 - visit_covered
+        while iter < 2:
+            # The first child, if any, directly follows its parent.
+            ci = ind + 1
+            spos[0] = pos[0] - sdds[0]/2.0
+            for i in range(2):
+                spos[1] = pos[1] - sdds[1]/2.0
+                for j in range(2):
+                    spos[2] = pos[2] - sdds[2]/2.0
+                    for k in range(2):
+                        ch = NULL
+                        if next_level == 1 and \
+                           lo.children & (1 << cind(i, j, k)):
+                            ch = &root
+                        if iter == 1 and ch != NULL:
+                            visitor.pos[0] = (visitor.pos[0] << 1) + i
+                            visitor.pos[1] = (visitor.pos[1] << 1) + j
+                            visitor.pos[2] = (visitor.pos[2] << 1) + k
+                            visitor.level += 1
+                            self.recursively_visit_linear_octs(
+                                octs, ci, spos, sdds, level + 1, visitor,
+                                visit_covered)
+                            visitor.pos[0] = (visitor.pos[0] >> 1)
+                            visitor.pos[1] = (visitor.pos[1] >> 1)
+                            visitor.pos[2] = (visitor.pos[2] >> 1)
+                            visitor.level -= 1
+                        elif this_level == 1 and visitor.oref > 0:
+                            visitor.global_index += increment
+                            increment = 0
+                            self.visit_oct_cells(&root, ch, spos, sdds,
+                                                 visitor, i, j, k)
+                        elif this_level == 1 and increment == 1:
+                            visitor.global_index += increment
+                            increment = 0
+                            visitor.ind[0] = visitor.ind[1] = visitor.ind[2] = 0
+                            visitor.visit(&root, 1)
+                        if lo.children & (1 << cind(i, j, k)):
+                            # Skip over this child's subtree to the next one.
+                            ci = octs[ci].next
+                        spos[2] += sdds[2]
+                    spos[1] += sdds[1]
+                spos[0] += sdds[0]
+            this_level = 0
+            iter += 1
+
     cdef void visit_oct_cells(self, Oct *root, Oct *ch,
                               np.float64_t spos[3], np.float64_t sdds[3],
                               OctVisitor visitor, int i, int j, int k):
@@ -483,6 +684,44 @@ cdef class SelectorObject:
                 pos[0] += dds[0]
         return total
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef np.int64_t fill_mask_packed(self, np.float64_t left_edge[3],
+                                     np.float64_t dds[3], np.int32_t dim[3],
+                                     int level, np.uint8_t *child_mask,
+                                     np.uint8_t *mask) nogil:
+        # This is fill_mask_selector operating on flattened buffers, so that
+        # it can be called from fill_grid_masks without the GIL.  A NULL
+        # child_mask means no cells are covered, and a NULL mask means we
+        # only count; otherwise selected cells are set in the (zeroed) bit
+        # array.
+        cdef int i, j, k
+        cdef np.int64_t ind = 0, total = 0
+        cdef int this_level = 0
+        cdef np.float64_t pos[3]
+        if level < self.min_level or level > self.max_level:
+            return 0
+        if level == self.max_level:
+            this_level = 1
+        pos[0] = left_edge[0] + dds[0] * 0.5
+        for i in range(dim[0]):
+            pos[1] = left_edge[1] + dds[1] * 0.5
+            for j in range(dim[1]):
+                pos[2] = left_edge[2] + dds[2] * 0.5
+                for k in range(dim[2]):
+                    if this_level == 1 or child_mask == NULL \
+                            or child_mask[ind] == 1:
+                        if self.select_cell(pos, dds) > 0:
+                            total += 1
+                            if mask != NULL:
+                                ba_set_value(mask, ind, 1)
+                    ind += 1
+                    pos[2] += dds[2]
+                pos[1] += dds[1]
+            pos[0] += dds[0]
+        return total
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
@@ -971,6 +1210,7 @@ region_selector = RegionSelector
 cdef class CutRegionSelector(SelectorObject):
     cdef set _positions
     cdef tuple _conditionals
+    _parallel_masks = False
 
     def __init__(self, dobj):
         positions = np.array([dobj['index', 'x'], dobj['index', 'y'], dobj['index', 'z']]).T
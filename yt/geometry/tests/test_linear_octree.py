@@ -0,0 +1,172 @@
+"""
+Tests for linear octrees
+
+
+
+"""
+
+#-----------------------------------------------------------------------------
+# Copyright (c) 2017, yt Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+
+from yt.geometry import particle_smooth
+from yt.geometry.oct_container import \
+    LinearOctreeContainer, \
+    OctreeContainer, \
+    RAMSESOctreeContainer
+from yt.geometry.particle_oct_container import \
+    ParticleOctreeContainer
+from yt.geometry.oct_container import _ORDER_MAX
+from yt.geometry.selection_routines import RegionSelector, AlwaysSelector
+from yt.testing import \
+    fake_particle_ds, \
+    assert_equal, \
+    assert_raises, \
+    assert_true
+from yt.utilities.lib.geometry_utils import get_morton_indices
+
+class FakeDS:
+    domain_left_edge = np.zeros(3)
+    domain_right_edge = np.ones(3)
+    domain_width = np.ones(3)
+    periodicity = (False, False, False)
+
+class FakeRegion:
+    def __init__(self, left_edge, right_edge):
+        self.ds = FakeDS()
+        self.left_edge = np.array(left_edge, dtype="float64")
+        self.right_edge = np.array(right_edge, dtype="float64")
+
+def _ramses_octree():
+    # Eight roots, split between two domains and inserted out of Morton
+    # order, with some of them refined twice.
+    oct_handler = RAMSESOctreeContainer([2, 2, 2], np.zeros(3), np.ones(3))
+    c = np.array([0.25, 0.75])
+    roots = np.array([[x, y, z] for x in c for y in c for z in c])
+    roots = roots[[5, 0, 3, 6, 1, 7, 2, 4]]
+    level1 = np.array([[0.625, 0.125, 0.375], [0.875, 0.375, 0.375],
+                       [0.125, 0.125, 0.125], [0.375, 0.625, 0.875]])
+    level2 = np.array([[0.0625, 0.0625, 0.1875], [0.3125, 0.6875, 0.8125]])
+    oct_handler.allocate_domains([7, 7], 8)
+    oct_handler.add(1, 0, roots[:4])
+    oct_handler.add(2, 0, roots[4:])
+    oct_handler.add(1, 1, level1[2:])
+    oct_handler.add(2, 1, level1[:2])
+    oct_handler.add(1, 2, level2[:1])
+    oct_handler.add(2, 2, level2[1:])
+    oct_handler.finalize()
+    return oct_handler
+
+def _sorted_cells(oct_handler, selector):
+    fc = oct_handler.fcoords(selector)
+    ires = oct_handler.ires(selector)
+    order = np.lexsort((ires, fc[:, 2], fc[:, 1], fc[:, 0]))
+    return fc[order], ires[order], oct_handler.fwidth(selector)[order]
+
+def test_linear_octree():
+    octree = _ramses_octree()
+    linear = octree.compact()
+    assert_true(isinstance(linear, LinearOctreeContainer))
+    assert_equal(linear.nocts, octree.nocts)
+    assert_equal(linear.nocts, 14)
+    assert_equal(linear.num_domains, 2)
+    assert_equal(linear.fill_style, octree.fill_style)
+    selectors = [AlwaysSelector(None),
+                 RegionSelector(FakeRegion([0.1, 0.0, 0.05],
+                                           [0.4, 0.8, 0.9]))]
+    for selector in selectors:
+        assert_equal(linear.domain_identify(selector),
+                     octree.domain_identify(selector))
+        for domain_id in (-1, 1, 2):
+            assert_equal(selector.count_octs(linear, domain_id),
+                         selector.count_octs(octree, domain_id))
+            assert_equal(selector.count_oct_cells(linear, domain_id),
+                         selector.count_oct_cells(octree, domain_id))
+        for a, b in zip(_sorted_cells(linear, selector),
+                        _sorted_cells(octree, selector)):
+            assert_equal(a, b)
+        for domain_id in (1, 2):
+            inds = [np.array(f) for f in
+                    zip(*sorted(zip(*linear.file_index_octs(selector,
+                                                            domain_id))))]
+            inds0 = [np.array(f) for f in
+                     zip(*sorted(zip(*octree.file_index_octs(selector,
+                                                             domain_id))))]
+            assert_equal(inds, inds0)
+    # Octs are found by position, and know their level and edges
+    np.random.seed(0x4d3d3d3)
+    pos = np.random.random((100, 3))
+    for oh in (octree, linear):
+        ids, octs = oh.locate_positions(pos)
+        levels = [octs[i]["level"] for i in ids]
+        edges = [octs[i]["left_edge"] for i in ids]
+        if oh is octree:
+            levels0, edges0 = levels, edges
+    assert_equal(levels, levels0)
+    assert_equal(edges, edges0)
+    assert_true(linear.memory_usage()["total"] <
+                octree.memory_usage()["total"])
+    assert_raises(NotImplementedError, linear.add, 1, 0, pos)
+
+def test_linear_particle_octree():
+    np.random.seed(int(0x4d3d3d3))
+    DLE = np.zeros(3)
+    DRE = np.ones(3) * 10.0
+    dx = (DRE - DLE) / (2**_ORDER_MAX)
+    pos = np.random.normal(0.5, scale=0.05, size=(4096, 3)) * (DRE-DLE) + DLE
+    for i in range(3):
+        np.clip(pos[:, i], DLE[i], DRE[i], pos[:, i])
+    octree = ParticleOctreeContainer((1, 1, 1), DLE, DRE)
+    octree.n_ref = 32
+    morton = get_morton_indices(np.floor((pos - DLE)/dx).astype("uint64"))
+    morton.sort()
+    octree.add(morton)
+    octree.finalize()
+    linear = octree.compact()
+    always = AlwaysSelector(None)
+    # With a single root the octs are visited in the same order.
+    assert_equal(linear.ires(always), octree.ires(always))
+    assert_equal(linear.fcoords(always), octree.fcoords(always))
+    assert_equal(linear.save_octree()["octree"],
+                 octree.save_octree()["octree"])
+    loaded = LinearOctreeContainer.load_octree(octree.save_octree())
+    assert_equal(loaded.fcoords(always), OctreeContainer.load_octree(
+        octree.save_octree()).fcoords(always))
+    usage = octree.memory_usage()
+    assert_equal(usage["octs"], octree.nocts * 32)
+    assert_equal(sum(usage[k] for k in ("octs", "children", "roots")),
+                 usage["total"])
+    assert_equal(linear.memory_usage()["children"], 0)
+
+def test_linear_octree_smoothing():
+    # The octs of a linear octree have no neighbors, so smoothing onto one
+    # indexes the particles with an octree of their own.
+    np.random.seed(0x4d3d3d3)
+    ds = fake_particle_ds(npart = 16**3)
+    dd = ds.all_data()
+    ds.index._identify_base_chunk(dd)
+    subset = dd._chunk_info[0]
+    pos = dd["all", "particle_position"]
+    mass = np.array(dd["all", "particle_mass"])
+    vals = subset.smooth(pos, [mass], method="idw", nneighbors=16,
+                         create_octree=True)
+    subset.oct_handler = subset.oct_handler.compact()
+    subset._domain_ind = None
+    assert_true(isinstance(subset.oct_handler, LinearOctreeContainer))
+    assert_equal(subset.smooth(pos, [mass], method="idw", nneighbors=16),
+                 vals)
+    # Searching the linear octree itself for neighbors is an error, whether
+    # the neighbors are kept or not.
+    for cache_size in (-1, 0):
+        op = particle_smooth.idw_smooth(vals[0].shape, 1, 16, "cubic")
+        op.initialize()
+        assert_raises(NotImplementedError, op.process_octree,
+                      subset.oct_handler, subset.domain_ind, pos,
+                      subset.fcoords, [mass], -1, 0, ds.periodicity, None,
+                      None, None, "cartesian", None, 1, cache_size)
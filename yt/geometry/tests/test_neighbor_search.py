@@ -15,12 +15,17 @@ Tests for neighbor finding
 
 import numpy as np
 
+from yt.config import ytcfg
 from yt.fields.particle_fields import \
     add_nearest_neighbor_field
+from yt.geometry import particle_smooth
+from yt.geometry.particle_smooth import \
+    SmoothingNeighbors
 from yt.testing import \
     fake_particle_ds, \
     assert_equal, \
-    assert_array_almost_equal
+    assert_array_almost_equal, \
+    assert_true
 
 
 def test_neighbor_search():
@@ -56,3 +61,69 @@ def test_neighbor_search():
         #dd.field_data.pop(("all", "particle_radius"))
     assert_equal((min_in == 63).sum(), min_in.size)
     assert_array_almost_equal(nearest_neighbors, all_neighbors)
+
+def test_smoothing_neighbors():
+    np.random.seed(0x4d3d3d3)
+    ds = fake_particle_ds(npart = 16**3)
+    dd = ds.all_data()
+    ds.index._identify_base_chunk(dd)
+    subset = dd._chunk_info[0]
+    pos = dd["all", "particle_position"]
+    vals = [np.array(dd["all", f]) for f in
+            ("particle_mass", "particle_velocity_x")]
+    old = ytcfg.get("yt", "smoothing_neighbor_cache_size")
+    results = []
+    try:
+        for cache_size, num_threads in (("0", 1), ("256", 4)):
+            ytcfg["yt", "smoothing_neighbor_cache_size"] = cache_size
+            subset._smoothing_neighbors = None
+            results.append([subset.smooth(pos, [v], method="idw",
+                                          nneighbors=16,
+                                          num_threads=num_threads)
+                            for v in vals])
+            neighbors = subset._smoothing_neighbors
+            assert_true((neighbors is None) == (cache_size == "0"))
+    finally:
+        ytcfg["yt", "smoothing_neighbor_cache_size"] = old
+    # The neighbors found for the first field were reused for the second,
+    # and match those found with one thread and no cache.
+    assert_equal(results[1], results[0])
+    assert_true(isinstance(neighbors[1], SmoothingNeighbors))
+    # The neighbors of every cell are the nearest particles to it
+    neighbors = neighbors[1]
+    assert_true(np.all(neighbors.counts == 16))
+    p = np.array(pos)
+    for c in range(0, neighbors.counts.size, 97):
+        dr = p - neighbors.cell_pos[c]
+        dr -= np.rint(dr / ds.domain_width.d) * ds.domain_width.d
+        r2 = (dr * dr).sum(axis=1)
+        assert_array_almost_equal(r2[neighbors.pn[c]], np.sort(r2)[:16])
+
+def test_smoothing_without_cache():
+    # With no cache, the neighbors of the cells are never all held at once.
+    class NoNeighbors(object):
+        def __init__(self, *args):
+            raise RuntimeError("Neighbor lists were allocated.")
+        @staticmethod
+        def estimate_nbytes(ncells, nneighbors):
+            return SmoothingNeighbors.estimate_nbytes(ncells, nneighbors)
+    np.random.seed(0x4d3d3d3)
+    ds = fake_particle_ds(npart = 16**3)
+    dd = ds.all_data()
+    ds.index._identify_base_chunk(dd)
+    subset = dd._chunk_info[0]
+    pos = dd["all", "particle_position"]
+    mass = np.array(dd["all", "particle_mass"])
+    old = ytcfg.get("yt", "smoothing_neighbor_cache_size")
+    try:
+        ytcfg["yt", "smoothing_neighbor_cache_size"] = "256"
+        cached = subset.smooth(pos, [mass], method="idw", nneighbors=16)
+        ytcfg["yt", "smoothing_neighbor_cache_size"] = "0"
+        subset._smoothing_neighbors = None
+        particle_smooth.SmoothingNeighbors = NoNeighbors
+        streamed = subset.smooth(pos, [mass], method="idw", nneighbors=16)
+    finally:
+        particle_smooth.SmoothingNeighbors = SmoothingNeighbors
+        ytcfg["yt", "smoothing_neighbor_cache_size"] = old
+    assert_true(subset._smoothing_neighbors is None)
+    assert_equal(streamed, cached)
@@ -1,9 +1,14 @@
+import numpy as np
+
 from yt.utilities.exceptions import \
     YTBoundsDefinitionError
 
 from yt.convenience import \
     load
 from yt.testing import \
+    assert_allclose, \
+    assert_equal, \
+    fake_particle_ds, \
     fake_random_ds, \
     requires_file
 from numpy.testing import \
@@ -28,3 +33,35 @@ def test_one_zone_octree_deposit():
 
     sp = ds.sphere(hpos, hrvir*10)
     assert sp['deposit', 'io_cic'].shape == (1,)
+
+def test_threaded_deposit():
+    # Threaded deposits match serial ones, exactly on octrees, where each oct
+    # is handled by one thread, and to round-off on grids, where a cell may be
+    # deposited into from two slabs.
+    methods = ["count", "sum", "cic", "weighted_mean", "std", "nearest"]
+    for ds in (fake_particle_ds(npart=4096),
+               fake_random_ds(32, nprocs=4, particles=4096)):
+        dd = ds.all_data()
+        pos = dd["all", "particle_position"]
+        mass = np.array(dd["all", "particle_mass"])
+        vx = np.array(dd["all", "particle_velocity_x"])
+        octree = not hasattr(ds.index, "grids")
+        if octree:
+            ds.index._identify_base_chunk(dd)
+            objs = dd._chunk_info
+        else:
+            objs = ds.index.grids
+        for obj in objs:
+            for method in methods:
+                serial = obj.deposit(pos, [vx, mass], method=method)
+                threaded = obj.deposit(pos, [vx, mass], method=method,
+                                       num_threads=4)
+                if octree:
+                    assert_equal(threaded, serial)
+                else:
+                    assert_allclose(threaded, serial, rtol=1e-12)
+            ids = [np.zeros(pos.shape[0]), np.zeros(pos.shape[0])]
+            for i, num_threads in enumerate((1, 4)):
+                obj.deposit(pos, [ids[i]], method="mesh_id",
+                            num_threads=num_threads)
+            assert_equal(ids[1], ids[0])
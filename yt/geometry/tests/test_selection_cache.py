@@ -0,0 +1,96 @@
+import numpy as np
+
+from yt.geometry.selection_cache import SelectionMaskCache
+from yt.testing import \
+    fake_amr_ds, \
+    fake_octree_ds, \
+    fake_random_ds, \
+    assert_equal, \
+    assert_true
+
+def test_repeated_selection():
+    ds = fake_random_ds(32, nprocs = 16)
+    cache = ds.index.selection_cache
+    sp1 = ds.sphere("c", (0.2, "unitary"))
+    rho1 = sp1["density"]
+    misses = cache.misses
+    assert_true(len(cache) > 0)
+    # A second sphere with identical parameters reuses every mask and count
+    sp2 = ds.sphere("c", (0.2, "unitary"))
+    assert_true(sp1 is not sp2)
+    assert_equal(sp2["density"], rho1)
+    assert_equal(cache.misses, misses)
+    # A different sphere does not
+    sp3 = ds.sphere("c", (0.3, "unitary"))
+    sp3["density"]
+    assert_true(cache.misses > misses)
+    assert_true(sp3["density"].size > rho1.size)
+
+def test_amr_selection():
+    ds = fake_amr_ds()
+    for i in range(2):
+        reg = ds.r[0.2:0.6, 0.1:0.7, :]
+        assert_equal(reg["index", "ones"].size,
+                     reg.quantities.total_quantity(("index", "ones")))
+        assert_equal(reg["index", "ones"].size, reg.size)
+
+def test_lru_eviction():
+    class FakeSelector(object):
+        def __init__(self, h):
+            self.h = h
+        def __hash__(self):
+            return self.h
+    masks = [np.random.random((16, 16, 16)) > 0.5 for i in range(4)]
+    # Room for three packed masks
+    cache = SelectionMaskCache(3 * 16**3 // 8)
+    for i, mask in enumerate(masks):
+        cache.store_mask(FakeSelector(i), 0, mask, mask.sum())
+    assert_equal(cache.get_mask(FakeSelector(0), 0), None)
+    for i, mask in enumerate(masks[1:]):
+        m, count = cache.get_mask(FakeSelector(i + 1), 0)
+        assert_equal(m, mask)
+        assert_equal(count, mask.sum())
+        assert_equal(cache.get_count(FakeSelector(i + 1), 0), mask.sum())
+    cache.store_mask(FakeSelector(9), 1, None, 0)
+    assert_equal(cache.get_mask(FakeSelector(9), 1), (None, 0))
+    disabled = SelectionMaskCache(0)
+    disabled.store_mask(FakeSelector(0), 0, masks[0], masks[0].sum())
+    assert_equal(len(disabled), 0)
+
+def test_octree_selection():
+    ds = fake_octree_ds()
+    cache = ds.index.selection_cache
+    reg1 = ds.r[0.1:0.6, 0.2:0.9, :]
+    rho1 = reg1["density"]
+    misses = cache.misses
+    reg2 = ds.r[0.1:0.6, 0.2:0.9, :]
+    assert_equal(reg2["density"], rho1)
+    assert_equal(cache.misses, misses)
+
+def test_fill_grid_masks():
+    ds = fake_amr_ds()
+    objs = [ds.sphere("c", (0.3, "unitary")),
+            ds.r[0.2:0.6, 0.1:0.7, :],
+            ds.disk("c", [0.2, 0.6, 0.1], 0.3, 0.1),
+            ds.ellipsoid("c", 0.3, 0.2, 0.1, np.array([1.0, 0.0, 0.0]), 0.1)]
+    objs.append(ds.intersection(objs[:2]))
+    grids = ds.index.grids
+    for obj in objs:
+        selector = obj.selector
+        assert_true(selector.can_fill_grid_masks)
+        counts, masks = selector.fill_grid_masks(
+            np.array([g.LeftEdge.d for g in grids]),
+            np.array([g.dds.d for g in grids]),
+            np.array([g.ActiveDimensions for g in grids]),
+            np.array([g.Level for g in grids]),
+            child_masks = [g.child_mask for g in grids])
+        for g, count, bits in zip(grids, counts, masks):
+            mask = selector.fill_mask(g)
+            if mask is None:
+                assert_equal(count, 0)
+                assert_equal(bits, None)
+                continue
+            assert_equal(count, mask.sum())
+            assert_equal(bits.as_bool_array().reshape(mask.shape), mask)
+        assert_equal(obj["index", "ones"].size, counts.sum())
+    assert_true(not ds.slice(0, 0.5).selector.can_fill_grid_masks)
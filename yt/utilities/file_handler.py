@@ -13,8 +13,13 @@ A wrapper class for h5py file objects.
 # The full license is in the file COPYING.txt, distributed with this software.
 #-----------------------------------------------------------------------------
 
+import os
+import numpy as np
+
+from yt.config import ytcfg
 from yt.utilities.on_demand_imports import _h5py as h5py
 from yt.utilities.on_demand_imports import NotAModule
+from collections import OrderedDict
 from contextlib import contextmanager
 
 
@@ -123,3 +128,179 @@ class NetCDF4FileHandler(object):
         ds = netCDF4.Dataset(self.filename)
         yield ds
         ds.close()
+
+
+class MemoryMappedFileHandler(object):
+    r"""Read-only access to the records of a raw binary file.
+
+    Records are returned as arrays that view the file through ``np.memmap``,
+    so nothing is copied out of the page cache until the caller selects,
+    masks or converts the data, and reading the same record twice costs
+    nothing extra.  If memory mapping is disabled (through the
+    ``memory_mapped_io`` configuration option) or not possible, records are
+    read with ``np.fromfile`` instead, behind the same interface.
+
+    Frontends can keep record offsets they compute for this file in the
+    ``offsets`` dictionary, so that they are only computed once.
+
+    Parameters
+    ----------
+    filename : str
+        The file to read.
+    mmap : bool, optional
+        Whether to memory-map the file.  Defaults to the ``memory_mapped_io``
+        configuration option.
+    """
+    handle = None
+
+    def __init__(self, filename, mmap=None):
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+        self.mtime = os.path.getmtime(filename)
+        self.offsets = {}
+        if mmap is None:
+            mmap = ytcfg.getboolean("yt", "memory_mapped_io")
+        if mmap and self.size > 0:
+            try:
+                self.handle = np.memmap(filename, dtype="uint8", mode="r")
+            except (IOError, OSError, ValueError):
+                self.handle = None
+
+    @property
+    def mapped(self):
+        return self.handle is not None
+
+    def _check(self, offset, nbytes):
+        if offset < 0 or offset + nbytes > self.size:
+            raise IOError("Cannot read %s bytes at offset %s of %s, which "
+                          "is %s bytes long." %
+                          (nbytes, offset, self.filename, self.size))
+
+    def record(self, offset, dtype, count, shape=None, order="C"):
+        """
+        Return the *count* values of type *dtype* that start *offset* bytes
+        into the file, optionally reshaped to *shape* in *order*.
+        """
+        dtype = np.dtype(dtype)
+        count = int(count)
+        if shape is None:
+            shape = (count,)
+        self._check(offset, count * dtype.itemsize)
+        if self.handle is not None:
+            return np.ndarray(shape, dtype=dtype, buffer=self.handle,
+                              offset=offset, order=order)
+        with open(self.filename, "rb") as f:
+            f.seek(offset)
+            arr = np.fromfile(f, dtype=dtype, count=count)
+        return arr.reshape(shape, order=order)
+
+    def read_int(self, offset, dtype="i4"):
+        return int(self.record(offset, dtype, 1)[0])
+
+    def fortran_record(self, offset, dtype):
+        """
+        Return the values of the unformatted Fortran record that starts
+        (with its length marker) at *offset*, and the offset of the record
+        following it.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = self.read_int(offset)
+        if nbytes % dtype.itemsize != 0 or \
+           self.read_int(offset + 4 + nbytes) != nbytes:
+            raise IOError("Invalid record of %s bytes at offset %s of %s." %
+                          (nbytes, offset, self.filename))
+        data = self.record(offset + 4, dtype, nbytes // dtype.itemsize)
+        return data, offset + nbytes + 8
+
+    def fortran_records(self, offset, dtype, count, nrec, stride=None):
+        """
+        Return *nrec* unformatted Fortran records, starting at *offset* and
+        each holding *count* values, as a single array of shape
+        (nrec, count).  By default the records are consecutive; otherwise
+        *stride* is the number of bytes from the start of one record to the
+        start of the next, so that records interleaved with others can be
+        picked out.  The record markers are validated.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(count) * dtype.itemsize
+        size = nbytes + 8
+        if stride is None:
+            stride = size
+        self._check(offset, (nrec - 1) * stride + size)
+        if self.handle is not None:
+            buf, start = self.handle, offset
+        elif stride == size:
+            buf, start = self.record(offset, "uint8", nrec * size), 0
+        else:
+            # Only read the records we were asked for.
+            buf, start = np.empty(nrec * size, dtype="uint8"), 0
+            with open(self.filename, "rb") as f:
+                for i in range(nrec):
+                    f.seek(offset + i * stride)
+                    buf[i * size:(i + 1) * size] = \
+                        np.fromfile(f, dtype="uint8", count=size)
+            stride = size
+        for marker in (start, start + 4 + nbytes):
+            markers = np.ndarray((nrec,), dtype="i4", buffer=buf,
+                                 offset=marker, strides=(stride,))
+            if (markers != nbytes).any():
+                raise IOError("Expected %s records of %s bytes at offset %s "
+                              "of %s." % (nrec, nbytes, offset, self.filename))
+        return np.ndarray((nrec, count), dtype=dtype, buffer=buf,
+                          offset=start + 4, strides=(stride, dtype.itemsize))
+
+    def line_end(self, offset, block=1024):
+        """
+        Return the offset just past the first newline at or after *offset*.
+        """
+        pos = offset
+        while pos < self.size:
+            n = min(block, self.size - pos)
+            i = self.record(pos, "uint8", n).tobytes().find(b"\n")
+            if i >= 0:
+                return pos + i + 1
+            pos += n
+        return self.size
+
+    def close(self):
+        """
+        Unmap the file.  The mapping, and the file handle behind it, are
+        released as soon as the records returned so far are, and further
+        records are read with ``np.fromfile``.
+        """
+        self.handle = None
+
+
+_mapped_files = OrderedDict()
+_max_mapped_files = 64
+
+def get_mapped_file(filename):
+    """
+    Return a :class:`MemoryMappedFileHandler` for *filename*, reusing a
+    recently opened one (and the record offsets stored on it) if the file
+    has not changed since.  Handlers dropped from the cache are closed.
+    """
+    mmap = ytcfg.getboolean("yt", "memory_mapped_io")
+    handler = _mapped_files.pop(filename, None)
+    if handler is None or handler.mapped != (mmap and handler.size > 0) or \
+       os.path.getmtime(filename) != handler.mtime or \
+       os.path.getsize(filename) != handler.size:
+        if handler is not None:
+            handler.close()
+        handler = MemoryMappedFileHandler(filename, mmap=mmap)
+    _mapped_files[filename] = handler
+    while len(_mapped_files) > _max_mapped_files:
+        _mapped_files.popitem(last=False)[1].close()
+    return handler
+
+def close_mapped_files(directory=None):
+    """
+    Close the handlers returned by :func:`get_mapped_file`, or only those of
+    the files inside *directory*.
+    """
+    if directory is not None:
+        directory = os.path.join(os.path.abspath(directory), "")
+    for filename in list(_mapped_files):
+        if directory is None or \
+           os.path.abspath(filename).startswith(directory):
+            _mapped_files.pop(filename).close()
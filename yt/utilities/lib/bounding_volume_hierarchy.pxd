@@ -20,12 +20,13 @@ cdef extern from "mesh_triangulation.h":
     int hex20_faces[6][8]
     int tet10_faces[4][6]
 
-# node for the bounding volume hierarchy
+# node for the bounding volume hierarchy. The nodes are stored in a single
+# array, and left and right are the indices of the children in it.
 cdef struct BVHNode:
     np.int64_t begin
     np.int64_t end
-    BVHNode* left
-    BVHNode* right
+    np.int64_t left
+    np.int64_t right
     BBox bbox
 
 # pointer to function that computes primitive intersection
@@ -45,10 +46,12 @@ ctypedef void (*bbox_func_type)(const void *primitives,
 
 
 cdef class BVH:
-    cdef BVHNode* root
+    cdef BVHNode* nodes
+    cdef np.int64_t num_nodes
+    cdef np.int64_t max_nodes
     cdef void* primitives
     cdef np.int64_t* prim_ids
-    cdef np.float64_t** centroids
+    cdef np.float64_t* centroids
     cdef BBox* bboxes
     cdef np.float64_t* vertices
     cdef np.float64_t* field_data
@@ -66,16 +69,24 @@ cdef class BVH:
                                np.int64_t ax, np.float64_t split) nogil
     cdef void _set_up_triangles(self,
                                 np.float64_t[:, :] vertices,
-                                np.int64_t[:, :] indices) nogil
+                                np.int64_t[:, :] indices,
+                                int num_threads) nogil
     cdef void _set_up_patches(self,
                               np.float64_t[:, :] vertices,
-                              np.int64_t[:, :] indices) nogil
+                              np.int64_t[:, :] indices,
+                              int num_threads) nogil
     cdef void _set_up_tet_patches(self,
                               np.float64_t[:, :] vertices,
-                              np.int64_t[:, :] indices) nogil
+                              np.int64_t[:, :] indices,
+                              int num_threads) nogil
     cdef void intersect(self, Ray* ray) nogil
     cdef void _get_node_bbox(self, BVHNode* node,
                              np.int64_t begin, np.int64_t end) nogil
-    cdef void _recursive_intersect(self, Ray* ray, BVHNode* node) nogil
-    cdef BVHNode* _recursive_build(self, np.int64_t begin, np.int64_t end) nogil
-    cdef void _recursive_free(self, BVHNode* node) nogil
+    cdef void _recursive_intersect(self, Ray* ray, np.int64_t node) nogil
+    cdef np.int64_t _add_node(self, np.int64_t begin, np.int64_t end) nogil
+    cdef np.int64_t _recursive_build(self, np.int64_t begin,
+                                     np.int64_t end) nogil
+    cdef np.int64_t _morton_build(self, np.uint64_t* codes,
+                                  np.int64_t begin, np.int64_t end) nogil
+    cdef void _reorder(self, np.int64_t[:] order, int num_threads)
+    cdef void _set_node_bboxes(self, int num_threads) nogil
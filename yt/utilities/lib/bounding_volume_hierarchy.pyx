@@ -2,7 +2,7 @@ cimport cython
 import numpy as np
 cimport numpy as np
 from libc.math cimport fabs
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, realloc, free
 from cython.parallel import parallel, prange
 from .image_samplers cimport ImageSampler
 
@@ -47,6 +47,18 @@ cdef extern from "platform_dep.h" nogil:
 # define some constants
 cdef np.float64_t INF = np.inf
 cdef np.int64_t   LEAF_SIZE = 16
+# the number of bits per dimension of the Morton codes of the centroids
+cdef int MORTON_BITS = 21
+
+cdef inline np.uint64_t spread_bits(np.uint64_t x) nogil:
+    # inserts two zero bits before each of the lowest 21 bits of x
+    x &= 0x1fffff
+    x = (x | x << 32) & 0x1f00000000ffffULL
+    x = (x | x << 16) & 0x1f0000ff0000ffULL
+    x = (x | x << 8) & 0x100f00f00f00f00fULL
+    x = (x | x << 4) & 0x10c30c30c30c30c3ULL
+    x = (x | x << 2) & 0x1249249249249249ULL
+    return x
 
 
 cdef class BVH:
@@ -74,6 +86,14 @@ cdef class BVH:
     See yt/utilities/lib/primitives.pyx for the definitions of both of these primitive
     types.
 
+    By default the hierarchy is built as a linear BVH: the primitives are sorted
+    along a Morton curve through their centroids, which is done in parallel, and
+    split where their Morton codes differ. Passing builder="midpoint" instead
+    splits every node in the middle of its longest axis. The structure of a
+    hierarchy is available from its tree attribute, and can be passed back as
+    the tree argument to skip the build for another mesh with the same
+    connectivity, such as a later output of the same simulation.
+
     '''
 
     @cython.boundscheck(False)
@@ -82,7 +102,10 @@ cdef class BVH:
     def __cinit__(self,
                   np.float64_t[:, :] vertices,
                   np.int64_t[:, :] indices,
-                  np.float64_t[:, :] field_data):
+                  np.float64_t[:, :] field_data,
+                  builder = "morton",
+                  tree = None,
+                  int num_threads = 0):
 
         self.num_elem = indices.shape[0]
         self.num_verts_per_elem = indices.shape[1]
@@ -110,6 +133,8 @@ cdef class BVH:
         else:
             raise NotImplementedError("Could not determine element type for "
                                       "nverts = %d. " % self.num_verts_per_elem)
+        if builder not in ("morton", "midpoint"):
+            raise NotImplementedError("Unknown BVH builder %s." % builder)
         self.num_prim = self.num_prim_per_elem*self.num_elem
 
         # allocate storage
@@ -118,23 +143,23 @@ cdef class BVH:
         cdef np.int64_t f_size = self.num_field_per_elem * self.num_elem
         self.field_data = <np.float64_t*> malloc(f_size * sizeof(np.float64_t))
         self.prim_ids = <np.int64_t*> malloc(self.num_prim * sizeof(np.int64_t))
-        self.centroids = <np.float64_t**> malloc(self.num_prim * sizeof(np.float64_t*))
-        cdef np.int64_t i
-        for i in range(self.num_prim):
-            self.centroids[i] = <np.float64_t*> malloc(3*sizeof(np.float64_t))
+        self.centroids = <np.float64_t*> malloc(3 * self.num_prim *
+                                                sizeof(np.float64_t))
         self.bboxes = <BBox*> malloc(self.num_prim * sizeof(BBox))
 
         # create data buffers
-        cdef np.int64_t j, k
+        cdef np.int64_t i, j, k
         cdef np.int64_t field_offset, vertex_offset
-        for i in range(self.num_elem):
-            for j in range(self.num_verts_per_elem):
-                vertex_offset = i*self.num_verts_per_elem*3 + j*3
-                for k in range(3):
-                    self.vertices[vertex_offset + k] = vertices[indices[i,j]][k]
-            field_offset = i*self.num_field_per_elem
-            for j in range(self.num_field_per_elem):
-                self.field_data[field_offset + j] = field_data[i][j]
+        with nogil:
+            for i in prange(self.num_elem, num_threads=num_threads):
+                for j in range(self.num_verts_per_elem):
+                    vertex_offset = i*self.num_verts_per_elem*3 + j*3
+                    for k in range(3):
+                        self.vertices[vertex_offset + k] = \
+                            vertices[indices[i,j]][k]
+                field_offset = i*self.num_field_per_elem
+                for j in range(self.num_field_per_elem):
+                    self.field_data[field_offset + j] = field_data[i][j]
 
         # set up primitives
         if self.num_verts_per_elem == 20:
@@ -142,31 +167,37 @@ cdef class BVH:
             self.get_centroid = patch_centroid
             self.get_bbox = patch_bbox
             self.get_intersect = ray_patch_intersect
-            self._set_up_patches(vertices, indices)
+            self._set_up_patches(vertices, indices, num_threads)
         elif self.num_verts_per_elem == 10:
             self.primitives = malloc(self.num_prim * sizeof(TetPatch))
             self.get_centroid = tet_patch_centroid
             self.get_bbox = tet_patch_bbox
             self.get_intersect = ray_tet_patch_intersect
-            self._set_up_tet_patches(vertices, indices)
+            self._set_up_tet_patches(vertices, indices, num_threads)
         else:
             self.primitives = malloc(self.num_prim * sizeof(Triangle))
             self.get_centroid = triangle_centroid
             self.get_bbox = triangle_bbox
             self.get_intersect = ray_triangle_intersect
-            self._set_up_triangles(vertices, indices)
+            self._set_up_triangles(vertices, indices, num_threads)
 
-        self.root = self._recursive_build(0, self.num_prim)
+        if tree is not None:
+            self._load_tree(tree, num_threads)
+        elif builder == "morton":
+            self._build_morton(num_threads)
+        else:
+            self._recursive_build(0, self.num_prim)
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
     cdef void _set_up_patches(self, np.float64_t[:, :] vertices,
-                              np.int64_t[:, :] indices) nogil:
+                              np.int64_t[:, :] indices,
+                              int num_threads) nogil:
         cdef Patch* patch
         cdef np.int64_t i, j, k, ind, idim
         cdef np.int64_t offset, prim_index
-        for i in range(self.num_elem):
+        for i in prange(self.num_elem, num_threads=num_threads):
             offset = self.num_prim_per_elem*i
             for j in range(self.num_prim_per_elem):  # for each face
                 prim_index = offset + j
@@ -179,7 +210,7 @@ cdef class BVH:
                         patch.v[k][idim] = vertices[indices[i, ind]][idim]
                 self.get_centroid(self.primitives,
                                   prim_index,
-                                  self.centroids[prim_index])
+                                  &self.centroids[3*prim_index])
                 self.get_bbox(self.primitives,
                               prim_index,
                               &(self.bboxes[prim_index]))
@@ -188,11 +219,12 @@ cdef class BVH:
     @cython.wraparound(False)
     @cython.cdivision(True)
     cdef void _set_up_tet_patches(self, np.float64_t[:, :] vertices,
-                              np.int64_t[:, :] indices) nogil:
+                              np.int64_t[:, :] indices,
+                              int num_threads) nogil:
         cdef TetPatch* tet_patch
         cdef np.int64_t i, j, k, ind, idim
         cdef np.int64_t offset, prim_index
-        for i in range(self.num_elem):
+        for i in prange(self.num_elem, num_threads=num_threads):
             offset = self.num_prim_per_elem*i
             for j in range(self.num_prim_per_elem):  # for each face
                 prim_index = offset + j
@@ -205,7 +237,7 @@ cdef class BVH:
                         tet_patch.v[k][idim] = vertices[indices[i, ind]][idim]
                 self.get_centroid(self.primitives,
                                   prim_index,
-                                  self.centroids[prim_index])
+                                  &self.centroids[3*prim_index])
                 self.get_bbox(self.primitives,
                               prim_index,
                               &(self.bboxes[prim_index]))
@@ -214,13 +246,14 @@ cdef class BVH:
     @cython.wraparound(False)
     @cython.cdivision(True)
     cdef void _set_up_triangles(self, np.float64_t[:, :] vertices,
-                                np.int64_t[:, :] indices) nogil:
+                                np.int64_t[:, :] indices,
+                                int num_threads) nogil:
         # fill our array of primitives
         cdef np.int64_t offset, tri_index
         cdef np.int64_t v0, v1, v2
         cdef Triangle* tri
         cdef np.int64_t i, j, k
-        for i in range(self.num_elem):
+        for i in prange(self.num_elem, num_threads=num_threads):
             offset = self.num_prim_per_elem*i
             for j in range(self.num_prim_per_elem):
                 tri_index = offset + j
@@ -236,30 +269,194 @@ cdef class BVH:
                     tri.p2[k] = vertices[v2][k]
                 self.get_centroid(self.primitives,
                                   tri_index,
-                                  self.centroids[tri_index])
+                                  &self.centroids[3*tri_index])
                 self.get_bbox(self.primitives,
                               tri_index,
                               &(self.bboxes[tri_index]))
 
-    cdef void _recursive_free(self, BVHNode* node) nogil:
-        if node.end - node.begin > LEAF_SIZE:
-            self._recursive_free(node.left)
-            self._recursive_free(node.right)
-        free(node)
-
     def __dealloc__(self):
-        if self.root == NULL:
-            return
-        self._recursive_free(self.root)
+        free(self.nodes)
         free(self.primitives)
         free(self.prim_ids)
-        for i in range(self.num_prim):
-            free(self.centroids[i])
         free(self.centroids)
         free(self.bboxes)
         free(self.field_data)
         free(self.vertices)
 
+    property tree:
+        '''
+
+        The structure of the hierarchy, as a dictionary of arrays: the order
+        the primitives are stored in, and the range of primitives and the
+        children of every node. Passing it back to the constructor as the
+        tree argument rebuilds this hierarchy for a mesh with the same
+        connectivity without partitioning the primitives again.
+
+        '''
+        def __get__(self):
+            cdef np.int64_t i
+            cdef np.int64_t[:] prim_ids = np.empty(self.num_prim,
+                                                   dtype="int64")
+            cdef np.int64_t[:, :] nodes = np.empty((self.num_nodes, 4),
+                                                   dtype="int64")
+            for i in range(self.num_prim):
+                prim_ids[i] = self.prim_ids[i]
+            for i in range(self.num_nodes):
+                nodes[i, 0] = self.nodes[i].begin
+                nodes[i, 1] = self.nodes[i].end
+                nodes[i, 2] = self.nodes[i].left
+                nodes[i, 3] = self.nodes[i].right
+            return {"prim_ids": np.asarray(prim_ids),
+                    "nodes": np.asarray(nodes)}
+
+    def _load_tree(self, tree, int num_threads):
+        prim_ids = np.asarray(tree["prim_ids"], dtype="int64")
+        nodes = np.asarray(tree["nodes"], dtype="int64")
+        if prim_ids.shape != (self.num_prim,) or nodes.ndim != 2 or \
+           nodes.shape[0] == 0 or nodes.shape[1] != 4 or \
+           nodes[:, :2].min() < 0 or nodes[:, :2].max() > self.num_prim or \
+           nodes[:, 2:].max() >= nodes.shape[0] or \
+           np.any(np.bincount(prim_ids, minlength=self.num_prim) != 1):
+            raise ValueError("This tree was not built for a mesh with the "
+                             "same connectivity.")
+        cdef np.int64_t[:, :] node_view = nodes
+        cdef np.int64_t i
+        for i in range(node_view.shape[0]):
+            self._add_node(node_view[i, 0], node_view[i, 1])
+            self.nodes[i].left = node_view[i, 2]
+            self.nodes[i].right = node_view[i, 3]
+        self._reorder(prim_ids, num_threads)
+        self._set_node_bboxes(num_threads)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef void _reorder(self, np.int64_t[:] order, int num_threads):
+        # stores the primitives in the given order
+        cdef np.int64_t i, j
+        cdef np.float64_t* centroids = <np.float64_t*> malloc(
+            3 * self.num_prim * sizeof(np.float64_t))
+        cdef BBox* bboxes = <BBox*> malloc(self.num_prim * sizeof(BBox))
+        with nogil:
+            for i in prange(self.num_prim, num_threads=num_threads):
+                self.prim_ids[i] = order[i]
+                for j in range(3):
+                    centroids[3*i + j] = self.centroids[3*order[i] + j]
+                bboxes[i] = self.bboxes[order[i]]
+        free(self.centroids)
+        free(self.bboxes)
+        self.centroids = centroids
+        self.bboxes = bboxes
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    def _build_morton(self, int num_threads):
+        # This builds a linear BVH: the primitives are sorted along a Morton
+        # curve through their centroids, and every node is split where the
+        # Morton codes of its primitives first differ.
+        cdef np.int64_t i, j
+        cdef BVHNode root
+        self._get_node_bbox(&root, 0, self.num_prim)
+        cdef np.float64_t[3] scale
+        for j in range(3):
+            scale[j] = root.bbox.right_edge[j] - root.bbox.left_edge[j]
+            if scale[j] > 0:
+                scale[j] = ((1 << MORTON_BITS) - 1) / scale[j]
+        cdef np.ndarray[np.uint64_t, ndim=1] codes
+        codes = np.empty(self.num_prim, dtype="uint64")
+        cdef np.uint64_t code
+        with nogil:
+            for i in prange(self.num_prim, num_threads=num_threads):
+                code = 0
+                for j in range(3):
+                    code = code | (spread_bits(<np.uint64_t> (
+                        (self.centroids[3*i + j] - root.bbox.left_edge[j]) *
+                        scale[j])) << (2 - j))
+                codes[i] = code
+        order = np.argsort(codes, kind="mergesort")
+        codes = codes[order]
+        self._reorder(order, num_threads)
+        with nogil:
+            self._morton_build(&codes[0], 0, self.num_prim)
+            self._set_node_bboxes(num_threads)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef np.int64_t _morton_build(self, np.uint64_t* codes,
+                                  np.int64_t begin, np.int64_t end) nogil:
+        cdef np.int64_t node = self._add_node(begin, end)
+        if (end - begin) <= LEAF_SIZE:
+            return node
+        # find the highest bit the codes in this node differ in, and split
+        # before the first code that has it set
+        cdef np.int64_t mid, lo, hi
+        cdef np.uint64_t diff = codes[begin] ^ codes[end - 1]
+        cdef np.uint64_t bit = 1
+        if diff == 0:
+            mid = begin + (end - begin)/2
+        else:
+            while (diff >> 1) != 0:
+                diff = diff >> 1
+                bit = bit << 1
+            lo = begin
+            hi = end - 1
+            while lo < hi:
+                mid = lo + (hi - lo)/2
+                if codes[mid] & bit:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            mid = lo
+        cdef np.int64_t left = self._morton_build(codes, begin, mid)
+        cdef np.int64_t right = self._morton_build(codes, mid, end)
+        self.nodes[node].left = left
+        self.nodes[node].right = right
+        return node
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef void _set_node_bboxes(self, int num_threads) nogil:
+        # Every child is stored after its parent, so the bounding boxes of
+        # the leaves are computed in parallel and then merged upwards.
+        cdef np.int64_t i, j
+        cdef BVHNode* node
+        cdef BBox* left
+        cdef BBox* right
+        for i in prange(self.num_nodes, num_threads=num_threads,
+                        schedule="dynamic", chunksize=64):
+            node = &self.nodes[i]
+            if node.end - node.begin <= LEAF_SIZE:
+                self._get_node_bbox(node, node.begin, node.end)
+        for i in range(self.num_nodes - 1, -1, -1):
+            node = &self.nodes[i]
+            if node.end - node.begin <= LEAF_SIZE:
+                continue
+            left = &self.nodes[node.left].bbox
+            right = &self.nodes[node.right].bbox
+            for j in range(3):
+                node.bbox.left_edge[j] = fmin(left.left_edge[j],
+                                              right.left_edge[j])
+                node.bbox.right_edge[j] = fmax(left.right_edge[j],
+                                               right.right_edge[j])
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef np.int64_t _add_node(self, np.int64_t begin, np.int64_t end) nogil:
+        if self.num_nodes == self.max_nodes:
+            self.max_nodes = 2*self.max_nodes + 64
+            self.nodes = <BVHNode*> realloc(self.nodes,
+                                            self.max_nodes * sizeof(BVHNode))
+        cdef BVHNode* node = &self.nodes[self.num_nodes]
+        node.begin = begin
+        node.end = end
+        node.left = node.right = -1
+        self.num_nodes += 1
+        return self.num_nodes - 1
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
@@ -270,14 +467,16 @@ cdef class BVH:
         # along the direction "ax". All the primitives to the right of mid
         # will have centroids *greater* than "split" along "ax".
         cdef np.int64_t mid = begin
+        cdef np.int64_t k
         while (begin != end):
-            if self.centroids[mid][ax] > split:
+            if self.centroids[3*mid + ax] > split:
                 mid += 1
-            elif self.centroids[begin][ax] > split:
+            elif self.centroids[3*begin + ax] > split:
                 self.prim_ids[mid], self.prim_ids[begin] = \
                 self.prim_ids[begin], self.prim_ids[mid]
-                self.centroids[mid], self.centroids[begin] = \
-                self.centroids[begin], self.centroids[mid]
+                for k in range(3):
+                    self.centroids[3*mid + k], self.centroids[3*begin + k] = \
+                    self.centroids[3*begin + k], self.centroids[3*mid + k]
                 self.bboxes[mid], self.bboxes[begin] = \
                 self.bboxes[begin], self.bboxes[mid]
                 mid += 1
@@ -303,7 +502,7 @@ cdef class BVH:
     @cython.wraparound(False)
     @cython.cdivision(True)
     cdef void intersect(self, Ray* ray) nogil:
-        self._recursive_intersect(ray, self.root)
+        self._recursive_intersect(ray, 0)
 
         if ray.elem_id < 0:
             return
@@ -330,7 +529,9 @@ cdef class BVH:
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
-    cdef void _recursive_intersect(self, Ray* ray, BVHNode* node) nogil:
+    cdef void _recursive_intersect(self, Ray* ray, np.int64_t node_id) nogil:
+
+        cdef BVHNode* node = &self.nodes[node_id]
 
         # check for bbox intersection:
         if not ray_bbox_intersect(ray, node.bbox):
@@ -350,16 +551,16 @@ cdef class BVH:
     @cython.boundscheck(False)
     @cython.wraparound(False)
     @cython.cdivision(True)
-    cdef BVHNode* _recursive_build(self, np.int64_t begin, np.int64_t end) nogil:
-        cdef BVHNode *node = <BVHNode* > malloc(sizeof(BVHNode))
-        node.begin = begin
-        node.end = end
+    cdef np.int64_t _recursive_build(self, np.int64_t begin,
+                                     np.int64_t end) nogil:
+        cdef np.int64_t node_id = self._add_node(begin, end)
+        cdef BVHNode *node = &self.nodes[node_id]
 
         self._get_node_bbox(node, begin, end)
 
         # check for leaf
         if (end - begin) <= LEAF_SIZE:
-            return node
+            return node_id
 
         # we use the "split in the middle of the longest axis approach"
         # see: http://www.vadimkravcenko.com/bvh-tree-building/
@@ -383,11 +584,13 @@ cdef class BVH:
         if(mid == begin or mid == end):
             mid = begin + (end-begin)/2
 
-        # recursively build sub-trees
-        node.left = self._recursive_build(begin, mid)
-        node.right = self._recursive_build(mid, end)
+        # recursively build sub-trees; the nodes may move as they are added
+        cdef np.int64_t left = self._recursive_build(begin, mid)
+        cdef np.int64_t right = self._recursive_build(mid, end)
+        self.nodes[node_id].left = left
+        self.nodes[node_id].right = right
 
-        return node
+        return node_id
 
 
 @cython.boundscheck(False)
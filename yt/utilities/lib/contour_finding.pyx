@@ -18,6 +18,7 @@ cimport numpy as np
 cimport cython
 from cython cimport floating
 from libc.stdlib cimport malloc, free, realloc
+from cython.parallel cimport prange
 from yt.geometry.selection_routines cimport \
     SelectorObject, AlwaysSelector, OctreeSubsetSelector
 from yt.utilities.lib.fp_utils cimport imax
@@ -493,6 +494,211 @@ def update_joins(np.ndarray[np.int64_t, ndim=2] joins,
                         contour_ids[ci,cj,ck] = j + 1
                         break
 
+cdef inline np.int64_t label_find(np.int64_t *parent, np.int64_t i) nogil:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+cdef inline np.int64_t label_root(np.int64_t *parent, np.int64_t i) nogil:
+    # As label_find, but without modifying parent, so that it is safe to call
+    # from several threads at once.
+    while parent[i] != i:
+        i = parent[i]
+    return i
+
+cdef inline void label_union(np.int64_t *parent, np.int64_t i,
+                             np.int64_t j) nogil:
+    # The root of every set is its lowest index.
+    i = label_find(parent, i)
+    j = label_find(parent, j)
+    if i < j:
+        parent[j] = i
+    elif j < i:
+        parent[i] = j
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void label_tile(VolumeContainer *vc, int n_levels,
+                     np.float64_t *min_vals, np.float64_t *max_vals,
+                     np.int64_t offset, int nested) nogil:
+    # The first field of the container holds the values and the next ones the
+    # labels of each level, which are set to offset plus the lowest index of
+    # the cells each cell is connected to within the tile, or to -1.  If the
+    # levels are nested, only the cells labeled at the previous level are
+    # examined.
+    cdef int i, j, k, di, dj, dk, ni, nj, nk, level
+    cdef np.int64_t index, nindex
+    cdef np.int64_t n = vc.dims[0] * vc.dims[1] * vc.dims[2]
+    cdef np.float64_t v
+    cdef np.float64_t *values = vc.data[0]
+    cdef np.int64_t *labels
+    cdef np.int64_t *previous
+    cdef np.int64_t *parent = <np.int64_t *> malloc(sizeof(np.int64_t) * n)
+    for level in range(n_levels):
+        labels = <np.int64_t *> vc.data[level + 1]
+        previous = NULL
+        if nested and level > 0:
+            previous = <np.int64_t *> vc.data[level]
+        for i in range(vc.dims[0]):
+            for j in range(vc.dims[1]):
+                for k in range(vc.dims[2]):
+                    index = (i * vc.dims[1] + j) * vc.dims[2] + k
+                    labels[index] = -1
+                    if vc.mask[index] == 0: continue
+                    if previous != NULL and previous[index] == -1: continue
+                    v = values[index]
+                    if v < min_vals[level] or v > max_vals[level]: continue
+                    labels[index] = parent[index] = index
+                    # Cells touching by faces, edges or corners are
+                    # connected; only those already examined are joined.
+                    for di in range(-1, 1):
+                        ni = i + di
+                        if ni < 0: continue
+                        for dj in range(-1, 2):
+                            nj = j + dj
+                            if nj < 0 or nj >= vc.dims[1]: continue
+                            if di == 0 and dj == 1: break
+                            for dk in range(-1, 2):
+                                nk = k + dk
+                                if nk < 0 or nk >= vc.dims[2]: continue
+                                if di == 0 and dj == 0 and dk == 0: break
+                                nindex = (ni * vc.dims[1] + nj) * vc.dims[2] + nk
+                                if labels[nindex] > -1:
+                                    label_union(parent, index, nindex)
+        for index in range(n):
+            if labels[index] > -1:
+                labels[index] = offset + label_find(parent, index)
+    free(parent)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def label_tile_levels(tiles, np.ndarray[np.int64_t, ndim=1] offsets,
+                      np.ndarray[np.float64_t, ndim=1] min_vals,
+                      np.ndarray[np.float64_t, ndim=1] max_vals,
+                      int nested = 0, int num_threads = 0):
+    # Each tile is a PartitionedGrid with the values and the labels of every
+    # level as fields, and the tiles are labeled by all threads at once.
+    cdef int n_tiles = len(tiles)
+    cdef int n_levels = min_vals.shape[0]
+    cdef int i
+    cdef PartitionedGrid pg
+    if n_tiles == 0 or n_levels == 0: return
+    cdef VolumeContainer **vcs = <VolumeContainer **> malloc(
+        sizeof(VolumeContainer*) * n_tiles)
+    for i in range(n_tiles):
+        pg = tiles[i]
+        vcs[i] = pg.container
+    with nogil:
+        for i in prange(n_tiles, schedule="dynamic", num_threads=num_threads):
+            label_tile(vcs[i], n_levels, &min_vals[0], &max_vals[0],
+                       offsets[i], nested)
+    free(vcs)
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def find_tile_boundaries(Node trunk, tiles,
+                         np.ndarray[np.int64_t, ndim=1] offsets):
+    # Pairs of cells, as indices into the concatenated cells of the tiles,
+    # that are in different tiles and touch by a face, an edge or a corner,
+    # where both are in the mask.  These are the same for every level.
+    cdef int n_tiles = len(tiles)
+    cdef int t, i, j, k, di, dj, dk, ax, outside
+    cdef np.int64_t ti = 0, s, n, index0, index1, adj = -1
+    cdef int pos[3]
+    cdef np.float64_t[:] spos = np.empty(3, dtype="float64")
+    cdef Node adj_node
+    cdef PartitionedGrid pg
+    cdef VolumeContainer *vc0
+    cdef VolumeContainer *vc1
+    cdef VolumeContainer **vcs = <VolumeContainer **> malloc(
+        sizeof(VolumeContainer*) * n_tiles)
+    s = 0
+    for t in range(n_tiles):
+        pg = tiles[t]
+        vcs[t] = vc0 = pg.container
+        n = 1
+        for ax in range(3):
+            n *= imax(vc0.dims[ax] - 2, 0)
+        s += (vc0.dims[0] * vc0.dims[1] * vc0.dims[2] - n) * 26
+    cdef np.ndarray[np.int64_t, ndim=2] pairs = np.empty((s, 2), dtype="int64")
+    for t in range(n_tiles):
+        vc0 = vcs[t]
+        for i in range(vc0.dims[0]):
+            for j in range(vc0.dims[1]):
+                k = 0
+                while k < vc0.dims[2]:
+                    index0 = vc_index(vc0, i, j, k)
+                    if vc0.mask[index0] == 1:
+                        for di in range(-1, 2):
+                            for dj in range(-1, 2):
+                                for dk in range(-1, 2):
+                                    pos[0] = i + di
+                                    pos[1] = j + dj
+                                    pos[2] = k + dk
+                                    outside = 0
+                                    for ax in range(3):
+                                        if pos[ax] < 0 or \
+                                           pos[ax] >= vc0.dims[ax]:
+                                            outside = 1
+                                    if outside == 0: continue
+                                    # the center of the neighboring cell, at
+                                    # the resolution of this tile
+                                    for ax in range(3):
+                                        spos[ax] = vc0.left_edge[ax] + \
+                                            (pos[ax] + 0.5) * vc0.dds[ax]
+                                    # the tile found last usually holds
+                                    # the next neighbor as well
+                                    if adj < 0 or \
+                                       not spos_contained(vcs[adj], &spos[0]):
+                                        adj_node = trunk._find_node(spos)
+                                        adj = adj_node.node_ind
+                                    vc1 = vcs[adj]
+                                    if not spos_contained(vc1, &spos[0]):
+                                        continue
+                                    index1 = vc_pos_index(vc1, &spos[0])
+                                    if vc1.mask[index1] == 1:
+                                        pairs[ti, 0] = offsets[t] + index0
+                                        pairs[ti, 1] = offsets[adj] + index1
+                                        ti += 1
+                    # only the cells on the faces of the tile are examined
+                    if 0 < i < vc0.dims[0] - 1 and 0 < j < vc0.dims[1] - 1 \
+                       and k == 0 and vc0.dims[2] > 2:
+                        k = vc0.dims[2] - 1
+                    else:
+                        k += 1
+    free(vcs)
+    return pairs[:ti]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def join_tile_labels(np.ndarray[np.int64_t, ndim=1] labels,
+                     np.ndarray[np.int64_t, ndim=2] pairs,
+                     int num_threads = 0):
+    # Join the labels of the cells of each pair found by find_tile_boundaries
+    # and renumber the connected sets from 1, in place.  Returns the number of
+    # connected sets.
+    cdef np.int64_t n = labels.shape[0]
+    cdef np.int64_t i, l0, l1
+    if n == 0: return 0
+    cdef np.ndarray[np.int64_t, ndim=1] parent = np.arange(n, dtype="int64")
+    for i in range(pairs.shape[0]):
+        l0 = labels[pairs[i, 0]]
+        l1 = labels[pairs[i, 1]]
+        if l0 > -1 and l1 > -1:
+            label_union(<np.int64_t *> parent.data, l0, l1)
+    with nogil:
+        for i in prange(n, num_threads=num_threads):
+            if labels[i] > -1:
+                labels[i] = label_root(<np.int64_t *> parent.data, labels[i])
+    roots = np.zeros(n, dtype="bool")
+    members = labels > -1
+    roots[labels[members]] = True
+    number = np.cumsum(roots)
+    labels[members] = number[labels[members]]
+    return number[n - 1]
+
 cdef class FOFNode:
     cdef np.int64_t tag, count
     def __init__(self, np.int64_t tag):
@@ -528,6 +734,7 @@ cdef class ParticleContourTree(ContourTree):
         cdef np.ndarray[np.int64_t, ndim=1] pdoms, pcount, pind, doff
         cdef np.float64_t pos[3]
         cdef Oct *oct = NULL
+        cdef Oct storage
         cdef Oct **neighbors = NULL
         cdef OctInfo oi
         cdef ContourID *c0
@@ -552,7 +759,7 @@ cdef class ParticleContourTree(ContourTree):
             container[i] = NULL
             for j in range(3):
                 pos[j] = positions[i, j]
-            oct = octree.get(pos, NULL)
+            oct = octree.get(pos, NULL, 99, &storage)
             if oct == NULL or (domain_id > 0 and oct.domain != domain_id):
                 continue
             offset = oct.domain_ind - moff
@@ -583,7 +790,7 @@ cdef class ParticleContourTree(ContourTree):
             # This can probably be replaced at some point with a faster lookup.
             for j in range(3):
                 pos[j] = positions[offset, j]
-            oct = octree.get(pos, &oi)
+            oct = octree.get(pos, &oi, 99, &storage)
             if oct == NULL or (domain_id > 0 and oct.domain != domain_id):
                 continue
             # Now we have our primary oct, so we will get its neighbors.
@@ -280,3 +280,13 @@ cdef class Tet2Sampler3D(NonlinearSolveSampler3D):
                                      double* vals) nogil
 
     cdef int check_inside(self, double* mapped_coord) nogil
+
+
+cpdef ElementSampler get_element_sampler(int ndim, int nvertices)
+
+cdef int sample_element(ElementSampler sampler,
+                        double* vertices,
+                        double* field_values,
+                        int num_field_values,
+                        double* physical_x,
+                        double* value) nogil
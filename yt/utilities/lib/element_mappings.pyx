@@ -19,6 +19,9 @@ from numpy cimport ndarray
 cimport cython
 import numpy as np
 from libc.math cimport fabs
+from libc.stdlib cimport malloc, free
+from cython.parallel cimport prange, parallel
+from yt.utilities.exceptions import YTElementTypeNotRecognized
 from yt.utilities.lib.autogenerated_element_samplers cimport \
     Q1Function3D, \
     Q1Jacobian3D, \
@@ -35,6 +38,12 @@ from yt.utilities.lib.autogenerated_element_samplers cimport \
 
 cdef extern from "platform_dep.h":
     double fmax(double x, double y) nogil
+    double fmin(double x, double y) nogil
+
+# Points further than this fraction of the size of an element outside of its
+# bounding box are not looked for in it. Higher-order elements can bulge a
+# little beyond the bounding box of their nodes.
+cdef double BBOX_TOLERANCE = 0.1
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -1109,6 +1118,127 @@ cdef class Tet2Sampler3D(NonlinearSolveSampler3D):
             return 1
         return -1
 
+cpdef ElementSampler get_element_sampler(int ndim, int nvertices):
+    '''
+
+    This returns a sampler for elements with nvertices vertices in ndim
+    dimensions.
+
+    '''
+    if ndim == 3 and nvertices == 4:
+        return P1Sampler3D()
+    elif ndim == 3 and nvertices == 6:
+        return W1Sampler3D()
+    elif ndim == 3 and nvertices == 8:
+        return Q1Sampler3D()
+    elif ndim == 3 and nvertices == 20:
+        return S2Sampler3D()
+    elif ndim == 2 and nvertices == 3:
+        return P1Sampler2D()
+    elif ndim == 1 and nvertices == 2:
+        return P1Sampler1D()
+    elif ndim == 2 and nvertices == 4:
+        return Q1Sampler2D()
+    elif ndim == 2 and nvertices == 9:
+        return Q2Sampler2D()
+    elif ndim == 2 and nvertices == 6:
+        return T2Sampler2D()
+    elif ndim == 3 and nvertices == 10:
+        return Tet2Sampler3D()
+    raise YTElementTypeNotRecognized(ndim, nvertices)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef int sample_element(ElementSampler sampler,
+                        double* vertices,
+                        double* field_values,
+                        int num_field_values,
+                        double* physical_x,
+                        double* value) nogil:
+    # This samples the field of an element at a physical point, and returns
+    # whether the point is inside the element at all. Elements with a single
+    # field value are constant.
+    cdef double mapped_coord[4]
+    sampler.map_real_to_unit(mapped_coord, vertices, physical_x)
+    if not sampler.check_inside(mapped_coord):
+        return 0
+    if num_field_values == 1:
+        value[0] = field_values[0]
+    else:
+        value[0] = sampler.sample_at_unit_point(mapped_coord, field_values)
+    return 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def sample_element_points(np.float64_t[:, :] coords,
+                          np.int64_t[:, :] conn,
+                          np.float64_t[:, :] field,
+                          np.int64_t[:] elem_ids,
+                          np.float64_t[:, :] points,
+                          int index_offset = 0,
+                          int num_threads = 0):
+    '''
+
+    This samples a finite element field at many points at once. Each point
+    points[i] is looked for in the element elem_ids[i] of the mesh with
+    vertices coords and connectivity conn, and field holds the values of
+    every element. Points well outside the bounding box of their element
+    are rejected without inverting its mapping, and the pairs are split
+    between num_threads threads. This returns the sampled values and
+    whether each point was inside its element.
+
+    '''
+    cdef int nvertices = conn.shape[1]
+    cdef int ndim = coords.shape[1]
+    cdef int num_field_vals = field.shape[1]
+    cdef ElementSampler sampler = get_element_sampler(ndim, nvertices)
+    if points.shape[0] != elem_ids.shape[0] or points.shape[1] != ndim:
+        raise ValueError("Need one point with %d coordinates for every "
+                         "element." % ndim)
+    cdef np.float64_t[:] values = np.zeros(points.shape[0], dtype="float64")
+    cdef np.uint8_t[:] inside = np.zeros(points.shape[0], dtype="uint8")
+    cdef np.int64_t p, ci, cj, n
+    cdef int i, use
+    cdef double* vertices
+    cdef double* field_vals
+    cdef double* point
+    cdef double LE, RE, margin
+    with nogil, parallel(num_threads=num_threads):
+        vertices = <double *> malloc(ndim * nvertices * sizeof(double))
+        field_vals = <double *> malloc(num_field_vals * sizeof(double))
+        point = <double *> malloc(3 * sizeof(double))
+        for p in prange(points.shape[0], schedule="dynamic", chunksize=64):
+            ci = elem_ids[p]
+            for n in range(nvertices):
+                cj = conn[ci, n] - index_offset
+                for i in range(ndim):
+                    vertices[ndim*n + i] = coords[cj, i]
+            use = 1
+            for i in range(ndim):
+                point[i] = points[p, i]
+                LE = RE = vertices[i]
+                for n in range(1, nvertices):
+                    LE = fmin(LE, vertices[ndim*n + i])
+                    RE = fmax(RE, vertices[ndim*n + i])
+                margin = BBOX_TOLERANCE * (RE - LE)
+                if point[i] < LE - margin or point[i] > RE + margin:
+                    use = 0
+                    break
+            if use == 0:
+                continue
+            for n in range(num_field_vals):
+                field_vals[n] = field[ci, n]
+            inside[p] = sample_element(sampler, vertices, field_vals,
+                                       num_field_vals, point, &values[p])
+        free(vertices)
+        free(field_vals)
+        free(point)
+    return np.asarray(values), np.asarray(inside).astype("bool")
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
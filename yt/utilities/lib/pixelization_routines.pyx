@@ -21,20 +21,15 @@ from yt.utilities.lib.fp_utils cimport fmin, fmax, i64min, i64max, imin, imax, f
 from yt.utilities.exceptions import \
     YTPixelizeError, \
     YTElementTypeNotRecognized
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, calloc, free
+from cython.parallel cimport prange, parallel
 from vec3_ops cimport dot, cross, subtract
+from yt.utilities.lib.particle_kernels cimport kernel_func, get_kernel_func
 from yt.utilities.lib.element_mappings cimport \
     ElementSampler, \
-    P1Sampler1D, \
-    P1Sampler2D, \
-    P1Sampler3D, \
-    Q1Sampler3D, \
-    Q1Sampler2D, \
-    Q2Sampler2D, \
-    S2Sampler3D, \
-    W1Sampler3D, \
-    T2Sampler2D, \
-    Tet2Sampler3D
+    get_element_sampler, \
+    sample_element
+from yt.utilities.lib.element_mappings import sample_element_points
 
 cdef extern from "pixelization_constants.h":
     enum:
@@ -726,13 +721,15 @@ cdef int check_face_dot(int nvertices,
                 return 0
     return 1
 
-
+@cython.boundscheck(False)
+@cython.wraparound(False)
 def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
                           np.ndarray[np.int64_t, ndim=2] conn,
                           buff_size,
                           np.ndarray[np.float64_t, ndim=2] field,
                           extents,
-                          int index_offset = 0):
+                          int index_offset = 0,
+                          int num_threads = 0):
     cdef np.ndarray[np.float64_t, ndim=3] img
     img = np.zeros(buff_size, dtype="float64")
     # Two steps:
@@ -742,48 +739,35 @@ def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
     # mapped coordinate system, and check whether the result in in-bounds or not
     # Note that we have to have a pseudo-3D pixel buffer.  One dimension will
     # always be 1.
+    # The elements are split between num_threads threads, each with its own
+    # image.  Where elements overlap a pixel, the last one wins, as it would
+    # if they were all done in order.
     cdef np.float64_t pLE[3]
     cdef np.float64_t pRE[3]
-    cdef np.float64_t LE[3]
-    cdef np.float64_t RE[3]
+    cdef np.float64_t *LE
+    cdef np.float64_t *RE
     cdef int use
-    cdef np.int64_t n, i, pi, pj, pk, ci, cj
-    cdef np.int64_t pstart[3]
-    cdef np.int64_t pend[3]
-    cdef np.float64_t ppoint[3]
+    cdef np.int64_t n, i, pi, pj, pk, ci, cj, pind, k
+    cdef np.int64_t *pstart
+    cdef np.int64_t *pend
+    cdef np.float64_t *ppoint
     cdef np.float64_t idds[3]
     cdef np.float64_t dds[3]
     cdef np.float64_t *vertices
     cdef np.float64_t *field_vals
+    cdef np.float64_t *local_img
+    cdef np.int64_t *local_elem
     cdef int nvertices = conn.shape[1]
     cdef int ndim = coords.shape[1]
     cdef int num_field_vals = field.shape[1]
-    cdef double[4] mapped_coord
-    cdef ElementSampler sampler
-
-    # Pick the right sampler and allocate storage for the mapped coordinate
-    if ndim == 3 and nvertices == 4:
-        sampler = P1Sampler3D()
-    elif ndim == 3 and nvertices == 6:
-        sampler = W1Sampler3D()
-    elif ndim == 3 and nvertices == 8:
-        sampler = Q1Sampler3D()
-    elif ndim == 3 and nvertices == 20:
-        sampler = S2Sampler3D()
-    elif ndim == 2 and nvertices == 3:
-        sampler = P1Sampler2D()
-    elif ndim == 1 and nvertices == 2:
-        sampler = P1Sampler1D()
-    elif ndim == 2 and nvertices == 4:
-        sampler = Q1Sampler2D()
-    elif ndim == 2 and nvertices == 9:
-        sampler = Q2Sampler2D()
-    elif ndim == 2 and nvertices == 6:
-        sampler = T2Sampler2D()
-    elif ndim == 3 and nvertices == 10:
-        sampler = Tet2Sampler3D()
-    else:
-        raise YTElementTypeNotRecognized(ndim, nvertices)
+    cdef np.int64_t[:] nimg = np.array(buff_size, dtype="int64")
+    cdef np.int64_t npix = nimg[0] * nimg[1] * nimg[2]
+    cdef np.float64_t[:] img_flat = img.reshape(npix)
+    cdef np.int64_t[:] elem_flat = np.empty(npix, dtype="int64")
+    elem_flat[:] = -1
+
+    # Pick the right sampler
+    cdef ElementSampler sampler = get_element_sampler(ndim, nvertices)
 
     # if we are in 2D land, the 1 cell thick dimension had better be 'z'
     if ndim == 2:
@@ -791,10 +775,6 @@ def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
             raise RuntimeError("Slices of 2D datasets must be "
                                "perpendicular to the 'z' direction.")
 
-    # allocate temporary storage
-    vertices = <np.float64_t *> malloc(ndim * sizeof(np.float64_t) * nvertices)
-    field_vals = <np.float64_t *> malloc(sizeof(np.float64_t) * num_field_vals)
-
     # fill the image bounds and pixel size information here
     for i in range(ndim):
         pLE[i] = extents[i][0]
@@ -805,16 +785,37 @@ def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
         else:
             idds[i] = 1.0 / dds[i]
 
-    with cython.boundscheck(False):
-        for ci in range(conn.shape[0]):
+    # Set if the storage of any thread could not be allocated
+    cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+    cdef int allocated
+    with nogil, parallel(num_threads=num_threads):
+        # allocate temporary storage
+        vertices = <np.float64_t *> malloc(ndim * sizeof(np.float64_t) * nvertices)
+        field_vals = <np.float64_t *> malloc(sizeof(np.float64_t) * num_field_vals)
+        ppoint = <np.float64_t *> malloc(3 * sizeof(np.float64_t))
+        LE = <np.float64_t *> malloc(3 * sizeof(np.float64_t))
+        RE = <np.float64_t *> malloc(3 * sizeof(np.float64_t))
+        pstart = <np.int64_t *> malloc(3 * sizeof(np.int64_t))
+        pend = <np.int64_t *> malloc(3 * sizeof(np.int64_t))
+        local_img = <np.float64_t *> malloc(npix * sizeof(np.float64_t))
+        local_elem = <np.int64_t *> malloc(npix * sizeof(np.int64_t))
+        allocated = vertices != NULL and field_vals != NULL and \
+                    ppoint != NULL and LE != NULL and RE != NULL and \
+                    pstart != NULL and pend != NULL and \
+                    local_img != NULL and local_elem != NULL
+        if allocated:
+            for k in range(npix):
+                local_elem[k] = -1
+        else:
+            failed[0] = 1
+        for ci in prange(conn.shape[0], schedule="static"):
+            if not allocated:
+                continue
 
             # Fill the vertices
             LE[0] = LE[1] = LE[2] = 1e60
             RE[0] = RE[1] = RE[2] = -1e60
 
-            for n in range(num_field_vals):
-                field_vals[n] = field[ci, n]
-
             for n in range(nvertices):
                 cj = conn[ci, n] - index_offset
                 for i in range(ndim):
@@ -828,7 +829,10 @@ def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
                     use = 0
                     break
                 pstart[i] = i64max(<np.int64_t> ((LE[i] - pLE[i])*idds[i]) - 1, 0)
-                pend[i] = i64min(<np.int64_t> ((RE[i] - pLE[i])*idds[i]) + 1, img.shape[i]-1)
+                pend[i] = i64min(<np.int64_t> ((RE[i] - pLE[i])*idds[i]) + 1, nimg[i]-1)
+
+            if use == 0:
+                continue
 
             # override for the low-dimensional case
             if ndim < 3:
@@ -838,8 +842,8 @@ def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
                 pstart[1] = 0
                 pend[1] = 0
 
-            if use == 0:
-                continue
+            for n in range(num_field_vals):
+                field_vals[n] = field[ci, n]
 
             # Now our bounding box intersects, so we get the extents of our pixel
             # region which overlaps with the bounding box, and we'll check each
@@ -852,16 +856,29 @@ def pixelize_element_mesh(np.ndarray[np.float64_t, ndim=2] coords,
                         ppoint[2] = (pk + 0.5) * dds[2] + pLE[2]
                         # Now we just need to figure out if our ppoint is within
                         # our set of vertices.
-                        sampler.map_real_to_unit(mapped_coord, vertices, ppoint)
-                        if not sampler.check_inside(mapped_coord):
-                            continue
-                        if (num_field_vals == 1):
-                            img[pi, pj, pk] = field_vals[0]
-                        else:
-                            img[pi, pj, pk] = sampler.sample_at_unit_point(mapped_coord,
-                                                                           field_vals)
-    free(vertices)
-    free(field_vals)
+                        pind = (pi * nimg[1] + pj) * nimg[2] + pk
+                        if sample_element(sampler, vertices, field_vals,
+                                          num_field_vals, ppoint,
+                                          &local_img[pind]):
+                            local_elem[pind] = ci
+        # img is left as it was if any thread is missing its storage.
+        if failed[0] == 0:
+            with gil:
+                for k in range(npix):
+                    if local_elem[k] > elem_flat[k]:
+                        elem_flat[k] = local_elem[k]
+                        img_flat[k] = local_img[k]
+        free(vertices)
+        free(field_vals)
+        free(ppoint)
+        free(LE)
+        free(RE)
+        free(pstart)
+        free(pend)
+        free(local_img)
+        free(local_elem)
+    if failed[0]:
+        raise MemoryError
     return img
 
 def pixelize_element_mesh_line(np.ndarray[np.float64_t, ndim=2] coords,
@@ -870,62 +887,28 @@ def pixelize_element_mesh_line(np.ndarray[np.float64_t, ndim=2] coords,
                                np.ndarray[np.float64_t, ndim=1] end_point,
                                npoints,
                                np.ndarray[np.float64_t, ndim=2] field,
-                               int index_offset = 0):
+                               int index_offset = 0,
+                               int num_threads = 0):
 
     # This routine chooses the correct element sampler to interpolate field
-    # values at evenly spaced points along a sampling line
-    cdef np.float64_t *vertices
-    cdef np.float64_t *field_vals
+    # values at evenly spaced points along a sampling line.  Every point is
+    # sampled from the first element it is in; elements whose bounding boxes
+    # miss the line are skipped up front.
     cdef int nvertices = conn.shape[1]
     cdef int ndim = coords.shape[1]
-    cdef int num_field_vals = field.shape[1]
-    cdef int num_plot_nodes = npoints
     cdef int num_intervals = npoints - 1
-    cdef double[4] mapped_coord
-    cdef ElementSampler sampler
     cdef np.ndarray[np.float64_t, ndim=1] lin_vec
     cdef np.ndarray[np.float64_t, ndim=1] lin_inc
     cdef np.ndarray[np.float64_t, ndim=2] lin_sample_points
-    cdef np.int64_t i, n, j, k
+    cdef np.int64_t i, j
     cdef np.ndarray[np.float64_t, ndim=1] arc_length
     cdef np.float64_t lin_length, inc_length
     cdef np.ndarray[np.float64_t, ndim=1] plot_values
-    cdef np.float64_t sample_point[3]
-
-    lin_vec = np.zeros(ndim, dtype="float64")
-    lin_inc = np.zeros(ndim, dtype="float64")
-
-    lin_sample_points = np.zeros((num_plot_nodes, ndim), dtype="float64")
-    arc_length = np.zeros(num_plot_nodes, dtype="float64")
-    plot_values = np.zeros(num_plot_nodes, dtype="float64")
-
-    # Pick the right sampler and allocate storage for the mapped coordinate
-    if ndim == 3 and nvertices == 4:
-        sampler = P1Sampler3D()
-    elif ndim == 3 and nvertices == 6:
-        sampler = W1Sampler3D()
-    elif ndim == 3 and nvertices == 8:
-        sampler = Q1Sampler3D()
-    elif ndim == 3 and nvertices == 20:
-        sampler = S2Sampler3D()
-    elif ndim == 2 and nvertices == 3:
-        sampler = P1Sampler2D()
-    elif ndim == 1 and nvertices == 2:
-        sampler = P1Sampler1D()
-    elif ndim == 2 and nvertices == 4:
-        sampler = Q1Sampler2D()
-    elif ndim == 2 and nvertices == 9:
-        sampler = Q2Sampler2D()
-    elif ndim == 2 and nvertices == 6:
-        sampler = T2Sampler2D()
-    elif ndim == 3 and nvertices == 10:
-        sampler = Tet2Sampler3D()
-    else:
-        raise YTElementTypeNotRecognized(ndim, nvertices)
 
-    # allocate temporary storage
-    vertices = <np.float64_t *> malloc(ndim * sizeof(np.float64_t) * nvertices)
-    field_vals = <np.float64_t *> malloc(sizeof(np.float64_t) * num_field_vals)
+    get_element_sampler(ndim, nvertices)
+
+    lin_sample_points = np.zeros((npoints, ndim), dtype="float64")
+    arc_length = np.zeros(npoints, dtype="float64")
 
     lin_vec = end_point - start_point
     lin_length = np.linalg.norm(lin_vec)
@@ -939,31 +922,260 @@ def pixelize_element_mesh_line(np.ndarray[np.float64_t, ndim=2] coords,
             lin_sample_points[i, j] = lin_sample_points[i-1, j] + lin_inc[j]
             arc_length[i] = arc_length[i-1] + inc_length
 
-    for i in range(num_intervals + 1):
-        for j in range(3):
-            if j < ndim:
-                sample_point[j] = lin_sample_points[i][j]
+    # The candidate elements of each point are those whose bounding boxes,
+    # padded like those of sample_element_points, hold it.  They are found
+    # for as many points at a time as keeps the work arrays small.
+    elem_coords = coords[conn - index_offset]
+    LE = elem_coords.min(axis=1)
+    RE = elem_coords.max(axis=1)
+    margin = 0.1 * (RE - LE)
+    LE -= margin
+    RE += margin
+    plot_values = np.zeros(npoints, dtype="float64")
+    found = np.zeros(npoints, dtype="bool")
+    chunk_size = max(int(1e7) // max(conn.shape[0], 1), 1)
+    for start in range(0, npoints, chunk_size):
+        chunk = lin_sample_points[start:start + chunk_size]
+        near = np.all((LE[:, None, :] <= chunk[None, :, :]) &
+                      (RE[:, None, :] >= chunk[None, :, :]), axis=2)
+        elem_ids, point_ids = np.nonzero(near)
+        values, inside = sample_element_points(
+            coords, conn, field, elem_ids.astype("int64"),
+            chunk[point_ids], index_offset, num_threads)
+        # each point takes its value from the first element it is in
+        elem_ids = elem_ids[inside]
+        point_ids = point_ids[inside]
+        values = values[inside]
+        order = np.lexsort((elem_ids, point_ids))
+        hit_points, first = np.unique(point_ids[order], return_index=True)
+        plot_values[start + hit_points] = values[order][first]
+        found[start + hit_points] = True
+    if not found.all():
+        raise ValueError("Check to see that both starting and ending line points "
+                         "are within the domain of the mesh.")
+    return arc_length, plot_values
+
+# The number of intervals the projected kernels are tabulated on
+cdef int KERNEL_TABLE_SIZE = 1024
+# Particles whose kernel spans more pixels than this in both directions are
+# normalized analytically, rather than by summing their weights.
+cdef int KERNEL_MIN_PIXELS = 16
+
+@cython.cdivision(True)
+def projected_kernel_table(kernel_name = "cubic", int nz = 512):
+    r"""Tabulate the integral of an SPH kernel along the line of sight.
+
+    This returns, for KERNEL_TABLE_SIZE + 1 values of the impact parameter
+    q = b / h between zero and one, the column integral
+
+    .. math::
+
+        F(q) = \int W(\sqrt{q^2 + z^2}) dz
+
+    of the kernel, which has unit support, so that a particle of smoothing
+    length h contributes F(b/h) / h^2 per unit area at a distance b.
+    """
+    cdef kernel_func kernel = get_kernel_func(kernel_name)
+    cdef np.ndarray[np.float64_t, ndim=1] table
+    table = np.zeros(KERNEL_TABLE_SIZE + 1, dtype="float64")
+    cdef int i, k
+    cdef np.float64_t q, zmax, dz, z, total
+    for i in range(KERNEL_TABLE_SIZE):
+        q = i / (<np.float64_t> KERNEL_TABLE_SIZE)
+        zmax = math.sqrt(1.0 - q * q)
+        dz = zmax / nz
+        total = 0.0
+        for k in range(nz):
+            z = (k + 0.5) * dz
+            total += kernel(math.sqrt(q * q + z * z))
+        table[i] = 2.0 * total * dz
+    return table
+
+@cython.cdivision(True)
+cdef inline np.float64_t interpolate_table(np.float64_t *table,
+                                           np.float64_t q2) nogil:
+    cdef np.float64_t t
+    cdef int i
+    if q2 >= 1.0:
+        return 0.0
+    t = math.sqrt(q2) * KERNEL_TABLE_SIZE
+    i = <int> t
+    return table[i] + (t - i) * (table[i + 1] - table[i])
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def pixelize_sph_kernel_projection(np.float64_t[:,:] buff,
+                                   np.float64_t[:] px,
+                                   np.float64_t[:] py,
+                                   np.float64_t[:] hsml,
+                                   np.float64_t[:] pmass,
+                                   np.float64_t[:] pdens,
+                                   np.float64_t[:] quantity,
+                                   bounds,
+                                   kernel_name = "cubic",
+                                   int num_threads = 0):
+    r"""Project SPH particles directly onto an image.
+
+    Every particle adds quantity * mass / density, spread over the image
+    with its kernel integrated along the line of sight, so that buff holds
+    the column integral of quantity.  Each particle's contribution is
+    normalized over the pixels its kernel covers, so that none of it is lost
+    to pixelization, and smoothing lengths are raised to half a pixel
+    diagonal so that every particle covers a pixel center.  The particles
+    are split between num_threads threads, each with its own image.
+    """
+    cdef np.float64_t x_min, x_max, y_min, y_max, dx, dy, hmin
+    cdef np.float64_t h, ih2, xc, yc, q2, wsum, coeff
+    cdef np.int64_t p, i, j, i0, i1, j0, j1, k
+    cdef int nx = buff.shape[1]
+    cdef int ny = buff.shape[0]
+    cdef np.float64_t *local
+    if px.shape[0] != py.shape[0] or \
+       px.shape[0] != hsml.shape[0] or \
+       px.shape[0] != pmass.shape[0] or \
+       px.shape[0] != pdens.shape[0] or \
+       px.shape[0] != quantity.shape[0]:
+        raise YTPixelizeError("Arrays are not of correct shape.")
+    cdef np.float64_t[:] table = projected_kernel_table(kernel_name)
+    x_min, x_max, y_min, y_max = bounds
+    dx = (x_max - x_min) / nx
+    dy = (y_max - y_min) / ny
+    hmin = 0.5 * math.sqrt(dx * dx + dy * dy)
+    # Set if the image of any thread could not be allocated
+    cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+    with nogil, parallel(num_threads=num_threads):
+        local = <np.float64_t *> calloc(nx * ny, sizeof(np.float64_t))
+        if local == NULL:
+            failed[0] = 1
+        for p in prange(px.shape[0], schedule="dynamic", chunksize=256):
+            if local == NULL:
+                continue
+            if pdens[p] == 0.0:
+                continue
+            h = fmax(hsml[p], hmin)
+            if px[p] + h < x_min or px[p] - h > x_max or \
+               py[p] + h < y_min or py[p] - h > y_max:
+                continue
+            ih2 = 1.0 / (h * h)
+            j0 = <np.int64_t> math.floor((px[p] - h - x_min) / dx)
+            j1 = <np.int64_t> math.floor((px[p] + h - x_min) / dx)
+            i0 = <np.int64_t> math.floor((py[p] - h - y_min) / dy)
+            i1 = <np.int64_t> math.floor((py[p] + h - y_min) / dy)
+            # The weights of the pixels the whole kernel covers, including
+            # those outside the image.
+            if j1 - j0 >= KERNEL_MIN_PIXELS and i1 - i0 >= KERNEL_MIN_PIXELS:
+                wsum = h * h / (dx * dy)
             else:
-                sample_point[j] = 0
-        for ci in range(conn.shape[0]):
-            for n in range(num_field_vals):
-                field_vals[n] = field[ci, n]
+                wsum = 0.0
+                for i in range(i0, i1 + 1):
+                    yc = y_min + (i + 0.5) * dy - py[p]
+                    for j in range(j0, j1 + 1):
+                        xc = x_min + (j + 0.5) * dx - px[p]
+                        q2 = (xc * xc + yc * yc) * ih2
+                        wsum = wsum + interpolate_table(&table[0], q2)
+            coeff = quantity[p] * pmass[p] / pdens[p] / (dx * dy)
+            if wsum == 0.0:
+                # All of it goes into the pixel the particle is in.
+                j = <np.int64_t> math.floor((px[p] - x_min) / dx)
+                i = <np.int64_t> math.floor((py[p] - y_min) / dy)
+                if i >= 0 and i < ny and j >= 0 and j < nx:
+                    local[i * nx + j] += coeff
+                continue
+            coeff = coeff / wsum
+            for i in range(i64max(i0, 0), i64min(i1 + 1, ny)):
+                yc = y_min + (i + 0.5) * dy - py[p]
+                for j in range(i64max(j0, 0), i64min(j1 + 1, nx)):
+                    xc = x_min + (j + 0.5) * dx - px[p]
+                    q2 = (xc * xc + yc * yc) * ih2
+                    local[i * nx + j] += coeff * interpolate_table(&table[0],
+                                                                   q2)
+        # buff is left as it was if any thread is missing its image.
+        if failed[0] == 0:
+            with gil:
+                for k in range(nx * ny):
+                    buff[k // nx, k % nx] += local[k]
+        free(local)
+    if failed[0]:
+        raise MemoryError
 
-            # Fill the vertices
-            for n in range(nvertices):
-                cj = conn[ci, n] - index_offset
-                for k in range(ndim):
-                    vertices[ndim*n + k] = coords[cj, k]
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def pixelize_sph_kernel_slice(np.float64_t[:,:] buff,
+                              np.float64_t[:] px,
+                              np.float64_t[:] py,
+                              np.float64_t[:] pdz,
+                              np.float64_t[:] hsml,
+                              np.float64_t[:] pmass,
+                              np.float64_t[:] pdens,
+                              np.float64_t[:] quantity,
+                              bounds,
+                              kernel_name = "cubic",
+                              int num_threads = 0):
+    r"""Interpolate SPH particles directly onto the pixels of a slice.
 
-            sampler.map_real_to_unit(mapped_coord, vertices, sample_point)
-            if not sampler.check_inside(mapped_coord) and ci != conn.shape[0] - 1:
+    The value at every pixel center is the SPH estimate
+    sum(quantity * mass / density * W(r / h) / h^3) over the particles whose
+    kernels reach it, where pdz is the distance of each particle from the
+    plane of the slice.  The particles are split between num_threads
+    threads, each with its own image.
+    """
+    cdef kernel_func kernel = get_kernel_func(kernel_name)
+    cdef np.float64_t x_min, x_max, y_min, y_max, dx, dy
+    cdef np.float64_t h, ih, r, xc, yc, r2, coeff
+    cdef np.int64_t p, i, j, i0, i1, j0, j1, k
+    cdef int nx = buff.shape[1]
+    cdef int ny = buff.shape[0]
+    cdef np.float64_t *local
+    if px.shape[0] != py.shape[0] or \
+       px.shape[0] != pdz.shape[0] or \
+       px.shape[0] != hsml.shape[0] or \
+       px.shape[0] != pmass.shape[0] or \
+       px.shape[0] != pdens.shape[0] or \
+       px.shape[0] != quantity.shape[0]:
+        raise YTPixelizeError("Arrays are not of correct shape.")
+    x_min, x_max, y_min, y_max = bounds
+    dx = (x_max - x_min) / nx
+    dy = (y_max - y_min) / ny
+    # Set if the image of any thread could not be allocated
+    cdef np.uint8_t[:] failed = np.zeros(1, dtype="uint8")
+    with nogil, parallel(num_threads=num_threads):
+        local = <np.float64_t *> calloc(nx * ny, sizeof(np.float64_t))
+        if local == NULL:
+            failed[0] = 1
+        for p in prange(px.shape[0], schedule="dynamic", chunksize=256):
+            if local == NULL:
                 continue
-            elif not sampler.check_inside(mapped_coord):
-                raise ValueError("Check to see that both starting and ending line points "
-                                 "are within the domain of the mesh.")
-            plot_values[i] = sampler.sample_at_unit_point(mapped_coord, field_vals)
-            break
-
-    free(vertices)
-    free(field_vals)
-    return arc_length, plot_values
+            h = hsml[p]
+            if pdens[p] == 0.0 or h <= 0.0 or fabs(pdz[p]) >= h:
+                continue
+            # The radius of the kernel in the plane of the slice
+            r = math.sqrt(h * h - pdz[p] * pdz[p])
+            if px[p] + r < x_min or px[p] - r > x_max or \
+               py[p] + r < y_min or py[p] - r > y_max:
+                continue
+            ih = 1.0 / h
+            coeff = quantity[p] * pmass[p] / pdens[p] * ih * ih * ih
+            j0 = i64max(<np.int64_t> math.floor((px[p] - r - x_min) / dx), 0)
+            j1 = i64min(<np.int64_t> math.floor((px[p] + r - x_min) / dx),
+                        nx - 1)
+            i0 = i64max(<np.int64_t> math.floor((py[p] - r - y_min) / dy), 0)
+            i1 = i64min(<np.int64_t> math.floor((py[p] + r - y_min) / dy),
+                        ny - 1)
+            for i in range(i0, i1 + 1):
+                yc = y_min + (i + 0.5) * dy - py[p]
+                for j in range(j0, j1 + 1):
+                    xc = x_min + (j + 0.5) * dx - px[p]
+                    r2 = xc * xc + yc * yc + pdz[p] * pdz[p]
+                    if r2 >= h * h:
+                        continue
+                    local[i * nx + j] += coeff * kernel(math.sqrt(r2) * ih)
+        # buff is left as it was if any thread is missing its image.
+        if failed[0] == 0:
+            with gil:
+                for k in range(nx * ny):
+                    buff[k // nx, k % nx] += local[k]
+        free(local)
+    if failed[0]:
+        raise MemoryError